@@ -81,16 +81,49 @@ class Config(BaseSettings):
     # Прокси для запросов к Telegram (все сообщения бота идут через этот прокси; при VPN в браузере укажи локальный прокси)
     # Примеры: http://127.0.0.1:7890  socks5://127.0.0.1:1080  (для SOCKS нужен aiohttp-socks)
     BOT_PROXY_URL: Optional[str] = Field(default=None, env="BOT_PROXY_URL")
+    # Другой сервер Bot API вместо api.telegram.org: локальный Bot API или scripts/mock_bot_api.py для нагрузочных тестов
+    # Пример: http://127.0.0.1:8081
+    BOT_API_BASE_URL: Optional[str] = Field(default=None, env="BOT_API_BASE_URL")
 
     # Настройки работы бота
     MESSAGE_DELETE_TIMEOUT: int = 30  # секунды
     GAME_RESULT_DELETE_TIMEOUT: int = 20  # секунды для сообщений с результатами игр
     TRANSACTION_MESSAGE_TIMEOUT: int = 5  # секунды для сообщений "Списано/Начислено"
+    MESSAGE_BUDGET_MODE: bool = True  # «Списано/Начислено» и налог игры — строкой в итоговом сообщении, а не отдельными сообщениями
+    MESSAGE_DELETE_BATCH_WINDOW: float = 1.0  # секунды: удаления одного чата в этом окне уходят одним deleteMessages
+    GAME_SESSION_TTL: int = 3600  # секунды: зависшая игровая сессия удаляется из памяти
+    SESSION_JOURNAL_PATH: Path = Field(default_factory=lambda: Path(__file__).parent / "sessions.journal")  # журнал сессий со ставкой (+ .snapshot рядом)
+    SESSION_JOURNAL_FLUSH_INTERVAL: float = 1.0  # секунды между дозаписями журнала
+    SESSION_JOURNAL_SNAPSHOT_INTERVAL: int = 60  # секунды между снапшотами (журнал после них обрезается)
+    LOBBY_EDIT_INTERVAL: float = 3.0  # секунды: сообщение лобби /rulet, /frekaz правится не чаще раза за интервал
+    EDIT_MIN_INTERVAL: float = 1.0  # секунды: одно «живое» сообщение игры правится не чаще раза за интервал (уходит последняя правка)
+    OUTBOUND_GLOBAL_PER_SECOND: float = 30  # исходящих запросов к Bot API в секунду на бота
+    OUTBOUND_CHAT_PER_SECOND: float = 1.0  # сообщений в секунду в личный чат
+    OUTBOUND_CHAT_BURST: int = 3  # сколько сообщений подряд личный чат получает без задержки
+    OUTBOUND_GROUP_PER_MINUTE: float = 20  # сообщений в минуту в группу
+    OUTBOUND_GROUP_BURST: int = 5  # сколько сообщений подряд группа получает без задержки
+    OUTBOUND_MAX_RETRIES: int = 3  # повторов запроса после TelegramRetryAfter
+    OUTBOUND_MAX_RETRY_AFTER: int = 60  # секунды: более долгий RetryAfter не ждём, ошибка уходит вызывающему
+    BOT_API_POOL_SIZE: int = 100  # соединений с Bot API одновременно (пул aiohttp)
+    BOT_API_KEEPALIVE: float = 15.0  # секунды: простаивающее соединение с Bot API держится открытым
+    BROADCAST_CHUNK_SIZE: int = 200  # получателей рассылки за одно чтение из БД (после порции — контрольная точка)
+    BROADCAST_CONCURRENCY: int = 25  # одновременных отправок рассылки (темп задаёт планировщик исходящих)
+    BROADCAST_REPORT_INTERVAL: float = 5.0  # секунды: как часто обновлять сообщение с прогрессом рассылки
+    UPDATE_CONCURRENCY: int = 256  # входящих обновлений обрабатывается одновременно (обновления одного пользователя — по порядку)
+    UPDATE_QUEUE_SIZE: int = 1000  # обновлений в очереди; очередь полна — webhook отвечает Telegram 429
+    UPDATE_RETRY_AFTER: int = 1  # секунды: Retry-After в ответе 429 на webhook
+    UPDATE_DRAIN_TIMEOUT: float = 5.0  # секунды: при остановке дообработать очередь, потом отменить
+    UPDATE_DEDUP_SIZE: int = 10000  # сколько последних update_id и id callback-запросов помнить для отсева повторов
     
     # Cooldown настройки (в секундах)
     DEFAULT_COOLDOWN: int = 60
     PREMIUM_COOLDOWN: int = 15
     KACHALKA_COOLDOWN_REDUCTION: int = 30  # снижение до 30 сек при /kachalka
+    COOLDOWN_FLUSH_INTERVAL: int = 5  # секунды: пакетная запись cooldown'ов в БД
+    COOLDOWN_PERKS_TTL: int = 300  # секунды: кэш Premium/kachalka для расчёта cooldown
+    COOLDOWN_MEMORY_TTL: int = 7 * 86400  # секунды: выгрузка из памяти давно истекших cooldown'ов
+    # Долгие cooldown'ы пишутся в БД сразу (должны пережить перезапуск)
+    DURABLE_COOLDOWN_COMMANDS: List[str] = ["/steal", "/refill", "/kachalka", "/plsdon"]
     KACHALKA_DURATION: int = 600  # 10 минут в секундах
     
     # Автономность бота: авто-сброс сезона и опция вайпа балансов
@@ -142,6 +175,9 @@ class Config(BaseSettings):
     # Уведомления создателю: при превышении порогов
     NOTIFY_CREATOR_BALANCE_THRESHOLD: int = 100_000  # баланс пользователя выше
     NOTIFY_CREATOR_SINGLE_AMOUNT: int = 50_000  # одно начисление/выигрыш выше
+    NOTIFY_CREATOR_CRITICAL_AMOUNT: int = 1_000_000  # начисление/выигрыш выше — уведомление сразу, минуя сводку
+    CREATOR_DIGEST_INTERVAL: int = 60  # секунды: уведомления создателю копятся и уходят одной сводкой (0 — сразу)
+    CREATOR_DIGEST_MAX_LINES: int = 5  # сколько последних событий каждого вида показывать в сводке
     
     # Premium настройки
     PREMIUM_PRICES: dict = {
@@ -165,6 +201,7 @@ class Config(BaseSettings):
     
     KRIPTA_MAX_MULTIPLIER: int = 100
     KRIPTA_MULTIPLIER_INTERVAL: int = 10  # секунды
+    KRIPTA_TICK_INTERVAL: float = 1.0  # секунды: шаг общего тикера всех игр /kripta
     # /kripta баланс: дожить до x2 ~20%, x3 значительно меньше, x4+ очень редко, 100x крайне редко
     KRIPTA_SURVIVE_X2_CHANCE: float = 0.20  # ~20% дожить до x2
     KRIPTA_SURVIVE_X3_CHANCE: float = 0.06  # значительно меньше до x3
@@ -294,6 +331,7 @@ class Config(BaseSettings):
     # БД настройки
     DB_TIMEOUT: int = 20  # секунды
     DB_CHECK_SAME_THREAD: bool = False  # для async
+    USER_ACTIVITY_FLUSH_INTERVAL: int = 5  # секунды: пакетная запись last_active/username
     
     # Retry настройки
     MAX_RETRIES: int = 3
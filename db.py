@@ -8,6 +8,7 @@ import aiosqlite
 import asyncio
 import random
 import sqlite3
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Tuple, Any
 from pathlib import Path
@@ -118,7 +119,38 @@ class Database:
         """
         cursor = await self.execute(query, params)
         return await cursor.fetchall()
-    
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Несколько запросов в одной транзакции с одним commit.
+        Внутри блока используется соединение напрямую (self.execute вызывать нельзя — блокировка уже взята).
+
+        Yields:
+            aiosqlite.Connection
+        """
+        async with self._lock:
+            try:
+                yield self.connection
+                await self.connection.commit()
+            except Exception as e:
+                logger.error(f"Ошибка транзакции: {e}")
+                await self.connection.rollback()
+                raise
+
+    async def executemany(self, query: str, params_seq: List[tuple]) -> None:
+        """
+        Пакетное выполнение одного запроса для набора параметров (один commit)
+
+        Args:
+            query: SQL запрос
+            params_seq: Список кортежей параметров
+        """
+        if not params_seq:
+            return
+        async with self.transaction() as conn:
+            await conn.executemany(query, params_seq)
+
     async def create_tables(self):
         """
         Создание всех необходимых таблиц в БД
@@ -342,6 +374,11 @@ class Database:
                 await self.execute("ALTER TABLE users ADD COLUMN mmr INTEGER DEFAULT 0 NOT NULL")
             except Exception:
                 pass
+            # Миграция: пользователь заблокировал бота (рассылка его пропускает)
+            try:
+                await self.execute("ALTER TABLE users ADD COLUMN bot_blocked INTEGER DEFAULT 0 NOT NULL")
+            except Exception:
+                pass
             # Миграции birzh_state/user_birzh выполняются после CREATE TABLE этих таблиц (см. ниже)
 
             # Таблица: 1 бесплатная игра в сутки при балансе 0 (дата последнего использования)
@@ -700,6 +737,25 @@ class Database:
             """)
             await self.execute("CREATE INDEX IF NOT EXISTS idx_game_news_expires ON game_news(expires_at)")
 
+            # Рассылки создателя: текст и прогресс (last_user_id — курсор, с него рассылка продолжается после перезапуска)
+            await self.execute("""
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    text TEXT NOT NULL,
+                    created_by INTEGER NOT NULL,
+                    created_at INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    total INTEGER NOT NULL DEFAULT 0,
+                    last_user_id INTEGER NOT NULL DEFAULT 0,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    blocked INTEGER NOT NULL DEFAULT 0,
+                    report_chat_id INTEGER DEFAULT NULL,
+                    report_message_id INTEGER DEFAULT NULL,
+                    finished_at INTEGER DEFAULT NULL
+                )
+            """)
+
             # Создание индексов для оптимизации запросов
             await self.execute("CREATE INDEX IF NOT EXISTS idx_users_balance ON users(balance DESC)")
             await self.execute("CREATE INDEX IF NOT EXISTS idx_users_level ON users(level DESC)")
@@ -926,7 +982,7 @@ class Database:
     # ==================== МЕТОДЫ ДЛЯ РАБОТЫ С БАЛАНСОМ ====================
     
     async def set_balance_direct(self, user_id: int, new_balance: int) -> bool:
-        """Прямая установка баланса (для /skinna0, перерождения)."""
+        """Прямая установка баланса — только под блокировкой счёта (balance_service.reset_balance)."""
         await self.execute(
             "UPDATE users SET balance = ? WHERE user_id = ?",
             (new_balance, user_id)
@@ -1763,12 +1819,11 @@ class Database:
             return {"sharaga": 0, "kris": 0, "jd": 0, "lisaya": 0}
         return {"sharaga": row[0], "kris": row[1] if len(row) > 1 else 0, "jd": row[2] if len(row) > 2 else 0, "lisaya": row[3] if len(row) > 3 else 0}
 
-    async def birzh_buy_100(self, user_id: int, price_koins: int, coin_type: str = "sharaga") -> bool:
-        """Купить 100 единиц коина за price_koins. coin_type: sharaga, kris, jd, lisaya."""
-        balance = await self.get_balance(user_id)
-        if balance < price_koins:
-            return False
-        await self.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (price_koins, user_id))
+    async def birzh_buy_100(self, user_id: int, coin_type: str = "sharaga") -> bool:
+        """
+        Зачислить 100 единиц коина после покупки. coin_type: sharaga, kris, jd, lisaya.
+        Цену в коинах списывает вызывающий через balance_service под блокировкой счёта.
+        """
         col = self.BIRZH_COINS.get(coin_type, (0, 0, "sharaga_balance"))[2]
         await self.execute(
             """INSERT INTO user_birzh (user_id, sharaga_balance) VALUES (?, 0)
@@ -1781,14 +1836,16 @@ class Database:
         )
         return True
 
-    async def birzh_sell_100(self, user_id: int, price_koins: int, coin_type: str = "sharaga") -> bool:
-        """Продать 100 единиц коина за price_koins."""
+    async def birzh_sell_100(self, user_id: int, coin_type: str = "sharaga") -> bool:
+        """
+        Списать 100 единиц коина при продаже (False — не хватает).
+        Выручку в коинах начисляет вызывающий через balance_service под блокировкой счёта.
+        """
         balances = await self.get_user_birzh_all(user_id)
         if balances.get(coin_type, 0) < 100:
             return False
         col = self.BIRZH_COINS.get(coin_type, (0, 0, "sharaga_balance"))[2]
         await self.execute(f"UPDATE user_birzh SET {col} = COALESCE({col}, 0) - 100 WHERE user_id = ?", (user_id,))
-        await self.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (price_koins, user_id))
         return True
 
     # ==================== БЕСПЛАТНАЯ ИГРА ПРИ БАЛАНСЕ 0 ====================
@@ -2328,18 +2385,12 @@ class Database:
         count = await self.get_rebirth_count(user_id)
         return self.REBIRTH_BASE_COST * (2 ** count)
 
-    async def do_rebirth(self, user_id: int) -> Tuple[bool, int, str]:
+    async def add_rebirth(self, user_id: int) -> int:
         """
-        Выполнить перерождение. Требует balance >= cost. Обнуляет баланс, +1 к rebirth_count.
-        Returns: (успех, новый rebirth_count, сообщение об ошибке)
+        +1 к rebirth_count после перерождения (баланс обнуляет balance_service.reset_balance
+        под блокировкой счёта). Returns: новый rebirth_count
         """
-        balance = await self.get_balance(user_id)
-        cost = await self.get_rebirth_cost(user_id)
-        if balance < cost:
-            return False, 0, f"Нужно минимум <b>{cost:,}</b> коинов. У тебя: <b>{balance:,}</b>."
-        await self.set_balance_direct(user_id, 0)
         count = await self.get_rebirth_count(user_id)
-        new_count = count + 1
         if count == 0:
             await self.execute("INSERT INTO rebirths (user_id, rebirth_count) VALUES (?, 1)", (user_id,))
         else:
@@ -2347,7 +2398,7 @@ class Database:
                 "UPDATE rebirths SET rebirth_count = rebirth_count + 1 WHERE user_id = ?",
                 (user_id,)
             )
-        return True, new_count, ""
+        return count + 1
 
     # ==================== ИГРОВЫЕ НОВОСТИ ====================
 
@@ -2439,6 +2490,10 @@ class Database:
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
             (user_id, game_type, bet, result, amount_change, multiplier, now)
         )
+        await self.progress_game_quests(user_id, game_type, result, amount_change)
+
+    async def progress_game_quests(self, user_id: int, game_type: str, result: str, amount_change: int):
+        """Прогресс квестов боевого пропуска за сыгранную игру (строка games_sessions уже записана)."""
         try:
             bp = await self.get_current_bp_season()
             if bp:
@@ -2465,6 +2520,76 @@ class Database:
         except Exception:
             pass
 
+    async def settle_game(
+        self, user_id: int, command_source: str, game_type: str, username: Optional[str],
+        bet: int, charge: int, net: int, tax: int, result: str, amount_change: int,
+        multiplier: float = 1.0, comment: str = "", penalty: int = 0
+    ) -> Optional[Tuple[int, int, int]]:
+        """
+        Расчёт раунда игры одной транзакцией: списание ставки, выигрыш, штраф за проигрыш,
+        строки transactions, total_coins, admin_game_logs и games_sessions
+        Прогресс квестов (progress_game_quests) — после, отдельно: это не движение денег.
+
+        Args:
+            bet: Ставка для логов
+            charge: Сколько списать сейчас (0 — ставка уже списана при старте игры)
+            net: Выигрыш к начислению (после налога)
+            tax: Налог Технолога (для админ-лога)
+            amount_change: Изменение баланса для логов без учёта штрафа
+            penalty: Доп. списание при проигрыше — только если после ставки на него хватает
+
+        Returns:
+            (баланс_до, баланс_после, списанный штраф) или None — не хватило на ставку
+        """
+        now = int(datetime.now().timestamp())
+        async with self.transaction() as conn:
+            async with conn.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)) as cur:
+                row = await cur.fetchone()
+            balance_before = row[0] if row else 0
+            if balance_before < charge:
+                return None
+            balance = balance_before
+            rows = []
+            if charge > 0:
+                rows.append(("expense", -charge, balance, balance - charge, f"Ставка: {comment}"))
+                balance -= charge
+            if penalty > 0 and balance < penalty:
+                penalty = 0
+            if penalty > 0:
+                rows.append(("expense", -penalty, balance, balance - penalty, f"Проигрыш: {comment}"))
+                balance -= penalty
+            if net > 0:
+                rows.append(("income", net, balance, balance + net, f"Выигрыш: {comment}"))
+                balance += net
+            if rows:
+                await conn.execute("UPDATE users SET balance = ? WHERE user_id = ?", (balance, user_id))
+                await conn.executemany(
+                    """INSERT INTO transactions
+                       (user_id, transaction_type, amount, balance_before, balance_after,
+                        command_source, comment, created_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    [(user_id, kind, amount, before, after, command_source, text, now)
+                     for kind, amount, before, after, text in rows]
+                )
+            if net > 0:
+                await conn.execute(
+                    "UPDATE levels SET total_coins_earned = total_coins_earned + ? WHERE user_id = ?",
+                    (net, user_id)
+                )
+            await conn.execute(
+                """INSERT INTO admin_game_logs
+                   (user_id, username, command, bet, result, balance_change, tax, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (user_id, username or "", command_source, bet, result, amount_change - penalty, tax or 0, now)
+            )
+            await conn.execute(
+                """INSERT INTO games_sessions
+                   (user_id, game_type, bet, result, amount_change, multiplier, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (user_id, game_type, bet, result, amount_change - penalty, float(multiplier), now)
+            )
+            return balance_before, balance, penalty
+
     # ==================== АДМИН-ЛОГИ (ИГРЫ) ====================
 
     async def log_admin_game(self, user_id: int, username: str, command: str, bet: int,
@@ -2636,7 +2761,7 @@ class Database:
     
     async def create_chisla_session(self, session_id: str, player1_id: int, player2_id: int,
                                     amount: int, message_id: int, chat_id: int, ttl_seconds: int = 300) -> bool:
-        """Создать сессию /chisla. TTL 5 минут."""
+        """Создать сессию /chisla (вызов отправлен, ставка игрока1 списана). TTL 5 минут."""
         now = int(datetime.now().timestamp())
         expires_at = now + ttl_seconds
         try:
@@ -2678,25 +2803,115 @@ class Database:
         )
         return await self.get_chisla_session(row[0]) if row else None
     
-    async def update_chisla_accepted(self, session_id: str):
-        """Игрок2 принял вызов — статус active"""
-        await self.execute("UPDATE chisla_sessions SET status = 'active' WHERE session_id = ?", (session_id,))
+    async def accept_chisla_session(
+        self, session_id: str, player2_id: int, amount: int, ttl_seconds: int
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Игрок2 принял вызов — одной транзакцией: списание его ставки, транзакция,
+        статус active и новый срок дуэли
+
+        Returns:
+            (баланс_до, баланс_после) или None, если средств не хватает или вызов уже не pending
+        """
+        now = int(datetime.now().timestamp())
+        async with self.transaction() as conn:
+            async with conn.execute("SELECT balance FROM users WHERE user_id = ?", (player2_id,)) as cur:
+                row = await cur.fetchone()
+            balance_before = row[0] if row else 0
+            if balance_before < amount:
+                return None
+            cursor = await conn.execute(
+                "UPDATE chisla_sessions SET status = 'active', expires_at = ? WHERE session_id = ? AND status = 'pending'",
+                (now + ttl_seconds, session_id)
+            )
+            if cursor.rowcount == 0:
+                return None
+            balance_after = balance_before - amount
+            await conn.execute("UPDATE users SET balance = ? WHERE user_id = ?", (balance_after, player2_id))
+            await conn.execute(
+                """INSERT INTO transactions
+                   (user_id, transaction_type, amount, balance_before, balance_after,
+                    command_source, comment, created_at)
+                   VALUES (?, 'expense', ?, ?, ?, '/chisla_accept', 'Резерв на дуэль chisla', ?)""",
+                (player2_id, -amount, balance_before, balance_after, now)
+            )
+            return balance_before, balance_after
     
     async def update_chisla_choice(self, session_id: str, player_id: int, choice: int, mult: float):
-        """Записать выбор игрока (кнопка 0-5) и множитель"""
-        sess = await self.get_chisla_session(session_id)
-        if not sess:
-            return
-        if sess["player1_id"] == player_id:
-            await self.execute(
-                "UPDATE chisla_sessions SET player1_choice = ?, player1_mult = ? WHERE session_id = ?",
-                (choice, mult, session_id)
+        """Записать выбор игрока (кнопка 0-5) и множитель — один UPDATE, слот игрока выбирает SQLite"""
+        await self.execute(
+            """UPDATE chisla_sessions SET
+                   player1_choice = CASE WHEN player1_id = ? THEN ? ELSE player1_choice END,
+                   player1_mult = CASE WHEN player1_id = ? THEN ? ELSE player1_mult END,
+                   player2_choice = CASE WHEN player1_id = ? THEN player2_choice ELSE ? END,
+                   player2_mult = CASE WHEN player1_id = ? THEN player2_mult ELSE ? END
+               WHERE session_id = ?""",
+            (player_id, choice, player_id, mult, player_id, choice, player_id, mult, session_id)
+        )
+
+    async def get_live_chisla_sessions(self) -> List[Dict[str, Any]]:
+        """Незавершённые дуэли (pending/active) — для восстановления после перезапуска"""
+        rows = await self.fetchall(
+            "SELECT session_id FROM chisla_sessions WHERE status IN ('pending', 'active')"
+        )
+        sessions = []
+        for row in rows:
+            sess = await self.get_chisla_session(row[0])
+            if sess:
+                sessions.append(sess)
+        return sessions
+
+    async def settle_chisla_session(
+        self, session_id: str, winner_id: int, loser_id: int, amount: int, net: int, tax: int,
+        winner_mult: float, loser_mult: float, winner_username: Optional[str], loser_username: Optional[str]
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Расчёт дуэли /chisla одной транзакцией: закрытие сессии, выигрыш, транзакция,
+        total_coins, админ-логи и games_sessions обоих игроков
+
+        Returns:
+            (баланс победителя, баланс проигравшего) или None, если сессия уже рассчитана
+        """
+        now = int(datetime.now().timestamp())
+        async with self.transaction() as conn:
+            cursor = await conn.execute(
+                "DELETE FROM chisla_sessions WHERE session_id = ? AND status = 'active'", (session_id,)
             )
-        else:
-            await self.execute(
-                "UPDATE chisla_sessions SET player2_choice = ?, player2_mult = ? WHERE session_id = ?",
-                (choice, mult, session_id)
+            if cursor.rowcount == 0:
+                return None
+            async with conn.execute("SELECT balance FROM users WHERE user_id = ?", (winner_id,)) as cur:
+                row = await cur.fetchone()
+            balance_before = row[0] if row else 0
+            balance_after = balance_before + net
+            await conn.execute("UPDATE users SET balance = ? WHERE user_id = ?", (balance_after, winner_id))
+            await conn.execute(
+                """INSERT INTO transactions
+                   (user_id, transaction_type, amount, balance_before, balance_after,
+                    command_source, comment, created_at)
+                   VALUES (?, 'income', ?, ?, ?, '/chisla', 'Победа в дуэли', ?)""",
+                (winner_id, net, balance_before, balance_after, now)
             )
+            await conn.execute(
+                "UPDATE levels SET total_coins_earned = total_coins_earned + ? WHERE user_id = ?",
+                (net, winner_id)
+            )
+            await conn.executemany(
+                """INSERT INTO admin_game_logs
+                   (user_id, username, command, bet, result, balance_change, tax, created_at)
+                   VALUES (?, ?, '/chisla', ?, ?, ?, ?, ?)""",
+                [(winner_id, winner_username or "", amount, "win", amount, tax, now),
+                 (loser_id, loser_username or "", amount, "loss", -amount, 0, now)]
+            )
+            await conn.executemany(
+                """INSERT INTO games_sessions
+                   (user_id, game_type, bet, result, amount_change, multiplier, created_at)
+                   VALUES (?, 'chisla', ?, ?, ?, ?, ?)""",
+                [(winner_id, amount, "win", amount, float(winner_mult), now),
+                 (loser_id, amount, "loss", -amount, float(loser_mult), now)]
+            )
+            async with conn.execute("SELECT balance FROM users WHERE user_id = ?", (loser_id,)) as cur:
+                row = await cur.fetchone()
+            return balance_after, (row[0] if row else 0)
     
     async def finish_chisla_session(self, session_id: str):
         """Завершить сессию"""
@@ -2829,6 +3044,13 @@ class Database:
             (multiplier, next_update_at, user_id)
         )
     
+    async def update_kripta_multipliers(self, rows: List[Tuple[float, int, int]]):
+        """Пакетное обновление множителей: строки (multiplier, next_update_at, user_id)"""
+        await self.executemany(
+            "UPDATE kripta_sessions SET current_multiplier = ?, next_update_at = ? WHERE user_id = ?",
+            rows
+        )
+    
     async def close_kripta_session(self, user_id: int):
         """Закрытие активной сессии kripta"""
         await self.execute(
@@ -2844,6 +3066,72 @@ class Database:
             (now,)
         )
 
+    # ==================== РАССЫЛКИ ====================
+
+    _BROADCAST_FIELDS = (
+        "id", "text", "created_by", "created_at", "status", "total", "last_user_id",
+        "sent", "failed", "blocked", "report_chat_id", "report_message_id", "finished_at",
+    )
+
+    async def count_broadcast_recipients(self) -> int:
+        """Сколько пользователей получит рассылку (без заблокировавших бота)"""
+        row = await self.fetchone("SELECT COUNT(*) FROM users WHERE bot_blocked = 0")
+        return row[0] if row else 0
+
+    async def create_broadcast(self, text: str, created_by: int, total: int) -> int:
+        """Новая рассылка в статусе running. Returns: id рассылки"""
+        cursor = await self.execute(
+            "INSERT INTO broadcasts (text, created_by, created_at, total) VALUES (?, ?, ?, ?)",
+            (text, created_by, int(datetime.now().timestamp()), total)
+        )
+        return cursor.lastrowid
+
+    async def get_running_broadcast(self) -> Optional[Dict[str, Any]]:
+        """Незавершённая рассылка (одна на бота) или None"""
+        row = await self.fetchone(
+            f"SELECT {', '.join(self._BROADCAST_FIELDS)} FROM broadcasts WHERE status = 'running' ORDER BY id LIMIT 1"
+        )
+        return dict(zip(self._BROADCAST_FIELDS, row)) if row else None
+
+    async def get_broadcast_chunk(self, after_user_id: int, limit: int) -> List[int]:
+        """
+        Следующая порция получателей по курсору: user_id > after_user_id, по возрастанию
+        (выборка по первичному ключу — без OFFSET, сколько бы пользователей ни было)
+        """
+        rows = await self.fetchall(
+            "SELECT user_id FROM users WHERE user_id > ? AND bot_blocked = 0 ORDER BY user_id LIMIT ?",
+            (after_user_id, limit)
+        )
+        return [row[0] for row in rows]
+
+    async def save_broadcast_progress(
+        self, broadcast_id: int, last_user_id: int, sent: int, failed: int, blocked: int, blocked_ids: List[int]
+    ):
+        """Контрольная точка рассылки и отметка заблокировавших бота — одной транзакцией"""
+        async with self.transaction() as conn:
+            await conn.execute(
+                "UPDATE broadcasts SET last_user_id = ?, sent = ?, failed = ?, blocked = ? WHERE id = ?",
+                (last_user_id, sent, failed, blocked, broadcast_id)
+            )
+            if blocked_ids:
+                await conn.executemany(
+                    "UPDATE users SET bot_blocked = 1 WHERE user_id = ?", [(uid,) for uid in blocked_ids]
+                )
+
+    async def set_broadcast_report(self, broadcast_id: int, chat_id: int, message_id: int):
+        """Сообщение, в котором показывается прогресс рассылки"""
+        await self.execute(
+            "UPDATE broadcasts SET report_chat_id = ?, report_message_id = ? WHERE id = ?",
+            (chat_id, message_id, broadcast_id)
+        )
+
+    async def finish_broadcast(self, broadcast_id: int, status: str):
+        """Завершение рассылки: done или cancelled"""
+        await self.execute(
+            "UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ?",
+            (status, int(datetime.now().timestamp()), broadcast_id)
+        )
+
 
 # Глобальный экземпляр БД
 db = Database()
@@ -4,7 +4,6 @@ Tehnolog Games — профиль, аккаунт, уровни.
 /status, /checkaccount, /lvl, /lvlup, /lvlcheck, /vzortehnologa
 """
 
-import asyncio
 import logging
 
 from aiogram import Router, F
@@ -27,10 +26,11 @@ BOT_ADDRESS_CHOICES = [
 ]
 
 from db import db
-from utils import delete_message_after, format_message_with_username, resolve_recipient_from_message
+from utils import delete_message_later, format_message_with_username, resolve_recipient_from_message
 from middlewares import set_command_cooldown
 from services.balance import balance_service
 from services.effects import effects_service
+from services.callbacks import CallbackPayload, CallbackPrefix, pack
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -93,26 +93,25 @@ async def cmd_profile(message: Message):
     out = format_message_with_username(text, username, first_name)
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Изменить обращение", callback_data=f"profile_addr_{user_id}")]
+        [InlineKeyboardButton(text="Изменить обращение", callback_data=pack("profile_addr", user_id))]
     ])
     sent = await message.answer(out, reply_markup=keyboard)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
-@router.callback_query(F.data.startswith("profile_addr_"))
-async def cb_profile_address_menu(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("profile_addr"))
+async def cb_profile_address_menu(callback: CallbackQuery, payload: CallbackPayload):
     """Меню выбора обращения (дружок, боец, легенда...)."""
-    parts = callback.data.split("_")
-    if len(parts) < 3:
+    uid = payload.get_int(0)
+    if uid is None:
         await callback.answer("Ошибка", show_alert=True)
         return
-    uid = int(parts[2])
     if callback.from_user.id != uid:
         await callback.answer("Не жми на чужое!", show_alert=True)
         return
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=addr, callback_data=f"setaddr_{uid}_{i}")]
+        [InlineKeyboardButton(text=addr, callback_data=pack("setaddr", uid, i))]
         for i, addr in enumerate(BOT_ADDRESS_CHOICES)
     ])
     try:
@@ -128,15 +127,14 @@ async def cb_profile_address_menu(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("setaddr_"))
-async def cb_set_address(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("setaddr"))
+async def cb_set_address(callback: CallbackQuery, payload: CallbackPayload):
     """Установка обращения (дружок, боец и т.д.)."""
-    parts = callback.data.split("_")
-    if len(parts) < 4:
+    uid = payload.get_int(0)
+    idx = payload.get_int(1)
+    if uid is None or idx is None:
         await callback.answer("Ошибка", show_alert=True)
         return
-    uid = int(parts[2])
-    idx = int(parts[3])
     if callback.from_user.id != uid:
         await callback.answer("Не жми на чужое!", show_alert=True)
         return
@@ -187,7 +185,7 @@ async def cmd_accaunt(message: Message):
     except Exception as e:
         logger.warning(f"accaunt photo {e}")
         sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
 @router.message(Command("accountphoto"))
@@ -204,7 +202,7 @@ async def cmd_accountphoto(message: Message, state: FSMContext):
             username, first_name
         )
     )
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(StateFilter(AccountStates.wait_avatar), F.photo)
@@ -222,7 +220,7 @@ async def on_photo_for_avatar(message: Message, state: FSMContext):
     sent = await message.answer(
         format_message_with_username("Аватарка обновлена ✅", username, first_name)
     )
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("accountobrosh"))
@@ -240,14 +238,14 @@ async def cmd_accountobrosh(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     profile = await db.get_profile(user_id)
     current = profile.get("vip_address") or "не задано"
     variants = ["господин", "госпожа", "ваше величество", "босс", "царь"]
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=v, callback_data=f"vip_addr_{user_id}_{v}")] for v in variants
+        [InlineKeyboardButton(text=v, callback_data=pack("vip_addr", user_id, v))] for v in variants
     ])
     sent = await message.answer(
         format_message_with_username(
@@ -256,18 +254,17 @@ async def cmd_accountobrosh(message: Message):
         ),
         reply_markup=keyboard
     )
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
-@router.callback_query(F.data.startswith("vip_addr_"))
-async def cb_vip_address(callback: CallbackQuery):
-    parts = callback.data.split("_", 3)
-    if len(parts) < 4:
+@router.callback_query(CallbackPrefix("vip_addr"))
+async def cb_vip_address(callback: CallbackQuery, payload: CallbackPayload):
+    owner_id = payload.get_int(0)
+    addr = payload.get(1)
+    if owner_id is None or not addr:
         await callback.answer("Ошибка", show_alert=True)
         return
     cb_user_id = callback.from_user.id
-    owner_id = int(parts[2])
-    addr = parts[3]
     if cb_user_id != owner_id:
         await callback.answer("Не жми на чужое!", show_alert=True)
         return
@@ -297,14 +294,14 @@ async def cmd_accountinfo(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     await db.update_profile(user_id, about_info=after_cmd[:500])
     sent = await message.answer(
         format_message_with_username("Описание профиля сохранено ✅", username, first_name)
     )
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
 @router.message(Command("accountstatus"))
@@ -327,7 +324,7 @@ async def cmd_accountstatus(message: Message):
     sent = await message.answer(
         format_message_with_username("\n".join(lines), username, first_name)
     )
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
 @router.message(Command("statusmarket"))
@@ -349,7 +346,7 @@ async def cmd_statusmarket(message: Message):
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text=f"{s['status_name']} — {s['price']} 💰",
-            callback_data=f"buy_st_{user_id}_{i}"
+            callback_data=pack("buy_st", user_id, i)
         )] for i, s in enumerate(statuses)
     ])
     caption = format_message_with_username(
@@ -366,22 +363,17 @@ async def cmd_statusmarket(message: Message):
     except Exception as e:
         logger.error(f"statusmarket photo {e}")
         sent = await message.answer(caption, reply_markup=keyboard)
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
-@router.callback_query(F.data.startswith("buy_st_"))
-async def cb_buy_status(callback: CallbackQuery):
-    parts = callback.data.split("_")
-    if len(parts) < 4:
+@router.callback_query(CallbackPrefix("buy_st"))
+async def cb_buy_status(callback: CallbackQuery, payload: CallbackPayload):
+    owner_id = payload.get_int(0)
+    idx = payload.get_int(1)
+    if owner_id is None or idx is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     cb_user_id = callback.from_user.id
-    owner_id = int(parts[2])
-    try:
-        idx = int(parts[3])
-    except ValueError:
-        await callback.answer("Ошибка", show_alert=True)
-        return
     if cb_user_id != owner_id:
         await callback.answer("Не жми на чужое!", show_alert=True)
         return
@@ -438,7 +430,7 @@ async def cmd_checkaccount(message: Message):
             sent = await message.answer(
                 format_message_with_username("Формат: /checkaccount @user", username, first_name)
             )
-            asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+            delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
             return
         target_username = parts[1].strip().lstrip("@").lower()
         target_id = await db.get_user_id_by_username(target_username)
@@ -447,7 +439,7 @@ async def cmd_checkaccount(message: Message):
         sent = await message.answer(
             format_message_with_username("Пользователь не найден. Пусть сначала напишет боту.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     target = await db.get_user(target_id)
@@ -495,7 +487,7 @@ async def cmd_checkaccount(message: Message):
     except Exception as e:
         logger.error(f"checkaccount avatar {e}")
         sent = await message.answer(caption)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("season"))
@@ -509,7 +501,7 @@ async def cmd_season(message: Message):
     if not season:
         text = format_message_with_username("Сезон не активен. Скоро начнётся новый.", username, first_name)
         sent = await message.answer(text)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     from datetime import datetime
@@ -527,10 +519,10 @@ async def cmd_season(message: Message):
         lines.append(f"{i}. @{un} — {t.get('mmr', 0)} MMR")
     text = format_message_with_username("\n".join(lines), username, first_name)
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Кубок: слот", callback_data="cup_slot"), InlineKeyboardButton(text="Кубок: излом", callback_data="cup_fracture")],
+        [InlineKeyboardButton(text="Кубок: слот", callback_data=pack("cup", "slot")), InlineKeyboardButton(text="Кубок: излом", callback_data=pack("cup", "fracture"))],
     ])
     sent = await message.answer(text, reply_markup=kb)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("cup"))
@@ -546,14 +538,14 @@ async def cmd_cup(message: Message):
             username, first_name
         )
         sent = await message.answer(text)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     season = await db.get_current_season()
     if not season:
         text = format_message_with_username("Сезон не активен.", username, first_name)
         sent = await message.answer(text)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     title = "Слот" if game == "slot" else "Излом"
@@ -567,12 +559,12 @@ async def cmd_cup(message: Message):
             lines.append(f"{i}. @{un} — {t.get('wins', 0)} побед")
     text = format_message_with_username("\n".join(lines), username, first_name)
     sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
-@router.callback_query(F.data.in_({"cup_slot", "cup_fracture"}))
-async def cb_cup(callback: CallbackQuery):
-    game = "slot" if callback.data == "cup_slot" else "fracture"
+@router.callback_query(CallbackPrefix("cup"))
+async def cb_cup(callback: CallbackQuery, payload: CallbackPayload):
+    game = "slot" if payload.get(0) == "slot" else "fracture"
     username = callback.from_user.username or ""
     first_name = callback.from_user.first_name or ""
     season = await db.get_current_season()
@@ -620,7 +612,7 @@ async def cmd_lvl(message: Message):
             username, first_name
         )
     )
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
 @router.message(Command("lvlup"))
@@ -648,7 +640,7 @@ async def cmd_lvlup(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     balance = await db.get_balance(user_id)
@@ -660,7 +652,7 @@ async def cmd_lvlup(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     success, _, _, err = await balance_service.subtract_balance(
@@ -670,7 +662,7 @@ async def cmd_lvlup(message: Message):
     )
     if not success:
         sent = await message.answer(format_message_with_username(err, username, first_name))
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     old_lvl, new_lvl = await db.level_up(user_id)
@@ -680,7 +672,7 @@ async def cmd_lvlup(message: Message):
             username, first_name
         )
     )
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
 @router.message(Command("lvlcheck"))
@@ -704,7 +696,7 @@ async def cmd_lvlcheck(message: Message):
             sent = await message.answer(
                 format_message_with_username("Формат: /lvlcheck @user", username, first_name)
             )
-            asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+            delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
             return
         target_id = await db.get_user_id_by_username(parts[1].strip().lstrip("@").lower())
 
@@ -712,7 +704,7 @@ async def cmd_lvlcheck(message: Message):
         sent = await message.answer(
             format_message_with_username("Пользователь не найден.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     level_info = await db.get_user_level(target_id)
@@ -724,7 +716,7 @@ async def cmd_lvlcheck(message: Message):
             username, first_name
         )
     )
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("vzortehnologa"))
@@ -742,7 +734,7 @@ async def cmd_vzortehnologa(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     resolved_id, resolved_username = resolve_recipient_from_message(message)
@@ -759,7 +751,7 @@ async def cmd_vzortehnologa(message: Message):
             sent = await message.answer(
                 format_message_with_username("Формат: /vzortehnologa @user", username, first_name)
             )
-            asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+            delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
             return
         target_id = await db.get_user_id_by_username(parts[1].strip().lstrip("@").lower())
 
@@ -767,7 +759,7 @@ async def cmd_vzortehnologa(message: Message):
         sent = await message.answer(
             format_message_with_username("Пользователь не найден.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     target_user = await db.get_user(target_id)
@@ -789,4 +781,4 @@ async def cmd_vzortehnologa(message: Message):
     except Exception as e:
         logger.error("vzortehnologa photo: %s", e)
         sent = await message.answer(caption)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
@@ -7,7 +7,6 @@
 По всем вопросам — @DPOPTH. Создателя забанить нельзя.
 """
 
-import asyncio
 import re
 import logging
 from datetime import datetime
@@ -18,7 +17,7 @@ from aiogram.filters import Command
 
 from config import config
 from db import db
-from utils import delete_message_after, format_message_with_username, get_creator_id, is_creator_by_username
+from utils import delete_message_later, format_message_with_username, get_creator_id, is_creator_by_username
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -49,13 +48,14 @@ async def cmd_admin(message: Message):
         "/economy — оборот, налог Технолога, топ выигрышей и проигрышей\n"
         "/logs [N] — последние N записей логов игр (по умолчанию 30)\n\n"
         "/event тип секунды — глобальное событие: slot_day 86400, birzh_day 7200\n"
-        "/endseason — завершить сезон (сброс MMR), награды топ-3, старт нового\n\n"
+        "/endseason — завершить сезон (сброс MMR), награды топ-3, старт нового\n"
+        "/broadcast текст — рассылка всем (/broadcast obnova — текст /obnova), /broadcaststop — остановить\n\n"
         "Роли и баны: /addadmin, /addmoder, /ban, /unban, /deladmin и т.д.\n\n"
         "/skinna0 @user — сброс баланса на 0 за жульничество (только создатель)",
         username, first_name
     )
     sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("event"))
@@ -69,12 +69,12 @@ async def cmd_event(message: Message):
             "Использование: /event slot_day 86400  (день слота, +10% выигрыш, 24ч)\n"
             "              /event birzh_day 7200   (день биржи, меньше разброс, 2ч)"
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     event_type = parts[1].strip().lower()
     if event_type not in ("slot_day", "birzh_day"):
         sent = await message.answer("Тип: slot_day или birzh_day")
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     try:
         duration = int(parts[2])
@@ -82,12 +82,12 @@ async def cmd_event(message: Message):
             raise ValueError("Секунды: 1 — 604800 (неделя)")
     except ValueError as e:
         sent = await message.answer(str(e))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     await db.set_global_event(event_type, duration)
     label = "День слота (+10% в /slot)" if event_type == "slot_day" else "День биржи (меньше разброс)"
     sent = await message.answer(f"✅ Включено: {label}, на {duration} сек.")
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info("event: %s duration=%s by creator", event_type, duration)
 
 
@@ -99,15 +99,16 @@ async def cmd_endseason(message: Message):
     season = await db.get_current_season()
     if not season:
         sent = await message.answer("Нет активного сезона.")
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
+    from services.balance import balance_service
     top = await db.get_top_by_mmr(3)
     rewards = [10000, 5000, 2500]  # коины за 1, 2, 3 место
     for i, t in enumerate(top):
         uid = t.get("user_id")
         if uid and i < len(rewards) and rewards[i] > 0:
-            await db.update_balance(uid, rewards[i], "income", "endseason", "Награда за топ сезона")
-            await db.update_total_coins(uid, rewards[i])
+            async with balance_service.locked(uid):
+                await balance_service.credit(uid, rewards[i], "endseason", "Награда за топ сезона")
             try:
                 await message.bot.send_message(
                     uid,
@@ -120,10 +121,46 @@ async def cmd_endseason(message: Message):
     sent = await message.answer(
         f"✅ Сезон завершён. Награды выданы топ-3. Новый сезон: {name}"
     )
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info("endseason: new_season=%s", name)
 
 
+@router.message(Command("broadcast"))
+async def cmd_broadcast(message: Message):
+    """Рассылка всем пользователям: /broadcast текст или /broadcast obnova. Только создатель."""
+    if not await _is_creator(message.from_user.id, message.from_user.username):
+        return
+    from services.broadcast import broadcast_engine
+    parts = (message.html_text or "").split(maxsplit=1)
+    if len(parts) < 2:
+        sent = await message.answer(
+            "Использование: /broadcast текст — рассылка всем пользователям\n"
+            "              /broadcast obnova — разослать текст /obnova"
+        )
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
+        return
+    text = parts[1].strip()
+    if text.lower() == "obnova":
+        text = "\n".join(getattr(config, "OBNOVA_LINES", []))
+    broadcast_id = await broadcast_engine.start(message.bot, text, message.from_user.id, message.chat.id)
+    if broadcast_id is None:
+        sent = await message.answer("Уже идёт другая рассылка. Останови её: /broadcaststop")
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
+        return
+    logger.info("broadcast #%s started by creator", broadcast_id)
+
+
+@router.message(Command("broadcaststop"))
+async def cmd_broadcaststop(message: Message):
+    """Остановить текущую рассылку. Только создатель."""
+    if not await _is_creator(message.from_user.id, message.from_user.username):
+        return
+    from services.broadcast import broadcast_engine
+    text = "Рассылка останавливается." if await broadcast_engine.cancel() else "Рассылка не идёт."
+    sent = await message.answer(text)
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
+
+
 @router.message(Command("skinna0"))
 async def cmd_skinna0(message: Message):
     """Анти-жульничество: сброс баланса цели на 0. Только создатель."""
@@ -132,7 +169,7 @@ async def cmd_skinna0(message: Message):
     parts = (message.text or "").strip().split(maxsplit=1)
     if len(parts) < 2:
         sent = await message.answer("Использование: /skinna0 @username или /skinna0 user_id")
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     target_str = parts[1].strip().lstrip("@")
     target_id = None
@@ -142,20 +179,20 @@ async def cmd_skinna0(message: Message):
         target_id = await db.get_user_id_by_username(target_str)
     if not target_id:
         sent = await message.answer("Пользователь не найден.")
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     if config.CREATOR_ID and target_id == config.CREATOR_ID:
         sent = await message.answer("Создателя скинуть нельзя.")
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
-    balance_before = await db.get_balance(target_id)
-    await db.set_balance_direct(target_id, 0)
+    from services.balance import balance_service
+    _, balance_before = await balance_service.reset_balance(target_id)
     target_user = await db.get_user(target_id)
     target_name = f"@{target_user.get('username') or target_id}" if target_user else str(target_id)
     sent = await message.answer(
         f"⚠️ Баланс {target_name} сброшен на 0 (было {balance_before:,} коинов). За жульничество."
     )
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info("skinna0: target_id=%s balance_was=%s by creator", target_id, balance_before)
 
 
@@ -179,7 +216,7 @@ async def cmd_stats(message: Message):
         logger.exception("stats: %s", e)
         text = format_message_with_username("Ошибка получения статистики.", username, first_name)
     sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("economy"))
@@ -215,7 +252,7 @@ async def cmd_economy(message: Message):
         logger.exception("economy: %s", e)
         text = format_message_with_username("Ошибка получения экономики.", username, first_name)
     sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("logs"))
@@ -247,7 +284,7 @@ async def cmd_logs(message: Message):
         logger.exception("logs: %s", e)
         text = format_message_with_username("Ошибка получения логов.", username, first_name)
     sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("debug"))
@@ -259,16 +296,59 @@ async def cmd_debug(message: Message):
     first_name = message.from_user.first_name
     try:
         from handlers.games import get_active_sessions_debug
-        counts = get_active_sessions_debug()
+        from services.api_session import api_stats
+        from services.balance import balance_service
+        from services.broadcast import broadcast_engine
+        from services.dedup import update_dedup
+        from services.digest import creator_digest
+        from services.deletion import deletion_scheduler
+        from services.edits import edit_coalescer
+        from services.journal import session_journal
+        from services.lobby import lobby_engine
+        from services.outbound import outbound_scheduler
+        from services.timers import game_timers
+        from services.updates import update_queue
+        stats = get_active_sessions_debug()
+        busiest_text = ", ".join(
+            f"{key}: ждут {depth}, старейшее {age:.1f} с" for key, depth, age in update_queue.busiest()
+        ) or "нет"
+        api_total = api_stats.total()
+        slow_text = ", ".join(
+            f"{name} {st.avg_time * 1000:.0f} мс" for name, st in api_stats.slowest()
+        ) or "нет"
+        sessions_text = ", ".join(
+            f"{game}={st['count']} ({st['bytes'] // 1024} КБ)" for game, st in stats.items() if st["count"]
+        ) or "нет"
         text = format_message_with_username(
             "🔧 <b>DEBUG</b> (только создатель)\n\n"
-            f"Активных сессий: kripta={counts['kripta']}, almaz={counts['almaz']}, plsdon={counts['plsdon']}",
+            f"Активных сессий: {sessions_text}\n"
+            f"Автоудаление: ждут {deletion_scheduler.pending}, удалено {deletion_scheduler.deleted}, ошибок {deletion_scheduler.failed}, вызовов API {deletion_scheduler.api_calls}\n"
+            f"Журнал сессий: открыто {session_journal.open_count}, ждут записи {session_journal.pending}, строк {session_journal.lines_written}, снапшотов {session_journal.snapshots}\n"
+            f"Таймауты игр: ждут {game_timers.live}, сработало {game_timers.fired}, отменено {game_timers.cancelled}\n"
+            f"Лобби: открыто {len(lobby_engine)}, правок {lobby_engine.edits}, склеено {lobby_engine.coalesced}\n"
+            f"Правки сообщений: отправлено {edit_coalescer.edits}, склеено {edit_coalescer.coalesced}, без изменений {edit_coalescer.unchanged}, ошибок {edit_coalescer.failed}\n"
+            f"Блокировки счетов: занято {len(balance_service.account_locks)}, захватов {balance_service.account_locks.acquired}, ожиданий {balance_service.account_locks.contended}\n"
+            f"Bot API: запросов {api_total.count}, p50 {api_total.quantile(0.5):.2f} с, p95 {api_total.quantile(0.95):.2f} с, макс. {api_total.max_time:.1f} с, "
+            f"ошибок {api_total.errors}, сетевых {api_total.network_errors}, RetryAfter {api_total.retry_after}, отправлено {api_total.bytes_sent // 1024} КБ\n"
+            f"Медленные методы: {slow_text}\n"
+            f"Соединения: в полёте {api_stats.in_flight} (макс. {api_stats.max_in_flight}), новых {api_stats.connections_created}, "
+            f"переиспользовано {api_stats.connections_reused}, ждали свободного {api_stats.pool_waits} ({api_stats.pool_wait_time:.1f} с)\n"
+            f"Исходящие: отправлено {outbound_scheduler.sent}, ждут {outbound_scheduler.waiting}, отложено {outbound_scheduler.delayed}, RetryAfter {outbound_scheduler.retry_after}\n"
+            f"Входящие: в очереди {update_queue.depth}/{update_queue.capacity}, пользователей в работе {update_queue.active} (макс. {update_queue.max_active}), "
+            f"обработано {update_queue.processed}, ошибок {update_queue.failed}, отклонено (429) {update_queue.rejected}, "
+            f"ожидание ср. {update_queue.wait_avg:.2f} с, макс. {update_queue.wait_max:.1f} с\n"
+            f"Самые длинные очереди: {busiest_text}\n"
+            f"Повторы отброшены: обновлений {update_dedup.dropped_updates}, callback {update_dedup.dropped_callbacks}\n"
+            f"Уведомления создателю: получено {creator_digest.received}, ждут сводки {creator_digest.pending}, сообщений {creator_digest.sent}, срочных {creator_digest.critical}\n"
+            f"Рассылка: "
+            + (f"#{broadcast_engine.current['id']}, доставлено {broadcast_engine.current['sent']} из {broadcast_engine.current['total']}, {broadcast_engine.rate:.1f} сообщ./с"
+               if broadcast_engine.running else "не идёт"),
             username, first_name
         )
     except Exception as e:
         text = format_message_with_username(f"Ошибка debug: {e}", username, first_name)
     sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 async def _is_creator(user_id: int, username: str = None) -> bool:
@@ -363,24 +443,24 @@ async def cmd_ban(message: Message):
     jr_ids = await _get_junior_moder_ids()
     if not await _is_creator(actor_id, username) and actor_id not in admin_ids and actor_id not in moder_ids and actor_id not in jr_ids:
         sent = await message.answer(format_message_with_username("Нет прав на бан.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     target_id, _ = await _resolve_user_from_message(message)
     if not target_id:
         sent = await message.answer(format_message_with_username("Укажи пользователя: /ban @user время причина", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     if await _is_creator(target_id, (await db.get_user(target_id) or {}).get("username")):
         sent = await message.answer(format_message_with_username("Создателя забанить нельзя. По всем вопросам — @" + CREATOR_USERNAME, username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     parts = (message.text or "").strip().split(maxsplit=3)
     if len(parts) < 4:
         sent = await message.answer(format_message_with_username("Формат: /ban @user время причина (например: 1ч, 30м, навсегда)", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     duration_str = parts[2]
     reason = parts[3][:200] if len(parts) > 3 else "без причины"
@@ -391,7 +471,7 @@ async def cmd_ban(message: Message):
     if duration_sec == -1:
         if max_sec != 0:
             sent = await message.answer(format_message_with_username("Ты не можешь банить навсегда. Лимит по твоей роли.", username, first_name))
-            asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+            delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
             return
         ban_until = None
     else:
@@ -402,7 +482,7 @@ async def cmd_ban(message: Message):
     ok = await db.set_user_ban(target_id, True, ban_until)
     if not ok:
         sent = await message.answer(format_message_with_username("Не удалось забанить (возможно, это создатель).", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     now_ts = int(datetime.now().timestamp())
@@ -419,7 +499,7 @@ async def cmd_ban(message: Message):
             sent = await message.answer(format_message_with_username(ban_text + "\n\nТеперь ты чилишь на банановых островах.", username, first_name))
     except Exception:
         sent = await message.answer(format_message_with_username(ban_text, username, first_name))
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info("Ban: actor=%s target=%s duration=%s reason=%s", actor_id, target_id, duration_str, reason)
 
 
@@ -434,13 +514,13 @@ async def cmd_adddenga(message: Message):
     target_id, _ = await _resolve_user_from_message(message)
     if not target_id:
         sent = await message.answer(format_message_with_username("Формат: /adddenga @user сумма", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     parts = (message.text or "").strip().split(maxsplit=2)
     if len(parts) < 3:
         sent = await message.answer(format_message_with_username("Формат: /adddenga @user сумма", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     try:
         amount = int(parts[2])
@@ -448,7 +528,7 @@ async def cmd_adddenga(message: Message):
             raise ValueError("Сумма должна быть положительной")
     except (ValueError, TypeError):
         sent = await message.answer(format_message_with_username("Укажи корректную сумму (целое число).", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     from services.balance import balance_service
@@ -467,7 +547,7 @@ async def cmd_adddenga(message: Message):
         sent = await message.answer(format_message_with_username(f"✅ Выдано {target_tag} {amount} коинов. Баланс: {balance_after}", username, first_name))
     else:
         sent = await message.answer(format_message_with_username("Ошибка начисления.", username, first_name))
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info("Adddenga: creator gave %s coins to user %s", amount, target_id)
 
 
@@ -481,13 +561,13 @@ async def cmd_unban(message: Message):
     admin_ids = await _get_admin_ids()
     if not await _is_creator(actor_id, username) and actor_id not in admin_ids:
         sent = await message.answer(format_message_with_username("Нет прав на разбан.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     target_id, _ = await _resolve_user_from_message(message)
     if not target_id:
         sent = await message.answer(format_message_with_username("Формат: /unban @user причина", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     parts = (message.text or "").strip().split(maxsplit=2)
@@ -496,26 +576,26 @@ async def cmd_unban(message: Message):
     target_user = await db.get_user(target_id)
     if not target_user:
         sent = await message.answer(format_message_with_username("Пользователь не найден.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     if not target_user.get("is_banned"):
         sent = await message.answer(format_message_with_username("Пользователь не забанен.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     ban_until = target_user.get("ban_until")
     is_permanent = ban_until is None
     if not await _is_creator(actor_id, username) and is_permanent:
         sent = await message.answer(format_message_with_username("Только создатель может разбанить при перманентном бане.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     await db.set_user_ban(target_id, False, None)
     await db.mark_ban_unbanned(target_id)
     target_tag = f"@{target_user['username']}" if target_user.get("username") else str(target_id)
     sent = await message.answer(format_message_with_username(f"✅ Разбанил {target_tag}. Причина: {reason}", username, first_name))
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info("Unban: actor=%s target=%s target_tag=%s reason=%s", actor_id, target_id, target_tag, reason)
 
 
@@ -524,7 +604,7 @@ async def cmd_addadmin(message: Message):
     """Только создатель @DPOPTH: /addadmin @user время|навсегда """
     if not await _is_creator(message.from_user.id, message.from_user.username):
         sent = await message.answer(format_message_with_username("Только создатель может добавлять админов. По всем вопросам — @" + CREATOR_USERNAME, message.from_user.username, message.from_user.first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     await _add_role_cmd(message, "admin")
 
@@ -534,7 +614,7 @@ async def cmd_addmoder(message: Message):
     """Только создатель @DPOPTH: /addmoder @user время|навсегда """
     if not await _is_creator(message.from_user.id, message.from_user.username):
         sent = await message.answer(format_message_with_username("Только создатель может добавлять модеров.", message.from_user.username, message.from_user.first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     await _add_role_cmd(message, "moder")
 
@@ -544,7 +624,7 @@ async def cmd_addjuniormoder(message: Message):
     """Только создатель @DPOPTH: /addjuniormoder @user время|навсегда """
     if not await _is_creator(message.from_user.id, message.from_user.username):
         sent = await message.answer(format_message_with_username("Только создатель может добавлять младших модеров.", message.from_user.username, message.from_user.first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     await _add_role_cmd(message, "juniormoder")
 
@@ -553,7 +633,7 @@ async def _add_role_cmd(message: Message, role: str):
     target_id, _ = await _resolve_user_from_message(message)
     if not target_id:
         sent = await message.answer(format_message_with_username(f"Формат: /add{role} @user время|навсегда", message.from_user.username, message.from_user.first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     parts = (message.text or "").strip().split(maxsplit=2)
     until_ts = None
@@ -566,7 +646,7 @@ async def _add_role_cmd(message: Message, role: str):
     await db.add_role(target_id, role, message.from_user.id, until_ts)
     role_name = {"admin": "админ", "moder": "модер", "juniormoder": "мл.модер"}.get(role, role)
     sent = await message.answer(format_message_with_username(f"Роль «{role_name}» выдана пользователю.", message.from_user.username, message.from_user.first_name))
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("deladmin"))
@@ -592,7 +672,7 @@ async def _del_role_cmd(message: Message, role: str):
     target_id, _ = await _resolve_user_from_message(message)
     if not target_id:
         sent = await message.answer(format_message_with_username(f"Формат: /del{role} @user причина", message.from_user.username, message.from_user.first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     parts = (message.text or "").strip().split(maxsplit=2)
     reason = parts[2][:100] if len(parts) >= 3 else "без причины"
@@ -600,9 +680,9 @@ async def _del_role_cmd(message: Message, role: str):
     target_user = await db.get_user(target_id)
     if await _is_creator(target_id, target_user.get("username") if target_user else None):
         sent = await message.answer(format_message_with_username("Нельзя снять роль создателя.", message.from_user.username, message.from_user.first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     await db.remove_role(target_id, role)
     role_name = {"admin": "админ", "moder": "модер", "juniormoder": "мл.модер"}.get(role, role)
     sent = await message.answer(format_message_with_username(f"Роль «{role_name}» снята. Причина: {reason}", message.from_user.username, message.from_user.first_name))
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
@@ -2,17 +2,17 @@
 Tehnolog Games — базовые команды: /help, /start, /balance, /top, /report, /admins
 """
 
-import asyncio
 import logging
 from datetime import datetime
 
 from aiogram import Router
 from aiogram.types import Message, FSInputFile, CallbackQuery
-from aiogram.filters import Command, F
+from aiogram.filters import Command
 
 from config import config
 from db import db
-from utils import delete_message_after, format_message_with_username
+from utils import delete_message_later, format_message_with_username
+from services.callbacks import CallbackPayload, CallbackPrefix, pack
 
 # Создаем роутер для базовых команд
 router = Router()
@@ -54,12 +54,12 @@ async def cmd_start(message: Message):
     try:
         from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="📖 Обучение — где что искать", callback_data="tutorial_main")],
+            [InlineKeyboardButton(text="📖 Обучение — где что искать", callback_data=pack("tutorial", "main"))],
         ])
     except Exception:
         pass
     sent_message = await message.answer(help_text, reply_markup=keyboard)
-    asyncio.create_task(delete_message_after(sent_message, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent_message, config.MESSAGE_DELETE_TIMEOUT)
     logger.info(f"Пользователь {user_id} использовал /start")
 
 
@@ -81,17 +81,16 @@ async def cmd_tutorial(message: Message):
     )
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Профиль и достижения", callback_data="tutorial_profile"), InlineKeyboardButton(text="Биржа и задания", callback_data="tutorial_birzh")],
-        [InlineKeyboardButton(text="Лиги и кубки", callback_data="tutorial_season"), InlineKeyboardButton(text="Мини-игры", callback_data="tutorial_minigames")],
+        [InlineKeyboardButton(text="Профиль и достижения", callback_data=pack("tutorial", "profile")), InlineKeyboardButton(text="Биржа и задания", callback_data=pack("tutorial", "birzh"))],
+        [InlineKeyboardButton(text="Лиги и кубки", callback_data=pack("tutorial", "season")), InlineKeyboardButton(text="Мини-игры", callback_data=pack("tutorial", "minigames"))],
     ])
     sent = await message.answer(text, reply_markup=keyboard)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
-@router.callback_query(F.data.startswith("tutorial_"))
-async def cb_tutorial(callback: CallbackQuery):
-    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-    part = callback.data.replace("tutorial_", "")
+@router.callback_query(CallbackPrefix("tutorial"))
+async def cb_tutorial(callback: CallbackQuery, payload: CallbackPayload):
+    part = payload.get(0, "")
     username = callback.from_user.username or ""
     first_name = callback.from_user.first_name or ""
     if part == "main":
@@ -175,7 +174,7 @@ async def cmd_help(message: Message):
     help_text += "📌 <b>Общее:</b> каждая игра живёт до 3 минут; при таймауте — возврат ставки или авто-результат. Реклама каждые 60 команд (3 мин блок); у Premium рекламы нет. Tehnolog Games"
 
     sent_message = await message.answer(help_text)
-    asyncio.create_task(delete_message_after(sent_message, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent_message, config.MESSAGE_DELETE_TIMEOUT)
     logger.info(f"Пользователь {user_id} использовал /help")
 
 
@@ -187,7 +186,7 @@ async def cmd_obnova(message: Message):
     lines = getattr(config, "OBNOVA_LINES", ["Нет записей об обновлениях."])
     text = format_message_with_username("\n".join(lines), username, first_name)
     sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("report"))
@@ -198,7 +197,7 @@ async def cmd_report(message: Message):
     creator = getattr(config, "CREATOR_USERNAME", "DPOPTH")
     text = f"@{username} хочет репортнуть баг или игрока. @{creator} помоги"
     sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info(f"Пользователь {user_id} использовал /report")
 
 
@@ -271,7 +270,7 @@ async def cmd_balance(message: Message):
         # Fallback - отправляем только текст
         sent_message = await message.answer(caption)
     
-    asyncio.create_task(delete_message_after(sent_message, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent_message, config.MESSAGE_DELETE_TIMEOUT)
     logger.info(f"Пользователь {user_id} использовал /balance (баланс: {balance}, уровень: {level})")
 
 
@@ -334,7 +333,7 @@ async def cmd_top(message: Message):
 
     top_text = format_message_with_username("".join(lines), username, first_name)
     sent_message = await message.answer(top_text)
-    asyncio.create_task(delete_message_after(sent_message, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent_message, config.MESSAGE_DELETE_TIMEOUT)
     logger.info(f"Пользователь {user_id} использовал /top")
 
 
@@ -370,5 +369,5 @@ async def cmd_admins(message: Message):
     text = "\n\n".join(blocks)
     out = format_message_with_username(text, username, first_name)
     sent = await message.answer(out)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info(f"Пользователь {user_id} использовал /admins")
@@ -3,7 +3,6 @@
 /bp, /battlepass — уровень, квесты, награды free/premium.
 """
 
-import asyncio
 import logging
 from datetime import datetime
 
@@ -13,7 +12,8 @@ from aiogram.filters import Command
 
 from config import config
 from db import db
-from utils import format_message_with_username, delete_message_after
+from utils import format_message_with_username, delete_message_later
+from services.callbacks import CallbackPayload, CallbackPrefix, pack
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -30,7 +30,7 @@ async def cmd_bp(message: Message):
     if not season:
         text = format_message_with_username("Сезон боевого пропуска не активен. Скоро новый.", username, first_name)
         sent = await message.answer(text)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     progress = await db.get_user_bp_progress(user_id, season["id"])
@@ -69,29 +69,25 @@ async def cmd_bp(message: Message):
         if lvl > level:
             break
         if (lvl, False) not in claimed:
-            buttons.append(InlineKeyboardButton(text=f"🎁 Ур.{lvl} (free)", callback_data=f"bp_claim:{season['id']}:{lvl}:0"))
+            buttons.append(InlineKeyboardButton(text=f"🎁 Ур.{lvl} (free)", callback_data=pack("bp_claim", season["id"], lvl, 0)))
         if is_premium and (lvl, True) not in claimed:
-            buttons.append(InlineKeyboardButton(text=f"👑 Ур.{lvl} (prem)", callback_data=f"bp_claim:{season['id']}:{lvl}:1"))
+            buttons.append(InlineKeyboardButton(text=f"👑 Ур.{lvl} (prem)", callback_data=pack("bp_claim", season["id"], lvl, 1)))
     kb = InlineKeyboardMarkup(inline_keyboard=[buttons[i:i+2] for i in range(0, len(buttons), 2)]) if buttons else None
     sent = await message.answer(text, reply_markup=kb)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
-@router.callback_query(F.data.startswith("bp_claim:"))
-async def cb_bp_claim(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("bp_claim"))
+async def cb_bp_claim(callback: CallbackQuery, payload: CallbackPayload):
     """Забрать награду за уровень БП."""
     user_id = callback.from_user.id
-    parts = callback.data.split(":")
-    if len(parts) < 4:
-        await callback.answer("Ошибка", show_alert=True)
-        return
-    try:
-        season_id = int(parts[1])
-        level = int(parts[2])
-        is_premium = int(parts[3]) == 1
-    except (ValueError, IndexError):
+    season_id = payload.get_int(0)
+    level = payload.get_int(1)
+    premium_flag = payload.get_int(2)
+    if season_id is None or level is None or premium_flag is None:
         await callback.answer("Ошибка", show_alert=True)
         return
+    is_premium = premium_flag == 1
     progress = await db.get_user_bp_progress(user_id, season_id)
     if level > progress["level"]:
         await callback.answer("Сначала достигни этого уровня", show_alert=True)
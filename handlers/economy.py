@@ -3,7 +3,6 @@
 /refill, обработка налога Технолога
 """
 
-import asyncio
 import logging
 import time
 
@@ -13,9 +12,13 @@ from aiogram.filters import Command
 
 from config import config
 from db import db
-from utils import delete_message_after, format_message_with_username, resolve_recipient_from_message
+from utils import delete_message_later, format_message_with_username, resolve_recipient_from_message
 from middlewares import set_command_cooldown
 from services.balance import balance_service
+from services.edits import edit_coalescer
+from services.cooldown import cooldown_service
+from services.tax import tax_service
+from services.callbacks import CallbackPayload, CallbackPrefix, pack
 
 # Создаем роутер для экономических команд
 router = Router()
@@ -71,7 +74,7 @@ async def cmd_refill(message: Message):
         user = await db.get_user(user_id)
     
     # Проверяем cooldown для /refill
-    last_used = await db.get_cooldown(user_id, "/refill")
+    last_used = await cooldown_service.get_last_used(user_id, "/refill")
     now = int(time.time())
     cooldown_seconds = config.REFILL_COOLDOWN
     
@@ -105,7 +108,7 @@ async def cmd_refill(message: Message):
                 sent_message = await message.answer(caption)
             
             # Автоудаление через 30 секунд
-            asyncio.create_task(delete_message_after(sent_message))
+            delete_message_later(sent_message)
             
             logger.info(f"Пользователь {user_id} попытался использовать /refill (cooldown {remaining} сек)")
             return
@@ -131,7 +134,7 @@ async def cmd_refill(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(error_msg))
+        delete_message_later(error_msg)
         logger.error(f"Ошибка начисления баланса для пользователя {user_id}")
         return
     
@@ -161,7 +164,7 @@ async def cmd_refill(message: Message):
         sent_message = await message.answer(caption)
     
     # Автоудаление через 30 секунд
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
     
     logger.info(f"Пользователь {user_id} использовал /refill (+{refill_amount} коинов, баланс: {balance_after})")
 
@@ -192,14 +195,16 @@ async def cmd_pererozhd(message: Message):
             username, first_name
         )
         sent = await message.answer(text)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
-    ok, new_count, err = await db.do_rebirth(user_id)
+    ok, balance = await balance_service.reset_balance(user_id, required=cost)
     if not ok:
+        err = f"Нужно минимум <b>{cost:,}</b> коинов. У тебя: <b>{balance:,}</b>."
         sent = await message.answer(format_message_with_username(err, username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
+    new_count = await db.add_rebirth(user_id)
 
     luck_bonus = 1.0 + new_count * 0.5
     text = format_message_with_username(
@@ -212,24 +217,22 @@ async def cmd_pererozhd(message: Message):
         await db.unlock_achievement(user_id, "rebirth_first")
         text += "\n\n🔄 <b>Достижение:</b> Первое перерождение!"
     sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info("pererozhd: user_id=%s rebirth_count=%s", user_id, new_count)
 
 
-@router.callback_query(F.data.startswith("pay_tax_"))
-async def callback_pay_tax(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("pay_tax"))
+async def callback_pay_tax(callback: CallbackQuery, payload: CallbackPayload):
     """
     Обработчик callback для оплаты налога Технолога
-    Формат callback_data: pay_tax_{user_id}
+    Формат callback_data: pay_tax|{user_id}
     """
     # Проверяем, что callback от правильного пользователя
     callback_user_id = callback.from_user.id
-    callback_data = callback.data
     
     # Извлекаем user_id из callback_data
-    try:
-        tax_user_id = int(callback_data.split("_")[-1])
-    except (ValueError, IndexError):
+    tax_user_id = payload.get_int(0)
+    if tax_user_id is None:
         await callback.answer("Ошибка обработки запроса", show_alert=True)
         return
     
@@ -242,7 +245,7 @@ async def callback_pay_tax(callback: CallbackQuery):
     first_name = callback.from_user.first_name
     
     # Получаем состояние налога
-    tax_state = await db.get_tax_state(callback_user_id)
+    tax_state = await tax_service.get_state(callback_user_id)
     
     # Проверяем, есть ли налог к оплате
     if tax_state["is_paid"]:
@@ -267,7 +270,7 @@ async def callback_pay_tax(callback: CallbackQuery):
     
     if balance == 0:
         # Баланс = 0, налог пропадает
-        await db.pay_tax(callback_user_id)
+        await tax_service.pay(callback_user_id)
         await callback.answer("С тебя нечего взять, нищий", show_alert=True)
         
         # Удаляем сообщение с кнопкой
@@ -297,7 +300,7 @@ async def callback_pay_tax(callback: CallbackQuery):
         return
     
     # Отмечаем налог как оплаченный
-    await db.pay_tax(callback_user_id)
+    await tax_service.pay(callback_user_id)
     logger.info(f"Налог Технолог: user_id={callback_user_id}, списано {tax_amount}, баланс {balance_before} -> {balance_after}")
     
     # Сообщение игроку: «@user, дружок, Технолог забрал налог ⚙️»
@@ -332,7 +335,7 @@ async def callback_pay_tax(callback: CallbackQuery):
         )
     
     # Автоудаление через 30 секунд
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
     
     # Удаляем старое сообщение с кнопкой
     try:
@@ -371,7 +374,7 @@ async def cmd_donate(message: Message):
             username, first_name
         )
         sent = await message.answer(msg)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     _, raw_mention, raw_amount, comment = (parts + [""])[:4]
@@ -385,7 +388,7 @@ async def cmd_donate(message: Message):
         sent = await message.answer(
             format_message_with_username("Укажи корректную сумму (целое число).", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     # Разрешаем получателя: по entity (text_mention) или по @username
@@ -410,14 +413,14 @@ async def cmd_donate(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     if receiver_id == user_id:
         sent = await message.answer(
             format_message_with_username("Нельзя переводить самому себе.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     success, err = await balance_service.transfer_balance(
@@ -437,7 +440,7 @@ async def cmd_donate(message: Message):
 
     if not success:
         sent = await message.answer(format_message_with_username(err, username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     display_name = f"@{receiver_username}" if receiver_username and not str(receiver_username).isdigit() else f"id{receiver_id}"
@@ -447,7 +450,7 @@ async def cmd_donate(message: Message):
         username, first_name
     )
     sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info(f"Donate: {user_id} -> {receiver_id}, amount={amount}, comment={comment}")
 
 
@@ -473,7 +476,7 @@ async def cmd_ref(message: Message):
             username, first_name
         )
         sent = await message.answer(msg)
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     code_raw = parts[1].strip().lstrip("#").upper()
@@ -481,7 +484,7 @@ async def cmd_ref(message: Message):
         sent = await message.answer(
             format_message_with_username("Укажи код после #.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     refcode = await db.get_refcode(code_raw)
@@ -489,7 +492,7 @@ async def cmd_ref(message: Message):
         sent = await message.answer(
             format_message_with_username("Такого кода нет.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     if refcode["activated_by"] is not None:
@@ -500,7 +503,7 @@ async def cmd_ref(message: Message):
             username, first_name
         )
         sent = await message.answer(msg)
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     activated = await db.activate_refcode(code_raw, user_id)
@@ -508,7 +511,7 @@ async def cmd_ref(message: Message):
         sent = await message.answer(
             format_message_with_username("Не удалось активировать код.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     reward_type = refcode["reward_type"]
@@ -526,6 +529,7 @@ async def cmd_ref(message: Message):
     elif reward_type == "premium":
         duration = int(reward_value)
         await db.set_premium(user_id, duration)
+        cooldown_service.invalidate_perks(user_id)
         mins = duration // 60
         msg = format_message_with_username(f"Код активирован! Premium на {mins} мин 👑", username, first_name)
 
@@ -558,7 +562,7 @@ async def cmd_ref(message: Message):
         )
 
     elif reward_type == "reset_refill":
-        await db.reset_cooldown(user_id, "/refill")
+        await cooldown_service.reset(user_id, "/refill")
         msg = format_message_with_username("Код активирован! Cooldown /refill сброшен 🔄", username, first_name)
 
     elif reward_type == "steal_balance":
@@ -572,10 +576,14 @@ async def cmd_ref(message: Message):
         else:
             import random
             row = random.choice(all_users)
-            victim_id, victim_balance = row[0], row[1]
-            steal_amount = max(1, int(victim_balance * fraction))
-            await db.update_balance(victim_id, -steal_amount, "expense", "ref_steal", f"VECNA кража активатором {user_id}")
-            await db.update_balance(user_id, steal_amount, "income", "ref_steal", f"VECNA кража у {victim_id}")
+            victim_id = row[0]
+            async with balance_service.locked(user_id, victim_id):
+                # Баланс жертвы перечитываем под блокировкой: выборка выше могла устареть
+                victim_balance = await db.get_balance(victim_id)
+                steal_amount = max(1, int(victim_balance * fraction)) if victim_balance > 0 else 0
+                if steal_amount:
+                    await db.update_balance(victim_id, -steal_amount, "expense", "ref_steal", f"VECNA кража активатором {user_id}")
+                    await db.update_balance(user_id, steal_amount, "income", "ref_steal", f"VECNA кража у {victim_id}")
             victim_user = await db.get_user(victim_id)
             v_username = (victim_user or {}).get("username") or str(victim_id)
             msg = format_message_with_username(
@@ -593,7 +601,7 @@ async def cmd_ref(message: Message):
         msg = format_message_with_username("Код активирован!", username, first_name)
 
     sent = await message.answer(msg)
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
     logger.info(f"Ref code {code_raw} activated by {user_id}")
 
 
@@ -621,14 +629,22 @@ async def _birzh_caption(prices: dict, balances: dict, balance: int, user_id: in
 
 def _birzh_keyboard(user_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Купить 100 Шарага", callback_data=f"birzh_buy|{user_id}|sharaga"), InlineKeyboardButton(text="Продать 100 Шарага", callback_data=f"birzh_sell|{user_id}|sharaga")],
-        [InlineKeyboardButton(text="Купить 100 Mr.Kris", callback_data=f"birzh_buy|{user_id}|kris"), InlineKeyboardButton(text="Продать 100 Mr.Kris", callback_data=f"birzh_sell|{user_id}|kris")],
-        [InlineKeyboardButton(text="Купить 100 ЖД", callback_data=f"birzh_buy|{user_id}|jd"), InlineKeyboardButton(text="Продать 100 ЖД", callback_data=f"birzh_sell|{user_id}|jd")],
-        [InlineKeyboardButton(text="Купить 100 MR.lisaya", callback_data=f"birzh_buy|{user_id}|lisaya"), InlineKeyboardButton(text="Продать 100 MR.lisaya", callback_data=f"birzh_sell|{user_id}|lisaya")],
-        [InlineKeyboardButton(text="🔄 Обновить курс", callback_data=f"birzh_refresh|{user_id}")],
+        [InlineKeyboardButton(text="Купить 100 Шарага", callback_data=pack("birzh_buy", user_id, "sharaga")), InlineKeyboardButton(text="Продать 100 Шарага", callback_data=pack("birzh_sell", user_id, "sharaga"))],
+        [InlineKeyboardButton(text="Купить 100 Mr.Kris", callback_data=pack("birzh_buy", user_id, "kris")), InlineKeyboardButton(text="Продать 100 Mr.Kris", callback_data=pack("birzh_sell", user_id, "kris"))],
+        [InlineKeyboardButton(text="Купить 100 ЖД", callback_data=pack("birzh_buy", user_id, "jd")), InlineKeyboardButton(text="Продать 100 ЖД", callback_data=pack("birzh_sell", user_id, "jd"))],
+        [InlineKeyboardButton(text="Купить 100 MR.lisaya", callback_data=pack("birzh_buy", user_id, "lisaya")), InlineKeyboardButton(text="Продать 100 MR.lisaya", callback_data=pack("birzh_sell", user_id, "lisaya"))],
+        [InlineKeyboardButton(text="🔄 Обновить курс", callback_data=pack("birzh_refresh", user_id))],
     ])
 
 
+def _birzh_edit(callback: CallbackQuery, caption: str) -> None:
+    """Правка окна биржи через склейку: частые нажатия дают одну правку, повтор курса — ни одной"""
+    edit_coalescer.submit(
+        callback.bot, callback.message.chat.id, callback.message.message_id, caption, _birzh_keyboard(callback.from_user.id),
+        kind="caption" if callback.message.photo else "text",
+    )
+
+
 @router.message(Command("birzh"))
 async def cmd_birzh(message: Message):
     """Биржа: Шарага (для новичков), Mr.Kris, ЖД, MR.lisayaderektrisa. Купить/продать по 100."""
@@ -654,19 +670,14 @@ async def cmd_birzh(message: Message):
             sent = await message.answer(caption, reply_markup=keyboard)
     except Exception:
         sent = await message.answer(caption, reply_markup=keyboard)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
-@router.callback_query(F.data.startswith("birzh_buy|"))
-async def cb_birzh_buy(callback: CallbackQuery):
-    data = callback.data
-    if not data.startswith("birzh_buy|"):
-        return
-    parts = data.split("|")
-    try:
-        uid = int(parts[1])
-        coin_type = parts[2] if len(parts) > 2 else "sharaga"
-    except (IndexError, ValueError):
+@router.callback_query(CallbackPrefix("birzh_buy"))
+async def cb_birzh_buy(callback: CallbackQuery, payload: CallbackPayload):
+    uid = payload.get_int(0)
+    coin_type = payload.get(1, "sharaga")
+    if uid is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     if callback.from_user.id != uid:
@@ -676,7 +687,11 @@ async def cb_birzh_buy(callback: CallbackQuery):
         coin_type = "sharaga"
     prices = await db.get_birzh_all_prices()
     price = prices.get(coin_type, prices["sharaga"])
-    ok = await db.birzh_buy_100(uid, price, coin_type)
+    label = BIRZH_COIN_LABELS.get(coin_type, coin_type)
+    async with balance_service.locked(uid):
+        ok, _, _ = await balance_service.debit(uid, price, "/birzh", f"Покупка 100 {label}")
+        if ok:
+            await db.birzh_buy_100(uid, coin_type)
     if not ok:
         await callback.answer(f"Нужно {price} коинов. Не хватает.", show_alert=True)
         return
@@ -708,24 +723,15 @@ async def cb_birzh_buy(callback: CallbackQuery):
     un = callback.from_user.username or ""
     fn = callback.from_user.first_name or ""
     caption = await _birzh_caption(prices, balances, balance, uid, un, fn)
-    try:
-        await callback.message.edit_caption(caption=caption, reply_markup=_birzh_keyboard(uid))
-    except Exception:
-        await callback.message.edit_text(caption, reply_markup=_birzh_keyboard(uid))
-    label = BIRZH_COIN_LABELS.get(coin_type, coin_type)
+    _birzh_edit(callback, caption)
     await callback.answer(f"Куплено 100 {label} за {price} коинов ✅")
 
 
-@router.callback_query(F.data.startswith("birzh_sell|"))
-async def cb_birzh_sell(callback: CallbackQuery):
-    data = callback.data
-    if not data.startswith("birzh_sell|"):
-        return
-    parts = data.split("|")
-    try:
-        uid = int(parts[1])
-        coin_type = parts[2] if len(parts) > 2 else "sharaga"
-    except (IndexError, ValueError):
+@router.callback_query(CallbackPrefix("birzh_sell"))
+async def cb_birzh_sell(callback: CallbackQuery, payload: CallbackPayload):
+    uid = payload.get_int(0)
+    coin_type = payload.get(1, "sharaga")
+    if uid is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     if callback.from_user.id != uid:
@@ -735,9 +741,12 @@ async def cb_birzh_sell(callback: CallbackQuery):
         coin_type = "sharaga"
     prices = await db.get_birzh_all_prices()
     price = prices.get(coin_type, prices["sharaga"])
-    ok = await db.birzh_sell_100(uid, price, coin_type)
+    label = BIRZH_COIN_LABELS.get(coin_type, coin_type)
+    async with balance_service.locked(uid):
+        ok = await db.birzh_sell_100(uid, coin_type)
+        if ok:
+            await balance_service.credit(uid, price, "/birzh", f"Продажа 100 {label}")
     if not ok:
-        label = BIRZH_COIN_LABELS.get(coin_type, coin_type)
         await callback.answer(f"Нужно минимум 100 {label}.", show_alert=True)
         return
     try:
@@ -768,22 +777,14 @@ async def cb_birzh_sell(callback: CallbackQuery):
     un = callback.from_user.username or ""
     fn = callback.from_user.first_name or ""
     caption = await _birzh_caption(prices, balances, balance, uid, un, fn)
-    try:
-        await callback.message.edit_caption(caption=caption, reply_markup=_birzh_keyboard(uid))
-    except Exception:
-        await callback.message.edit_text(caption, reply_markup=_birzh_keyboard(uid))
-    label = BIRZH_COIN_LABELS.get(coin_type, coin_type)
+    _birzh_edit(callback, caption)
     await callback.answer(f"Продано 100 {label} за {price} коинов ✅")
 
 
-@router.callback_query(F.data.startswith("birzh_refresh|"))
-async def cb_birzh_refresh(callback: CallbackQuery):
-    data = callback.data
-    if not data.startswith("birzh_refresh|"):
-        return
-    try:
-        uid = int(data.split("|")[1])
-    except (IndexError, ValueError):
+@router.callback_query(CallbackPrefix("birzh_refresh"))
+async def cb_birzh_refresh(callback: CallbackQuery, payload: CallbackPayload):
+    uid = payload.get_int(0)
+    if uid is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     if callback.from_user.id != uid:
@@ -795,8 +796,5 @@ async def cb_birzh_refresh(callback: CallbackQuery):
     un = callback.from_user.username or ""
     fn = callback.from_user.first_name or ""
     caption = await _birzh_caption(prices, balances, balance, uid, un, fn)
-    try:
-        await callback.message.edit_caption(caption=caption, reply_markup=_birzh_keyboard(uid))
-    except Exception:
-        await callback.message.edit_text(caption, reply_markup=_birzh_keyboard(uid))
+    _birzh_edit(callback, caption)
     await callback.answer("Курс обновлён")
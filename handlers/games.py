@@ -6,12 +6,14 @@
 """
 
 import asyncio
+import heapq
 import html
 import logging
 import random
+import sys
 import time
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
@@ -20,29 +22,37 @@ from aiogram.exceptions import TelegramBadRequest
 
 from config import config
 from db import db
-from utils import delete_message_after, delete_message_after_by_id, format_message_with_username, format_message_game_result_async, format_insufficient_balance, format_game_error, resolve_recipient_from_message
+from utils import delete_message_later, delete_message_later_by_id, format_message_with_username, format_message_game_result_async, format_insufficient_balance, format_game_error, resolve_recipient_from_message
 from games.rng import game_random
 from games.constants import GAME_MAX_DURATION_SEC
 from games.fracture_questions import FRACTURE_QUESTIONS_POOL
 from middlewares import set_command_cooldown
 from services.balance import balance_service
+from services.cooldown import cooldown_service
 from services.effects import effects_service
 from services.news import news_service
 from services.events import events_service
+from services.callbacks import CallbackPayload, CallbackPrefix, pack
+from services.sessions import GameSession, SessionStore, session_locked, session_manager
+from services.timers import TimerHandle, game_timers
+from services.edits import edit_coalescer
+from services.lobby import lobby_engine
 
 # Создаем роутер для игровых команд
 router = Router()
 
 logger = logging.getLogger(__name__)
 
-# Глобальное хранилище для активных сессий kripta (в памяти для быстрого доступа)
-_active_kripta_sessions: Dict[int, Dict] = {}
+# Активные сессии всех игр живут в services/sessions.py (TTL, замки, общий индекс по пользователю).
+# stake — списанная ставка: такие сессии пишутся в журнал и после перезапуска продолжаются или возвращаются.
+# Сессии kripta: user_id -> {bet, current_multiplier, message_id, chat_id, next_update_at, crash_at, is_active}
+_active_kripta_sessions = session_manager.store("kripta", stake="bet")
 
-# Глобальное хранилище для активных сообщений plsdon (для кнопки пожертвования)
-_active_plsdon_messages: Dict[int, Dict] = {}
+# Активные сообщения plsdon (для кнопки пожертвования)
+_active_plsdon_messages = session_manager.store("plsdon")
 
 # Сессии /almaz: user_id -> {bet, current_win, message_id, chat_id, explosion_chance}
-_active_almaz_sessions: Dict[int, Dict] = {}
+_active_almaz_sessions = session_manager.store("almaz", stake="bet")
 
 # 40 игр «риск/забрать»: команда /reactor 100, /vault 50 и т.д.
 RISK40_SLUGS = (
@@ -53,23 +63,16 @@ RISK40_SLUGS = (
     "storm", "navigator", "icepath", "coinstack", "target", "fuse", "web", "logicgate",
     "depth", "field", "ritual", "trace",
 )
-_active_risk40_sessions: Dict[int, Dict] = {}  # user_id -> {slug, bet, mult, message_id, chat_id, started_at}
-_active_fracture_sessions: Dict[int, Dict] = {}  # user_id -> {bet, choices[], message_id, chat_id, username, first_name}
-_active_mirror_sessions: Dict[int, Dict] = {}  # Buckshot: обойма 8, жизни 2/2, ход в себя/в дилера
+_active_risk40_sessions = session_manager.store("risk40", stake="bet")  # user_id -> {slug, bet, mult, message_id, chat_id, started_at}
+_active_fracture_sessions = session_manager.store("fracture", stake="bet")  # user_id -> {bet, choices[], message_id, chat_id, username, first_name}
+_active_mirror_sessions = session_manager.store("mirror", stake="stake")  # Buckshot: обойма 8, жизни 2/2, ход в себя/в дилера
 
 
-def get_active_sessions_debug() -> Dict[str, int]:
-    """Для /debug: количество активных сессий по играм."""
-    return {
-        "kripta": len(_active_kripta_sessions),
-        "almaz": len(_active_almaz_sessions),
-        "plsdon": len(_active_plsdon_messages),
-        "risk40": len(_active_risk40_sessions),
-        "perekyp": len(_active_perekyp_sessions),
-        "blackmarket": len(_active_blackmarket),
-        "fracture": len(_active_fracture_sessions),
-        "mirror": len(_active_mirror_sessions),
-    }
+def get_active_sessions_debug() -> Dict[str, Dict[str, int]]:
+    """Для /debug: {игра: {count, bytes}} по всем играм из менеджера сессий и дуэлям /chisla."""
+    stats = session_manager.stats()
+    stats["chisla"] = {"count": len(_chisla_duels), "bytes": sum(sys.getsizeof(d) for d in _chisla_duels.values())}
+    return stats
 
 
 # Честные игры дают больше MMR за победу и меньше за поражение; азартные — наоборот
@@ -86,6 +89,23 @@ async def _safe_callback_answer(callback: CallbackQuery, text: str = "", show_al
         pass
 
 
+GAME_SETTLE_RETRY = 30  # сек до повторного расчёта сессии, если БД не записала расчёт
+
+
+def _restore_unsettled(store: SessionStore, key: int, sess: GameSession, retry: Callable[..., Awaitable[Any]], *args: Any) -> bool:
+    """
+    Расчёт снятой сессии не записался (транзакция откатилась, деньги не двигались): вернуть
+    сессию в хранилище и повторить расчёт по таймауту retry(*args) — как авто-забрать.
+    Если за это время игрок начал новую игру, остаётся только лог: её ключ уже занят.
+    """
+    if key in store:
+        logger.error("Расчёт %s (key=%s) не записан, а ключ занят новой игрой: %r", store.game, key, sess)
+        return False
+    store[key] = sess
+    sess.set_timeout(GAME_SETTLE_RETRY, retry, *args)
+    return True
+
+
 async def _update_mmr_and_achievements(
     user_id: int, game_type: str, result: str, balance_after: int,
     chat_id: Optional[int] = None, bot = None
@@ -188,11 +208,15 @@ async def cmd_cancel(message: Message):
     username = message.from_user.username
     first_name = message.from_user.first_name
 
+    if not session_manager.has_active_game(user_id):
+        sent = await message.answer(format_message_with_username("Нет активной игры для отмены.", username, first_name))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
+        return
+
     if user_id in _active_kripta_sessions:
         session_data = _active_kripta_sessions[user_id]
         bet = session_data.get("bet", 0)
-        if session_data.get("task"):
-            session_data["task"].cancel()
+        session_data["is_active"] = False
         await db.close_kripta_session(user_id)
         del _active_kripta_sessions[user_id]
         if bet > 0:
@@ -206,7 +230,7 @@ async def cmd_cancel(message: Message):
             username, first_name
         )
         sent = await message.answer(msg)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     if user_id in _active_almaz_sessions:
@@ -216,7 +240,7 @@ async def cmd_cancel(message: Message):
             username, first_name
         )
         sent = await message.answer(msg)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     if user_id in _active_perekyp_sessions:
@@ -226,7 +250,7 @@ async def cmd_cancel(message: Message):
             username, first_name
         )
         sent = await message.answer(msg)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     if user_id in _active_risk40_sessions:
@@ -242,7 +266,7 @@ async def cmd_cancel(message: Message):
             username, first_name
         )
         sent = await message.answer(msg)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     if user_id in _active_mirror_sessions:
@@ -258,16 +282,11 @@ async def cmd_cancel(message: Message):
             username, first_name
         )
         sent = await message.answer(msg)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     if user_id in _active_fracture_sessions:
         sess = _active_fracture_sessions.pop(user_id, None)
-        if sess and sess.get("timer_task"):
-            try:
-                sess["timer_task"].cancel()
-            except Exception:
-                pass
         if sess and sess.get("bet", 0) > 0:
             await balance_service.add_balance(
                 user_id=user_id, amount=sess["bet"],
@@ -279,7 +298,7 @@ async def cmd_cancel(message: Message):
             username, first_name
         )
         sent = await message.answer(msg)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     msg = format_message_with_username(
@@ -287,7 +306,7 @@ async def cmd_cancel(message: Message):
         username, first_name
     )
     sent = await message.answer(msg)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("status"))
@@ -296,8 +315,11 @@ async def cmd_status(message: Message):
     user_id = message.from_user.id
     username = message.from_user.username
     first_name = message.from_user.first_name
+    active = session_manager.active_games(user_id)
 
-    if user_id in _active_kripta_sessions:
+    if not active:
+        msg = format_message_with_username("Нет активной игры.", username, first_name)
+    elif "kripta" in active:
         sess = _active_kripta_sessions[user_id]
         mult = sess.get("current_multiplier", 1.0)
         bet = sess.get("bet", 0)
@@ -305,14 +327,14 @@ async def cmd_status(message: Message):
             f"Активная игра: <b>Lucky Jet</b> (/kripta)\nСтавка: {bet} коинов, множитель: x{mult:.1f}",
             username, first_name
         )
-    elif user_id in _active_almaz_sessions:
+    elif "almaz" in active:
         sess = _active_almaz_sessions[user_id]
         cw = sess.get("current_win", 0)
         msg = format_message_with_username(
             f"Активная игра: <b>Алмазы</b> (/almaz)\nТекущий выигрыш: {cw} коинов",
             username, first_name
         )
-    elif user_id in _active_risk40_sessions:
+    elif "risk40" in active:
         sess = _active_risk40_sessions[user_id]
         slug = sess.get("slug", "?")
         mult = sess.get("mult", 1.0)
@@ -321,14 +343,14 @@ async def cmd_status(message: Message):
             f"Активная игра: <b>{slug}</b> (/{slug})\nСтавка: {bet}, множитель: x{mult:.2f}",
             username, first_name
         )
-    elif user_id in _active_perekyp_sessions:
+    elif "perekyp" in active:
         sess = _active_perekyp_sessions[user_id]
         price = sess.get("listing", {}).get("price", 0)
         msg = format_message_with_username(
             f"Активная игра: <b>Перекуп</b> (/perekyp)\nТекущее объявление: {price} коинов",
             username, first_name
         )
-    elif user_id in _active_fracture_sessions:
+    elif "fracture" in active:
         sess = _active_fracture_sessions[user_id]
         step = len(sess.get("answers", [])) + 1
         lives = sess.get("lives", FRACTURE_LIVES)
@@ -336,7 +358,7 @@ async def cmd_status(message: Message):
             f"Активная игра: <b>Излом решения</b> (/fracture)\nВопрос {step}/{FRACTURE_NUM_STEPS}, жизней: ❤️{lives}, на ответ {FRACTURE_QUESTION_TIMEOUT_SEC} сек.",
             username, first_name
         )
-    elif user_id in _active_mirror_sessions:
+    elif "mirror" in active:
         msg = format_message_with_username(
             "Активная игра: <b>Зеркало</b> (/mirror)\nВыбери: в себя или в дилера.",
             username, first_name
@@ -345,7 +367,7 @@ async def cmd_status(message: Message):
         msg = format_message_with_username("Нет активной игры.", username, first_name)
 
     sent = await message.answer(msg)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 # ---------- 40 игр: уникальные описания и механика (bust_base, bust_per_step, mult_step) ----------
@@ -693,42 +715,17 @@ RISK40_GAMES = {
     },
 }
 
-# Парсинг callback_data для risk40: risk40_take_SLUG|USER_ID или risk40_act_SLUG|ACTION|USER_ID
-def _parse_risk40_callback(data: str, prefix: str):
-    """Возвращает (slug, user_id) или (None, None) при ошибке."""
-    if not data.startswith(prefix) or "|" not in data:
-        return None, None
-    try:
-        rest = data[len(prefix):]
-        slug, uid_str = rest.split("|", 1)
-        return slug.strip(), int(uid_str.strip())
-    except (ValueError, IndexError):
-        return None, None
-
-
-def _parse_risk40_act_callback(data: str, prefix: str):
-    """Для risk40_act_SLUG|ACTION|USER_ID возвращает (slug, action_id, user_id) или (None, None, None)."""
-    if not data.startswith(prefix) or data.count("|") < 2:
-        return None, None, None
-    try:
-        rest = data[len(prefix):]
-        parts = rest.split("|", 2)
-        return parts[0].strip(), parts[1].strip(), int(parts[2].strip())
-    except (ValueError, IndexError):
-        return None, None, None
-
-
 def _risk40_build_keyboard(slug: str, user_id: int, mult: float):
     """Клавиатура: Забрать + две тематические кнопки по RISK40_GAMES[slug]."""
     game = RISK40_GAMES.get(slug)
     if not game:
         return InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=f"💰 Забрать x{mult:.2f}", callback_data=f"risk40_take_{slug}|{user_id}")],
+            [InlineKeyboardButton(text=f"💰 Забрать x{mult:.2f}", callback_data=pack("risk40_take", slug, user_id))],
         ])
     take_btn = game["take_btn"]
-    row_take = [InlineKeyboardButton(text=f"💰 {take_btn} x{mult:.2f}", callback_data=f"risk40_take_{slug}|{user_id}")]
+    row_take = [InlineKeyboardButton(text=f"💰 {take_btn} x{mult:.2f}", callback_data=pack("risk40_take", slug, user_id))]
     row_actions = [
-        InlineKeyboardButton(text=label, callback_data=f"risk40_act_{slug}|{act_id}|{user_id}")
+        InlineKeyboardButton(text=label, callback_data=pack("risk40_act", slug, act_id, user_id))
         for act_id, label, _, _, _ in game["actions"]
     ]
     return InlineKeyboardMarkup(inline_keyboard=[row_take, row_actions])
@@ -743,13 +740,13 @@ async def _run_risk40(message: Message, slug: str):
     if user_id in _active_risk40_sessions:
         sent = await message.answer(format_message_with_username(
             f"У тебя уже есть активная игра. Заверши её или /cancel.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     if await news_service.is_game_closed(slug):
         sent = await message.answer(format_message_with_username(
             f"Игра «{_risk40_display_name(slug)}» временно на починке — загляни в /news.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     user = await db.get_user(user_id)
@@ -765,14 +762,15 @@ async def _run_risk40(message: Message, slug: str):
     balance = await db.get_balance(user_id)
     if balance < bet:
         sent = await message.answer(format_insufficient_balance(username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
+    receipt = balance_service.receipt()
     success, _, _, _ = await balance_service.subtract_balance(
         user_id=user_id, amount=bet,
         command_source=f"/{slug}", comment=f"Ставка в игре {slug}",
         message=message, username=username, first_name=first_name,
-        allow_negative=False
+        allow_negative=False, receipt=receipt
     )
     if not success:
         return
@@ -786,11 +784,12 @@ async def _run_risk40(message: Message, slug: str):
         username, first_name
     )
     # Сессию создаём до отправки сообщения, чтобы кнопки не давали «Игра уже завершена»
-    _active_risk40_sessions[user_id] = {
+    _active_risk40_sessions[user_id] = GameSession({
         "slug": slug, "bet": bet, "mult": 1.0, "step": 0,
         "username": username, "first_name": first_name,
         "message_id": None, "chat_id": None, "started_at": time.time(),
-    }
+        "receipt": receipt.entries,
+    })
     keyboard = _risk40_build_keyboard(slug, user_id, 1.0)
     photo_path = config.get_game_image_path(slug, "start")
     try:
@@ -806,44 +805,59 @@ async def _run_risk40(message: Message, slug: str):
 
     _active_risk40_sessions[user_id]["message_id"] = sent_msg.message_id
     _active_risk40_sessions[user_id]["chat_id"] = sent_msg.chat.id
-    asyncio.create_task(_risk40_timeout_task(message.bot, user_id, GAME_MAX_DURATION_SEC))
+    _active_risk40_sessions.save(user_id)
+    _active_risk40_sessions[user_id].set_timeout(GAME_MAX_DURATION_SEC, _risk40_timeout_task, message.bot, user_id)
     logger.info("User %s started /%s bet=%s", user_id, slug, bet)
 
 
-async def _risk40_timeout_task(bot: Bot, user_id: int, timeout_sec: int):
-    """По таймауту — забрать по текущему множителю."""
-    await asyncio.sleep(timeout_sec)
-    sess = _active_risk40_sessions.pop(user_id, None)
+async def _risk40_timeout_task(bot: Bot, user_id: int):
+    """По таймауту — забрать по текущему множителю (вызывается планировщиком таймаутов)."""
+    sess = _active_risk40_sessions.get(user_id)
     if not sess:
         return
+    # Таймаут ждёт нажатие кнопки, которое уже идёт: оно могло завершить игру, тогда платить нечего
+    async with sess.lock:
+        if _active_risk40_sessions.get(user_id) is not sess:
+            return
+        _active_risk40_sessions.pop(user_id)
+        await _risk40_timeout_settle(bot, user_id, sess)
+
+
+async def _risk40_timeout_settle(bot: Bot, user_id: int, sess: GameSession):
+    """Авто-забрать снятой по таймауту сессии risk40 (под её блокировкой)"""
     slug, bet, mult = sess["slug"], sess["bet"], sess["mult"]
     chat_id, message_id = sess["chat_id"], sess["message_id"]
     win_amount = int(bet * mult)
+    receipt = balance_service.receipt(sess.get("receipt"))
     try:
-        if win_amount > 0:
-            await balance_service.add_game_win(
-                user_id=user_id, gross_amount=win_amount,
-                command_source=f"/{slug}", comment="Авто-забрать по таймауту",
-                bot=bot, chat_id=chat_id, username=None, first_name=None,
-            )
-            await db.log_game_session(user_id, slug, bet, "win", win_amount - bet, mult)
-            await db.log_admin_game(user_id, None, f"/{slug}", bet, "win", win_amount - bet, None)
+        # Ставка списана при старте; выигрыш с налогом и логи — одной транзакцией
+        settled, _, _ = await balance_service.settle_game(
+            user_id=user_id, stake=bet, payout=win_amount, game=slug, charge=0, multiplier=mult,
+            comment=f"{slug} x{mult:.2f}, авто-забрать по таймауту",
+            bot=bot, chat_id=chat_id, receipt=receipt,
+        )
+        if not settled:
+            _restore_unsettled(_active_risk40_sessions, user_id, sess, _risk40_timeout_task, bot, user_id)
+            return
         user = await db.get_user(user_id)
         un = user.get("username") if user else None
         caption = format_message_with_username(
-            f"⏱ Время вышло. Забрал <b>{win_amount}</b> коинов (x{mult:.2f})." if win_amount > 0 else "⏱ Время вышло. Игра завершена.",
+            (f"⏱ Время вышло. Забрал <b>{win_amount}</b> коинов (x{mult:.2f})." if win_amount > 0 else "⏱ Время вышло. Игра завершена.")
+            + receipt.render(),
             un, None
         )
+        await edit_coalescer.close(chat_id, message_id)
         await bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=caption, reply_markup=None)
-        asyncio.create_task(delete_message_after_by_id(bot, chat_id, message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+        delete_message_later_by_id(bot, chat_id, message_id, config.GAME_RESULT_DELETE_TIMEOUT)
     except Exception as e:
         logger.exception("risk40 timeout: %s", e)
 
 
-@router.callback_query(F.data.startswith("risk40_take_"))
-async def cb_risk40_take(callback: CallbackQuery):
-    """Забрать выигрыш в одной из 40 игр."""
-    slug, target_id = _parse_risk40_callback(callback.data, "risk40_take_")
+@router.callback_query(CallbackPrefix("risk40_take"))
+@session_locked(_active_risk40_sessions, key_index=1)
+async def cb_risk40_take(callback: CallbackQuery, payload: CallbackPayload):
+    """Забрать выигрыш в одной из 40 игр. callback_data: risk40_take|SLUG|USER_ID"""
+    slug, target_id = payload.get(0), payload.get_int(1)
     if slug is None or target_id is None:
         await _safe_callback_answer(callback, "Ошибка", show_alert=True)
         return
@@ -863,24 +877,29 @@ async def cb_risk40_take(callback: CallbackQuery):
     win_amount = int(bet * mult)
     username = callback.from_user.username
     first_name = callback.from_user.first_name
-    _, _, _, tax = await balance_service.add_game_win(
-        user_id=target_id, gross_amount=win_amount,
-        command_source=f"/{slug}", comment=f"Выигрыш {slug} x{mult:.2f}",
+    receipt = balance_service.receipt(sess.get("receipt"))
+    # Ставка списана при старте; выигрыш с налогом и логи — одной транзакцией
+    settled, balance_after, _ = await balance_service.settle_game(
+        user_id=target_id, stake=bet, payout=win_amount, game=slug, charge=0, multiplier=mult,
+        comment=f"{slug} x{mult:.2f}",
         bot=callback.bot, chat_id=callback.message.chat.id,
-        username=username, first_name=first_name,
+        username=username, first_name=first_name, receipt=receipt,
     )
-    await db.log_game_session(target_id, slug, bet, "win", win_amount - bet, mult)
-    await db.log_admin_game(target_id, username, f"/{slug}", bet, "win", win_amount - bet, tax or 0)
-    balance_after = await db.get_balance(target_id)
+    if not settled:
+        _restore_unsettled(_active_risk40_sessions, target_id, sess, _risk40_timeout_task, callback.bot, target_id)
+        await _safe_callback_answer(callback, "Не удалось зачислить выигрыш — повторим автоматически.", show_alert=True)
+        return
     await _update_mmr_and_achievements(target_id, slug, "win", balance_after)
     await db.add_cup_win(target_id, slug)
     if await db.get_risk40_distinct_count(target_id) >= 40:
         await db.unlock_achievement(target_id, "all_40_risk")
     caption = await format_message_game_result_async(
-        f"вы выиграли. 🎮 Забрал <b>{win_amount}</b> коинов (x{mult:.2f}). Баланс: <b>{balance_after}</b>",
+        f"вы выиграли. 🎮 Забрал <b>{win_amount}</b> коинов (x{mult:.2f}). Баланс: <b>{balance_after}</b>"
+        + receipt.render(),
         target_id
     )
     photo_path = config.get_game_image_path(slug, "win")
+    await edit_coalescer.close(callback.message.chat.id, callback.message.message_id)
     try:
         if photo_path.exists():
             media = InputMediaPhoto(media=FSInputFile(str(photo_path)), caption=caption)
@@ -896,13 +915,15 @@ async def cb_risk40_take(callback: CallbackQuery):
         except Exception:
             pass
     await _safe_callback_answer(callback, "Забрал!")
-    asyncio.create_task(delete_message_after_by_id(callback.bot, callback.message.chat.id, callback.message.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+    delete_message_later_by_id(callback.bot, callback.message.chat.id, callback.message.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
 
 
-@router.callback_query(F.data.startswith("risk40_act_"))
-async def cb_risk40_act(callback: CallbackQuery):
-    """Одна из двух тематических кнопок: своя механика (bust_base, bust_per, mult_step) на действие."""
-    slug, action_id, target_id = _parse_risk40_act_callback(callback.data, "risk40_act_")
+@router.callback_query(CallbackPrefix("risk40_act"))
+@session_locked(_active_risk40_sessions, key_index=2)
+async def cb_risk40_act(callback: CallbackQuery, payload: CallbackPayload):
+    """Одна из двух тематических кнопок: своя механика (bust_base, bust_per, mult_step) на действие.
+    callback_data: risk40_act|SLUG|ACTION|USER_ID"""
+    slug, action_id, target_id = payload.get(0), payload.get(1), payload.get_int(2)
     if slug is None or action_id is None or target_id is None:
         await _safe_callback_answer(callback, "Ошибка", show_alert=True)
         return
@@ -926,29 +947,37 @@ async def cb_risk40_act(callback: CallbackQuery):
         return
     await _safe_callback_answer(callback, "")
     _act_id, label, bust_base, bust_per, mult_step = action_mech
+    news_mod = await news_service.get_win_modifier(slug)
+    # Пока ждали ответ Telegram и модификатор новостей, игру мог закрыть таймаут или /cancel
+    if _active_risk40_sessions.get(target_id) is not sess:
+        return
     step = sess.get("step", 0) + 1
     bust_chance = min(0.95, bust_base + step * bust_per)
-    news_mod = await news_service.get_win_modifier(slug)
     bust_chance = max(0.02, min(0.95, bust_chance - news_mod))
     if game_random.random() < bust_chance:
         bet = sess["bet"]
-        del _active_risk40_sessions[target_id]
-        await db.log_game_session(target_id, slug, bet, "loss", -bet, sess["mult"])
-        await db.log_admin_game(target_id, (await db.get_user(target_id) or {}).get("username", ""), f"/{slug}", bet, "loss", -bet, 0)
+        _active_risk40_sessions.pop(target_id, None)
+        # Ставка списана при старте: денег не движется, логи проигрыша — одной транзакцией
+        await balance_service.settle_game(
+            user_id=target_id, stake=bet, payout=0, game=slug, charge=0, multiplier=sess["mult"],
+            username=callback.from_user.username,
+        )
         balance_after = await db.get_balance(target_id)
         await _update_mmr_and_achievements(target_id, slug, "loss", balance_after)
         photo_path = config.get_game_image_path(slug, "lose")
         caption = await format_message_game_result_async(
-            f"вы проиграли. 💥 Потеряли ставку <b>{bet}</b> коинов. Баланс: <b>{balance_after}</b>",
+            f"вы проиграли. 💥 Потеряли ставку <b>{bet}</b> коинов. Баланс: <b>{balance_after}</b>"
+            + balance_service.receipt(sess.get("receipt")).render(),
             target_id
         )
+        await edit_coalescer.close(callback.message.chat.id, callback.message.message_id)
         try:
             if photo_path.exists():
                 media = InputMediaPhoto(media=FSInputFile(str(photo_path)), caption=caption)
                 await callback.bot.edit_message_media(chat_id=callback.message.chat.id, message_id=callback.message.message_id, media=media, reply_markup=None)
             else:
                 await callback.bot.edit_message_caption(chat_id=callback.message.chat.id, message_id=callback.message.message_id, caption=caption, reply_markup=None)
-            asyncio.create_task(delete_message_after_by_id(callback.bot, callback.message.chat.id, callback.message.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+            delete_message_later_by_id(callback.bot, callback.message.chat.id, callback.message.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
         except Exception:
             bust_msg = None
             if photo_path.exists():
@@ -956,7 +985,7 @@ async def cb_risk40_act(callback: CallbackQuery):
             else:
                 bust_msg = await callback.bot.send_message(callback.message.chat.id, caption)
             if bust_msg:
-                asyncio.create_task(delete_message_after_by_id(callback.bot, callback.message.chat.id, bust_msg.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+                delete_message_later_by_id(callback.bot, callback.message.chat.id, bust_msg.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
         await _safe_callback_answer(callback, "Обвал…")
     else:
         sess["step"] = step
@@ -969,13 +998,8 @@ async def cb_risk40_act(callback: CallbackQuery):
             callback.from_user.username, callback.from_user.first_name
         )
         keyboard = _risk40_build_keyboard(slug, target_id, mult)
-        try:
-            await callback.bot.edit_message_caption(
-                chat_id=callback.message.chat.id, message_id=callback.message.message_id,
-                caption=caption, reply_markup=keyboard
-            )
-        except Exception as e:
-            logger.warning("risk40 act edit: %s", e)
+        # Не ждём правку под блокировкой сессии: частые нажатия склеиваются в одну, последнюю
+        edit_coalescer.submit(callback.bot, callback.message.chat.id, callback.message.message_id, caption, keyboard)
         await _safe_callback_answer(callback, f"x{mult:.2f}!")
 
 
@@ -990,71 +1014,111 @@ for _slug in RISK40_SLUGS:
 
 
 # ---------- /rulet (русская рулетка: 2–8 игроков, каждые 20 сек выбывает один, последний забирает банк) ----------
-_active_rulet_sessions: Dict[int, Dict] = {}  # chat_id -> {creator_id, bet, participants, message_id, chat_id, bank, task, bot}
+_active_rulet_sessions = session_manager.store(
+    "rulet", owner_field="creator_id",
+    # Прерванная рулетка не состоялась: ставку возвращаем всем, кто платил, включая выбывших
+    stake=lambda s: [(uid, s["bet"]) for uid in s.get("paid", s.get("participants", []))],
+)  # chat_id -> {creator_id, bet, participants, paid, message_id, chat_id, bank, started, bot}
+
+
+def _rulet_lobby_render(sess: GameSession):
+    """Подпись и кнопки лобби рулетки по текущему составу"""
+    chat_id = sess.key
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Вступить", callback_data=pack("rulet_join", chat_id)),
+         InlineKeyboardButton(text="Отмена", callback_data=pack("rulet_cancel", chat_id))]
+    ])
+    caption = f"Участников: <b>{len(sess['participants'])}</b>. Банк: <b>{sess['bank']}</b> коинов.\nВступить — кнопка ниже."
+    return caption, keyboard
+
+
+async def _settle_pot(store: SessionStore, chat_id: int, sess: GameSession, winner_id: int, stake: int) -> bool:
+    """
+    Банк групповой игры (рулетка, фреказ) победителю снятой сессии: ставки списаны при
+    вступлении, выигрыш с налогом и логи победителя — одной транзакцией. Не записалось —
+    сессия возвращается с победителем (winner) и выплата повторяется по таймауту.
+    """
+    bank = sess["bank"]
+    settled, _, _ = await balance_service.settle_game(
+        user_id=winner_id, stake=stake, payout=bank, game=store.game, charge=0,
+        multiplier=bank / max(stake, 1), comment=f"банк {bank}", bot=sess["bot"], chat_id=chat_id,
+    )
+    if not settled:
+        sess["winner"] = [winner_id, stake]
+        _restore_unsettled(store, chat_id, sess, _settle_pot_retry, store, chat_id)
+    return settled
 
 
-async def _rulet_elimination_loop(chat_id: int):
-    """Каждые 20 сек исключаем случайного игрока; когда остаётся 1 — он забирает банк."""
-    min_players = getattr(config, "RULET_MIN_PLAYERS", 2)
+async def _settle_pot_retry(store: SessionStore, chat_id: int):
+    """Повтор выплаты банка, если прошлый расчёт не записался (вызывается планировщиком таймаутов)"""
+    sess = store.get(chat_id)
+    if not sess or "winner" not in sess:
+        return
+    async with sess.lock:
+        if store.get(chat_id) is not sess:
+            return
+        store.pop(chat_id)
+        winner_id, stake = sess["winner"]
+        if await _settle_pot(store, chat_id, sess, winner_id, stake):
+            logger.info("Банк /%s (chat=%s) выплачен %s повторным расчётом", store.game, chat_id, winner_id)
+
+
+async def _rulet_eliminate(chat_id: int):
+    """Раз в RULET_ELIMINATION_INTERVAL сек (планировщик таймаутов) выбывает случайный игрок; последний забирает банк."""
     interval = getattr(config, "RULET_ELIMINATION_INTERVAL", 20)
-    while True:
-        await asyncio.sleep(interval)
-        sess = _active_rulet_sessions.get(chat_id)
-        if not sess or len(sess["participants"]) <= 1:
-            if sess and sess.get("task"):
-                sess["task"].cancel()
-            break
-        out_id = game_random.choice(sess["participants"])
-        sess["participants"] = [p for p in sess["participants"] if p != out_id]
-        bot = sess["bot"]
-        out_msg_id = None
+    sess = _active_rulet_sessions.get(chat_id)
+    if not sess or len(sess["participants"]) <= 1:
+        return
+    out_id = game_random.choice(sess["participants"])
+    sess["participants"] = [p for p in sess["participants"] if p != out_id]
+    bot = sess["bot"]
+    # Исход решаем сразу, до сетевых вызовов: вступление во время await не должно «оживить» игру
+    winner_id = sess["participants"][0] if len(sess["participants"]) == 1 else None
+    if winner_id is None:
+        sess.set_timeout(interval, _rulet_eliminate, chat_id)
+    else:
+        del _active_rulet_sessions[chat_id]
+    out_msg_id = None
+    try:
+        user = await db.get_user(out_id)
+        un = (user.get("username") or "user") if user else "user"
+        out_caption = format_message_with_username("💥 Выбыл из рулетки. Остальные держатся.", un, None)
+        photo_path = config.get_image_path("rulet_out.jpg")
+        if photo_path.exists():
+            out_msg = await bot.send_photo(chat_id, FSInputFile(str(photo_path)), caption=out_caption)
+        else:
+            out_msg = await bot.send_message(chat_id, out_caption)
+        out_msg_id = out_msg.message_id
+    except Exception as e:
+        logger.warning("rulet out message: %s", e)
+    if out_msg_id is not None:
+        delete_message_later_by_id(bot, chat_id, out_msg_id, 15)
+    if winner_id is not None:
+        bank = sess["bank"]
+        await lobby_engine.close(sess)
         try:
-            user = await db.get_user(out_id)
+            main_mid = sess.get("message_id")
+            try:
+                await bot.edit_message_reply_markup(chat_id=chat_id, message_id=main_mid, reply_markup=None)
+                await bot.edit_message_caption(chat_id=chat_id, message_id=main_mid, caption="🔫 Русская рулетка завершена. Победитель забирает банк.")
+            except Exception:
+                pass
+            delete_message_later_by_id(bot, chat_id, main_mid, config.GAME_RESULT_DELETE_TIMEOUT)
+            if not await _settle_pot(_active_rulet_sessions, chat_id, sess, winner_id, sess["bet"]):
+                return
+            user = await db.get_user(winner_id)
             un = (user.get("username") or "user") if user else "user"
-            out_caption = format_message_with_username("💥 Выбыл из рулетки. Остальные держатся.", un, None)
-            photo_path = config.get_image_path("rulet_out.jpg")
+            win_caption = format_message_with_username(
+                f"🎉 Дружок, ты последний на ногах — забираешь банк <b>{bank}</b> коинов.", un, None
+            )
+            photo_path = config.get_image_path("rulet_win.jpg")
             if photo_path.exists():
-                out_msg = await bot.send_photo(chat_id, FSInputFile(str(photo_path)), caption=out_caption)
+                win_msg = await bot.send_photo(chat_id, FSInputFile(str(photo_path)), caption=win_caption)
             else:
-                out_msg = await bot.send_message(chat_id, out_caption)
-            out_msg_id = out_msg.message_id
+                win_msg = await bot.send_message(chat_id, win_caption)
+            delete_message_later_by_id(bot, chat_id, win_msg.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
         except Exception as e:
-            logger.warning("rulet out message: %s", e)
-        if out_msg_id is not None:
-            asyncio.create_task(delete_message_after_by_id(bot, chat_id, out_msg_id, 15))
-        if len(sess["participants"]) == 1:
-            winner_id = sess["participants"][0]
-            bank = sess["bank"]
-            del _active_rulet_sessions[chat_id]
-            if sess.get("task"):
-                sess["task"].cancel()
-            try:
-                main_mid = sess.get("message_id")
-                try:
-                    await bot.edit_message_reply_markup(chat_id=chat_id, message_id=main_mid, reply_markup=None)
-                    await bot.edit_message_caption(chat_id=chat_id, message_id=main_mid, caption="🔫 Русская рулетка завершена. Победитель забирает банк.")
-                except Exception:
-                    pass
-                asyncio.create_task(delete_message_after_by_id(bot, chat_id, main_mid, config.GAME_RESULT_DELETE_TIMEOUT))
-                await balance_service.add_game_win(
-                    user_id=winner_id, gross_amount=bank,
-                    command_source="/rulet", comment="Победа в русской рулетке",
-                    bot=bot, chat_id=chat_id, username=None, first_name=None,
-                )
-                user = await db.get_user(winner_id)
-                un = (user.get("username") or "user") if user else "user"
-                win_caption = format_message_with_username(
-                    f"🎉 Дружок, ты последний на ногах — забираешь банк <b>{bank}</b> коинов.", un, None
-                )
-                photo_path = config.get_image_path("rulet_win.jpg")
-                if photo_path.exists():
-                    win_msg = await bot.send_photo(chat_id, FSInputFile(str(photo_path)), caption=win_caption)
-                else:
-                    win_msg = await bot.send_message(chat_id, win_caption)
-                asyncio.create_task(delete_message_after_by_id(bot, chat_id, win_msg.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
-            except Exception as e:
-                logger.exception("rulet winner pay: %s", e)
-            break
+            logger.exception("rulet winner pay: %s", e)
 
 
 @router.message(Command("rulet"))
@@ -1068,7 +1132,7 @@ async def cmd_rulet(message: Message):
     if chat_id in _active_rulet_sessions:
         sent = await message.answer(format_message_with_username(
             "В этом чате уже идёт русская рулетка. Вступи или дождись окончания.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     parts = (message.text or "").strip().split()
@@ -1081,7 +1145,7 @@ async def cmd_rulet(message: Message):
     balance = await db.get_balance(user_id)
     if balance < bet:
         sent = await message.answer(format_insufficient_balance(username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     success, _, _, _ = await balance_service.subtract_balance(
@@ -1098,8 +1162,8 @@ async def cmd_rulet(message: Message):
         username, first_name
     )
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Вступить", callback_data=f"rulet_join_{chat_id}"),
-         InlineKeyboardButton(text="Отмена", callback_data=f"rulet_cancel_{chat_id}")]
+        [InlineKeyboardButton(text="Вступить", callback_data=pack("rulet_join", chat_id)),
+         InlineKeyboardButton(text="Отмена", callback_data=pack("rulet_cancel", chat_id))]
     ])
     photo_path = config.get_image_path("rulet.jpg")
     try:
@@ -1111,28 +1175,29 @@ async def cmd_rulet(message: Message):
         logger.warning("rulet start photo: %s", e)
         sent_msg = await message.answer(caption, reply_markup=keyboard)
 
-    _active_rulet_sessions[chat_id] = {
+    _active_rulet_sessions[chat_id] = GameSession({
         "creator_id": user_id,
         "bet": bet,
         "participants": [user_id],
+        "paid": [user_id],
         "message_id": sent_msg.message_id,
         "chat_id": chat_id,
         "bank": bet,
-        "task": None,
+        "started": False,
         "bot": message.bot,
-    }
+    })
 
 
-@router.callback_query(F.data.startswith("rulet_join_"))
-async def cb_rulet_join(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("rulet_join"))
+@session_locked(_active_rulet_sessions)
+async def cb_rulet_join(callback: CallbackQuery, payload: CallbackPayload):
     """Вступление в русскую рулетку."""
-    try:
-        chat_id = int(callback.data.split("_")[-1])
-    except (ValueError, IndexError):
+    chat_id = payload.get_int(0)
+    if chat_id is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     sess = _active_rulet_sessions.get(chat_id)
-    if not sess:
+    if not sess or "winner" in sess:
         await callback.answer("Игра уже завершена.", show_alert=True)
         return
     user_id = callback.from_user.id
@@ -1158,28 +1223,29 @@ async def cb_rulet_join(callback: CallbackQuery):
     if not success:
         await callback.answer("Не удалось списать ставку.", show_alert=True)
         return
+    if _active_rulet_sessions.get(chat_id) is not sess:
+        # Пока списывали ставку, рулетка закончилась
+        await balance_service.add_balance(user_id, bet, "/rulet", "Возврат: рулетка уже завершена", bot=callback.bot, chat_id=chat_id)
+        await callback.answer("Игра уже завершена.", show_alert=True)
+        return
     sess["participants"].append(user_id)
+    sess["paid"].append(user_id)
     sess["bank"] += bet
+    _active_rulet_sessions.save(chat_id)
     min_p = getattr(config, "RULET_MIN_PLAYERS", 2)
-    if len(sess["participants"]) == min_p and sess.get("task") is None:
-        sess["task"] = asyncio.create_task(_rulet_elimination_loop(chat_id))
-    try:
-        new_caption = f"Участников: <b>{len(sess['participants'])}</b>. Банк: <b>{sess['bank']}</b> коинов.\nВступить — кнопка ниже."
-        await callback.bot.edit_message_caption(
-            chat_id=chat_id, message_id=sess["message_id"],
-            caption=new_caption, reply_markup=callback.message.reply_markup
-        )
-    except Exception:
-        pass
+    if len(sess["participants"]) >= min_p and not sess.get("started"):
+        sess["started"] = True
+        sess.set_timeout(getattr(config, "RULET_ELIMINATION_INTERVAL", 20), _rulet_eliminate, chat_id)
+    lobby_engine.touch(sess, _rulet_lobby_render)
     await callback.answer("Ты в игре!")
 
 
-@router.callback_query(F.data.startswith("rulet_cancel_"))
-async def cb_rulet_cancel(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("rulet_cancel"))
+@session_locked(_active_rulet_sessions)
+async def cb_rulet_cancel(callback: CallbackQuery, payload: CallbackPayload):
     """Отмена рулетки создателем: возврат всем, удаление сообщения."""
-    try:
-        chat_id = int(callback.data.split("_")[-1])
-    except (ValueError, IndexError):
+    chat_id = payload.get_int(0)
+    if chat_id is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     sess = _active_rulet_sessions.get(chat_id)
@@ -1189,11 +1255,13 @@ async def cb_rulet_cancel(callback: CallbackQuery):
     if callback.from_user.id != sess["creator_id"]:
         await callback.answer("Отменить может только создатель.", show_alert=True)
         return
-    if sess.get("task"):
+    if sess.get("started"):
         await callback.answer("Игра уже идёт — отмена невозможна.", show_alert=True)
         return
     bot = sess["bot"]
     main_mid = sess["message_id"]
+    # Сначала закрываем сессию (журнал), потом возвращаем ставки
+    del _active_rulet_sessions[chat_id]
     for uid in sess["participants"]:
         try:
             await balance_service.add_game_win(
@@ -1203,31 +1271,48 @@ async def cb_rulet_cancel(callback: CallbackQuery):
             )
         except Exception as e:
             logger.warning("rulet cancel refund %s: %s", uid, e)
-    del _active_rulet_sessions[chat_id]
+    await lobby_engine.close(sess)
     try:
         await bot.edit_message_reply_markup(chat_id=chat_id, message_id=main_mid, reply_markup=None)
         await bot.edit_message_caption(chat_id=chat_id, message_id=main_mid, caption="🔫 Рулетка отменена. Ставки возвращены.")
     except Exception:
         pass
-    asyncio.create_task(delete_message_after_by_id(bot, chat_id, main_mid, config.GAME_RESULT_DELETE_TIMEOUT))
+    delete_message_later_by_id(bot, chat_id, main_mid, config.GAME_RESULT_DELETE_TIMEOUT)
     await callback.answer("Рулетка отменена, коины возвращены.")
 
 
 # ---------- /frekaz (ставка 1000–100000, макс 5 игроков, через 2 мин победитель по шансам пропорционально ставкам) ----------
-_active_frekaz_sessions: Dict[int, Dict] = {}  # chat_id -> {creator_id, bet, participants: [{user_id, bet}], message_id, bank, task, bot}
+_active_frekaz_sessions = session_manager.store(
+    "frekaz", owner_field="creator_id",
+    stake=lambda s: [(p["user_id"], p["bet"]) for p in s.get("participants", [])],
+)  # chat_id -> {creator_id, bet, participants: [{user_id, bet}], message_id, bank, bot}
+
+
+def _frekaz_lobby_render(sess: GameSession):
+    """Подпись и кнопки лобби фреказа по текущему составу"""
+    chat_id = sess.key
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Вступить", callback_data=pack("frekaz_join", chat_id)),
+         InlineKeyboardButton(text="Отмена", callback_data=pack("frekaz_cancel", chat_id))]
+    ])
+    caption = f"Участников: <b>{len(sess['participants'])}</b>. Банк: <b>{sess['bank']}</b> коинов. Через 2 мин — победитель."
+    return caption, keyboard
 
 
 async def _frekaz_finish(chat_id: int):
-    """Через 2 минуты — один победитель по весу ставок. Сообщения удаляются после результата."""
+    """Через 2 минуты (планировщик таймаутов) — один победитель по весу ставок. Сообщения удаляются после результата."""
     sess = _active_frekaz_sessions.get(chat_id)
+    if sess:
+        lobby_engine.discard(sess)
     if not sess or len(sess["participants"]) < 2:
         if sess:
+            del _active_frekaz_sessions[chat_id]
+            await lobby_engine.close(sess)
             try:
                 await sess["bot"].edit_message_reply_markup(chat_id=chat_id, message_id=sess["message_id"], reply_markup=None)
-                asyncio.create_task(delete_message_after_by_id(sess["bot"], chat_id, sess["message_id"], config.GAME_RESULT_DELETE_TIMEOUT))
+                delete_message_later_by_id(sess["bot"], chat_id, sess["message_id"], config.GAME_RESULT_DELETE_TIMEOUT)
             except Exception:
                 pass
-            del _active_frekaz_sessions[chat_id]
         return
     main_mid = sess["message_id"]
     bot = sess["bot"]
@@ -1238,18 +1323,16 @@ async def _frekaz_finish(chat_id: int):
     winner_id = winner["user_id"]
     bank = sess["bank"]
     del _active_frekaz_sessions[chat_id]
+    await lobby_engine.close(sess)
     try:
         try:
             await bot.edit_message_reply_markup(chat_id=chat_id, message_id=main_mid, reply_markup=None)
             await bot.edit_message_caption(chat_id=chat_id, message_id=main_mid, caption="🎲 Фреказ завершён. Победитель определён по ставкам.")
         except Exception:
             pass
-        asyncio.create_task(delete_message_after_by_id(bot, chat_id, main_mid, config.GAME_RESULT_DELETE_TIMEOUT))
-        await balance_service.add_game_win(
-            user_id=winner_id, gross_amount=bank,
-            command_source="/frekaz", comment="Победа во фреказе",
-            bot=bot, chat_id=chat_id, username=None, first_name=None,
-        )
+        delete_message_later_by_id(bot, chat_id, main_mid, config.GAME_RESULT_DELETE_TIMEOUT)
+        if not await _settle_pot(_active_frekaz_sessions, chat_id, sess, winner_id, winner["bet"]):
+            return
         user = await db.get_user(winner_id)
         un = (user.get("username") or "user") if user else "user"
         win_caption = format_message_with_username(
@@ -1260,7 +1343,7 @@ async def _frekaz_finish(chat_id: int):
             win_msg = await bot.send_photo(chat_id, FSInputFile(str(photo_path)), caption=win_caption)
         else:
             win_msg = await bot.send_message(chat_id, win_caption)
-        asyncio.create_task(delete_message_after_by_id(bot, chat_id, win_msg.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+        delete_message_later_by_id(bot, chat_id, win_msg.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
     except Exception as e:
         logger.exception("frekaz finish: %s", e)
 
@@ -1276,7 +1359,7 @@ async def cmd_frekaz(message: Message):
     if chat_id in _active_frekaz_sessions:
         sent = await message.answer(format_message_with_username(
             "В этом чате уже идёт фреказ. Вступи или дождись окончания.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     parts = (message.text or "").strip().split()
@@ -1289,7 +1372,7 @@ async def cmd_frekaz(message: Message):
     balance = await db.get_balance(user_id)
     if balance < bet:
         sent = await message.answer(format_insufficient_balance(username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     success, _, _, _ = await balance_service.subtract_balance(
@@ -1306,8 +1389,8 @@ async def cmd_frekaz(message: Message):
         username, first_name
     )
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Вступить", callback_data=f"frekaz_join_{chat_id}"),
-         InlineKeyboardButton(text="Отмена", callback_data=f"frekaz_cancel_{chat_id}")]
+        [InlineKeyboardButton(text="Вступить", callback_data=pack("frekaz_join", chat_id)),
+         InlineKeyboardButton(text="Отмена", callback_data=pack("frekaz_cancel", chat_id))]
     ])
     photo_path = config.get_image_path("frekaz.jpg")
     try:
@@ -1318,32 +1401,26 @@ async def cmd_frekaz(message: Message):
     except Exception as e:
         sent_msg = await message.answer(caption, reply_markup=keyboard)
 
-    _active_frekaz_sessions[chat_id] = {
+    _active_frekaz_sessions[chat_id] = GameSession({
         "creator_id": user_id,
         "bet": bet,
         "participants": [{"user_id": user_id, "bet": bet}],
         "message_id": sent_msg.message_id,
         "bank": bet,
         "bot": message.bot,
-    }
-    task = asyncio.create_task(_frekaz_delayed_finish(chat_id))
-    _active_frekaz_sessions[chat_id]["task"] = task
+    })
+    _active_frekaz_sessions[chat_id].set_timeout(getattr(config, "FREKAZ_DURATION", 120), _frekaz_finish, chat_id)
 
 
-async def _frekaz_delayed_finish(chat_id: int):
-    await asyncio.sleep(getattr(config, "FREKAZ_DURATION", 120))
-    await _frekaz_finish(chat_id)
-
-
-@router.callback_query(F.data.startswith("frekaz_join_"))
-async def cb_frekaz_join(callback: CallbackQuery):
-    try:
-        chat_id = int(callback.data.split("_")[-1])
-    except (ValueError, IndexError):
+@router.callback_query(CallbackPrefix("frekaz_join"))
+@session_locked(_active_frekaz_sessions)
+async def cb_frekaz_join(callback: CallbackQuery, payload: CallbackPayload):
+    chat_id = payload.get_int(0)
+    if chat_id is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     sess = _active_frekaz_sessions.get(chat_id)
-    if not sess:
+    if not sess or "winner" in sess:
         await callback.answer("Игра уже завершена.", show_alert=True)
         return
     user_id = callback.from_user.id
@@ -1369,29 +1446,28 @@ async def cb_frekaz_join(callback: CallbackQuery):
     if not success:
         await callback.answer("Не удалось списать ставку.", show_alert=True)
         return
+    if _active_frekaz_sessions.get(chat_id) is not sess:
+        # Пока списывали ставку, фреказ закончился
+        await balance_service.add_balance(user_id, bet, "/frekaz", "Возврат: фреказ уже завершён", bot=callback.bot, chat_id=chat_id)
+        await callback.answer("Игра уже завершена.", show_alert=True)
+        return
     sess["participants"].append({"user_id": user_id, "bet": bet})
     sess["bank"] += bet
-    try:
-        new_caption = f"Участников: <b>{len(sess['participants'])}</b>. Банк: <b>{sess['bank']}</b> коинов. Через 2 мин — победитель."
-        await callback.bot.edit_message_caption(
-            chat_id=chat_id, message_id=sess["message_id"],
-            caption=new_caption, reply_markup=callback.message.reply_markup
-        )
-    except Exception:
-        pass
+    _active_frekaz_sessions.save(chat_id)
+    lobby_engine.touch(sess, _frekaz_lobby_render)
     await callback.answer("Ты в игре!")
 
 
-@router.callback_query(F.data.startswith("frekaz_cancel_"))
-async def cb_frekaz_cancel(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("frekaz_cancel"))
+@session_locked(_active_frekaz_sessions)
+async def cb_frekaz_cancel(callback: CallbackQuery, payload: CallbackPayload):
     """Отмена фреказа создателем: возврат всем, удаление сообщения."""
-    try:
-        chat_id = int(callback.data.split("_")[-1])
-    except (ValueError, IndexError):
+    chat_id = payload.get_int(0)
+    if chat_id is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     sess = _active_frekaz_sessions.get(chat_id)
-    if not sess:
+    if not sess or "winner" in sess:
         await callback.answer("Игра уже завершена.", show_alert=True)
         return
     if callback.from_user.id != sess["creator_id"]:
@@ -1399,6 +1475,8 @@ async def cb_frekaz_cancel(callback: CallbackQuery):
         return
     bot = sess["bot"]
     main_mid = sess["message_id"]
+    # Сначала закрываем сессию (журнал), потом возвращаем ставки
+    del _active_frekaz_sessions[chat_id]
     for p in sess["participants"]:
         try:
             await balance_service.add_game_win(
@@ -1408,20 +1486,18 @@ async def cb_frekaz_cancel(callback: CallbackQuery):
             )
         except Exception as e:
             logger.warning("frekaz cancel refund %s: %s", p["user_id"], e)
-    if sess.get("task"):
-        sess["task"].cancel()
-    del _active_frekaz_sessions[chat_id]
+    await lobby_engine.close(sess)
     try:
         await bot.edit_message_reply_markup(chat_id=chat_id, message_id=main_mid, reply_markup=None)
         await bot.edit_message_caption(chat_id=chat_id, message_id=main_mid, caption="🎲 Фреказ отменён. Ставки возвращены.")
     except Exception:
         pass
-    asyncio.create_task(delete_message_after_by_id(bot, chat_id, main_mid, config.GAME_RESULT_DELETE_TIMEOUT))
+    delete_message_later_by_id(bot, chat_id, main_mid, config.GAME_RESULT_DELETE_TIMEOUT)
     await callback.answer("Фреказ отменён, коины возвращены.")
 
 
 # ---------- /perekyp (Перекуп: объявления, торг, перепродажа) ----------
-_active_perekyp_sessions: Dict[int, Dict] = {}  # user_id -> {chat_id, message_id, listing, scroll_count, torg_failed}
+_active_perekyp_sessions = session_manager.store("perekyp")  # user_id -> {chat_id, message_id, listing, scroll_count, torg_failed}
 
 # Спецпродавцы: редкие, фиксированное описание, 70% шанс окупа (не 100%)
 PEREKYP_SPECIAL_DIRECTRISA = {
@@ -1701,17 +1777,17 @@ def _perekyp_listing_caption(listing: Dict, username: str, first_name: str) -> s
 def _perekyp_keyboard(user_id: int, torg_failed: bool = False) -> InlineKeyboardMarkup:
     if torg_failed:
         return InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Купить", callback_data=f"perekyp_buy|{user_id}")],
-            [InlineKeyboardButton(text="Выйти", callback_data=f"perekyp_exit|{user_id}")],
+            [InlineKeyboardButton(text="Купить", callback_data=pack("perekyp_buy", user_id))],
+            [InlineKeyboardButton(text="Выйти", callback_data=pack("perekyp_exit", user_id))],
         ])
     return InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="Выйти", callback_data=f"perekyp_exit|{user_id}"),
-            InlineKeyboardButton(text="Пролистать", callback_data=f"perekyp_scroll|{user_id}"),
+            InlineKeyboardButton(text="Выйти", callback_data=pack("perekyp_exit", user_id)),
+            InlineKeyboardButton(text="Пролистать", callback_data=pack("perekyp_scroll", user_id)),
         ],
         [
-            InlineKeyboardButton(text="Купить", callback_data=f"perekyp_buy|{user_id}"),
-            InlineKeyboardButton(text="Торг", callback_data=f"perekyp_torg|{user_id}"),
+            InlineKeyboardButton(text="Купить", callback_data=pack("perekyp_buy", user_id)),
+            InlineKeyboardButton(text="Торг", callback_data=pack("perekyp_torg", user_id)),
         ],
     ])
 
@@ -1792,7 +1868,7 @@ async def _perekyp_do_buy(
         except Exception:
             sent_perekyp = await bot.send_message(chat_id, caption)
             result_msg_id = sent_perekyp.message_id if sent_perekyp else message_id
-    asyncio.create_task(delete_message_after_by_id(bot, chat_id, result_msg_id, config.GAME_RESULT_DELETE_TIMEOUT))
+    delete_message_later_by_id(bot, chat_id, result_msg_id, config.GAME_RESULT_DELETE_TIMEOUT)
 
 
 @router.message(Command("perekyp"))
@@ -1805,7 +1881,7 @@ async def cmd_perekyp(message: Message):
     if user_id in _active_perekyp_sessions:
         sent = await message.answer(format_message_with_username(
             "Заверши текущий перекуп (Выйти) или выбери объявление.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     parts = (message.text or "").strip().split()
@@ -1823,7 +1899,7 @@ async def cmd_perekyp(message: Message):
         sent = await message.answer(format_message_with_username(
             f"Для этого объявления нужно минимум <b>{listing['price']}</b> коинов. Баланс: {balance}.",
             username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     caption = _perekyp_listing_caption(listing, username or "", first_name or "")
@@ -1838,7 +1914,7 @@ async def cmd_perekyp(message: Message):
         logger.warning("perekyp start photo: %s", e)
         sent_msg = await message.answer(caption, reply_markup=keyboard)
 
-    _active_perekyp_sessions[user_id] = {
+    _active_perekyp_sessions[user_id] = GameSession({
         "chat_id": message.chat.id,
         "message_id": sent_msg.message_id,
         "listing": listing,
@@ -1846,28 +1922,14 @@ async def cmd_perekyp(message: Message):
         "scroll_count": 0,
         "torg_failed": False,
         "bot": message.bot,
-    }
+    })
     await set_command_cooldown(user_id, "/perekyp")
 
 
-def _parse_perekyp_cb(data: str, prefix: str):
-    """perekyp_exit|user_id -> (action, user_id). После префикса идёт только user_id (без второго |)."""
-    if not data.startswith(prefix):
-        return None, None
-    try:
-        rest = data[len(prefix):].strip()
-        if not rest:
-            return None, None
-        uid = int(rest)
-        action = prefix.replace("perekyp_", "").rstrip("|")
-        return action, uid
-    except (ValueError, IndexError):
-        return None, None
-
-
-@router.callback_query(F.data.startswith("perekyp_exit|"))
-async def cb_perekyp_exit(callback: CallbackQuery):
-    _, target_id = _parse_perekyp_cb(callback.data, "perekyp_exit|")
+@router.callback_query(CallbackPrefix("perekyp_exit"))
+@session_locked(_active_perekyp_sessions)
+async def cb_perekyp_exit(callback: CallbackQuery, payload: CallbackPayload):
+    target_id = payload.get_int(0)
     if target_id is None or callback.from_user.id != target_id:
         await _safe_callback_answer(callback, "Не жми на чужое!" if (target_id and callback.from_user.id != target_id) else "Ошибка", show_alert=True)
         return
@@ -1883,12 +1945,13 @@ async def cb_perekyp_exit(callback: CallbackQuery):
         )
     except Exception:
         pass
-    asyncio.create_task(delete_message_after_by_id(callback.bot, sess["chat_id"], sess["message_id"], config.GAME_RESULT_DELETE_TIMEOUT))
+    delete_message_later_by_id(callback.bot, sess["chat_id"], sess["message_id"], config.GAME_RESULT_DELETE_TIMEOUT)
 
 
-@router.callback_query(F.data.startswith("perekyp_scroll|"))
-async def cb_perekyp_scroll(callback: CallbackQuery):
-    _, target_id = _parse_perekyp_cb(callback.data, "perekyp_scroll|")
+@router.callback_query(CallbackPrefix("perekyp_scroll"))
+@session_locked(_active_perekyp_sessions)
+async def cb_perekyp_scroll(callback: CallbackQuery, payload: CallbackPayload):
+    target_id = payload.get_int(0)
     if target_id is None or callback.from_user.id != target_id:
         await _safe_callback_answer(callback, "Не жми на чужое!" if target_id else "Ошибка", show_alert=True)
         return
@@ -1920,9 +1983,10 @@ async def cb_perekyp_scroll(callback: CallbackQuery):
         logger.warning("perekyp scroll edit: %s", e)
 
 
-@router.callback_query(F.data.startswith("perekyp_buy|"))
-async def cb_perekyp_buy(callback: CallbackQuery):
-    _, target_id = _parse_perekyp_cb(callback.data, "perekyp_buy|")
+@router.callback_query(CallbackPrefix("perekyp_buy"))
+@session_locked(_active_perekyp_sessions)
+async def cb_perekyp_buy(callback: CallbackQuery, payload: CallbackPayload):
+    target_id = payload.get_int(0)
     if target_id is None or callback.from_user.id != target_id:
         await _safe_callback_answer(callback, "Не жми на чужое!" if target_id else "Ошибка", show_alert=True)
         return
@@ -1945,9 +2009,10 @@ async def cb_perekyp_buy(callback: CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("perekyp_torg|"))
-async def cb_perekyp_torg(callback: CallbackQuery):
-    _, target_id = _parse_perekyp_cb(callback.data, "perekyp_torg|")
+@router.callback_query(CallbackPrefix("perekyp_torg"))
+@session_locked(_active_perekyp_sessions)
+async def cb_perekyp_torg(callback: CallbackQuery, payload: CallbackPayload):
+    target_id = payload.get_int(0)
     if target_id is None or callback.from_user.id != target_id:
         await _safe_callback_answer(callback, "Не жми на чужое!" if target_id else "Ошибка", show_alert=True)
         return
@@ -1980,7 +2045,7 @@ async def cb_perekyp_torg(callback: CallbackQuery):
         except Exception:
             pass
         if torg_msg_id is not None:
-            asyncio.create_task(delete_message_after_by_id(bot, chat_id, torg_msg_id, config.GAME_RESULT_DELETE_TIMEOUT))
+            delete_message_later_by_id(bot, chat_id, torg_msg_id, config.GAME_RESULT_DELETE_TIMEOUT)
         listing = sess.get("listing")
         _active_perekyp_sessions.pop(target_id, None)
         await _safe_callback_answer(callback, "Торг удался! Покупаем…")
@@ -2000,7 +2065,7 @@ async def cb_perekyp_torg(callback: CallbackQuery):
     except Exception:
         pass
     if torg_msg_id is not None:
-        asyncio.create_task(delete_message_after_by_id(bot, chat_id, torg_msg_id, config.GAME_RESULT_DELETE_TIMEOUT))
+        delete_message_later_by_id(bot, chat_id, torg_msg_id, config.GAME_RESULT_DELETE_TIMEOUT)
     caption = _perekyp_listing_caption(sess["listing"], username, first_name)
     caption_extra = caption + "\n\n⚠️ Торг не удался — купи или выйди."
     try:
@@ -2033,7 +2098,7 @@ async def cmd_slot(message: Message):
     if await news_service.is_game_closed("slot"):
         sent = await message.answer(format_message_with_username(
             "Слоты временно на починке — загляни в /news.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     bet = config.SLOT_BET
@@ -2057,30 +2122,36 @@ async def cmd_slot(message: Message):
             use_free_daily = True
         else:
             sent_message = await message.answer(format_insufficient_balance(username, first_name))
-            asyncio.create_task(delete_message_after(sent_message))
+            delete_message_later(sent_message)
             return
 
-    if bet_charged > 0:
-        success, balance_before, balance_after, error = await balance_service.subtract_balance(
+    receipt = balance_service.receipt()
+    try:
+        final_chance = await calculate_win_chance_async(base_chance, user_id, "slot")
+        roll = game_random.random()
+        is_win = roll < final_chance
+
+        win_to_add = 0
+        if is_win:
+            win_to_add = min(win_amount, getattr(config, "FREE_GAME_WIN_CAP", 100)) if use_free_daily else win_amount
+            slot_day = await db.get_global_event("slot_day")
+            if slot_day:
+                win_to_add = int(win_to_add * 1.1)
+        # Ставка, выигрыш с налогом и логи игры — одной транзакцией
+        success, balance_final, _ = await balance_service.settle_game(
             user_id=user_id,
-            amount=bet_charged,
-            command_source="/slot",
-            comment="Ставка в слотах",
+            stake=bet,
+            payout=win_to_add,
+            game="slot",
+            charge=bet_charged,
+            comment="слоты",
             message=message,
             username=username,
             first_name=first_name,
-            allow_negative=False
+            receipt=receipt,
         )
         if not success:
             return
-        balance_after_slot = balance_after
-    else:
-        balance_after_slot = balance
-
-    try:
-        final_chance = await calculate_win_chance_async(base_chance, user_id, "slot")
-        roll = game_random.random()
-        is_win = roll < final_chance
 
         await set_command_cooldown(user_id, "/slot")
         
@@ -2088,32 +2159,8 @@ async def cmd_slot(message: Message):
         if is_win:
             # Выигрыш - показываем 5.jpg (согласно README: "5.jpg — шанс 5% это и есть выигрыш")
             photo_path = config.get_image_path("5.jpg")
-            win_to_add = min(win_amount, getattr(config, "FREE_GAME_WIN_CAP", 100)) if use_free_daily else win_amount
-            slot_day = await db.get_global_event("slot_day")
-            if slot_day:
-                win_to_add = int(win_to_add * 1.1)
-            _, _, _, tax = await balance_service.add_game_win(
-                user_id=user_id,
-                gross_amount=win_to_add,
-                command_source="/slot",
-                comment="Выигрыш в слотах",
-                message=message,
-                username=username,
-                first_name=first_name,
-            )
-            await db.log_admin_game(user_id, username, "/slot", bet, "win", win_to_add - (bet_charged or 0), tax or 0)
             if use_free_daily:
                 await db.set_free_game_used_today(user_id)
-            
-            await db.log_game_session(
-                user_id=user_id,
-                game_type="slot",
-                bet=bet,
-                result="win",
-                amount_change=win_amount - bet,
-                multiplier=1.0
-            )
-            balance_final = await db.get_balance(user_id)
             await _update_mmr_and_achievements(user_id, "slot", "win", balance_final)
             await db.add_cup_win(user_id, "slot")
             caption = format_message_with_username(
@@ -2121,7 +2168,8 @@ async def cmd_slot(message: Message):
                 f"Выиграл: <b>{win_to_add}</b> коинов 💰\n"
                 f"Твой баланс: <b>{balance_final}</b> коинов"
                 + (" (фриспин)" if use_free else "")
-                + (" (бесплатная игра)" if use_free_daily else ""),
+                + (" (бесплатная игра)" if use_free_daily else "")
+                + receipt.render(),
                 username, first_name
             )
             if photo_path.exists():
@@ -2130,7 +2178,7 @@ async def cmd_slot(message: Message):
             else:
                 sent_message = await message.answer(caption)
                 logger.warning(f"Фото 5.jpg не найдено для пользователя {user_id}")
-            asyncio.create_task(delete_message_after(sent_message, config.GAME_RESULT_DELETE_TIMEOUT))
+            delete_message_later(sent_message, config.GAME_RESULT_DELETE_TIMEOUT)
             logger.info(
                 f"Пользователь {user_id} сыграл в /slot: "
                 f"bet={bet}, win={is_win}, chance={final_chance:.4f} (base={base_chance:.4f})"
@@ -2141,21 +2189,13 @@ async def cmd_slot(message: Message):
             caption = format_message_with_username(
                 f"🎰 <b>ПРОИГРЫШ</b>\n\n"
                 f"Ставка: {bet} коинов\n"
-                f"Твой баланс: <b>{balance_after_slot}</b> коинов"
-                + (" (фриспин)" if use_free else ""),
+                f"Твой баланс: <b>{balance_final}</b> коинов"
+                + (" (фриспин)" if use_free else "")
+                + receipt.render(),
                 username, first_name
             )
             
-            await db.log_game_session(
-                user_id=user_id,
-                game_type="slot",
-                bet=bet,
-                result="loss",
-                amount_change=-bet,
-                multiplier=1.0
-            )
-            await db.log_admin_game(user_id, username, "/slot", bet, "loss", -bet, 0)
-            await _update_mmr_and_achievements(user_id, "slot", "loss", balance_after_slot)
+            await _update_mmr_and_achievements(user_id, "slot", "loss", balance_final)
         
             # Отправляем фото
             if photo_path.exists():
@@ -2164,15 +2204,14 @@ async def cmd_slot(message: Message):
             else:
                 sent_message = await message.answer(caption)
                 logger.warning(f"Фото {photo_path.name} не найдено для пользователя {user_id}")
-            asyncio.create_task(delete_message_after(sent_message, config.GAME_RESULT_DELETE_TIMEOUT))
+            delete_message_later(sent_message, config.GAME_RESULT_DELETE_TIMEOUT)
             logger.info(
                 f"Пользователь {user_id} сыграл в /slot: "
                 f"bet={bet}, win={is_win}, chance={final_chance:.4f} (base={base_chance:.4f})"
             )
     except Exception as e:
+        # Расчёт атомарный: до него ничего не списано, после — ставка сыграна (возврат не нужен)
         logger.exception("Ошибка в /slot для %s: %s", user_id, e)
-        if bet_charged > 0:
-            await balance_service.add_balance(user_id=user_id, amount=bet_charged, command_source="/slot", comment="Возврат при сбое", message=message, username=username, first_name=first_name)
         await message.answer(format_game_error(username, first_name))
 
 
@@ -2198,7 +2237,7 @@ async def cmd_konopla(message: Message):
     if await news_service.is_game_closed("konopla"):
         sent = await message.answer(format_message_with_username(
             "Канапля временно на починке — загляни в /news.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     bet = config.KONOPLA_BET
@@ -2209,91 +2248,52 @@ async def cmd_konopla(message: Message):
     balance = await db.get_balance(user_id)
     if balance < bet:
         sent_message = await message.answer(format_insufficient_balance(username, first_name))
-        asyncio.create_task(delete_message_after(sent_message))
+        delete_message_later(sent_message)
         return
 
-    bet_subtracted = False
+    receipt = balance_service.receipt()
     try:
         final_chance = await calculate_win_chance_async(base_chance, user_id, "konopla")
         roll = game_random.random()
         is_win = roll < final_chance
 
-        success, balance_before, balance_after, error = await balance_service.subtract_balance(
+        # Ставка, выигрыш или штраф за проигрыш (если на него хватает) и логи — одной транзакцией
+        success, final_balance, _ = await balance_service.settle_game(
             user_id=user_id,
-            amount=bet,
-            command_source="/konopla",
-            comment="Ставка в конопле",
+            stake=bet,
+            payout=win_amount if is_win else 0,
+            game="konopla",
+            penalty=0 if is_win else loss_amount,
+            comment="конопля",
             message=message,
             username=username,
             first_name=first_name,
-            allow_negative=False
+            receipt=receipt,
         )
         if not success:
             return
-        bet_subtracted = True
 
         await set_command_cooldown(user_id, "/konopla")
 
         if is_win:
             photo_path = config.get_image_path("konwin.jpg")
-            _, _, _, tax = await balance_service.add_game_win(
-                user_id=user_id,
-                gross_amount=win_amount,
-                command_source="/konopla",
-                comment="Выигрыш в конопле",
-                message=message,
-                username=username,
-                first_name=first_name,
-            )
-            await db.log_admin_game(user_id, username, "/konopla", bet, "win", win_amount - bet, tax or 0)
-            balance_final = await db.get_balance(user_id)
-            await db.log_game_session(
-                user_id=user_id,
-                game_type="konopla",
-                bet=bet,
-                result="win",
-                amount_change=win_amount - bet,
-                multiplier=1.0
-            )
-            await _update_mmr_and_achievements(user_id, "konopla", "win", balance_final)
+            await _update_mmr_and_achievements(user_id, "konopla", "win", final_balance)
             caption = format_message_with_username(
                 f"🌿 <b>ВЫИГРЫШ!</b>\n\n"
                 f"Выиграл: <b>{win_amount}</b> коинов 💰\n"
-                f"Твой баланс: <b>{balance_final}</b> коинов",
+                f"Твой баланс: <b>{final_balance}</b> коинов"
+                + receipt.render(),
                 username, first_name
             )
         else:
             photo_path = config.get_image_path("kon.jpg")
-            balance_after_bet = await db.get_balance(user_id)
-            if balance_after_bet >= loss_amount:
-                await balance_service.subtract_balance(
-                    user_id=user_id,
-                    amount=loss_amount,
-                    command_source="/konopla",
-                    comment="Проигрыш в конопле",
-                    message=message,
-                    username=username,
-                    first_name=first_name,
-                    allow_negative=False
-                )
-                final_balance = balance_after_bet - loss_amount
-            else:
-                final_balance = balance_after_bet
-            await db.log_game_session(
-                user_id=user_id,
-                game_type="konopla",
-                bet=bet,
-                result="loss",
-                amount_change=-(bet + (loss_amount if balance_after_bet >= loss_amount else 0)),
-                multiplier=1.0
-            )
-            await db.log_admin_game(user_id, username, "/konopla", bet, "loss", -(bet + (loss_amount if balance_after_bet >= loss_amount else 0)), 0)
             await _update_mmr_and_achievements(user_id, "konopla", "loss", final_balance)
             caption = format_message_with_username(
                 f"🌿 <b>ПРОИГРЫШ</b>\n\n"
                 f"Ставка: {bet} коинов\n"
                 f"Проигрыш: {loss_amount} коинов\n"
-                f"Твой баланс: <b>{final_balance}</b> коинов",
+                f"Твой баланс: <b>{final_balance}</b> коинов"
+                + receipt.render(),
                 username, first_name
             )
 
@@ -2303,104 +2303,164 @@ async def cmd_konopla(message: Message):
         else:
             sent_message = await message.answer(caption)
             logger.warning(f"Фото {photo_path.name} не найдено для пользователя {user_id}")
-        asyncio.create_task(delete_message_after(sent_message, config.GAME_RESULT_DELETE_TIMEOUT))
+        delete_message_later(sent_message, config.GAME_RESULT_DELETE_TIMEOUT)
         logger.info(
             f"Пользователь {user_id} сыграл в /konopla: "
             f"bet={bet}, win={is_win}, chance={final_chance:.4f} (base={base_chance:.4f})"
         )
     except Exception as e:
+        # Расчёт атомарный: до него ничего не списано, после — ставка сыграна (возврат не нужен)
         logger.exception("Ошибка в /konopla для %s: %s", user_id, e)
-        if bet_subtracted:
-            try:
-                await balance_service.add_balance(user_id=user_id, amount=bet, command_source="/konopla", comment="Возврат при сбое", message=message, username=username, first_name=first_name)
-            except Exception:
-                pass
         await message.answer(format_game_error(username, first_name))
 
 
-async def kripta_game_loop(bot: Bot, user_id: int, session_data: Dict):
+class KriptaTicker:
     """
-    Фоновая задача для обновления множителя в игре /kripta
-    Обновляет сообщение каждые 10 секунд до обвала
+    Один тикер на все игры /kripta вместо отдельной задачи на каждую сессию.
+    Куча (время ближайшего события, seq, user_id, сессия) — событием считается рост
+    множителя или обвал. Времена округляются вверх до сетки KRIPTA_TICK_INTERVAL,
+    поэтому тикер просыпается не чаще раза за тик, а множители всех сессий
+    записываются в kripta_sessions одним executemany.
     """
+
+    def __init__(self):
+        self._heap: list = []
+        self._seq = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running: set = set()  # задачи обвала и редактирования, запущенные тикером
+
+    def _tick(self) -> float:
+        return max(0.1, float(getattr(config, "KRIPTA_TICK_INTERVAL", 1.0)))
+
+    def _push(self, user_id: int, session_data: Dict) -> None:
+        event_at = min(session_data["next_update_at"], session_data["crash_at"])
+        tick = self._tick()
+        event_at = -(-event_at // tick) * tick  # ceil до сетки тиков
+        self._seq += 1
+        heapq.heappush(self._heap, (event_at, self._seq, user_id, session_data))
+        if self._wakeup is not None and self._heap[0][2] == user_id:
+            self._wakeup.set()
+
+    def add(self, bot: Bot, user_id: int, session_data: Dict) -> None:
+        """Поставить сессию на обслуживание тикером"""
+        session_data["bot"] = bot
+        self._push(user_id, session_data)
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._process_due(time.time())
+            except Exception as e:
+                logger.error(f"Ошибка тикера kripta: {e}", exc_info=True)
+            timer = None
+            if self._heap:
+                delay = max(0.0, self._heap[0][0] - time.time())
+                timer = loop.call_later(delay, self._wakeup.set)
+            try:
+                await self._wakeup.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+    async def _process_due(self, now: float) -> None:
+        """Один тик: обвалы, рост множителей, одна запись в БД и правки сообщений"""
+        interval = config.KRIPTA_MULTIPLIER_INTERVAL
+        rows = []
+        edits = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, user_id, session_data = heapq.heappop(self._heap)
+            # Сессию уже забрали/отменили — запись в куче устарела
+            if _active_kripta_sessions.get(user_id) is not session_data or not session_data.get("is_active"):
+                continue
+            if now >= session_data["crash_at"]:
+                session_data["is_active"] = False  # «Забрать» после этого момента не сработает
+                self._spawn(_handle_kripta_crash(session_data["bot"], user_id, session_data, session_data["current_multiplier"]))
+                continue
+            if now >= session_data["next_update_at"]:
+                session_data["current_multiplier"] += 1.0
+                session_data["next_update_at"] = now + interval
+                rows.append((session_data["current_multiplier"], int(session_data["next_update_at"]), user_id))
+                edits.append((user_id, session_data))
+            self._push(user_id, session_data)
+        if rows:
+            try:
+                await db.update_kripta_multipliers(rows)
+            except Exception as e:
+                logger.error(f"Не удалось записать множители kripta ({len(rows)} сессий): {e}")
+        for user_id, session_data in edits:
+            _kripta_edit_caption(user_id, session_data)
+
+
+def _kripta_edit_caption(user_id: int, session_data: Dict) -> None:
+    """Обновление сообщения Lucky Jet после роста множителя (через склейку правок: при медленном API уйдёт последний множитель)"""
+    current_multiplier = session_data["current_multiplier"]
+    bet = session_data["bet"]
     try:
-        multiplier_interval = config.KRIPTA_MULTIPLIER_INTERVAL
-        current_multiplier = session_data["current_multiplier"]
-        next_update_at = session_data["next_update_at"]
-        crash_at = session_data["crash_at"]
-        message_id = session_data["message_id"]
-        chat_id = session_data["chat_id"]
-        bet = session_data["bet"]
+        caption = (
+            f"🚀 <b>LUCKY JET</b>\n\n"
+            f"Множитель: <b>x{current_multiplier:.1f}</b>\n"
+            f"Ставка: {bet} коинов\n"
+            f"Потенциальный выигрыш: <b>{int(bet * current_multiplier)}</b> коинов\n\n"
+            f"⚠️ Игра может обвалиться в любой момент!"
+        )
         
-        while True:
-            now = time.time()
-            
-            # Проверяем, не обвалилась ли игра
-            if now >= crash_at:
-                # Игра обвалилась
-                await _handle_kripta_crash(bot, user_id, session_data, current_multiplier)
-                break
-            
-            # Проверяем, нужно ли обновить множитель
-            if now >= next_update_at:
-                # Увеличиваем множитель
-                current_multiplier += 1.0
-                next_update_at = now + multiplier_interval
-                
-                # Обновляем в БД
-                await db.update_kripta_multiplier(user_id, current_multiplier, int(next_update_at))
-                
-                # Обновляем в памяти
-                if user_id in _active_kripta_sessions:
-                    _active_kripta_sessions[user_id]["current_multiplier"] = current_multiplier
-                    _active_kripta_sessions[user_id]["next_update_at"] = next_update_at
-                
-                # Обновляем сообщение
-                try:
-                    caption = (
-                        f"🚀 <b>LUCKY JET</b>\n\n"
-                        f"Множитель: <b>x{current_multiplier:.1f}</b>\n"
-                        f"Ставка: {bet} коинов\n"
-                        f"Потенциальный выигрыш: <b>{int(bet * current_multiplier)}</b> коинов\n\n"
-                        f"⚠️ Игра может обвалиться в любой момент!"
-                    )
-                    
-                    keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-                        InlineKeyboardButton(
-                            text=f"Забрать x{current_multiplier:.1f}",
-                            callback_data=f"kripta_take_{user_id}"
-                        )
-                    ]])
-                    
-                    await bot.edit_message_caption(
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        caption=caption,
-                        reply_markup=keyboard
-                    )
-                except TelegramBadRequest as e:
-                    # Сообщение уже было изменено или удалено
-                    logger.warning(f"Не удалось обновить сообщение kripta для {user_id}: {e}")
-                    break
-                except Exception as e:
-                    logger.error(f"Ошибка обновления сообщения kripta для {user_id}: {e}")
-                    break
-            
-            # Ждем до следующего обновления или обвала
-            sleep_time = min(next_update_at - now, crash_at - now, 1.0)
-            if sleep_time > 0:
-                await asyncio.sleep(sleep_time)
-            else:
-                break
-                
-    except asyncio.CancelledError:
-        logger.info(f"Задача kripta для пользователя {user_id} отменена")
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(
+                text=f"Забрать x{current_multiplier:.1f}",
+                callback_data=pack("kripta_take", user_id)
+            )
+        ]])
+        
+        edit_coalescer.submit(
+            session_data["bot"], session_data["chat_id"], session_data["message_id"], caption, keyboard
+        )
     except Exception as e:
-        logger.error(f"Ошибка в задаче kripta для пользователя {user_id}: {e}", exc_info=True)
-        # Закрываем сессию при ошибке
+        logger.error(f"Ошибка обновления сообщения kripta для {user_id}: {e}")
+
+
+_kripta_ticker = KriptaTicker()
+
+
+@_active_kripta_sessions.on_resume
+async def _kripta_resume(bot: Bot, user_id: int, state: Dict) -> bool:
+    """
+    Продолжение /kripta после перезапуска по строке kripta_sessions
+    Если обвал пришёлся на время простоя, игрок не мог забрать — игра отменяется и ставка возвращается.
+    """
+    row = await db.get_kripta_session(user_id)
+    now = time.time()
+    if not row or row["crash_at"] <= now:
         await db.close_kripta_session(user_id)
-        if user_id in _active_kripta_sessions:
-            del _active_kripta_sessions[user_id]
+        return False
+    session_data = GameSession({
+        "user_id": user_id,
+        "bet": row["bet"],
+        "current_multiplier": row["current_multiplier"],
+        "message_id": row["message_id"],
+        "chat_id": row["chat_id"],
+        "started_at": row["started_at"],
+        "next_update_at": max(row["next_update_at"], now),
+        "crash_at": row["crash_at"],
+        "is_active": True
+    })
+    _active_kripta_sessions[user_id] = session_data
+    _kripta_ticker.add(bot, user_id, session_data)
+    logger.info(f"Игра /kripta пользователя {user_id} продолжена после перезапуска (x{row['current_multiplier']:.1f})")
+    return True
 
 
 async def _handle_kripta_crash(bot: Bot, user_id: int, session_data: Dict, final_multiplier: float):
@@ -2417,24 +2477,23 @@ async def _handle_kripta_crash(bot: Bot, user_id: int, session_data: Dict, final
         # При краше — всегда проигрыш: kriptalox.jpg + текст проигрыша и множителя
         photo_path = config.get_image_path("kriptalox.jpg")
         
-        await db.log_game_session(
-            user_id=user_id,
-            game_type="kripta",
-            bet=bet,
-            result="loss",
-            amount_change=-bet,
-            multiplier=final_multiplier
+        # Ставка списана при старте: денег не движется, логи проигрыша — одной транзакцией
+        await balance_service.settle_game(
+            user_id=user_id, stake=bet, payout=0, game="kripta", charge=0,
+            multiplier=final_multiplier, username=username,
         )
-        await db.log_admin_game(user_id, username or "", "/kripta", bet, "loss", -bet, 0)
         balance_after = await db.get_balance(user_id)
         await _update_mmr_and_achievements(user_id, "kripta", "loss", balance_after)
+        receipt = balance_service.receipt(session_data.get("receipt"))
         caption = format_message_with_username(
             f"🚀 <b>ПРОИГРЫШ</b>\n\n"
-            f"Проиграл <b>{bet}</b> коинов на множителе <b>x{final_multiplier:.1f}</b>",
+            f"Проиграл <b>{bet}</b> коинов на множителе <b>x{final_multiplier:.1f}</b>"
+            + receipt.render(),
             username, first_name
         )
         
-        # Обновляем сообщение: в aiogram 3 нужен InputMediaPhoto
+        # Обновляем сообщение: в aiogram 3 нужен InputMediaPhoto; тиковая правка не должна затереть итог
+        await edit_coalescer.close(chat_id, message_id)
         try:
             if photo_path.exists():
                 media = InputMediaPhoto(media=FSInputFile(str(photo_path)), caption=caption)
@@ -2442,7 +2501,7 @@ async def _handle_kripta_crash(bot: Bot, user_id: int, session_data: Dict, final
             else:
                 await bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=caption)
             game_timeout = getattr(config, "GAME_RESULT_DELETE_TIMEOUT", 20)
-            asyncio.create_task(delete_message_after_by_id(bot, chat_id, message_id, game_timeout))
+            delete_message_later_by_id(bot, chat_id, message_id, game_timeout)
         except Exception as e:
             logger.error(f"Ошибка обновления финального сообщения kripta для {user_id}: {e}")
             try:
@@ -2452,21 +2511,61 @@ async def _handle_kripta_crash(bot: Bot, user_id: int, session_data: Dict, final
                     sent = await bot.send_message(chat_id=chat_id, text=caption)
                 if sent:
                     game_timeout = getattr(config, "GAME_RESULT_DELETE_TIMEOUT", 20)
-                    asyncio.create_task(delete_message_after_by_id(bot, chat_id, sent.message_id, game_timeout))
+                    delete_message_later_by_id(bot, chat_id, sent.message_id, game_timeout)
             except Exception as e2:
                 logger.error(f"Не удалось отправить результат kripta: {e2}")
         
         # Закрываем сессию
         await db.close_kripta_session(user_id)
-        if user_id in _active_kripta_sessions:
-            if "task" in _active_kripta_sessions[user_id]:
-                _active_kripta_sessions[user_id]["task"].cancel()
+        if _active_kripta_sessions.get(user_id) is session_data:
             del _active_kripta_sessions[user_id]
             
     except Exception as e:
         logger.error(f"Ошибка обработки обвала kripta для {user_id}: {e}", exc_info=True)
 
 
+async def _kripta_settle_take(
+    bot: Bot, user_id: int, session_data: GameSession, chat_id: int,
+    username: Optional[str] = None, first_name: Optional[str] = None, receipt=None
+) -> Optional[int]:
+    """
+    Выплата «Забрать» снятой сессии по её множителю: ставка списана при старте, выигрыш
+    с налогом и логи — одной транзакцией. Не записалось — сессия возвращается в хранилище
+    (is_active=False: тикер её не тронет) и выплата повторяется через GAME_SETTLE_RETRY.
+
+    Returns:
+        Баланс после выплаты или None
+    """
+    multiplier = session_data["current_multiplier"]
+    bet = session_data["bet"]
+    settled, balance_after, _ = await balance_service.settle_game(
+        user_id=user_id, stake=bet, payout=int(bet * multiplier), game="kripta", charge=0,
+        multiplier=multiplier, comment=f"Lucky Jet x{multiplier:.1f}",
+        bot=bot, chat_id=chat_id, username=username, first_name=first_name, receipt=receipt,
+    )
+    if not settled:
+        _restore_unsettled(_active_kripta_sessions, user_id, session_data, _kripta_take_retry, bot, user_id)
+        return None
+    return balance_after
+
+
+async def _kripta_take_retry(bot: Bot, user_id: int):
+    """Повтор выплаты «Забрать», если прошлый расчёт не записался (вызывается планировщиком таймаутов)"""
+    session_data = _active_kripta_sessions.get(user_id)
+    if not session_data:
+        return
+    async with session_data.lock:
+        if _active_kripta_sessions.get(user_id) is not session_data:
+            return
+        _active_kripta_sessions.pop(user_id)
+        balance_after = await _kripta_settle_take(bot, user_id, session_data, session_data["chat_id"])
+        if balance_after is None:
+            return
+    await db.close_kripta_session(user_id)
+    await _update_mmr_and_achievements(user_id, "kripta", "win", balance_after)
+    logger.info(f"Выигрыш /kripta пользователя {user_id} зачислен повторным расчётом")
+
+
 @router.message(Command("kripta"))
 async def cmd_kripta(message: Message):
     """
@@ -2485,13 +2584,13 @@ async def cmd_kripta(message: Message):
             username, first_name
         )
         sent_message = await message.answer(response_text)
-        asyncio.create_task(delete_message_after(sent_message))
+        delete_message_later(sent_message)
         return
 
     if await news_service.is_game_closed("kripta"):
         sent = await message.answer(format_message_with_username(
             "Lucky Jet временно на починке — загляни в /news.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     user = await db.get_user(user_id)
@@ -2509,7 +2608,7 @@ async def cmd_kripta(message: Message):
                 username, first_name
             )
             sent_message = await message.answer(response_text)
-            asyncio.create_task(delete_message_after(sent_message))
+            delete_message_later(sent_message)
             return
         
         bet = int(parts[1])
@@ -2522,15 +2621,17 @@ async def cmd_kripta(message: Message):
             username, first_name
         )
         sent_message = await message.answer(response_text)
-        asyncio.create_task(delete_message_after(sent_message))
+        delete_message_later(sent_message)
         return
     
     balance = await db.get_balance(user_id)
     if balance < bet:
         sent_message = await message.answer(format_insufficient_balance(username, first_name))
-        asyncio.create_task(delete_message_after(sent_message))
+        delete_message_later(sent_message)
         return
     
+    # «Списано» покажется в итоговом сообщении игры (чек хранится в сессии)
+    receipt = balance_service.receipt()
     success, balance_before, balance_after, error = await balance_service.subtract_balance(
         user_id=user_id,
         amount=bet,
@@ -2539,7 +2640,8 @@ async def cmd_kripta(message: Message):
         message=message,
         username=username,
         first_name=first_name,
-        allow_negative=False
+        allow_negative=False,
+        receipt=receipt
     )
     
     if not success:
@@ -2579,7 +2681,7 @@ async def cmd_kripta(message: Message):
     keyboard = InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(
             text="Забрать x1.0",
-            callback_data=f"kripta_take_{user_id}"
+            callback_data=pack("kripta_take", user_id)
         )
     ]])
     
@@ -2609,7 +2711,7 @@ async def cmd_kripta(message: Message):
     )
     
     # Создаем сессию в памяти
-    session_data = {
+    session_data = GameSession({
         "user_id": user_id,
         "bet": bet,
         "current_multiplier": 1.0,
@@ -2618,15 +2720,13 @@ async def cmd_kripta(message: Message):
         "started_at": now,
         "next_update_at": now + multiplier_interval,
         "crash_at": crash_at,
-        "is_active": True
-    }
+        "is_active": True,
+        "receipt": receipt.entries
+    })
     
-    # Запускаем фоновую задачу обновления множителя
-    task = asyncio.create_task(
-        kripta_game_loop(message.bot, user_id, session_data)
-    )
-    session_data["task"] = task
+    # Рост множителя и обвал обслуживает общий тикер
     _active_kripta_sessions[user_id] = session_data
+    _kripta_ticker.add(message.bot, user_id, session_data)
     
     logger.info(
         f"Пользователь {user_id} начал игру /kripta: "
@@ -2634,17 +2734,16 @@ async def cmd_kripta(message: Message):
     )
 
 
-@router.callback_query(F.data.startswith("kripta_take_"))
-async def callback_kripta_take(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("kripta_take"))
+@session_locked(_active_kripta_sessions)
+async def callback_kripta_take(callback: CallbackQuery, payload: CallbackPayload):
     """Обработчик кнопки "Забрать" в игре /kripta"""
     # Проверяем, что callback от правильного пользователя
     callback_user_id = callback.from_user.id
-    callback_data = callback.data
     
     # Извлекаем user_id из callback_data
-    try:
-        target_user_id = int(callback_data.split("_")[-1])
-    except (ValueError, IndexError):
+    target_user_id = payload.get_int(0)
+    if target_user_id is None:
         await callback.answer("Ошибка обработки запроса", show_alert=True)
         return
     
@@ -2663,6 +2762,10 @@ async def callback_kripta_take(callback: CallbackQuery):
     if not session_data.get("is_active", False):
         await callback.answer("Игра уже завершена", show_alert=True)
         return
+    # Тикер больше не трогает эту сессию (и повторное нажатие не пройдёт)
+    session_data["is_active"] = False
+    # Сессия закрывается в журнале до зачисления выигрыша
+    del _active_kripta_sessions[target_user_id]
     
     # Кнопка «Забрать» = пользователь забирает вовремя (README: «можно забрать вовремя»).
     # Проигрыш только при краше; при нажатии «Забрать» — всегда выигрыш по текущему множителю.
@@ -2675,34 +2778,23 @@ async def callback_kripta_take(callback: CallbackQuery):
 
     photo_path = config.get_image_path("kriptawin.jpg")
 
-    _, _, _, tax = await balance_service.add_game_win(
-        user_id=target_user_id,
-        gross_amount=win_amount,
-        command_source="/kripta",
-        comment=f"Выигрыш в Lucky Jet (x{current_multiplier:.1f})",
-        bot=callback.bot,
-        chat_id=callback.message.chat.id,
-        username=username,
-        first_name=first_name,
-    )
-    await db.log_admin_game(target_user_id, username, "/kripta", bet, "win", win_amount - bet, tax or 0)
-    balance_after = await db.get_balance(target_user_id)
-    await db.log_game_session(
-        user_id=target_user_id,
-        game_type="kripta",
-        bet=bet,
-        result="win",
-        amount_change=win_amount - bet,
-        multiplier=current_multiplier
+    receipt = balance_service.receipt(session_data.get("receipt"))
+    balance_after = await _kripta_settle_take(
+        callback.bot, target_user_id, session_data, callback.message.chat.id, username, first_name, receipt
     )
+    if balance_after is None:
+        await callback.answer("Не удалось зачислить выигрыш — повторим автоматически.", show_alert=True)
+        return
     await _update_mmr_and_achievements(target_user_id, "kripta", "win", balance_after)
     caption = format_message_with_username(
         f"🚀 <b>ВЫИГРЫШ!</b>\n\n"
         f"Выиграл <b>{win_amount}</b> коинов на множителе <b>x{current_multiplier:.1f}</b> 💰\n"
-        f"Твой баланс: <b>{balance_after}</b> коинов",
+        f"Твой баланс: <b>{balance_after}</b> коинов"
+        + receipt.render(),
         username, first_name
     )
 
+    await edit_coalescer.close(callback.message.chat.id, callback.message.message_id)
     try:
         if photo_path.exists():
             media = InputMediaPhoto(media=FSInputFile(str(photo_path)), caption=caption)
@@ -2720,10 +2812,10 @@ async def callback_kripta_take(callback: CallbackQuery):
                 reply_markup=None
             )
         game_timeout = getattr(config, "GAME_RESULT_DELETE_TIMEOUT", 20)
-        asyncio.create_task(delete_message_after_by_id(
+        delete_message_later_by_id(
             callback.bot, callback.message.chat.id, callback.message.message_id,
             game_timeout
-        ))
+        )
     except Exception as e:
         logger.error(f"Ошибка обновления сообщения kripta при раннем выходе для {target_user_id}: {e}")
         try:
@@ -2737,18 +2829,14 @@ async def callback_kripta_take(callback: CallbackQuery):
                 sent = await callback.bot.send_message(callback.message.chat.id, text=caption)
             if sent:
                 game_timeout = getattr(config, "GAME_RESULT_DELETE_TIMEOUT", 20)
-                asyncio.create_task(delete_message_after_by_id(
+                delete_message_later_by_id(
                     callback.bot, callback.message.chat.id, sent.message_id,
                     game_timeout
-                ))
+                )
         except Exception:
             pass
 
     await db.close_kripta_session(target_user_id)
-    if target_user_id in _active_kripta_sessions:
-        if "task" in _active_kripta_sessions[target_user_id]:
-            _active_kripta_sessions[target_user_id]["task"].cancel()
-        del _active_kripta_sessions[target_user_id]
 
     await callback.answer("Выигрыш зачислен!", show_alert=False)
     logger.info(
@@ -2784,11 +2872,11 @@ async def cmd_plsdon(message: Message):
     if await news_service.is_game_closed("plsdon"):
         sent = await message.answer(format_message_with_username(
             "Задонать временно на починке — загляни в /news.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     # Проверяем cooldown
-    last_used = await db.get_cooldown(user_id, "/plsdon")
+    last_used = await cooldown_service.get_last_used(user_id, "/plsdon")
     now = int(time.time())
     cooldown_seconds = config.PLSDON_COOLDOWN
     
@@ -2805,7 +2893,7 @@ async def cmd_plsdon(message: Message):
                 username, first_name
             )
             sent_message = await message.answer(response_text)
-            asyncio.create_task(delete_message_after(sent_message))
+            delete_message_later(sent_message)
             return
     
     # Устанавливаем cooldown
@@ -2818,7 +2906,7 @@ async def cmd_plsdon(message: Message):
     keyboard = InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(
             text="Пожертвовать 50 коинов",
-            callback_data=f"plsdon_donate_{user_id}"
+            callback_data=pack("plsdon_donate", user_id)
         )
     ]])
     
@@ -2841,15 +2929,15 @@ async def cmd_plsdon(message: Message):
         global_message = await message.answer(global_caption, reply_markup=keyboard)
     
     # Сохраняем сообщение для обработки кнопки
-    _active_plsdon_messages[user_id] = {
+    _active_plsdon_messages[user_id] = GameSession({
         "message_id": global_message.message_id,
         "chat_id": global_message.chat.id,
         "target_user_id": user_id,
         "expires_at": now + config.PLSDON_DONATE_BUTTON_TIMEOUT
-    }
+    })
     
     # Удаляем глобальное сообщение через 15 секунд
-    asyncio.create_task(delete_message_after(global_message, config.PLSDON_DONATE_BUTTON_TIMEOUT))
+    delete_message_later(global_message, config.PLSDON_DONATE_BUTTON_TIMEOUT)
     
     # Базовые шансы
     base_ignore_chance = config.PLSDON_IGNORE_CHANCE  # 50%
@@ -2950,7 +3038,7 @@ async def cmd_plsdon(message: Message):
         sent_message = await message.answer(caption)
     
     # Автоудаление через 30 секунд
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
     
     logger.info(
         f"Пользователь {user_id} использовал /plsdon: "
@@ -2959,16 +3047,15 @@ async def cmd_plsdon(message: Message):
     )
 
 
-@router.callback_query(F.data.startswith("plsdon_donate_"))
-async def callback_plsdon_donate(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("plsdon_donate"))
+@session_locked(_active_plsdon_messages)
+async def callback_plsdon_donate(callback: CallbackQuery, payload: CallbackPayload):
     """Обработчик кнопки "Пожертвовать" в /plsdon"""
     callback_user_id = callback.from_user.id
-    callback_data = callback.data
     
     # Извлекаем user_id получателя
-    try:
-        target_user_id = int(callback_data.split("_")[-1])
-    except (ValueError, IndexError):
+    target_user_id = payload.get_int(0)
+    if target_user_id is None:
         await callback.answer("Ошибка обработки запроса", show_alert=True)
         return
     
@@ -3046,7 +3133,7 @@ async def callback_plsdon_donate(callback: CallbackQuery):
             chat_id=callback.message.chat.id,
             text=donation_text
         )
-        asyncio.create_task(delete_message_after(don_msg, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(don_msg, config.MESSAGE_DELETE_TIMEOUT)
     except Exception as e:
         logger.error(f"Ошибка отправки сообщения о пожертвовании: {e}")
     
@@ -3073,13 +3160,13 @@ async def cmd_almaz(message: Message):
 
     if user_id in _active_almaz_sessions:
         sent = await message.answer(format_message_with_username("У тебя уже есть активная игра /almaz. Забери выигрыш или заверши.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     if await news_service.is_game_closed("almaz"):
         sent = await message.answer(format_message_with_username(
             "Алмазы временно на починке — загляни в /news.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     user = await db.get_user(user_id)
@@ -3090,7 +3177,7 @@ async def cmd_almaz(message: Message):
     parts = (message.text or "").strip().split()
     if len(parts) < 2:
         sent = await message.answer(format_message_with_username("Формат: /almaz сумма", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     try:
         bet = int(parts[1])
@@ -3098,20 +3185,21 @@ async def cmd_almaz(message: Message):
             raise ValueError("сумма > 0")
     except (ValueError, IndexError):
         sent = await message.answer(format_message_with_username("Укажи корректную сумму.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     balance = await db.get_balance(user_id)
     if balance < bet:
         sent = await message.answer(format_insufficient_balance(username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
+    receipt = balance_service.receipt()
     success, _, _, _ = await balance_service.subtract_balance(
         user_id=user_id, amount=bet,
         command_source="/almaz", comment="Ставка в алмазах",
         message=message, username=username, first_name=first_name,
-        allow_negative=False
+        allow_negative=False, receipt=receipt
     )
     if not success:
         return
@@ -3124,9 +3212,9 @@ async def cmd_almaz(message: Message):
         username, first_name
     )
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⛏ Копать дальше", callback_data=f"almaz_dig_{user_id}")],
-        [InlineKeyboardButton(text="💰 Забрать", callback_data=f"almaz_take_{user_id}")],
-        [InlineKeyboardButton(text="❌ Завершить", callback_data=f"almaz_end_{user_id}")]
+        [InlineKeyboardButton(text="⛏ Копать дальше", callback_data=pack("almaz_dig", user_id))],
+        [InlineKeyboardButton(text="💰 Забрать", callback_data=pack("almaz_take", user_id))],
+        [InlineKeyboardButton(text="❌ Завершить", callback_data=pack("almaz_end", user_id))]
     ])
     photo_path = config.get_image_path("almaz.jpg")
     try:
@@ -3139,63 +3227,70 @@ async def cmd_almaz(message: Message):
         sent_msg = await message.answer(caption, reply_markup=keyboard)
 
     bet_risk = min(0.12, bet / 10000 * 0.2)
-    _active_almaz_sessions[user_id] = {
+    _active_almaz_sessions[user_id] = GameSession({
         "bet": bet,
         "current_win": 0,
         "message_id": sent_msg.message_id,
         "chat_id": sent_msg.chat.id,
         "explosion_chance": ALMAZ_EXPLOSION_BASE + bet_risk,
         "started_at": time.time(),
-    }
-    asyncio.create_task(_almaz_timeout_task(message.bot, user_id, GAME_MAX_DURATION_SEC))
-    asyncio.create_task(delete_message_after(sent_msg, config.MESSAGE_DELETE_TIMEOUT))
+        "receipt": receipt.entries,
+    })
+    _active_almaz_sessions[user_id].set_timeout(GAME_MAX_DURATION_SEC, _almaz_timeout_task, message.bot, user_id)
+    delete_message_later(sent_msg, config.MESSAGE_DELETE_TIMEOUT)
     logger.info("User %s started /almaz bet=%s", user_id, bet)
 
 
-async def _almaz_timeout_task(bot: Bot, user_id: int, timeout_sec: int):
-    """По истечении 3 минут — авто-забрать текущий выигрыш или завершить."""
-    await asyncio.sleep(timeout_sec)
-    sess = _active_almaz_sessions.pop(user_id, None)
+async def _almaz_timeout_task(bot: Bot, user_id: int):
+    """По истечении 3 минут — авто-забрать текущий выигрыш или завершить (вызывается планировщиком таймаутов)."""
+    sess = _active_almaz_sessions.get(user_id)
     if not sess:
         return
+    # Как в risk40: «Копать» или «Забрать» под той же блокировкой могли уже закрыть игру
+    async with sess.lock:
+        if _active_almaz_sessions.get(user_id) is not sess:
+            return
+        _active_almaz_sessions.pop(user_id)
+        await _almaz_timeout_settle(bot, user_id, sess)
+
+
+async def _almaz_timeout_settle(bot: Bot, user_id: int, sess: GameSession):
+    """Авто-забрать снятой по таймауту сессии алмазов (под её блокировкой)"""
     chat_id = sess["chat_id"]
     message_id = sess["message_id"]
     bet = sess["bet"]
     current_win = sess["current_win"]
+    receipt = balance_service.receipt(sess.get("receipt"))
     try:
+        # Ставка списана при старте; выигрыш с налогом и логи — одной транзакцией
+        settled, balance_after, _ = await balance_service.settle_game(
+            user_id=user_id, stake=bet, payout=current_win, game="almaz", charge=0,
+            comment="алмазы, авто-забрать по таймауту",
+            bot=bot, chat_id=chat_id, receipt=receipt,
+        )
+        if not settled:
+            _restore_unsettled(_active_almaz_sessions, user_id, sess, _almaz_timeout_task, bot, user_id)
+            return
         if current_win > 0:
-            await balance_service.add_game_win(
-                user_id=user_id,
-                gross_amount=current_win,
-                command_source="/almaz",
-                comment="Авто-забрать по таймауту",
-                bot=bot,
-                chat_id=chat_id,
-                username=None,
-                first_name=None,
-            )
-            await db.log_game_session(user_id, "almaz", bet, "win", current_win - bet, 1.0)
-            balance_after = await db.get_balance(user_id)
             await _update_mmr_and_achievements(user_id, "almaz", "win", balance_after)
         user = await db.get_user(user_id)
         un = user.get("username") if user else None
         caption = format_message_with_username(
-            f"⏱ Время вышло. Забрал выигрыш: <b>{current_win}</b> коинов." if current_win > 0 else "⏱ Время вышло. Игра завершена.",
+            (f"⏱ Время вышло. Забрал выигрыш: <b>{current_win}</b> коинов." if current_win > 0 else "⏱ Время вышло. Игра завершена.")
+            + receipt.render(),
             un, None
         )
         await bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=caption, reply_markup=None)
     except Exception as e:
         logger.exception("almaz timeout task: %s", e)
-        if current_win > 0:
-            await balance_service.add_game_win(user_id=user_id, gross_amount=current_win, command_source="/almaz", comment="Авто-забрать по таймауту", bot=bot, chat_id=chat_id, username=None, first_name=None)
 
 
-@router.callback_query(F.data.startswith("almaz_dig_"))
-async def cb_almaz_dig(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("almaz_dig"))
+@session_locked(_active_almaz_sessions)
+async def cb_almaz_dig(callback: CallbackQuery, payload: CallbackPayload):
     """Добыть алмаз: 50/50 взрыв (потеря всего) или алмаз (выигрыш растёт)."""
-    try:
-        target_id = int(callback.data.split("_")[-1])
-    except (ValueError, IndexError):
+    target_id = payload.get_int(0)
+    if target_id is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     if callback.from_user.id != target_id:
@@ -3211,23 +3306,20 @@ async def cb_almaz_dig(callback: CallbackQuery):
     explosion_chance = sess["explosion_chance"]
 
     if game_random.random() < explosion_chance:
-        del _active_almaz_sessions[target_id]
-        await db.log_game_session(
-            user_id=target_id,
-            game_type="almaz",
-            bet=bet,
-            result="loss",
-            amount_change=-bet,
-            multiplier=1.0
+        _active_almaz_sessions.pop(target_id, None)
+        # Ставка списана при старте: денег не движется, логи проигрыша — одной транзакцией
+        await balance_service.settle_game(
+            user_id=target_id, stake=bet, payout=0, game="almaz", charge=0,
+            username=callback.from_user.username,
         )
-        await db.log_admin_game(target_id, (await db.get_user(target_id) or {}).get("username", ""), "/almaz", bet, "loss", -bet, 0)
         balance_after = await db.get_balance(target_id)
         await _update_mmr_and_achievements(target_id, "almaz", "loss", balance_after)
         photo_path = config.get_image_path("almazlox.jpg")
         user = await db.get_user(target_id)
         un = user.get("username") if user else None
         caption = format_message_with_username(
-            f"💥 <b>ВЗРЫВ!</b>\n\nПотерял весь выигрыш. Ставка {bet} коинов списана.",
+            f"💥 <b>ВЗРЫВ!</b>\n\nПотерял весь выигрыш. Ставка {bet} коинов списана."
+            + balance_service.receipt(sess.get("receipt")).render(),
             un, None
         )
         try:
@@ -3241,7 +3333,7 @@ async def cb_almaz_dig(callback: CallbackQuery):
         except Exception:
             await callback.bot.send_photo(callback.message.chat.id, FSInputFile(str(photo_path)), caption=caption) if photo_path.exists() else await callback.bot.send_message(callback.message.chat.id, caption)
         game_timeout = getattr(config, "GAME_RESULT_DELETE_TIMEOUT", 20)
-        asyncio.create_task(delete_message_after_by_id(callback.bot, callback.message.chat.id, callback.message.message_id, game_timeout))
+        delete_message_later_by_id(callback.bot, callback.message.chat.id, callback.message.message_id, game_timeout)
         await callback.answer("Взрыв! Проигрыш.", show_alert=True)
         return
 
@@ -3256,9 +3348,9 @@ async def cb_almaz_dig(callback: CallbackQuery):
         username, first_name
     )
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⛏ Копать дальше", callback_data=f"almaz_dig_{target_id}")],
-        [InlineKeyboardButton(text="💰 Забрать", callback_data=f"almaz_take_{target_id}")],
-        [InlineKeyboardButton(text="❌ Завершить", callback_data=f"almaz_end_{target_id}")]
+        [InlineKeyboardButton(text="⛏ Копать дальше", callback_data=pack("almaz_dig", target_id))],
+        [InlineKeyboardButton(text="💰 Забрать", callback_data=pack("almaz_take", target_id))],
+        [InlineKeyboardButton(text="❌ Завершить", callback_data=pack("almaz_end", target_id))]
     ])
     try:
         await callback.bot.edit_message_caption(
@@ -3270,12 +3362,12 @@ async def cb_almaz_dig(callback: CallbackQuery):
     await callback.answer(f"+{add_win} коинов! Выигрыш: {sess['current_win']}", show_alert=False)
 
 
-@router.callback_query(F.data.startswith("almaz_take_"))
-async def cb_almaz_take(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("almaz_take"))
+@session_locked(_active_almaz_sessions)
+async def cb_almaz_take(callback: CallbackQuery, payload: CallbackPayload):
     """Забрать выигрыш."""
-    try:
-        target_id = int(callback.data.split("_")[-1])
-    except (ValueError, IndexError):
+    target_id = payload.get_int(0)
+    if target_id is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     if callback.from_user.id != target_id:
@@ -3288,27 +3380,26 @@ async def cb_almaz_take(callback: CallbackQuery):
     sess = _active_almaz_sessions.pop(target_id)
     win_amount = sess["current_win"]
     bet = sess["bet"]
-    if win_amount > 0:
-        _, _, _, tax = await balance_service.add_game_win(
-            user_id=target_id,
-            gross_amount=win_amount,
-            command_source="/almaz",
-            comment="Выигрыш в алмазах",
-            bot=callback.bot,
-            chat_id=callback.message.chat.id,
-            username=callback.from_user.username,
-            first_name=callback.from_user.first_name,
-        )
-        await db.log_admin_game(target_id, callback.from_user.username, "/almaz", bet, "win", win_amount - bet, tax or 0)
-    else:
-        await db.log_admin_game(target_id, callback.from_user.username, "/almaz", bet, "loss", -bet, 0)
-    balance_after = await db.get_balance(target_id)
+    receipt = balance_service.receipt(sess.get("receipt"))
+    # Ставка списана при старте; выигрыш с налогом и логи — одной транзакцией
+    settled, balance_after, _ = await balance_service.settle_game(
+        user_id=target_id, stake=bet, payout=win_amount, game="almaz", charge=0,
+        comment="алмазы",
+        bot=callback.bot, chat_id=callback.message.chat.id,
+        username=callback.from_user.username, first_name=callback.from_user.first_name,
+        receipt=receipt,
+    )
+    if not settled:
+        _restore_unsettled(_active_almaz_sessions, target_id, sess, _almaz_timeout_task, callback.bot, target_id)
+        await callback.answer("Не удалось зачислить выигрыш — повторим автоматически.", show_alert=True)
+        return
     await _update_mmr_and_achievements(target_id, "almaz", "win", balance_after)
     photo_path = config.get_image_path("almazwin.jpg")
     user = await db.get_user(target_id)
     un = user.get("username") if user else None
     caption = format_message_with_username(
-        f"💰 <b>ПОБЕДА!</b>\n\nЗабрал выигрыш: <b>{win_amount}</b> коинов.",
+        f"💰 <b>ПОБЕДА!</b>\n\nЗабрал выигрыш: <b>{win_amount}</b> коинов."
+        + receipt.render(),
         un, None
     )
     try:
@@ -3325,28 +3416,29 @@ async def cb_almaz_take(callback: CallbackQuery):
         else:
             await callback.bot.send_message(callback.message.chat.id, caption)
     game_timeout = getattr(config, "GAME_RESULT_DELETE_TIMEOUT", 20)
-    asyncio.create_task(delete_message_after_by_id(callback.bot, callback.message.chat.id, callback.message.message_id, game_timeout))
+    delete_message_later_by_id(callback.bot, callback.message.chat.id, callback.message.message_id, game_timeout)
     await callback.answer(f"Выигрыш {win_amount} зачислен!", show_alert=False)
 
 
-@router.callback_query(F.data.startswith("almaz_end_"))
-async def cb_almaz_end(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("almaz_end"))
+@session_locked(_active_almaz_sessions)
+async def cb_almaz_end(callback: CallbackQuery, payload: CallbackPayload):
     """Завершить без вывода (ставка уже списана)."""
-    try:
-        target_id = int(callback.data.split("_")[-1])
-    except (ValueError, IndexError):
+    target_id = payload.get_int(0)
+    if target_id is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     if callback.from_user.id != target_id:
         await callback.answer("Не жми на чужое!", show_alert=True)
         return
-    if target_id in _active_almaz_sessions:
-        _active_almaz_sessions.pop(target_id)
+    sess = _active_almaz_sessions.pop(target_id, None)
     try:
         await callback.message.delete()
     except Exception:
         pass
-    await callback.answer("Игра завершена.", show_alert=False)
+    # Сообщение игры удалено — чек (если «Списано» ушло в него) показываем в ответе на кнопку
+    receipt = balance_service.receipt(sess.get("receipt") if sess else None)
+    await callback.answer("Игра завершена." + receipt.render().replace("\n\n", " "), show_alert=False)
 
 
 # ==================== 5 УНИКАЛЬНЫХ ИГР: /random, /gamerandom, /blackmarket, /pressure, /echo ====================
@@ -3440,7 +3532,7 @@ async def cmd_random(message: Message):
     if balance < 100:
         sent = await message.answer(format_message_with_username(
             "Для разлома матрицы нужен минимум 100 коинов.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     await _maybe_send_event_message(user_id, chat_id, bot, balance=balance)
@@ -3462,16 +3554,7 @@ async def cmd_random(message: Message):
     if stake < 100:
         sent = await message.answer(format_message_with_username(
             "Минимум 100 коинов для разлома.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
-        return
-
-    success, _, _, _ = await balance_service.subtract_balance(
-        user_id=user_id, amount=stake,
-        command_source="/random", comment="Разлом матрицы",
-        message=message, username=username, first_name=first_name,
-        allow_negative=False
-    )
-    if not success:
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     # Плавная загрузка: «Идёт разлом матрицы…»
@@ -3502,15 +3585,17 @@ async def cmd_random(message: Message):
         user_id, game_id, stake, luck_bonus, bot, chat_id, username, first_name
     )
 
-    if won and win_amount > 0:
-        await balance_service.add_game_win(
-            user_id=user_id, gross_amount=win_amount,
-            command_source="/random", comment=f"Разлом: {name}",
-            bot=bot, chat_id=chat_id, username=username, first_name=first_name,
-        )
-        await db.log_game_session(user_id, "random", stake, "win", win_amount - stake, win_amount / max(stake, 1))
-        await db.log_admin_game(user_id, username, "/random", stake, "win", win_amount - stake, None)
-        balance_after = await db.get_balance(user_id)
+    won = won and win_amount > 0
+    # Ставка, выигрыш с налогом и логи — одной транзакцией; не хватило на ставку — разлома не было
+    settled, balance_after, _ = await balance_service.settle_game(
+        user_id=user_id, stake=stake, payout=win_amount if won else 0, game="random",
+        multiplier=win_amount / max(stake, 1) if won else 0, comment=f"Разлом: {name}",
+        message=message, username=username, first_name=first_name,
+    )
+    if not settled:
+        delete_message_later_by_id(bot, chat_id, loading.message_id, config.MESSAGE_DELETE_TIMEOUT)
+        return
+    if won:
         await _update_mmr_and_achievements(user_id, "random", "win", balance_after)
         echo_hint = (_last_echo_analysis.get(user_id, {}).get("signature", "") + "\n\n") if user_id in _last_echo_analysis else ""
         caption = format_message_with_username(
@@ -3521,9 +3606,6 @@ async def cmd_random(message: Message):
         if not photo.exists():
             photo = config.get_image_path("random_win.jpg")
     else:
-        await db.log_game_session(user_id, "random", stake, "loss", -stake, 0)
-        await db.log_admin_game(user_id, username, "/random", stake, "loss", -stake, 0)
-        balance_after = await db.get_balance(user_id)
         await _update_mmr_and_achievements(user_id, "random", "loss", balance_after)
         echo_hint = (_last_echo_analysis.get(user_id, {}).get("signature", "") + "\n\n") if user_id in _last_echo_analysis else ""
         caption = format_message_with_username(
@@ -3538,8 +3620,8 @@ async def cmd_random(message: Message):
         result_msg = await message.answer_photo(FSInputFile(str(photo)), caption=caption)
     else:
         result_msg = await message.answer(caption)
-    asyncio.create_task(delete_message_after_by_id(bot, chat_id, loading.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
-    asyncio.create_task(delete_message_after(result_msg, config.GAME_RESULT_DELETE_TIMEOUT))
+    delete_message_later_by_id(bot, chat_id, loading.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
+    delete_message_later(result_msg, config.GAME_RESULT_DELETE_TIMEOUT)
 
 
 # ---------- /gamerandom — Сбой матрицы ----------
@@ -3559,19 +3641,11 @@ async def cmd_gamerandom(message: Message):
     if balance < 50:
         sent = await message.answer(format_message_with_username(
             "Матрица требует минимум 50 коинов.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     pct = game_random.uniform(0.02, 0.05)
     stake = max(50, min(int(balance * pct), 5000))
-    success, _, _, _ = await balance_service.subtract_balance(
-        user_id=user_id, amount=stake,
-        command_source="/gamerandom", comment="Сбой матрицы",
-        message=message, username=username, first_name=first_name,
-        allow_negative=False
-    )
-    if not success:
-        return
 
     # Плавная загрузка: «Матрица думает» / «Вселенная думает»
     load_text = game_random.choice([
@@ -3611,6 +3685,16 @@ async def cmd_gamerandom(message: Message):
     win_amount = int(stake * mult) if game_random.random() < win_chance else 0
     won = win_amount > 0
 
+    # Ставка, выигрыш с налогом и логи — одной транзакцией; не хватило на ставку — сбоя не было
+    settled, balance_after, _ = await balance_service.settle_game(
+        user_id=user_id, stake=stake, payout=win_amount, game="gamerandom",
+        multiplier=win_amount / max(stake, 1) if won else 0, comment="Сбой матрицы",
+        message=message, username=username, first_name=first_name,
+    )
+    if not settled:
+        delete_message_later_by_id(bot, chat_id, loading.message_id, config.MESSAGE_DELETE_TIMEOUT)
+        return
+
     event_text = "🔧 Баг матрицы дал лишний шанс…\n\n" if bug_event else ""
     echo_hint = ""
     if user_id in _last_echo_analysis:
@@ -3630,24 +3714,12 @@ async def cmd_gamerandom(message: Message):
     except Exception:
         await bot.send_message(chat_id, result_cap)
 
-    if won:
-        await balance_service.add_game_win(
-            user_id=user_id, gross_amount=win_amount,
-            command_source="/gamerandom", comment="Сбой матрицы",
-            bot=bot, chat_id=chat_id, username=username, first_name=first_name,
-        )
-        await db.log_game_session(user_id, "gamerandom", stake, "win", win_amount - stake, win_amount / max(stake, 1))
-        await db.log_admin_game(user_id, username, "/gamerandom", stake, "win", win_amount - stake, None)
-    else:
-        await db.log_game_session(user_id, "gamerandom", stake, "loss", -stake, 0)
-        await db.log_admin_game(user_id, username, "/gamerandom", stake, "loss", -stake, 0)
-    balance_after = await db.get_balance(user_id)
     await _update_mmr_and_achievements(user_id, "gamerandom", "win" if won else "loss", balance_after)
-    asyncio.create_task(delete_message_after_by_id(bot, chat_id, loading.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+    delete_message_later_by_id(bot, chat_id, loading.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
 
 
 # ---------- /blackmarket — Чёрный рынок ----------
-_active_blackmarket: Dict[int, Dict] = {}  # user_id -> {stake, message_id, chat_id, bot}
+_active_blackmarket = session_manager.store("blackmarket", stake="stake")  # user_id -> {stake, message_id, chat_id, bot}
 
 BLACKMARKET_DEALS = [
     {"id": "red", "label": "🔴 Высокий риск / высокий профит", "win_chance": 0.35, "mult": 2.5, "podstva_chance": 0.25},
@@ -3673,7 +3745,7 @@ async def cmd_blackmarket(message: Message):
     balance = await db.get_balance(user_id)
     if balance < stake:
         sent = await message.answer(format_insufficient_balance(username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     success, _, _, _ = await balance_service.subtract_balance(
@@ -3687,7 +3759,7 @@ async def cmd_blackmarket(message: Message):
 
     red_count = _blackmarket_red_choices.get(user_id, 0)
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=d["label"], callback_data=f"bm|{user_id}|{d['id']}")]
+        [InlineKeyboardButton(text=d["label"], callback_data=pack("bm", user_id, d["id"]))]
         for d in BLACKMARKET_DEALS
     ])
     caption = format_message_with_username(
@@ -3699,19 +3771,15 @@ async def cmd_blackmarket(message: Message):
         sent = await message.answer_photo(FSInputFile(str(photo_bm)), caption=caption, reply_markup=keyboard)
     else:
         sent = await message.answer(caption, reply_markup=keyboard)
-    _active_blackmarket[user_id] = {"stake": stake, "message_id": sent.message_id, "chat_id": chat_id, "bot": message.bot}
+    _active_blackmarket[user_id] = GameSession({"stake": stake, "message_id": sent.message_id, "chat_id": chat_id, "bot": message.bot})
 
 
-@router.callback_query(F.data.startswith("bm|"))
-async def cb_blackmarket(callback: CallbackQuery):
-    data = callback.data.split("|")
-    if len(data) != 3:
-        await callback.answer("Ошибка", show_alert=True)
-        return
-    _, uid_str, deal_id = data
-    try:
-        target_id = int(uid_str)
-    except ValueError:
+@router.callback_query(CallbackPrefix("bm"))
+@session_locked(_active_blackmarket)
+async def cb_blackmarket(callback: CallbackQuery, payload: CallbackPayload):
+    target_id = payload.get_int(0)
+    deal_id = payload.get(1)
+    if len(payload) != 2 or target_id is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     if callback.from_user.id != target_id:
@@ -3801,7 +3869,7 @@ async def cb_blackmarket(callback: CallbackQuery):
         else:
             sent = await bot.send_message(chat_id, caption)
         msg_id_to_delete = sent.message_id
-    asyncio.create_task(delete_message_after_by_id(bot, chat_id, msg_id_to_delete, config.GAME_RESULT_DELETE_TIMEOUT))
+    delete_message_later_by_id(bot, chat_id, msg_id_to_delete, config.GAME_RESULT_DELETE_TIMEOUT)
     await callback.answer("Готово.")
 
 
@@ -3844,7 +3912,7 @@ async def cmd_topgame(message: Message):
     if not rows:
         sent = await message.answer(format_message_with_username(
             "Пока нет статистики по играм. Поиграй в разные игры — и топ появится.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     lines = [
         "📊 <b>Топ игр</b>\n",
@@ -3865,7 +3933,7 @@ async def cmd_topgame(message: Message):
     lines.append("\n💡 Подсказка: в /news иногда меняются условия в играх — заглядывай перед ставкой.")
     caption = format_message_with_username("\n".join(lines), username, first_name)
     sent = await message.answer(caption)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 # ---------- /echo — Эхо решений (архетипы, углублённый анализ, подстройка бота) ----------
@@ -4046,7 +4114,7 @@ async def cmd_echo(message: Message):
             await sent_think.edit_text(result_cap)
     except Exception:
         await bot.send_message(chat_id, result_cap)
-    asyncio.create_task(delete_message_after_by_id(bot, chat_id, sent_think.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+    delete_message_later_by_id(bot, chat_id, sent_think.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
 
 
 # ---------- /fracture — Излом решения (10 вопросов 7–9 класс, таймер 30 сек, 3 жизни) ----------
@@ -4074,9 +4142,44 @@ def _build_fracture_questions() -> list:
     return result
 
 
+async def _fracture_settle(user_id: int, sess: GameSession, payout: int, multiplier: float, comment: str) -> Optional[int]:
+    """
+    Итог излома снятой сессии: ставка списана при старте, выигрыш с налогом и логи — одной
+    транзакцией. Не записалось — сессия возвращается с итогом (outcome) и расчёт повторяется.
+
+    Returns:
+        Баланс после расчёта или None
+    """
+    settled, balance_after, _ = await balance_service.settle_game(
+        user_id=user_id, stake=sess["bet"], payout=payout, game="fracture", charge=0,
+        multiplier=multiplier, comment=comment, bot=sess.get("bot"), chat_id=sess["chat_id"],
+        username=sess.get("username"), first_name=sess.get("first_name"),
+    )
+    if not settled:
+        sess["outcome"] = [payout, multiplier, comment]
+        _restore_unsettled(_active_fracture_sessions, user_id, sess, _fracture_settle_retry, user_id)
+        return None
+    return balance_after
+
+
+async def _fracture_settle_retry(user_id: int):
+    """Повтор расчёта излома, если прошлый не записался (вызывается планировщиком таймаутов)"""
+    sess = _active_fracture_sessions.get(user_id)
+    if not sess or "outcome" not in sess:
+        return
+    async with sess.lock:
+        if _active_fracture_sessions.get(user_id) is not sess:
+            return
+        _active_fracture_sessions.pop(user_id)
+        payout, multiplier, comment = sess["outcome"]
+        balance_after = await _fracture_settle(user_id, sess, payout, multiplier, comment)
+    if balance_after is not None:
+        await _update_mmr_and_achievements(user_id, "fracture", "win" if payout > 0 else "loss", balance_after)
+        logger.info("Итог /fracture пользователя %s записан повторным расчётом", user_id)
+
+
 async def _fracture_timeout_task(user_id: int, step_at_start: int):
-    """Таймер 30 сек на вопрос: если игрок не ответил — минус жизнь или проигрыш."""
-    await asyncio.sleep(FRACTURE_QUESTION_TIMEOUT_SEC)
+    """Таймер 30 сек на вопрос (планировщик таймаутов): если игрок не ответил — минус жизнь или проигрыш."""
     sess = _active_fracture_sessions.get(user_id)
     if not sess or len(sess.get("answers", [])) != step_at_start:
         return
@@ -4094,9 +4197,9 @@ async def _fracture_timeout_task(user_id: int, step_at_start: int):
     wrong_idx = 0
     new_answers = sess.get("answers", []) + [wrong_idx]
     if lives <= 0:
-        await db.log_game_session(user_id, "fracture", bet, "loss", -bet, 0)
-        await db.log_admin_game(user_id, username, "/fracture", bet, "loss", -bet, 0)
-        balance_after = await db.get_balance(user_id)
+        balance_after = await _fracture_settle(user_id, sess, 0, 0, "излом, таймаут")
+        if balance_after is None:
+            balance_after = await db.get_balance(user_id)
         await _update_mmr_and_achievements(user_id, "fracture", "loss", balance_after)
         caption = format_message_with_username(
             f"🧩 <b>Излом решения</b>\n\n⏱ Время вышло. Жизней не осталось — проигрыш.\n\n❌ Минус <b>{bet}</b> коинов. Баланс: <b>{balance_after}</b>",
@@ -4107,10 +4210,10 @@ async def _fracture_timeout_task(user_id: int, step_at_start: int):
         except Exception:
             try:
                 sent = await bot.send_message(chat_id, caption, parse_mode="HTML")
-                asyncio.create_task(delete_message_after_by_id(bot, chat_id, sent.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+                delete_message_later_by_id(bot, chat_id, sent.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
             except Exception:
                 pass
-        asyncio.create_task(delete_message_after_by_id(bot, chat_id, message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+        delete_message_later_by_id(bot, chat_id, message_id, config.GAME_RESULT_DELETE_TIMEOUT)
         return
     next_step = len(new_answers)
     if next_step >= FRACTURE_NUM_STEPS:
@@ -4134,22 +4237,16 @@ async def _fracture_timeout_task(user_id: int, step_at_start: int):
                 pass
             mult = _apply_bet_penalty(bet, mult)
             win_amount = max(1, int(bet * mult))
-            success, balance_before, balance_after, tax = await balance_service.add_game_win(user_id=user_id, gross_amount=win_amount, command_source="/fracture", comment="Излом (финал по таймауту)", bot=bot, chat_id=chat_id, username=username, first_name=first_name)
-            if not success:
-                await balance_service.add_balance(user_id, bet, command_source="/fracture", comment="Возврат ставки (излом, таймаут)", bot=bot, chat_id=chat_id, username=username, first_name=first_name)
-                balance_after = await db.get_balance(user_id)
-                net_added = bet
-            else:
-                net_added = balance_after - balance_before
-            await db.log_game_session(user_id, "fracture", bet, "win", net_added - bet, mult)
-            await db.log_admin_game(user_id, username, "/fracture", bet, "win", net_added - bet, tax or 0)
+            balance_after = await _fracture_settle(user_id, sess, win_amount, mult, f"излом x{mult:.2f}, финал по таймауту")
+            if balance_after is None:
+                return
             await _update_mmr_and_achievements(user_id, "fracture", "win", balance_after, chat_id=chat_id, bot=bot)
             await db.add_cup_win(user_id, "fracture")
-            caption = format_message_with_username(f"🧩 <b>Излом решения</b>\n\n{style_comment}\n\n✅ Зачислено <b>+{net_added}</b> коинов (x{mult:.2f}). Баланс: <b>{balance_after}</b>", username, first_name)
+            caption = format_message_with_username(f"🧩 <b>Излом решения</b>\n\n{style_comment}\n\n✅ Выигрыш <b>{win_amount}</b> коинов (x{mult:.2f}). Баланс: <b>{balance_after}</b>", username, first_name)
         else:
-            await db.log_game_session(user_id, "fracture", bet, "loss", -bet, 0)
-            await db.log_admin_game(user_id, username, "/fracture", bet, "loss", -bet, 0)
-            balance_after = await db.get_balance(user_id)
+            balance_after = await _fracture_settle(user_id, sess, 0, 0, "излом, финал по таймауту")
+            if balance_after is None:
+                balance_after = await db.get_balance(user_id)
             await _update_mmr_and_achievements(user_id, "fracture", "loss", balance_after)
             caption = format_message_with_username(f"🧩 <b>Излом решения</b>\n\n{style_comment}\n\n❌ Минус <b>{bet}</b> коинов. Баланс: <b>{balance_after}</b>", username, first_name)
         try:
@@ -4157,10 +4254,10 @@ async def _fracture_timeout_task(user_id: int, step_at_start: int):
         except Exception:
             try:
                 sent = await bot.send_message(chat_id, caption, parse_mode="HTML")
-                asyncio.create_task(delete_message_after_by_id(bot, chat_id, sent.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+                delete_message_later_by_id(bot, chat_id, sent.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
             except Exception:
                 pass
-        asyncio.create_task(delete_message_after_by_id(bot, chat_id, message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+        delete_message_later_by_id(bot, chat_id, message_id, config.GAME_RESULT_DELETE_TIMEOUT)
         return
     q_data = questions[next_step]
     q_text, options, _ = q_data
@@ -4170,21 +4267,21 @@ async def _fracture_timeout_task(user_id: int, step_at_start: int):
         username, first_name
     )
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=opt, callback_data=f"fracture:{next_step}:{i}")] for i, opt in enumerate(options)
+        [InlineKeyboardButton(text=opt, callback_data=pack("fracture", next_step, i))] for i, opt in enumerate(options)
     ])
-    new_sess = {
+    new_sess = GameSession({
         "bet": bet, "questions": questions, "answers": new_answers,
         "message_id": message_id, "chat_id": chat_id, "username": username, "first_name": first_name, "bot": bot,
         "lives": lives,
-    }
+    })
     _active_fracture_sessions[user_id] = new_sess
     try:
         await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=cap, reply_markup=kb, parse_mode="HTML")
     except Exception:
         sent = await bot.send_message(chat_id, cap, reply_markup=kb)
         new_sess["message_id"] = sent.message_id
-        asyncio.create_task(delete_message_after_by_id(bot, chat_id, message_id, 5))
-    new_sess["timer_task"] = asyncio.create_task(_fracture_timeout_task(user_id, next_step))
+        delete_message_later_by_id(bot, chat_id, message_id, 5)
+    new_sess.set_timeout(FRACTURE_QUESTION_TIMEOUT_SEC, _fracture_timeout_task, user_id, next_step)
 
 
 @router.message(Command("fracture"))
@@ -4253,14 +4350,14 @@ async def cmd_fracture(message: Message):
         username, first_name
     )
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=opt, callback_data=f"fracture:0:{i}")] for i, opt in enumerate(options)
+        [InlineKeyboardButton(text=opt, callback_data=pack("fracture", 0, i))] for i, opt in enumerate(options)
     ])
     photo_start = config.get_game_image_path("fracture", "start")
     if photo_start.exists():
         loading_msg_id = sent.message_id
         try:
             sent = await message.answer_photo(FSInputFile(str(photo_start)), caption=caption, reply_markup=kb, parse_mode="HTML")
-            asyncio.create_task(delete_message_after_by_id(message.bot, chat_id, loading_msg_id, 3))
+            delete_message_later_by_id(message.bot, chat_id, loading_msg_id, 3)
         except Exception:
             sent = await message.answer(caption, reply_markup=kb, parse_mode="HTML")
     else:
@@ -4268,37 +4365,29 @@ async def cmd_fracture(message: Message):
             await sent.edit_text(caption, reply_markup=kb, parse_mode="HTML")
         except TelegramBadRequest:
             sent = await message.answer(caption, reply_markup=kb, parse_mode="HTML")
-    timer_task = asyncio.create_task(_fracture_timeout_task(user_id, 0))
-    _active_fracture_sessions[user_id] = {
+    _active_fracture_sessions[user_id] = GameSession({
         "bet": stake, "questions": questions, "answers": [], "message_id": sent.message_id, "chat_id": chat_id,
         "username": username, "first_name": first_name, "bot": message.bot,
-        "lives": FRACTURE_LIVES, "timer_task": timer_task,
-    }
+        "lives": FRACTURE_LIVES,
+    })
+    _active_fracture_sessions[user_id].set_timeout(FRACTURE_QUESTION_TIMEOUT_SEC, _fracture_timeout_task, user_id, 0)
 
 
-@router.callback_query(F.data.startswith("fracture:"))
-async def cb_fracture(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("fracture"))
+@session_locked(_active_fracture_sessions, key_index=None)
+async def cb_fracture(callback: CallbackQuery, payload: CallbackPayload):
     """Обработка ответов: отмена таймера, учёт жизней, следующий вопрос или финал."""
     user_id = callback.from_user.id
-    if user_id not in _active_fracture_sessions:
+    # С итогом (outcome) сессия лишь ждёт повтора расчёта — отвечать уже не на что
+    if user_id not in _active_fracture_sessions or "outcome" in _active_fracture_sessions[user_id]:
         await _safe_callback_answer(callback, "Тест уже завершён. Запусти /fracture заново.")
         return
-    parts = callback.data.split(":")
-    if len(parts) != 3:
-        await _safe_callback_answer(callback, "Ошибка данных.")
-        return
-    try:
-        step = int(parts[1])
-        choice_idx = int(parts[2])
-    except (ValueError, IndexError):
+    step = payload.get_int(0)
+    choice_idx = payload.get_int(1)
+    if len(payload) != 2 or step is None or choice_idx is None:
         await _safe_callback_answer(callback, "Ошибка данных.")
         return
     sess = _active_fracture_sessions[user_id]
-    if sess.get("timer_task"):
-        try:
-            sess["timer_task"].cancel()
-        except Exception:
-            pass
     answers = sess["answers"]
     questions = sess["questions"]
     if step != len(answers):
@@ -4307,6 +4396,8 @@ async def cb_fracture(callback: CallbackQuery):
     if choice_idx < 0 or choice_idx >= 4:
         await _safe_callback_answer(callback, "Неверный вариант.")
         return
+    # Ответ принят — таймер вопроса больше не нужен (следующий ставится ниже)
+    sess.cancel_timeout()
     is_correct = questions[step][2] == choice_idx
     lives = sess.get("lives", FRACTURE_LIVES)
     if not is_correct:
@@ -4322,9 +4413,9 @@ async def cb_fracture(callback: CallbackQuery):
 
     if lives <= 0 and not is_correct:
         _active_fracture_sessions.pop(user_id, None)
-        await db.log_game_session(user_id, "fracture", bet, "loss", -bet, 0)
-        await db.log_admin_game(user_id, username, "/fracture", bet, "loss", -bet, 0)
-        balance_after = await db.get_balance(user_id)
+        balance_after = await _fracture_settle(user_id, sess, 0, 0, "излом")
+        if balance_after is None:
+            balance_after = await db.get_balance(user_id)
         await _update_mmr_and_achievements(user_id, "fracture", "loss", balance_after)
         caption = format_message_with_username(
             f"🧩 <b>Излом решения</b>\n\n❌ Неверный ответ. Жизней не осталось — проигрыш.\n\nМинус <b>{bet}</b> коинов. Баланс: <b>{balance_after}</b>",
@@ -4335,10 +4426,10 @@ async def cb_fracture(callback: CallbackQuery):
         except Exception:
             try:
                 sent = await bot.send_message(chat_id, caption, parse_mode="HTML")
-                asyncio.create_task(delete_message_after_by_id(bot, chat_id, sent.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+                delete_message_later_by_id(bot, chat_id, sent.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
             except Exception:
                 pass
-        asyncio.create_task(delete_message_after_by_id(bot, chat_id, callback.message.message_id, config.GAME_RESULT_DELETE_TIMEOUT))
+        delete_message_later_by_id(bot, chat_id, callback.message.message_id, config.GAME_RESULT_DELETE_TIMEOUT)
         await _safe_callback_answer(callback, "Проигрыш.")
         return
 
@@ -4352,7 +4443,7 @@ async def cb_fracture(callback: CallbackQuery):
             username, first_name
         )
         kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=opt, callback_data=f"fracture:{len(answers)}:{i}")] for i, opt in enumerate(options)
+            [InlineKeyboardButton(text=opt, callback_data=pack("fracture", len(answers), i))] for i, opt in enumerate(options)
         ])
         try:
             await callback.message.edit_text(caption, reply_markup=kb, parse_mode="HTML")
@@ -4360,10 +4451,10 @@ async def cb_fracture(callback: CallbackQuery):
             try:
                 new_msg = await bot.send_message(chat_id, caption, reply_markup=kb, parse_mode="HTML")
                 sess["message_id"] = new_msg.message_id
-                asyncio.create_task(delete_message_after_by_id(bot, chat_id, callback.message.message_id, 5))
+                delete_message_later_by_id(bot, chat_id, callback.message.message_id, 5)
             except TelegramBadRequest:
                 pass
-        sess["timer_task"] = asyncio.create_task(_fracture_timeout_task(user_id, len(answers)))
+        sess.set_timeout(FRACTURE_QUESTION_TIMEOUT_SEC, _fracture_timeout_task, user_id, len(answers))
         await _safe_callback_answer(callback, "Верно!" if is_correct else "Неверно…")
         return
 
@@ -4382,30 +4473,21 @@ async def cb_fracture(callback: CallbackQuery):
         mult = events_service.apply_event_to_multiplier(mult, ev_type, is_win=True)
         mult = _apply_bet_penalty(bet, mult)
         win_amount = max(1, int(bet * mult))
-        success, balance_before, balance_after, tax = await balance_service.add_game_win(
-            user_id=user_id, gross_amount=win_amount,
-            command_source="/fracture", comment="Излом решения",
-            bot=bot, chat_id=chat_id, username=username, first_name=first_name,
-        )
-        if not success:
-            await balance_service.add_balance(user_id, bet, command_source="/fracture", comment="Возврат ставки (излом)", bot=bot, chat_id=chat_id, username=username, first_name=first_name)
-            balance_after = await db.get_balance(user_id)
-            net_added = bet
-        else:
-            net_added = balance_after - balance_before
-        await db.log_game_session(user_id, "fracture", bet, "win", net_added - bet, mult)
-        await db.log_admin_game(user_id, username, "/fracture", bet, "win", net_added - bet, tax or 0)
+        balance_after = await _fracture_settle(user_id, sess, win_amount, mult, f"излом x{mult:.2f}")
+        if balance_after is None:
+            await callback.answer("Не удалось зачислить выигрыш — повторим автоматически.", show_alert=True)
+            return
         await _update_mmr_and_achievements(user_id, "fracture", "win", balance_after, chat_id=chat_id, bot=bot)
         await db.add_cup_win(user_id, "fracture")
         caption = format_message_with_username(
-            f"🧩 <b>Излом решения</b>\n\n{style_comment}\n\n✅ Зачислено <b>+{net_added}</b> коинов (x{mult:.2f}). Баланс: <b>{balance_after}</b>",
+            f"🧩 <b>Излом решения</b>\n\n{style_comment}\n\n✅ Выигрыш <b>{win_amount}</b> коинов (x{mult:.2f}). Баланс: <b>{balance_after}</b>",
             username, first_name
         )
         photo = config.get_game_image_path("fracture", "win")
     else:
-        await db.log_game_session(user_id, "fracture", bet, "loss", -bet, 0)
-        await db.log_admin_game(user_id, username, "/fracture", bet, "loss", -bet, 0)
-        balance_after = await db.get_balance(user_id)
+        balance_after = await _fracture_settle(user_id, sess, 0, 0, "излом")
+        if balance_after is None:
+            balance_after = await db.get_balance(user_id)
         await _update_mmr_and_achievements(user_id, "fracture", "loss", balance_after)
         caption = format_message_with_username(
             f"🧩 <b>Излом решения</b>\n\n{style_comment}\n\n❌ Минус <b>{bet}</b> коинов. Баланс: <b>{balance_after}</b>",
@@ -4425,8 +4507,8 @@ async def cb_fracture(callback: CallbackQuery):
         else:
             sent = await bot.send_message(chat_id, caption)
         result_msg_id = sent.message_id
-        asyncio.create_task(delete_message_after_by_id(bot, chat_id, callback.message.message_id, 5))
-    asyncio.create_task(delete_message_after_by_id(bot, chat_id, result_msg_id, config.GAME_RESULT_DELETE_TIMEOUT))
+        delete_message_later_by_id(bot, chat_id, callback.message.message_id, 5)
+    delete_message_later_by_id(bot, chat_id, result_msg_id, config.GAME_RESULT_DELETE_TIMEOUT)
     await callback.answer("Результат готов.")
 
 
@@ -4508,7 +4590,7 @@ async def cmd_mirror(message: Message):
     await asyncio.sleep(0.6)
 
     magazine = _mirror_new_magazine()
-    sess = {
+    sess = GameSession({
         "stake": stake,
         "magazine": magazine,
         "index": 0,
@@ -4520,18 +4602,18 @@ async def cmd_mirror(message: Message):
         "bot": message.bot,
         "username": username,
         "first_name": first_name,
-    }
+    })
     caption = _mirror_caption(sess)
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔫 В себя", callback_data=f"mirror|{user_id}|self")],
-        [InlineKeyboardButton(text="🎯 В дилера", callback_data=f"mirror|{user_id}|opp")],
+        [InlineKeyboardButton(text="🔫 В себя", callback_data=pack("mirror", user_id, "self"))],
+        [InlineKeyboardButton(text="🎯 В дилера", callback_data=pack("mirror", user_id, "opp"))],
     ])
     photo_start = config.get_game_image_path("mirror", "start")
     if photo_start.exists():
         loading_msg_id = sent.message_id
         try:
             sent = await message.answer_photo(FSInputFile(str(photo_start)), caption=caption, reply_markup=kb)
-            asyncio.create_task(delete_message_after_by_id(message.bot, chat_id, loading_msg_id, 2))
+            delete_message_later_by_id(message.bot, chat_id, loading_msg_id, 2)
         except Exception:
             try:
                 await sent.edit_text(caption, reply_markup=kb)
@@ -4554,21 +4636,17 @@ def _mirror_advance_and_reload(sess: dict) -> None:
         sess["index"] = 0
 
 
-@router.callback_query(F.data.startswith("mirror|"))
-async def cb_mirror(callback: CallbackQuery):
-    data = callback.data.split("|")
-    if len(data) != 3:
-        await _safe_callback_answer(callback, "Ошибка", show_alert=True)
-        return
-    try:
-        uid = int(data[1])
-    except ValueError:
+@router.callback_query(CallbackPrefix("mirror"))
+@session_locked(_active_mirror_sessions)
+async def cb_mirror(callback: CallbackQuery, payload: CallbackPayload):
+    uid = payload.get_int(0)
+    if len(payload) != 2 or uid is None:
         await _safe_callback_answer(callback, "Ошибка", show_alert=True)
         return
     if callback.from_user.id != uid:
         await _safe_callback_answer(callback, "Не твоя дуэль.", show_alert=True)
         return
-    action = data[2]
+    action = payload.get(1)
     if action not in ("self", "opp"):
         await _safe_callback_answer(callback, "Неизвестное действие.", show_alert=True)
         return
@@ -4664,7 +4742,7 @@ async def cb_mirror(callback: CallbackQuery):
                 await bot.edit_message_text(chat_id=chat_id, message_id=msg_id, text=caption, reply_markup=None)
             except Exception:
                 await bot.send_message(chat_id, caption)
-        asyncio.create_task(delete_message_after_by_id(bot, chat_id, msg_id, config.GAME_RESULT_DELETE_TIMEOUT))
+        delete_message_later_by_id(bot, chat_id, msg_id, config.GAME_RESULT_DELETE_TIMEOUT)
         return
 
     # Продолжаем: обновить сообщение с жизнями и кнопками (если ход игрока)
@@ -4682,8 +4760,8 @@ async def cb_mirror(callback: CallbackQuery):
     kb = None
     if sess.get("turn") == "player":
         kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔫 В себя", callback_data=f"mirror|{uid}|self")],
-            [InlineKeyboardButton(text="🎯 В дилера", callback_data=f"mirror|{uid}|opp")],
+            [InlineKeyboardButton(text="🔫 В себя", callback_data=pack("mirror", uid, "self"))],
+            [InlineKeyboardButton(text="🎯 В дилера", callback_data=pack("mirror", uid, "opp"))],
         ])
     try:
         if kb:
@@ -5015,11 +5093,11 @@ async def cmd_helpgame(message: Message):
         ]
         msg = format_message_with_username("\n".join(lines), username, first_name)
         sent = await message.answer(msg)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     msg = format_message_with_username(GAME_HELP_TEXTS[name], username, first_name)
     sent = await message.answer(msg)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("infoslot"))
@@ -5038,7 +5116,7 @@ async def cmd_infoslot(message: Message):
     )
     
     sent_message = await message.answer(response_text)
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
 
 
 @router.message(Command("infokonopla"))
@@ -5058,7 +5136,7 @@ async def cmd_infokonopla(message: Message):
     )
     
     sent_message = await message.answer(response_text)
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
 
 
 @router.message(Command("infolucky"))
@@ -5077,15 +5155,87 @@ async def cmd_infolucky(message: Message):
     )
     
     sent_message = await message.answer(response_text)
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
 
 
 # ---------- /chisla PvP ----------
 CHISLA_TTL = GAME_MAX_DURATION_SEC  # 3 минуты макс
+CHISLA_SETTLE_RETRY = 30  # сек до повторного расчёта, если БД не записала расчёт
 CHISLA_CARDS = ["🂡", "🂢", "🂣", "🂤", "🂥", "🂦"]
 
-# Ожидающие вызовы: (p1_id, p2_id) -> {amount, chat_id, message_id} — для TTL возврата
-_chisla_pending: Dict[tuple, dict] = {}
+# Состояния дуэли: вызов отправлен → принят → рассчитана (или отклонена/истекла)
+CHISLA_PENDING = "pending"
+CHISLA_ACTIVE = "active"
+CHISLA_FINISHED = "finished"
+
+
+class ChislaDuel:
+    """
+    Дуэль /chisla целиком в памяти: состояние, выборы и таймаут.
+    Каждый переход пишет в chisla_sessions ровно одну запись (на случай перезапуска),
+    читать строку обратно не нужно; расчёт — одна транзакция settle_chisla_session.
+    Переход проверяется и выполняется синхронно, до первого await, поэтому двойное
+    нажатие не проведёт его дважды.
+    """
+
+    __slots__ = ("session_id", "player_ids", "amount", "chat_id", "message_id", "state", "choices", "mults", "timer")
+
+    def __init__(self, session_id: str, player1_id: int, player2_id: int, amount: int,
+                 chat_id: int, message_id: int, state: str = CHISLA_PENDING):
+        self.session_id = session_id
+        self.player_ids = (player1_id, player2_id)
+        self.amount = amount
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.state = state
+        self.choices: List[Optional[int]] = [None, None]
+        self.mults: List[Optional[float]] = [None, None]
+        self.timer: Optional[TimerHandle] = None
+
+    @property
+    def pair(self) -> tuple:
+        return self.player_ids
+
+    def slot(self, user_id: int) -> Optional[int]:
+        """Номер игрока в дуэли (0/1) или None"""
+        if user_id == self.player_ids[0]:
+            return 0
+        if user_id == self.player_ids[1]:
+            return 1
+        return None
+
+    def set_timeout(self, seconds: float, callback, *args) -> None:
+        self.cancel_timeout()
+        self.timer = game_timers.call_later(seconds, callback, *args)
+
+    def cancel_timeout(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+# Живые дуэли: session_id -> ChislaDuel; пара (p1, p2) -> session_id (кнопки вызова адресуют пару)
+_chisla_duels: Dict[str, ChislaDuel] = {}
+_chisla_by_pair: Dict[tuple, str] = {}
+
+
+def _chisla_get_by_pair(player1_id: int, player2_id: int) -> Optional[ChislaDuel]:
+    session_id = _chisla_by_pair.get((player1_id, player2_id))
+    return _chisla_duels.get(session_id) if session_id else None
+
+
+def _chisla_close(duel: ChislaDuel) -> None:
+    """Переход в finished: дуэль убирается из памяти вместе с таймаутом"""
+    duel.state = CHISLA_FINISHED
+    duel.cancel_timeout()
+    _chisla_duels.pop(duel.session_id, None)
+    if _chisla_by_pair.get(duel.pair) == duel.session_id:
+        del _chisla_by_pair[duel.pair]
+
+
+def _chisla_register(duel: ChislaDuel) -> None:
+    _chisla_duels[duel.session_id] = duel
+    _chisla_by_pair[duel.pair] = duel.session_id
 
 
 def _chisla_multiplier() -> float:
@@ -5119,18 +5269,18 @@ async def cmd_chisla(message: Message):
         recipient_id = await db.get_user_id_by_username(recipient_username)
     if not recipient_id:
         sent = await message.answer(format_message_with_username("Укажи пользователя: /chisla @user сумма", username, first_name))
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     if recipient_id == user_id:
         sent = await message.answer(format_message_with_username("Нельзя играть с самим собой.", username, first_name))
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     parts = (message.text or "").strip().split()
     if len(parts) < 3:
         sent = await message.answer(format_message_with_username("Формат: /chisla @user сумма", username, first_name))
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
     try:
         amount = int(parts[2])
@@ -5138,32 +5288,31 @@ async def cmd_chisla(message: Message):
             raise ValueError("сумма > 0")
     except (ValueError, IndexError):
         sent = await message.answer(format_message_with_username("Укажи корректную сумму.", username, first_name))
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     user2 = await db.get_user(recipient_id)
     if not user2:
         sent = await message.answer(format_message_with_username("Пользователь не найден.", username, first_name))
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     if user1.get("is_banned") or user2.get("is_banned"):
         sent = await message.answer(format_message_with_username("Один из игроков в бане.", username, first_name))
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     bal1 = await db.get_balance(user_id)
     bal2 = await db.get_balance(recipient_id)
     if bal1 < amount or bal2 < amount:
         sent = await message.answer(format_message_with_username("Недостаточно средств у одного из игроков.", username, first_name))
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
-    # Проверка: нет ли уже активного вызова между этими игроками
-    existing = await db.get_chisla_session_by_players(user_id, recipient_id)
-    if existing:
+    # Проверка: нет ли уже вызова или дуэли между этими игроками (в памяти, без запроса к БД)
+    if _chisla_get_by_pair(user_id, recipient_id) or _chisla_get_by_pair(recipient_id, user_id):
         sent = await message.answer(format_message_with_username("У вас уже есть активный вызов. Дождитесь ответа.", username, first_name))
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     # Резервируем у игрока1 (списываем)
@@ -5180,79 +5329,85 @@ async def cmd_chisla(message: Message):
     u2_tag = f"@{recipient_username}" if recipient_username else str(recipient_id)
     text = f"🎲 {u1_tag} хочет сразиться с {u2_tag} на {amount} коинов.\nПринять вызов?"
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Принять", callback_data=f"chisla_accept_{user_id}_{recipient_id}_{amount}")],
-        [InlineKeyboardButton(text="❌ Отказаться", callback_data=f"chisla_decline_{user_id}_{recipient_id}_{amount}")]
+        [InlineKeyboardButton(text="✅ Принять", callback_data=pack("chisla_accept", user_id, recipient_id, amount))],
+        [InlineKeyboardButton(text="❌ Отказаться", callback_data=pack("chisla_decline", user_id, recipient_id, amount))]
     ])
     sent_msg = await message.answer(text, reply_markup=keyboard)
-    key = (user_id, recipient_id)
-    _chisla_pending[key] = {"amount": amount, "chat_id": sent_msg.chat.id, "message_id": sent_msg.message_id}
-    asyncio.create_task(_chisla_challenge_ttl(message.bot, key))
+    duel = ChislaDuel(
+        f"{user_id}_{recipient_id}_{int(time.time())}", user_id, recipient_id, amount,
+        sent_msg.chat.id, sent_msg.message_id
+    )
+    _chisla_register(duel)
+    duel.set_timeout(CHISLA_TTL, _chisla_challenge_ttl, message.bot, duel)
+    # Переход → pending: одна запись (ставка игрока1 уже списана — после перезапуска вернётся)
+    await db.create_chisla_session(
+        duel.session_id, user_id, recipient_id, amount, sent_msg.message_id, sent_msg.chat.id, CHISLA_TTL
+    )
     logger.info(f"Chisla challenge: {user_id} vs {recipient_id} amount={amount}")
 
 
-async def _chisla_challenge_ttl(bot: Bot, key: tuple):
-    """Если второй игрок не ответил за 5 минут — возврат игроку 1."""
-    await asyncio.sleep(CHISLA_TTL)
-    if key not in _chisla_pending:
+async def _chisla_challenge_ttl(bot: Bot, duel: ChislaDuel):
+    """Если второй игрок не ответил за 5 минут — возврат игроку 1 (вызывается планировщиком таймаутов)."""
+    if duel.state != CHISLA_PENDING:
         return
-    data = _chisla_pending.pop(key, None)
-    if not data:
-        return
-    p1_id, p2_id = key
-    amount = data["amount"]
-    chat_id = data["chat_id"]
-    message_id = data["message_id"]
-    await balance_service.add_balance(p1_id, amount, "/chisla", "Возврат — вызов не принят", bot=bot, chat_id=chat_id, username=None, first_name=None)
+    _chisla_close(duel)
+    p1_id, p2_id = duel.pair
+    await db.delete_chisla_session(duel.session_id)
+    await balance_service.add_balance(p1_id, duel.amount, "/chisla", "Возврат — вызов не принят", bot=bot, chat_id=duel.chat_id, username=None, first_name=None)
     try:
-        await bot.delete_message(chat_id, message_id)
+        await bot.delete_message(duel.chat_id, duel.message_id)
     except Exception:
         pass
-    logger.info(f"Chisla challenge expired: {p1_id} vs {p2_id}, refunded {amount}")
+    logger.info(f"Chisla challenge expired: {p1_id} vs {p2_id}, refunded {duel.amount}")
 
 
-@router.callback_query(F.data.startswith("chisla_accept_"))
-async def cb_chisla_accept(callback: CallbackQuery):
-    parts = callback.data.split("_")
-    if len(parts) < 5:
+@router.callback_query(CallbackPrefix("chisla_accept"))
+async def cb_chisla_accept(callback: CallbackQuery, payload: CallbackPayload):
+    player1_id = payload.get_int(0)
+    player2_id = payload.get_int(1)
+    amount = payload.get_int(2)
+    if player1_id is None or player2_id is None or amount is None:
         await callback.answer("Ошибка", show_alert=True)
         return
-    player1_id = int(parts[2])
-    player2_id = int(parts[3])
-    amount = int(parts[4])
     if callback.from_user.id != player2_id:
         await callback.answer("Не жми на чужое!", show_alert=True)
         return
-    key = (player1_id, player2_id)
-    _chisla_pending.pop(key, None)
-    # Проверка: ещё не принято и игрок2 в наличии
-    bal2 = await db.get_balance(player2_id)
-    if bal2 < amount:
-        await callback.answer("Недостаточно средств.", show_alert=True)
+    duel = _chisla_get_by_pair(player1_id, player2_id)
+    if not duel or duel.state != CHISLA_PENDING:
+        await callback.answer("Вызов уже неактуален.", show_alert=True)
         return
-    success, _, _, _ = await balance_service.subtract_balance(
-        user_id=player2_id, amount=amount,
-        command_source="/chisla_accept", comment="Резерв на дуэль chisla",
+    # Переход pending → active до первого await: повторное нажатие сюда не пройдёт
+    duel.state = CHISLA_ACTIVE
+    amount = duel.amount
+    bal2 = await db.get_balance(player2_id)
+    balances = None
+    if bal2 >= amount:
+        # Переход → active и списание ставки игрока2 — одна транзакция
+        try:
+            async with balance_service.locked(player2_id):
+                balances = await db.accept_chisla_session(duel.session_id, player2_id, amount, CHISLA_TTL)
+        except Exception as e:
+            logger.error("chisla accept %s: %s", duel.session_id, e, exc_info=True)
+    if balances is None:
+        # Вызов остаётся в силе до своего срока
+        duel.state = CHISLA_PENDING
+        if duel.timer is None or not duel.timer.active:
+            # Срок вызова вышел, пока шло списание — истекает сейчас
+            duel.set_timeout(0, _chisla_challenge_ttl, callback.bot, duel)
+        await callback.answer("Недостаточно средств." if bal2 < amount else "Не удалось списать ставку.", show_alert=True)
+        return
+    await balance_service.notify_transaction(
+        user_id=player2_id, amount=amount, transaction_type="expense", balance_after=balances[1],
         bot=callback.bot, chat_id=callback.message.chat.id,
-        username=callback.from_user.username, first_name=callback.from_user.first_name,
-        allow_negative=False
+        username=callback.from_user.username, first_name=callback.from_user.first_name
     )
-    if not success:
-        await callback.answer("Не удалось списать ставку.", show_alert=True)
-        return
-    session_id = f"{player1_id}_{player2_id}_{int(time.time())}"
-    ok = await db.create_chisla_session(
-        session_id, player1_id, player2_id, amount,
-        callback.message.message_id, callback.message.chat.id, CHISLA_TTL
-    )
-    if not ok:
-        await balance_service.add_balance(player2_id, amount, "/chisla_accept", "Возврат", bot=callback.bot, chat_id=callback.message.chat.id, username=callback.from_user.username, first_name=callback.from_user.first_name)
-        await callback.answer("Ошибка создания сессии.", show_alert=True)
-        return
-    await db.update_chisla_accepted(session_id)
+    duel.chat_id = callback.message.chat.id
+    duel.message_id = callback.message.message_id
+    duel.set_timeout(CHISLA_TTL, _chisla_ttl_task, callback.bot, duel)
     rules = "Выбери одну карту. Больший множитель побеждает. У вас 5 минут."
     photo_path = config.get_image_path("chisla.jpg")
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=CHISLA_CARDS[i], callback_data=f"chisla_btn_{session_id}_{i}") for i in range(6)]
+        [InlineKeyboardButton(text=CHISLA_CARDS[i], callback_data=pack("chisla_btn", duel.session_id, i)) for i in range(6)]
     ])
     try:
         if photo_path.exists():
@@ -5263,24 +5418,27 @@ async def cb_chisla_accept(callback: CallbackQuery):
     except Exception:
         await callback.bot.edit_message_caption(chat_id=callback.message.chat.id, message_id=callback.message.message_id, caption=rules, reply_markup=keyboard)
     await callback.answer("Вызов принят! Выбери карту.", show_alert=False)
-    asyncio.create_task(_chisla_ttl_task(callback.bot, session_id, callback.message.chat.id, callback.message.message_id))
 
 
-@router.callback_query(F.data.startswith("chisla_decline_"))
-async def cb_chisla_decline(callback: CallbackQuery):
-    parts = callback.data.split("_")
-    if len(parts) < 5:
+@router.callback_query(CallbackPrefix("chisla_decline"))
+async def cb_chisla_decline(callback: CallbackQuery, payload: CallbackPayload):
+    player1_id = payload.get_int(0)
+    player2_id = payload.get_int(1)
+    amount = payload.get_int(2)
+    if player1_id is None or player2_id is None or amount is None:
         await callback.answer("Ошибка", show_alert=True)
         return
-    player1_id = int(parts[2])
-    player2_id = int(parts[3])
-    amount = int(parts[4])
     if callback.from_user.id != player2_id:
         await callback.answer("Не жми на чужое!", show_alert=True)
         return
-    key = (player1_id, player2_id)
-    _chisla_pending.pop(key, None)
-    await balance_service.add_balance(player1_id, amount, "/chisla_decline", "Возврат отказа", bot=callback.bot, chat_id=callback.message.chat.id, username=callback.from_user.username, first_name=callback.from_user.first_name)
+    duel = _chisla_get_by_pair(player1_id, player2_id)
+    if not duel or duel.state != CHISLA_PENDING:
+        await callback.answer("Вызов уже неактуален.", show_alert=True)
+        return
+    # Переход pending → finished: одна запись
+    _chisla_close(duel)
+    await db.delete_chisla_session(duel.session_id)
+    await balance_service.add_balance(player1_id, duel.amount, "/chisla_decline", "Возврат отказа", bot=callback.bot, chat_id=callback.message.chat.id, username=callback.from_user.username, first_name=callback.from_user.first_name)
     try:
         await callback.message.delete()
     except Exception:
@@ -5288,74 +5446,73 @@ async def cb_chisla_decline(callback: CallbackQuery):
     await callback.answer("Вызов отклонён.", show_alert=False)
 
 
-async def _chisla_ttl_task(bot: Bot, session_id: str, chat_id: int, message_id: int):
-    """Через 5 минут автовыбор и завершение игры."""
-    await asyncio.sleep(CHISLA_TTL)
-    sess = await db.get_chisla_session(session_id)
-    if not sess or sess["status"] != "active":
-        return
-    if sess.get("player1_choice") is None:
-        await db.update_chisla_choice(session_id, sess["player1_id"], game_random.randint(0, 5), _chisla_multiplier())
-        sess = await db.get_chisla_session(session_id)
-    if sess and sess.get("player2_choice") is None:
-        await db.update_chisla_choice(session_id, sess["player2_id"], game_random.randint(0, 5), _chisla_multiplier())
-    await _chisla_finish(bot, session_id, chat_id, message_id)
-
-
-async def _chisla_finish(bot: Bot, session_id: str, chat_id: int, message_id: int):
-    sess = await db.get_chisla_session(session_id)
-    if not sess or sess["status"] == "finished":
-        return
-    await db.finish_chisla_session(session_id)
-    p1_id, p2_id = sess["player1_id"], sess["player2_id"]
-    amount = sess["amount"]
-    mult1 = sess.get("player1_mult")
-    mult2 = sess.get("player2_mult")
-    if mult1 is None:
-        mult1 = _chisla_multiplier()
-        await db.update_chisla_choice(session_id, p1_id, sess.get("player1_choice") or 0, mult1)
-    if mult2 is None:
-        mult2 = _chisla_multiplier()
-        await db.update_chisla_choice(session_id, p2_id, sess.get("player2_choice") or 0, mult2)
-    sess = await db.get_chisla_session(session_id)
-    mult1, mult2 = sess["player1_mult"], sess["player2_mult"]
+async def _chisla_ttl_task(bot: Bot, duel: ChislaDuel):
+    """Через 5 минут (планировщик таймаутов) автовыбор за тех, кто не выбрал, и завершение игры."""
+    if duel.state != CHISLA_ACTIVE:
+        return
+    for slot in (0, 1):
+        if duel.choices[slot] is None:
+            duel.choices[slot] = game_random.randint(0, 5)
+            duel.mults[slot] = _chisla_multiplier()
+    await _chisla_finish(bot, duel)
+
+
+async def _chisla_finish(bot: Bot, duel: ChislaDuel):
+    """Расчёт дуэли: переход active → finished и одна транзакция в БД"""
+    if duel.state != CHISLA_ACTIVE:
+        return
+    # Переход до первого await (повторный расчёт сюда не пройдёт), но из памяти
+    # дуэль убирается только после записи расчёта в БД
+    duel.state = CHISLA_FINISHED
+    duel.cancel_timeout()
+    session_id, chat_id, message_id, amount = duel.session_id, duel.chat_id, duel.message_id, duel.amount
+    p1_id, p2_id = duel.pair
+    mult1, mult2 = duel.mults
     if mult1 > mult2:
-        winner_id, loser_id, win_mult = p1_id, p2_id, mult1
+        winner_id, loser_id, win_mult, lose_mult = p1_id, p2_id, mult1, mult2
     elif mult2 > mult1:
-        winner_id, loser_id, win_mult = p2_id, p1_id, mult2
+        winner_id, loser_id, win_mult, lose_mult = p2_id, p1_id, mult2, mult1
     else:
         winner_id = game_random.choice([p1_id, p2_id])
         loser_id = p2_id if winner_id == p1_id else p1_id
-        win_mult = mult1
-    u_win = await db.get_user(winner_id)
-    u_lose = await db.get_user(loser_id)
-    logger.info(
-        "chisla finish: winner_id=%s loser_id=%s amount=%s mult1=%.1f mult2=%.1f pot=%s",
-        winner_id, loser_id, amount, mult1, mult2, amount * 2
-    )
-    pot = amount * 2
-    _, _, _, tax = await balance_service.add_game_win(
-        user_id=winner_id,
-        gross_amount=pot,
-        command_source="/chisla",
-        comment="Победа в дуэли",
-        bot=bot,
-        chat_id=chat_id,
-        username=u_win.get("username") if u_win else None,
-        first_name=None,
+        win_mult = lose_mult = mult1
+    try:
+        u_win = await db.get_user(winner_id)
+        u_lose = await db.get_user(loser_id)
+        win_username = u_win.get("username") if u_win else None
+        lose_username = u_lose.get("username") if u_lose else None
+        logger.info(
+            "chisla finish: winner_id=%s loser_id=%s amount=%s mult1=%.1f mult2=%.1f pot=%s",
+            winner_id, loser_id, amount, mult1, mult2, amount * 2
+        )
+        pot = amount * 2
+        _, net, tax = await balance_service.game_win_tax(winner_id, pot)
+        # Расчёт пишет балансы обоих игроков — под их блокировками, как и прочие операции с балансом
+        async with balance_service.locked(winner_id, loser_id):
+            balances = await db.settle_chisla_session(
+                session_id, winner_id, loser_id, amount, net, tax, win_mult, lose_mult, win_username, lose_username
+            )
+    except Exception:
+        # Строка в БД осталась active — дуэль возвращается в игру и будет рассчитана снова
+        duel.state = CHISLA_ACTIVE
+        duel.set_timeout(CHISLA_SETTLE_RETRY, _chisla_ttl_task, bot, duel)
+        raise
+    _chisla_close(duel)
+    if balances is None:
+        logger.warning("chisla %s: сессия уже рассчитана, повторный расчёт пропущен", session_id)
+        return
+    balance_win, balance_lose = balances
+    await balance_service.announce_game_win(
+        winner_id, net, tax, balance_win, "/chisla", bot, chat_id, username=win_username
     )
-    await db.log_admin_game(winner_id, u_win.get("username") if u_win else "", "/chisla", amount, "win", amount, tax or 0)
-    await db.log_admin_game(loser_id, u_lose.get("username") if u_lose else "", "/chisla", amount, "loss", -amount, 0)
-    balance_win = await db.get_balance(winner_id)
-    balance_lose = await db.get_balance(loser_id)
-    await db.log_game_session(winner_id, "chisla", amount, "win", amount, float(win_mult))
-    await db.log_game_session(loser_id, "chisla", amount, "loss", -amount, float(mult2 if winner_id == p1_id else mult1))
+    await db.progress_game_quests(winner_id, "chisla", "win", amount)
+    await db.progress_game_quests(loser_id, "chisla", "loss", -amount)
     await _update_mmr_and_achievements(winner_id, "chisla", "win", balance_win)
     await _update_mmr_and_achievements(loser_id, "chisla", "loss", balance_lose)
-    win_tag = f"@{u_win['username']}" if u_win and u_win.get("username") else str(winner_id)
-    lose_tag = f"@{u_lose['username']}" if u_lose and u_lose.get("username") else str(loser_id)
+    win_tag = f"@{win_username}" if win_username else str(winner_id)
+    lose_tag = f"@{lose_username}" if lose_username else str(loser_id)
     win_caption = f"🏆 Победа! Твой множитель: x{win_mult}\nТы забрал {amount * 2} коинов"
-    lose_caption = f"💀 Проигрыш. Твой множитель: x{(mult2 if winner_id == p1_id else mult1)}"
+    lose_caption = f"💀 Проигрыш. Твой множитель: x{lose_mult}"
     try:
         await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None)
     except Exception:
@@ -5379,38 +5536,68 @@ async def _chisla_finish(bot: Bot, session_id: str, chat_id: int, message_id: in
             lose_msg = await bot.send_message(chat_id, f"{lose_tag}, {lose_caption}")
         game_timeout = getattr(config, "GAME_RESULT_DELETE_TIMEOUT", 20)
         if win_msg:
-            asyncio.create_task(delete_message_after_by_id(bot, chat_id, win_msg.message_id, game_timeout))
+            delete_message_later_by_id(bot, chat_id, win_msg.message_id, game_timeout)
         if lose_msg:
-            asyncio.create_task(delete_message_after_by_id(bot, chat_id, lose_msg.message_id, game_timeout))
+            delete_message_later_by_id(bot, chat_id, lose_msg.message_id, game_timeout)
     except Exception as e:
         logger.error(f"Chisla finish send: {e}")
-    await db.delete_chisla_session(session_id)
 
 
-@router.callback_query(F.data.startswith("chisla_btn_"))
-async def cb_chisla_btn(callback: CallbackQuery):
-    parts = callback.data.split("_")
-    if len(parts) < 4:
+@router.callback_query(CallbackPrefix("chisla_btn"))
+async def cb_chisla_btn(callback: CallbackQuery, payload: CallbackPayload):
+    session_id = payload.get(0)
+    btn_idx = payload.get_int(1)
+    if not session_id or btn_idx is None:
         await callback.answer("Ошибка", show_alert=True)
         return
-    session_id = "_".join(parts[2:-1])
-    btn_idx = int(parts[-1])
-    sess = await db.get_chisla_session(session_id)
-    if not sess or sess["status"] != "active":
+    duel = _chisla_duels.get(session_id)
+    if not duel or duel.state != CHISLA_ACTIVE:
         await callback.answer("Игра уже завершена.", show_alert=True)
         return
     player_id = callback.from_user.id
-    if player_id != sess["player1_id"] and player_id != sess["player2_id"]:
+    slot = duel.slot(player_id)
+    if slot is None:
         await callback.answer("Не жми на чужое!", show_alert=True)
         return
-    if (sess["player1_id"] == player_id and sess.get("player1_choice") is not None) or (sess["player2_id"] == player_id and sess.get("player2_choice") is not None):
+    if duel.choices[slot] is not None:
         await callback.answer("Ты уже выбрал карту.", show_alert=True)
         return
     mult = _chisla_multiplier()
-    await db.update_chisla_choice(session_id, player_id, btn_idx, mult)
-    sess = await db.get_chisla_session(session_id)
-    if sess.get("player1_choice") is not None and sess.get("player2_choice") is not None:
+    duel.choices[slot] = btn_idx
+    duel.mults[slot] = mult
+    if duel.choices[1 - slot] is not None:
+        # Оба выбрали: выбор второго игрока отдельно не пишем — расчёт закрывает сессию одной транзакцией
         await callback.answer(f"Твой множитель: x{mult}", show_alert=False)
-        await _chisla_finish(callback.bot, session_id, callback.message.chat.id, callback.message.message_id)
+        await _chisla_finish(callback.bot, duel)
     else:
+        # Переход «выбор сделан»: одна запись
+        await db.update_chisla_choice(session_id, player_id, btn_idx, mult)
         await callback.answer(f"Твой множитель: x{mult}. Ждём второго игрока.", show_alert=False)
+
+
+async def recover_chisla_duels(bot: Bot) -> int:
+    """
+    Восстановление дуэлей /chisla после перезапуска (при старте, до polling)
+    Вызовы и дуэли продолжаются с сохранёнными выборами; истёкшие отрабатывают свой таймаут сразу.
+
+    Returns:
+        Количество восстановленных дуэлей
+    """
+    now = time.time()
+    rows = await db.get_live_chisla_sessions()
+    for row in rows:
+        duel = ChislaDuel(
+            row["session_id"], row["player1_id"], row["player2_id"], row["amount"],
+            row["chat_id"], row["message_id"], state=row["status"]
+        )
+        duel.choices = [row["player1_choice"], row["player2_choice"]]
+        duel.mults = [row["player1_mult"], row["player2_mult"]]
+        _chisla_register(duel)
+        delay = max(0.0, row["expires_at"] - now)
+        if duel.state == CHISLA_PENDING:
+            duel.set_timeout(delay, _chisla_challenge_ttl, bot, duel)
+        else:
+            duel.set_timeout(delay, _chisla_ttl_task, bot, duel)
+    if rows:
+        logger.info("Восстановлено дуэлей /chisla: %s", len(rows))
+    return len(rows)
@@ -3,7 +3,6 @@
 /market, /tehnologmarket, /inventory, /dongift, /giftplus
 """
 
-import asyncio
 import logging
 import random
 
@@ -13,10 +12,11 @@ from aiogram.filters import Command
 
 from config import config
 from db import db
-from utils import delete_message_after, format_message_with_username, resolve_recipient_from_message
+from utils import delete_message_later, format_message_with_username, resolve_recipient_from_message
 from middlewares import set_command_cooldown
 from services.balance import balance_service
 from services.effects import effects_service
+from services.callbacks import CallbackPayload, CallbackPrefix, pack
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -50,7 +50,7 @@ async def cmd_market(message: Message):
         final_price = await effects_service.apply_price_discount(user_id, price)
         rows.append(InlineKeyboardButton(
             text=f"{key} — {final_price} коинов",
-            callback_data=f"buy_potion_{user_id}_{key}"
+            callback_data=pack("buy_potion", user_id, key)
         ))
 
     caption = format_message_with_username(
@@ -71,18 +71,17 @@ async def cmd_market(message: Message):
     except Exception as e:
         logger.error(f"market photo {e}")
         sent = await message.answer(caption, reply_markup=keyboard)
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
-@router.callback_query(F.data.startswith("buy_potion_"))
-async def cb_buy_potion(callback: CallbackQuery):
-    parts = callback.data.split("_")
-    if len(parts) < 4:
+@router.callback_query(CallbackPrefix("buy_potion"))
+async def cb_buy_potion(callback: CallbackQuery, payload: CallbackPayload):
+    owner_id = payload.get_int(0)
+    key = payload.get(1)
+    if owner_id is None or key is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     cb_user_id = callback.from_user.id
-    owner_id = int(parts[2])
-    key = parts[3]
     if cb_user_id != owner_id:
         await callback.answer("Не жми на чужое!", show_alert=True)
         return
@@ -125,7 +124,7 @@ async def cb_buy_potion(callback: CallbackQuery):
             thank = await callback.bot.send_photo(
                 callback.message.chat.id, FSInputFile(str(photo_path)), caption=caption
             )
-            asyncio.create_task(delete_message_after(thank))
+            delete_message_later(thank)
     except Exception as e:
         logger.warning(f"zelia.jpg after buy_potion: {e}")
     try:
@@ -158,9 +157,9 @@ async def cmd_tehnologmarket(message: Message):
         username, first_name
     )
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"Мишка — {price} 💰", callback_data=f"buy_toy_{user_id}_Мишка")],
-        [InlineKeyboardButton(text=f"Отвертка — {price} 💰", callback_data=f"buy_toy_{user_id}_Отвертка")],
-        [InlineKeyboardButton(text=f"Ключ на 32 — {price} 💰", callback_data=f"buy_toy_{user_id}_Ключ на 32")]
+        [InlineKeyboardButton(text=f"Мишка — {price} 💰", callback_data=pack("buy_toy", user_id, "Мишка"))],
+        [InlineKeyboardButton(text=f"Отвертка — {price} 💰", callback_data=pack("buy_toy", user_id, "Отвертка"))],
+        [InlineKeyboardButton(text=f"Ключ на 32 — {price} 💰", callback_data=pack("buy_toy", user_id, "Ключ на 32"))]
     ])
 
     photo_path = config.get_image_path("tehmarket.jpg")
@@ -172,18 +171,17 @@ async def cmd_tehnologmarket(message: Message):
     except Exception as e:
         logger.error(f"tehnologmarket {e}")
         sent = await message.answer(caption, reply_markup=keyboard)
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
-@router.callback_query(F.data.startswith("buy_toy_"))
-async def cb_buy_toy(callback: CallbackQuery):
-    parts = callback.data.split("_", 3)
-    if len(parts) < 4:
+@router.callback_query(CallbackPrefix("buy_toy"))
+async def cb_buy_toy(callback: CallbackQuery, payload: CallbackPayload):
+    owner_id = payload.get_int(0)
+    item_name = payload.get(1)
+    if owner_id is None or item_name is None:
         await callback.answer("Ошибка", show_alert=True)
         return
     cb_user_id = callback.from_user.id
-    owner_id = int(parts[2])
-    item_name = parts[3]
     if cb_user_id != owner_id:
         await callback.answer("Не жми на чужое!", show_alert=True)
         return
@@ -229,7 +227,7 @@ async def cb_buy_toy(callback: CallbackQuery):
                 thank = await callback.bot.send_photo(
                     callback.message.chat.id, FSInputFile(str(photo_path)), caption=caption
                 )
-                asyncio.create_task(delete_message_after(thank))
+                delete_message_later(thank)
         except Exception as e:
             logger.warning(f"toy image after buy_toy: {e}")
     try:
@@ -277,7 +275,7 @@ async def cmd_inventory(message: Message):
             sent = await message.answer(caption)
     except Exception as e:
         sent = await message.answer(caption)
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
 @router.message(Command("use_potion"))
@@ -295,7 +293,7 @@ async def cmd_use_potion(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     key = parts[1].strip().lower()
@@ -311,7 +309,7 @@ async def cmd_use_potion(message: Message):
         sent = await message.answer(
             format_message_with_username("Нет такого зелья в инвентаре.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     mult = item.get("multiplier") or 1.0
@@ -326,7 +324,7 @@ async def cmd_use_potion(message: Message):
                     username, first_name
                 )
             )
-            asyncio.create_task(delete_message_after(sent))
+            delete_message_later(sent)
             return
         await balance_service.subtract_balance(
             user_id=user_id, amount=cure,
@@ -340,7 +338,7 @@ async def cmd_use_potion(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     await db.add_effect(user_id, item["item_name"], config.POTION_DURATION, multiplier=mult)
@@ -351,7 +349,7 @@ async def cmd_use_potion(message: Message):
             username, first_name
         )
     )
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
 @router.message(Command("dongift"))
@@ -369,7 +367,7 @@ async def cmd_dongift(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     _, raw_user, item_name = parts
@@ -381,7 +379,7 @@ async def cmd_dongift(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     resolved_id, resolved_username = resolve_recipient_from_message(message)
@@ -398,13 +396,13 @@ async def cmd_dongift(message: Message):
         sent = await message.answer(
             format_message_with_username(f"Пользователь @{raw_user} не найден. Пусть напишет боту.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
     if receiver_id == user_id:
         sent = await message.answer(
             format_message_with_username("Нельзя подарить самому себе.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     rec_user = await db.get_user(receiver_id)
@@ -423,7 +421,7 @@ async def cmd_dongift(message: Message):
         sent = await message.answer(
             format_message_with_username(f"У тебя нет подарка «{item_name}».", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     receiver_inv = await db.get_user_inventory(receiver_id)
@@ -435,7 +433,7 @@ async def cmd_dongift(message: Message):
                     username, first_name
                 )
             )
-            asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+            delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
             return
 
     await db.remove_item_from_inventory(gift_id, user_id)
@@ -455,7 +453,7 @@ async def cmd_dongift(message: Message):
             sent = await message.answer(caption)
     except Exception:
         sent = await message.answer(caption)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command("giftplus"))
@@ -473,7 +471,7 @@ async def cmd_giftplus(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     _, toy_name, mult_str = parts
@@ -483,7 +481,7 @@ async def cmd_giftplus(message: Message):
         sent = await message.answer(
             format_message_with_username("Подарок: Мишка, Отвертка, Ключ на 32.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     inv = await db.get_user_inventory(user_id)
@@ -498,7 +496,7 @@ async def cmd_giftplus(message: Message):
         sent = await message.answer(
             format_message_with_username(f"Нет подарка «{toy_name}» в инвентаре.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     mult_map = {"x1.5": 1.5, "x2": 2.0, "x5": 5.0, "x10": 10.0}
@@ -507,7 +505,7 @@ async def cmd_giftplus(message: Message):
         sent = await message.answer(
             format_message_with_username("Множитель: x1.5, x2, x5, x10.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     ql = toy_item.get("quality_level") or 0
@@ -521,7 +519,7 @@ async def cmd_giftplus(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     success_craft = random.random() < 0.85
@@ -533,7 +531,7 @@ async def cmd_giftplus(message: Message):
                 username, first_name
             )
         )
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     success, _, _, err = await balance_service.subtract_balance(
@@ -543,7 +541,7 @@ async def cmd_giftplus(message: Message):
     )
     if not success:
         sent = await message.answer(format_message_with_username(err, username, first_name))
-        asyncio.create_task(delete_message_after(sent))
+        delete_message_later(sent)
         return
 
     await db.remove_item_from_inventory(toy_id, user_id)
@@ -555,7 +553,7 @@ async def cmd_giftplus(message: Message):
             username, first_name
         )
     )
-    asyncio.create_task(delete_message_after(sent))
+    delete_message_later(sent)
 
 
 @router.message(Command("freedurev"))
@@ -578,7 +576,7 @@ async def cmd_freedurev(message: Message):
     if activator_id is not None:
         text = "этот промокод уже применён"
         sent = await message.answer(format_message_with_username(text, username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     # Пытаемся записать себя как первого
@@ -586,7 +584,7 @@ async def cmd_freedurev(message: Message):
     if not inserted:
         text = "этот промокод уже применён"
         sent = await message.answer(format_message_with_username(text, username, first_name))
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     await balance_service.add_balance(
@@ -607,5 +605,5 @@ async def cmd_freedurev(message: Message):
     except Exception as e:
         logger.warning("freedurev photo: %s", e)
         sent = await message.answer(caption)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
     logger.info("User %s activated /freedurev (first and only for bot)", user_id)
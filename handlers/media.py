@@ -15,7 +15,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from config import config
-from utils import delete_message_after, format_message_with_username
+from utils import delete_message_later, format_message_with_username
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -67,7 +67,7 @@ async def cmd_photo(message: Message):
         sent = await message.answer(
             format_message_with_username(f"Медиа {pair[0]} пока нет. Добавь в assets/images.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+        delete_message_later(sent, DELETE_SEC)
         return
 
     try:
@@ -75,7 +75,7 @@ async def cmd_photo(message: Message):
     except Exception as e:
         logger.error(f"photo {cmd} {e}")
         sent = await message.answer(format_message_with_username("Не удалось отправить фото.", username, first_name))
-    asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+    delete_message_later(sent, DELETE_SEC)
 
 
 @router.message(Command("cam1", "cam2", "cam3", "cam4", "cam5"))
@@ -91,7 +91,7 @@ async def cmd_cam(message: Message):
         sent = await message.answer(
             format_message_with_username(f"Медиа {filename} пока нет. Добавь в assets/images.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+        delete_message_later(sent, DELETE_SEC)
         return
 
     try:
@@ -99,7 +99,7 @@ async def cmd_cam(message: Message):
     except Exception as e:
         logger.error(f"cam {cmd} {e}")
         sent = await message.answer(format_message_with_username("Не удалось отправить фото.", username, first_name))
-    asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+    delete_message_later(sent, DELETE_SEC)
 
 
 @router.message(Command("cityboy"))
@@ -113,7 +113,7 @@ async def cmd_cityboy(message: Message):
 
     if not audio_path:
         sent = await message.answer(format_message_with_username("Аудио cityboy пока нет в assets/audio.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+        delete_message_later(sent, DELETE_SEC)
         return
 
     try:
@@ -121,15 +121,15 @@ async def cmd_cityboy(message: Message):
         if photo_path:
             sent = await message.answer_photo(FSInputFile(str(photo_path)))
             msg2 = await message.answer_audio(audio)
-            asyncio.create_task(delete_message_after(sent, DELETE_SEC))
-            asyncio.create_task(delete_message_after(msg2, DELETE_SEC))
+            delete_message_later(sent, DELETE_SEC)
+            delete_message_later(msg2, DELETE_SEC)
         else:
             sent = await message.answer_audio(audio)
-            asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+            delete_message_later(sent, DELETE_SEC)
     except Exception as e:
         logger.error(f"cityboy {e}")
         sent = await message.answer(format_message_with_username("Медиа недоступно.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+        delete_message_later(sent, DELETE_SEC)
 
 
 @router.message(Command("ignat"))
@@ -140,14 +140,14 @@ async def cmd_ignat(message: Message):
     audio_path = _get_audio_path("ignat.ogg") or _get_audio_path("ignat.mp3")
     if not audio_path:
         sent = await message.answer(format_message_with_username("Аудио ignat пока нет в assets/audio.", username, first_name))
-        asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+        delete_message_later(sent, DELETE_SEC)
         return
     try:
         sent = await message.answer_audio(FSInputFile(str(audio_path)))
     except Exception as e:
         logger.error(f"ignat {e}")
         sent = await message.answer(format_message_with_username("Аудио недоступно.", username, first_name))
-    asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+    delete_message_later(sent, DELETE_SEC)
 
 
 @router.message(Command("olegdexter"))
@@ -160,7 +160,7 @@ async def cmd_olegdexter(message: Message):
     try:
         if audio_path:
             m = await message.answer_audio(FSInputFile(str(audio_path)))
-            asyncio.create_task(delete_message_after(m, DELETE_SEC))
+            delete_message_later(m, DELETE_SEC)
         if photo_path:
             sent = await message.answer_photo(FSInputFile(str(photo_path)))
         else:
@@ -168,7 +168,7 @@ async def cmd_olegdexter(message: Message):
     except Exception as e:
         logger.error(f"olegdexter {e}")
         sent = await message.answer(format_message_with_username("Медиа недоступно.", username, first_name))
-    asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+    delete_message_later(sent, DELETE_SEC)
 
 
 async def _run_dostavka_stages(
@@ -216,7 +216,7 @@ async def _run_dostavka_stages(
         if has_audio:
             try:
                 m2 = await bot.send_audio(chat_id=chat_id, audio=FSInputFile(str(audio_path)))
-                asyncio.create_task(delete_message_after(m2, DELETE_SEC))
+                delete_message_later(m2, DELETE_SEC)
             except Exception as e:
                 logger.warning(f"dostavka stages audio {e}")
         for delay, caption_text in stages[1:]:
@@ -240,7 +240,7 @@ async def _run_dostavka_stages(
             except Exception as e:
                 logger.warning(f"dostavka edit stage: {e}")
                 break
-        asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+        delete_message_later(sent, DELETE_SEC)
     except Exception as e:
         logger.error(f"dostavka stages {e}")
 
@@ -273,7 +273,7 @@ async def cmd_dostavka(message: Message, state: FSMContext):
         if audio_path and audio_path.exists():
             try:
                 m2 = await message.answer_audio(FSInputFile(str(audio_path)))
-                asyncio.create_task(delete_message_after(m2, DELETE_SEC))
+                delete_message_later(m2, DELETE_SEC)
             except Exception as e:
                 logger.warning(f"dostavka audio {e}")
     except Exception as e:
@@ -350,10 +350,10 @@ async def cmd_linux(message: Message):
     try:
         if photo_path:
             sent = await message.answer_photo(FSInputFile(str(photo_path)))
-            asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+            delete_message_later(sent, DELETE_SEC)
         if audio_path:
             m2 = await message.answer_audio(FSInputFile(str(audio_path)))
-            asyncio.create_task(delete_message_after(m2, DELETE_SEC))
+            delete_message_later(m2, DELETE_SEC)
         if not photo_path and not audio_path:
             sent = await message.answer(
                 format_message_with_username(
@@ -361,7 +361,7 @@ async def cmd_linux(message: Message):
                     username, first_name
                 )
             )
-            asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+            delete_message_later(sent, DELETE_SEC)
     except Exception as e:
         logger.warning(f"linux %s", e)
         if sent is None:
@@ -369,7 +369,7 @@ async def cmd_linux(message: Message):
                 sent = await message.answer(
                     format_message_with_username("Медиа недоступно.", username, first_name)
                 )
-                asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+                delete_message_later(sent, DELETE_SEC)
             except Exception:
                 pass
 
@@ -386,11 +386,11 @@ async def cmd_mramordpop(message: Message):
         sent = await message.answer(
             format_message_with_username("Медиа dpop.jpg пока нет в assets/images.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+        delete_message_later(sent, DELETE_SEC)
         return
     try:
         sent = await message.answer_photo(FSInputFile(str(photo_path)))
     except Exception as e:
         logger.warning(f"mramordpop {e}")
         sent = await message.answer(format_message_with_username("Не удалось отправить фото.", username, first_name))
-    asyncio.create_task(delete_message_after(sent, DELETE_SEC))
+    delete_message_later(sent, DELETE_SEC)
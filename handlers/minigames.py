@@ -10,7 +10,7 @@ from aiogram.filters import Command
 
 from config import config
 from db import db
-from utils import format_message_with_username, format_insufficient_balance, delete_message_after
+from utils import format_message_with_username, format_insufficient_balance, delete_message_later
 from services.balance import balance_service
 
 router = Router()
@@ -53,7 +53,7 @@ async def _run_minigame(user_id: int, username: str, first_name: str, slug: str,
     balance = await db.get_balance(user_id)
     if balance < stake:
         sent = await message.answer(format_insufficient_balance(username, first_name))
-        await delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT)
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     success, _, _, _ = await balance_service.subtract_balance(
@@ -82,7 +82,7 @@ async def _run_minigame(user_id: int, username: str, first_name: str, slug: str,
         username, first_name
     )
     sent = await message.answer(text)
-    await delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT)
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
 
 
 @router.message(Command(*MINIGAMES.keys()))
@@ -114,4 +114,4 @@ async def cmd_minigames_list(message: Message):
     lines.append("Пример: /coin 50 — орёл/решка на 50 коинов.")
     text = format_message_with_username("\n".join(lines), username, first_name)
     sent = await message.answer(text)
-    await delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT)
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
@@ -2,7 +2,6 @@
 Игровые новости: /news — текущая новость, к какой игре, когда заканчивается эффект.
 """
 
-import asyncio
 import logging
 from datetime import datetime
 
@@ -12,7 +11,7 @@ from aiogram.filters import Command
 
 from config import config
 from services.news import news_service
-from utils import delete_message_after, format_message_with_username
+from utils import delete_message_later, format_message_with_username
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -94,7 +93,7 @@ async def cmd_news(message: Message):
             username, first_name
         )
         sent = await message.answer(text)
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     game_name = GAME_DISPLAY_NAMES.get(news["game_slug"], news["game_slug"])
@@ -121,4 +120,4 @@ async def cmd_news(message: Message):
     except Exception as e:
         logger.warning("news photo %s: %s", photo_name, e)
         sent = await message.answer(caption)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
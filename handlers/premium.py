@@ -3,7 +3,6 @@
 /premium, /timeprem, /effect, /kachalka
 """
 
-import asyncio
 import logging
 import time
 from datetime import datetime, timedelta
@@ -14,10 +13,12 @@ from aiogram.filters import Command
 
 from config import config
 from db import db
-from utils import delete_message_after, format_message_with_username
+from utils import delete_message_later, format_message_with_username
 from middlewares import set_command_cooldown
 from services.balance import balance_service
+from services.cooldown import cooldown_service
 from services.effects import effects_service
+from services.callbacks import CallbackPayload, CallbackPrefix, pack
 
 # Создаем роутер для Premium команд
 router = Router()
@@ -62,19 +63,19 @@ async def cmd_premium(message: Message):
         [
             InlineKeyboardButton(
                 text="1 час — 2000 💰",
-                callback_data=f"buy_premium_{user_id}_1h"
+                callback_data=pack("buy_premium", user_id, "1h")
             )
         ],
         [
             InlineKeyboardButton(
                 text="1 день — 20000 💰",
-                callback_data=f"buy_premium_{user_id}_1d"
+                callback_data=pack("buy_premium", user_id, "1d")
             )
         ],
         [
             InlineKeyboardButton(
                 text="7 дней — 60000 💰",
-                callback_data=f"buy_premium_{user_id}_7d"
+                callback_data=pack("buy_premium", user_id, "7d")
             )
         ]
     ])
@@ -101,27 +102,24 @@ async def cmd_premium(message: Message):
         sent_message = await message.answer(caption, reply_markup=keyboard)
     
     # Автоудаление через 30 секунд
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
     
     logger.info(f"Пользователь {user_id} использовал /premium")
 
 
-@router.callback_query(F.data.startswith("buy_premium_"))
-async def callback_buy_premium(callback: CallbackQuery):
+@router.callback_query(CallbackPrefix("buy_premium"))
+async def callback_buy_premium(callback: CallbackQuery, payload: CallbackPayload):
     """
     Обработчик покупки Premium
-    Формат callback_data: buy_premium_{user_id}_{duration}
+    Формат callback_data: buy_premium|{user_id}|{duration}
     """
     # Проверяем, что callback от правильного пользователя
     callback_user_id = callback.from_user.id
-    callback_data = callback.data
     
     # Извлекаем данные из callback_data
-    try:
-        parts = callback_data.split("_")
-        tax_user_id = int(parts[2])
-        duration = parts[3]  # 1h, 1d, 7d
-    except (ValueError, IndexError):
+    tax_user_id = payload.get_int(0)
+    duration = payload.get(1)  # 1h, 1d, 7d
+    if tax_user_id is None or duration is None:
         await callback.answer("Ошибка обработки запроса", show_alert=True)
         return
     
@@ -174,6 +172,7 @@ async def callback_buy_premium(callback: CallbackQuery):
     
     # Устанавливаем Premium
     await db.set_premium(callback_user_id, duration_seconds)
+    cooldown_service.invalidate_perks(callback_user_id)
     
     # Вычисляем время окончания Premium
     now = int(datetime.now().timestamp())
@@ -214,7 +213,7 @@ async def callback_buy_premium(callback: CallbackQuery):
         )
     
     # Автоудаление через 30 секунд
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
     
     # Удаляем старое сообщение с кнопками
     try:
@@ -292,7 +291,7 @@ async def cmd_timeprem(message: Message):
     sent_message = await message.answer(response_text)
     
     # Автоудаление через 30 секунд
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
     
     logger.info(f"Пользователь {user_id} использовал /timeprem")
 
@@ -327,7 +326,7 @@ async def cmd_effect(message: Message):
     sent_message = await message.answer(response_text)
     
     # Автоудаление через 30 секунд
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
     
     logger.info(f"Пользователь {user_id} использовал /effect")
 
@@ -351,7 +350,7 @@ async def cmd_kachalka(message: Message):
         user = await db.get_user(user_id)
     
     # Проверяем cooldown для /kachalka (2 часа)
-    last_used = await db.get_cooldown(user_id, "/kachalka")
+    last_used = await cooldown_service.get_last_used(user_id, "/kachalka")
     now = int(time.time())
     cooldown_seconds = 7200  # 2 часа
     
@@ -379,7 +378,7 @@ async def cmd_kachalka(message: Message):
             )
             
             sent_message = await message.answer(response_text)
-            asyncio.create_task(delete_message_after(sent_message))
+            delete_message_later(sent_message)
             
             logger.info(f"Пользователь {user_id} попытался использовать /kachalka (cooldown {remaining} сек)")
             return
@@ -421,7 +420,7 @@ async def cmd_kachalka(message: Message):
         sent_message = await message.answer(caption)
     
     # Автоудаление через 30 секунд
-    asyncio.create_task(delete_message_after(sent_message))
+    delete_message_later(sent_message)
     
     logger.info(
         f"Пользователь {user_id} использовал /kachalka "
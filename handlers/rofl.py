@@ -3,7 +3,6 @@ Tehnolog Games — команда /steal (кража коинов, геймпл
 /sperm и /skinna0 отключены — только игры и экономика.
 """
 
-import asyncio
 import logging
 import random
 import time
@@ -14,9 +13,10 @@ from aiogram.filters import Command
 
 from config import config
 from db import db
-from utils import delete_message_after, format_message_with_username
+from utils import delete_message_later, format_message_with_username
 from middlewares import set_command_cooldown
 from services.balance import balance_service
+from services.cooldown import cooldown_service
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -29,14 +29,14 @@ async def cmd_steal(message: Message):
     username = message.from_user.username
     first_name = message.from_user.first_name
 
-    last_used = await db.get_cooldown(user_id, "/steal")
+    last_used = await cooldown_service.get_last_used(user_id, "/steal")
     now = int(time.time())
     if last_used and (now - last_used) < config.STEAL_COOLDOWN:
         left = config.STEAL_COOLDOWN - (now - last_used)
         sent = await message.answer(
             format_message_with_username(f"КД ещё {left // 3600}ч ⏳", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     amount = config.STEAL_AMOUNT
@@ -48,30 +48,34 @@ async def cmd_steal(message: Message):
         sent = await message.answer(
             format_message_with_username("Не у кого красть — все нищие 💸", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
 
     victim_id, _ = random.choice(victims)
-    success, _, _, err = await balance_service.subtract_balance(
-        user_id=victim_id, amount=amount,
-        command_source="/steal", comment="Кража",
-        bot=message.bot, chat_id=message.chat.id,
-        username=None, first_name=None, allow_negative=False
-    )
+    # Вор и жертва блокируются только на перевод в БД: повторный /steal ждёт и упирается в КД,
+    # уведомления и ответ в чат — уже после блокировки
+    async with balance_service.locked(user_id, victim_id):
+        last_used = await cooldown_service.get_last_used(user_id, "/steal")
+        if last_used and (int(time.time()) - last_used) < config.STEAL_COOLDOWN:
+            return
+        success, victim_after, thief_after = await balance_service.transfer(victim_id, user_id, amount, "/steal", "Кража")
+        if success:
+            await set_command_cooldown(user_id, "/steal")
     if not success:
         sent = await message.answer(
             format_message_with_username("Кража не удалась.", username, first_name)
         )
-        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
         return
-
-    await balance_service.add_balance(
-        user_id=user_id, amount=amount,
-        command_source="/steal", comment="Кража",
-        bot=message.bot, chat_id=message.chat.id,
-        username=username, first_name=first_name
+    balance_service.alert_income(message.bot, user_id, amount, thief_after, "/steal")
+    await balance_service.notify_transaction(
+        user_id=victim_id, amount=amount, transaction_type="expense", balance_after=victim_after,
+        bot=message.bot, chat_id=message.chat.id
+    )
+    await balance_service.notify_transaction(
+        user_id=user_id, amount=amount, transaction_type="income", balance_after=thief_after,
+        bot=message.bot, chat_id=message.chat.id, username=username, first_name=first_name
     )
-    await set_command_cooldown(user_id, "/steal")
 
     victim_user = await db.get_user(victim_id)
     v_username = (victim_user or {}).get("username") or str(victim_id)
@@ -89,4 +93,4 @@ async def cmd_steal(message: Message):
     except Exception as e:
         logger.error(f"steal photo {e}")
         sent = await message.answer(text)
-    asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+    delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
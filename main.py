@@ -5,13 +5,14 @@
 
 import asyncio
 import logging
+import signal
 import sys
 from pathlib import Path
 from logging.handlers import RotatingFileHandler
 
 from aiogram import Bot, Dispatcher, Router
 from aiogram.client.default import DefaultBotProperties
-from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.fsm.storage.memory import MemoryStorage
@@ -29,8 +30,11 @@ from middlewares import (
     LoggingMiddleware,
     UpdateUserDataMiddleware,
     ReklamaBlockMiddleware,
-    AdTriggerMiddleware
+    AdTriggerMiddleware,
+    CommandRoutingMiddleware,
+    CallbackRoutingMiddleware
 )
+from services.api_session import InstrumentedSession
 from services.effects import effects_service
 
 # Импорт роутеров (будут созданы позже)
@@ -362,12 +366,13 @@ def register_middlewares(dp: Dispatcher):
         raise
 
 
-async def on_startup(bot: Bot):
+async def on_startup(bot: Bot, dispatcher: Dispatcher):
     """
     Функция, вызываемая при старте бота
     
     Args:
         bot: Экземпляр бота
+        dispatcher: Диспетчер (для очереди обновлений)
     """
     logger = logging.getLogger(__name__)
     
@@ -387,6 +392,12 @@ async def on_startup(bot: Bot):
         logger.info(f"ID бота: {bot_info.id}")
         logger.info(f"Имя бота: {bot_info.first_name}")
         logger.info("=" * 50)
+        from services.routing import command_index
+        command_index.set_bot_username(bot_info.username)
+
+        # Обновления (webhook и polling) обрабатываются из ограниченной очереди по частям
+        from services.updates import update_queue
+        update_queue.start(dispatcher, bot)
         
         # Проверяем наличие необходимых директорий (на сервере могут быть read-only)
         required_dirs = [config.LOGS_DIR, config.ASSETS_DIR, config.IMAGES_DIR, config.AUDIO_DIR, config.VIDEO_DIR]
@@ -413,6 +424,36 @@ async def on_startup(bot: Bot):
         await effects_service.start_cleanup_task()
         logger.info("Задача очистки эффектов запущена")
 
+        # Пакетная запись last_active/username
+        from services.activity import activity_service
+        await activity_service.start_flush_task()
+
+        # Отложенная запись cooldown'ов
+        from services.cooldown import cooldown_service
+        await cooldown_service.start_flush_task()
+
+        # Единый планировщик автоудаления сообщений
+        from services.deletion import deletion_scheduler
+        await deletion_scheduler.start()
+
+        # Общий планировщик таймаутов игр
+        from services.timers import game_timers
+        await game_timers.start()
+
+        # Игры, прерванные перезапуском: продолжить или вернуть ставки, затем вести журнал
+        from db import db
+        from services.journal import session_journal
+        from services.sessions import session_manager
+        await db.cleanup_expired_kripta_sessions()
+        await session_manager.recover(bot)
+        await session_journal.start()
+        from handlers.games import recover_chisla_duels
+        await recover_chisla_duels(bot)
+
+        # Рассылка, прерванная перезапуском, продолжается с контрольной точки
+        from services.broadcast import broadcast_engine
+        await broadcast_engine.resume(bot)
+
         # Запускаем планировщик новостей (каждые 2 ч)
         from services.news import news_service
         await news_service.start_scheduler()
@@ -450,6 +491,13 @@ async def on_shutdown(bot: Bot):
             logger.info("Webhook снят")
         except Exception as e:
             logger.debug("delete_webhook: %s", e)
+
+        # Дообрабатываем принятые обновления, пока сервисы и БД ещё работают
+        try:
+            from services.updates import update_queue
+            await update_queue.stop()
+        except Exception as e:
+            logger.debug("update_queue stop: %s", e)
         
         # Останавливаем задачу очистки эффектов
         await effects_service.stop_cleanup_task()
@@ -467,6 +515,59 @@ async def on_shutdown(bot: Bot):
         except Exception as e:
             logger.debug("autonomy stop: %s", e)
 
+        # Рассылка прерывается; её контрольная точка уже в БД — продолжится при следующем старте
+        try:
+            from services.broadcast import broadcast_engine
+            await broadcast_engine.stop()
+        except Exception as e:
+            logger.debug("broadcast_engine stop: %s", e)
+
+        # Финальный снапшот незавершённых игр: при следующем старте они продолжатся или вернутся ставки
+        try:
+            from services.journal import session_journal
+            await session_journal.stop()
+        except Exception as e:
+            logger.debug("session_journal stop: %s", e)
+
+        try:
+            from services.timers import game_timers
+            await game_timers.stop()
+        except Exception as e:
+            logger.debug("game_timers stop: %s", e)
+
+        try:
+            from services.deletion import deletion_scheduler
+            await deletion_scheduler.stop()
+        except Exception as e:
+            logger.debug("deletion_scheduler stop: %s", e)
+
+        try:
+            from services.cooldown import cooldown_service
+            await cooldown_service.stop_flush_task()
+        except Exception as e:
+            logger.debug("cooldown_service stop: %s", e)
+
+        # Сбрасываем накопленную активность пользователей до закрытия БД
+        try:
+            from services.activity import activity_service
+            await activity_service.stop_flush_task()
+        except Exception as e:
+            logger.debug("activity_service stop: %s", e)
+
+        # Накопленная сводка уведомлений создателю уходит до остановки планировщика исходящих
+        try:
+            from services.digest import creator_digest
+            await creator_digest.flush()
+        except Exception as e:
+            logger.debug("creator_digest flush: %s", e)
+
+        # Отложенные лимитом запросы уходят без ожидания
+        try:
+            from services.outbound import outbound_scheduler
+            await outbound_scheduler.stop()
+        except Exception as e:
+            logger.debug("outbound_scheduler stop: %s", e)
+
         # Закрываем соединение с БД
         await close_db()
         logger.info("Соединение с БД закрыто")
@@ -504,28 +605,32 @@ async def main():
         # Создание бота (опционально через прокси — все запросы к Telegram пойдут через него, как в Chrome с VPN)
         logger.info("Создание бота...")
         proxy_url = getattr(config, "BOT_PROXY_URL", None) or getattr(config, "bot_proxy_url", None)
+        # Сессия со статистикой запросов к Bot API (время ответа, ошибки, байты, пул соединений)
+        session = InstrumentedSession(proxy=proxy_url) if proxy_url else InstrumentedSession()
+        api_base_url = getattr(config, "BOT_API_BASE_URL", None)
+        if api_base_url:
+            session.api = TelegramAPIServer.from_base(api_base_url.rstrip("/"))
+            logger.info("Бот будет обращаться к Bot API по адресу: %s", api_base_url)
+        bot = Bot(
+            token=config.BOT_TOKEN,
+            default=DefaultBotProperties(
+                parse_mode=ParseMode.HTML if config.PARSE_MODE == "HTML" else ParseMode.MARKDOWN_V2
+            ),
+            session=session,
+        )
         if proxy_url:
-            session = AiohttpSession(proxy=proxy_url)
-            bot = Bot(
-                token=config.BOT_TOKEN,
-                default=DefaultBotProperties(
-                    parse_mode=ParseMode.HTML if config.PARSE_MODE == "HTML" else ParseMode.MARKDOWN_V2
-                ),
-                session=session,
-            )
             logger.info("Бот будет отправлять запросы через прокси: %s", proxy_url)
-        else:
-            bot = Bot(
-                token=config.BOT_TOKEN,
-                default=DefaultBotProperties(
-                    parse_mode=ParseMode.HTML if config.PARSE_MODE == "HTML" else ParseMode.MARKDOWN_V2
-                )
-            )
+        
+        # Все запросы к Bot API — через планировщик лимитов (token bucket, приоритеты, RetryAfter)
+        from services.outbound import outbound_scheduler
+        bot.session.middleware(outbound_scheduler)
         
         # Создание диспетчера с хранилищем состояний
         logger.info("Создание диспетчера...")
         storage = MemoryStorage()
-        dp = Dispatcher(storage=storage)
+        # Polling: цикл getUpdates только раскладывает обновления по очередям (services/updates.py)
+        from services.updates import QueuedDispatcher
+        dp = QueuedDispatcher(storage=storage)
         
         # Регистрация middleware
         logger.info("Регистрация middleware...")
@@ -534,6 +639,13 @@ async def main():
         # Регистрация роутеров
         logger.info("Регистрация роутеров...")
         await register_routers(dp)
+
+        # Индексы команд и callback'ов: O(1) маршрутизация вместо перебора всех фильтров
+        from services.routing import command_index, callback_index
+        command_index.build(dp)
+        dp.message.outer_middleware(CommandRoutingMiddleware())
+        callback_index.build(dp)
+        dp.callback_query.outer_middleware(CallbackRoutingMiddleware())
         
         # Глобальный обработчик ошибок — чтобы пользователь всегда получал ответ при сбое
         @dp.error()
@@ -562,7 +674,8 @@ async def main():
             use_wh = bool(getattr(config, "WEBHOOK_URL", None) and getattr(config, "ENVIRONMENT", "") == "prod")
         if use_wh and getattr(config, "WEBHOOK_URL", None):
             from aiohttp import web
-            from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+            from aiogram.webhook.aiohttp_server import setup_application
+            from services.updates import QueuedRequestHandler, update_queue
             wh_url = config.WEBHOOK_URL
             port = int(config.PORT)
             logger.info("Режим webhook: URL=%s, PORT=%s — убедись, что polling нигде не запущен (один инстанс)", wh_url, port)
@@ -571,12 +684,28 @@ async def main():
                 return web.Response(text="ok")
             app.router.add_get("/", health)
             app.router.add_get("/health", health)
-            webhook_requests_handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
+            # Ответ Telegram сразу, обработка — из очереди; очередь полна — 429
+            webhook_requests_handler = QueuedRequestHandler(dispatcher=dp, bot=bot, queue=update_queue)
             webhook_requests_handler.register(app, path=config.WEBHOOK_PATH)
             setup_application(app, dp, bot=bot)
             port = int(config.PORT)
             logger.info("Запуск webhook на 0.0.0.0:%s", port)
-            web.run_app(app, host="0.0.0.0", port=port)
+            # Сервер в уже работающем цикле событий (web.run_app запускает свой цикл и здесь не годится)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            try:
+                await web.TCPSite(runner, host="0.0.0.0", port=port).start()
+                stop_event = asyncio.Event()
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    try:
+                        asyncio.get_running_loop().add_signal_handler(sig, stop_event.set)
+                    except (NotImplementedError, RuntimeError):
+                        pass
+                await stop_event.wait()
+                logger.info("Получен сигнал остановки")
+            finally:
+                # on_shutdown диспетчера (setup_application) вызывается здесь
+                await runner.cleanup()
         else:
             logger.info("Запуск polling")
             if getattr(config, "WEBHOOK_URL", None):
@@ -584,10 +713,12 @@ async def main():
             logger.info("ВНИМАНИЕ: если видишь Conflict (getUpdates), значит бот уже запущен в другом месте — закрой второй инстанс или на сервере задай WEBHOOK_URL и используй webhook.")
             logger.info("Режим работы: %s", config.ENVIRONMENT)
             try:
+                # Параллельность — в очереди обновлений, сам цикл разбирает их по одному
                 await dp.start_polling(
                     bot,
                     allowed_updates=dp.resolve_used_update_types() or None,
-                    close_bot_session=True
+                    close_bot_session=True,
+                    handle_as_tasks=False
                 )
             except KeyboardInterrupt:
                 logger.info("Получен сигнал прерывания (Ctrl+C)")
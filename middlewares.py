@@ -11,12 +11,18 @@ from typing import Callable, Dict, Any, Awaitable
 from datetime import datetime, timedelta
 
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
 from aiogram.types import Message, CallbackQuery, TelegramObject, Update
 from aiogram.exceptions import TelegramBadRequest
 
 from config import config
 from db import db
-from utils import format_message_with_username, format_message_vip_async, is_creator_by_username, delete_message_after
+from services.activity import activity_service
+from services.cooldown import cooldown_service
+from services.tax import tax_service
+from services.callbacks import pack
+from services.routing import FALLBACK, callback_index, command_index
+from utils import format_message_with_username, format_message_vip_async, is_creator_by_username, delete_message_later
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -34,7 +40,7 @@ async def set_command_cooldown(user_id: int, command: str):
         user_id: ID пользователя
         command: Название команды
     """
-    await db.set_cooldown(user_id, command)
+    await cooldown_service.set(user_id, command)
 
 
 def _is_creator(event: TelegramObject) -> bool:
@@ -154,7 +160,7 @@ class AntifloodMiddleware(BaseMiddleware):
                         if bot:
                             from utils import notify_creator
                             un = event.from_user.username if event.from_user else ""
-                            asyncio.create_task(notify_creator(bot, f"Антиспам: user_id={user_id} (@{un}) заблокирован на 1 ч (частый спам команд)."))
+                            asyncio.create_task(notify_creator(bot, f"user_id={user_id} (@{un}) заблокирован на 1 ч (частый спам команд).", kind="Антиспам"))
                     except Exception as e:
                         logger.debug("notify_creator antispam: %s", e)
                     return
@@ -347,7 +353,7 @@ class AntiAbuseMiddleware(BaseMiddleware):
             bot = getattr(event, "bot", None)
             if bot:
                 un = event.from_user.username if event.from_user else ""
-                asyncio.create_task(notify_creator(bot, f"Авто-бан (анти-абуз): user_id={user_id} @{un}\nПричина: {reason}\nМут до {mute_until}"))
+                asyncio.create_task(notify_creator(bot, f"user_id={user_id} @{un}, причина: {reason}, мут до {mute_until}", kind="Авто-бан (анти-абуз)"))
         except Exception as e:
             logger.debug("notify_creator autoban: %s", e)
         text = "ты улетел на Банановые острова 🍌 Отдыхай 1 час."
@@ -414,13 +420,13 @@ class CooldownMiddleware(BaseMiddleware):
         if not user_id:
             return await handler(event, data)
         
-        # Получаем время последнего использования команды
-        last_used = await db.get_cooldown(user_id, command)
+        # Время последнего использования — из таблицы в памяти (services/cooldown.py)
+        last_used = await cooldown_service.get_last_used(user_id, command)
         now = int(time.time())
         
         if last_used:
             # Вычисляем cooldown для пользователя
-            cooldown_seconds = await self._get_cooldown_seconds(user_id)
+            cooldown_seconds = await cooldown_service.get_cooldown_seconds(user_id)
             
             # Проверяем, прошло ли достаточно времени
             time_passed = now - last_used
@@ -445,7 +451,7 @@ class CooldownMiddleware(BaseMiddleware):
                         show_alert=False
                     )
                     if sent and hasattr(sent, "message_id"):
-                        asyncio.create_task(delete_message_after(sent, config.MESSAGE_DELETE_TIMEOUT))
+                        delete_message_later(sent, config.MESSAGE_DELETE_TIMEOUT)
                 except TelegramBadRequest:
                     pass  # Игнорируем ошибки отправки
                 
@@ -457,31 +463,6 @@ class CooldownMiddleware(BaseMiddleware):
 
         # Комиссия 5 коинов для платных команд (проверка и списание в CommissionMiddleware)
         return await handler(event, data)
-    
-    async def _get_cooldown_seconds(self, user_id: int) -> int:
-        """
-        Получение времени cooldown для пользователя с учётом Premium и эффектов
-        
-        Args:
-            user_id: ID пользователя
-            
-        Returns:
-            Время cooldown в секундах
-        """
-        # Базовый cooldown
-        base_cooldown = config.DEFAULT_COOLDOWN
-        
-        # Проверяем Premium
-        is_premium = await db.is_premium(user_id)
-        if is_premium:
-            base_cooldown = config.PREMIUM_COOLDOWN
-        
-        # Проверяем эффект kachalka (снижает cooldown до 30 сек)
-        has_kachalka = await db.has_effect(user_id, "kachalka")
-        if has_kachalka:
-            base_cooldown = config.KACHALKA_COOLDOWN_REDUCTION
-        
-        return base_cooldown
 
 
 class CommissionMiddleware(BaseMiddleware):
@@ -617,8 +598,6 @@ class TaxMiddleware(BaseMiddleware):
     def __init__(self):
         """Инициализация middleware налога"""
         super().__init__()
-        self.tax_interval_hours = config.TAX_INTERVAL_HOURS
-        self.tax_interval_seconds = self.tax_interval_hours * 3600
         # Команды, которые работают даже при неуплаченном налоге (баланс, помощь, профиль — не блокируем)
         self.allowed_commands = list(getattr(config, "FREE_COMMANDS", [])) or [
             "/refill", "/help", "/helpgame", "/start", "/news", "/balance", "/top", "/admins", "/report", "/obnova", "/tutorial"
@@ -660,23 +639,17 @@ class TaxMiddleware(BaseMiddleware):
         if not user_id:
             return await handler(event, data)
         
-        # Получаем состояние налога
-        tax_state = await db.get_tax_state(user_id)
-        now = int(time.time())
+        # Состояние налога — из кэша (services/tax.py), обычно без запросов к БД
+        tax_state = await tax_service.get_state(user_id)
         
         # Инициализация при первом использовании (старт 4-часового таймера, не блокировать команды)
         if tax_state["last_tax_time"] is None:
-            await db.init_tax_timer(user_id)
+            await tax_service.init_timer(user_id)
             return await handler(event, data)
         
-        # Проверяем, прошло ли 4 часа с последнего налога
-        time_since_last_tax = now - tax_state["last_tax_time"]
-        
         # Если налог был оплачен и прошло 4 часа, устанавливаем новый налог
-        if tax_state["is_paid"] and time_since_last_tax >= self.tax_interval_seconds:
-            await self._check_and_set_tax(user_id)
-            # Обновляем состояние после установки нового налога
-            tax_state = await db.get_tax_state(user_id)
+        if tax_service.is_due(tax_state):
+            tax_state = await tax_service.charge_if_due(user_id)
         
         # Если налог не оплачен, блокируем команду
         if not tax_state["is_paid"]:
@@ -685,7 +658,7 @@ class TaxMiddleware(BaseMiddleware):
             
             if balance == 0:
                 # Баланс = 0, налог пропадает
-                await db.pay_tax(user_id)
+                await tax_service.pay(user_id)
                 logger.info(f"Пользователь {user_id} имеет баланс 0, налог отменен")
                 return await handler(event, data)
             
@@ -711,7 +684,7 @@ class TaxMiddleware(BaseMiddleware):
                         reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
                             InlineKeyboardButton(
                                 text="Оплатить налог",
-                                callback_data=f"pay_tax_{user_id}"
+                                callback_data=pack("pay_tax", user_id)
                             )
                         ]])
                     )
@@ -737,25 +710,6 @@ class TaxMiddleware(BaseMiddleware):
         
         # Налог оплачен или еще не требуется
         return await handler(event, data)
-    
-    async def _check_and_set_tax(self, user_id: int):
-        """
-        Проверка и установка налога для пользователя
-        
-        Args:
-            user_id: ID пользователя
-        """
-        balance = await db.get_balance(user_id)
-        
-        if balance == 0:
-            # Баланс = 0, налог не требуется
-            await db.pay_tax(user_id)
-            return
-        
-        # Вычисляем налог (1/4 баланса, раз в 4 часа)
-        tax_amount = int(balance * config.TAX_PERCENTAGE)
-        logger.info(f"Налог Технолог установлен: user_id={user_id}, сумма={tax_amount}, баланс={balance}")
-        await db.set_tax_due(user_id, tax_amount)
 
 
 class LoggingMiddleware(BaseMiddleware):
@@ -802,13 +756,8 @@ class LoggingMiddleware(BaseMiddleware):
         # Логируем начало обработки
         if user_id:
             logger.info(f"[{user_id}] @{username} - {action}")
-            try:
-                # Обновляем время последней активности
-                await db.update_user_last_active(user_id)
-                if username:
-                    await db.update_user_username(user_id, username)
-            except Exception as e:
-                logger.warning("LoggingMiddleware: обновление user/username: %s", e)
+            # Время активности и username пишутся пакетно (services/activity.py)
+            activity_service.touch(user_id, username)
             
             # Premium 7d: при первом сообщении в чате раз в 24ч — «👑 @user зашёл в чат — целуйте экран»
             if isinstance(event, Message) and event.chat and event.chat.id:
@@ -846,6 +795,64 @@ class LoggingMiddleware(BaseMiddleware):
             raise
 
 
+class CommandRoutingMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.message: команды маршрутизируются по индексу (services/routing.py)
+    без перебора фильтров всех роутеров. Если индекс не знает команду — обычный путь aiogram.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if command_index.enabled and isinstance(event, Message):
+            route = command_index.resolve(event)
+            if route is not None:
+                result = await command_index.dispatch(route, event, data)
+                if result is not FALLBACK:
+                    command_index.hits += 1
+                    return result
+            elif command_index.is_command(event) and await command_index.is_unroutable(event, data):
+                # Неизвестная команда: ни один обработчик её не примет
+                command_index.hits += 1
+                return UNHANDLED
+            command_index.misses += 1
+        return await handler(event, data)
+
+
+class CallbackRoutingMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.callback_query: callback_data разбирается один раз,
+    обработчик выбирается словарём по префиксу (services/routing.py, services/callbacks.py).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if callback_index.enabled and isinstance(event, CallbackQuery):
+            route = callback_index.resolve(event, data)
+            if route is not None:
+                result = await callback_index.dispatch(route, event, data)
+                if result is not FALLBACK:
+                    callback_index.hits += 1
+                    return result
+            elif await callback_index.is_unroutable(event, data):
+                # Неизвестный префикс (например, кнопка старого формата): закрываем «часики»
+                callback_index.hits += 1
+                try:
+                    await event.answer("Кнопка устарела", show_alert=False)
+                except Exception:
+                    pass
+                return UNHANDLED
+            callback_index.misses += 1
+        return await handler(event, data)
+
+
 class BanMiddleware(BaseMiddleware):
     """
     Блокировка забаненных пользователей: запрет игр и команд.
@@ -935,19 +942,19 @@ class UpdateUserDataMiddleware(BaseMiddleware):
             if is_creator_by_username(username) and not getattr(config, "CREATOR_ID", None):
                 setattr(config, "CREATOR_ID", user_id)
                 logger.info(f"Создатель @DPOPTH привязан к user_id={user_id}")
-            # Проверяем существование пользователя
-            user = await db.get_user(user_id)
-            if not user:
-                # Создаем нового пользователя
-                await db.create_user(user_id, username)
-                logger.info(f"Создан новый пользователь: {user_id} (@{username})")
-            else:
-                # Обновляем username если изменился
-                if username and username != user.get("username"):
-                    await db.update_user_username(user_id, username)
-                
-                # Обновляем время последней активности
-                await db.update_user_last_active(user_id)
+            # Проверяем существование пользователя (один раз за процесс)
+            if not activity_service.is_known(user_id):
+                user = await db.get_user(user_id)
+                if not user:
+                    # Создаем нового пользователя
+                    await db.create_user(user_id, username)
+                    logger.info(f"Создан новый пользователь: {user_id} (@{username})")
+                    activity_service.remember(user_id, username)
+                else:
+                    activity_service.remember(user_id, user.get("username"))
+            
+            # username (если изменился) и время активности — в пакетную запись
+            activity_service.touch(user_id, username)
         
         # Пропускаем событие дальше
         return await handler(event, data)
@@ -957,6 +964,8 @@ class UpdateUserDataMiddleware(BaseMiddleware):
 __all__ = [
     "AntifloodMiddleware",
     "BanMiddleware",
+    "CommandRoutingMiddleware",
+    "CallbackRoutingMiddleware",
     "CooldownMiddleware",
     "CommissionMiddleware",
     "TaxMiddleware",
@@ -0,0 +1,95 @@
+"""
+Бенчмарк переводов под конкуренцией: пропускная способность transfer_balance и
+сохранность суммы балансов с блокировками счетов (services/balance.py) и без них.
+Работает на временной SQLite-базе, Bot API не нужен (уведомления без bot пропускаются).
+Запуск из корня проекта: python scripts/bench_account_locks.py
+"""
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import logging
+
+from db import db, init_db, close_db
+from services.balance import AccountLocks, balance_service
+
+START_BALANCE = 1_000_000
+TRANSFERS = 2000
+SCENARIOS = [
+    # (название, счетов, одновременных переводов)
+    ("горячие счета", 8, TRANSFERS),
+    ("умеренная конкуренция", 64, TRANSFERS),
+    ("без пересечений", 2 * TRANSFERS, TRANSFERS),
+]
+
+
+@asynccontextmanager
+async def _no_lock(*user_ids):
+    yield
+
+
+async def _reset_accounts(accounts: int):
+    await db.execute("DELETE FROM transactions")
+    await db.execute("DELETE FROM users")
+    for user_id in range(1, accounts + 1):
+        await db.create_user(user_id, f"bench{user_id}")
+    await db.execute("UPDATE users SET balance = ?", (START_BALANCE,))
+
+
+async def _run(title: str, accounts: int, transfers: int, rng: random.Random):
+    await _reset_accounts(accounts)
+    pairs = []
+    for i in range(transfers):
+        if accounts >= 2 * transfers:
+            sender, receiver = 2 * i + 1, 2 * i + 2
+        else:
+            sender, receiver = rng.sample(range(1, accounts + 1), 2)
+        pairs.append((sender, receiver, rng.randint(1, 100)))
+    started = time.perf_counter()
+    results = await asyncio.wait_for(asyncio.gather(*[
+        balance_service.transfer_balance(sender, receiver, amount, "bench")
+        for sender, receiver, amount in pairs
+    ]), timeout=300)
+    elapsed = time.perf_counter() - started
+    ok = sum(1 for success, _ in results if success)
+    total = (await db.fetchone("SELECT SUM(balance) FROM users"))[0]
+    drift = total - START_BALANCE * accounts
+    print(f"{title:<24}{accounts:>8}{ok:>8}{ok / elapsed:>12.0f}{drift:>14}")
+
+
+async def main():
+    logging.disable(logging.CRITICAL)
+    tmp = tempfile.TemporaryDirectory()
+    db.db_path = Path(tmp.name) / "bench.db"
+    await init_db()
+    rng = random.Random(42)
+    header = f"{'сценарий':<24}{'счетов':>8}{'успех':>8}{'перев./с':>12}{'расхождение':>14}"
+
+    print("--- без блокировок счетов ---")
+    print(header)
+    balance_service.locked = _no_lock
+    for title, accounts, transfers in SCENARIOS:
+        await _run(title, accounts, transfers, rng)
+    del balance_service.locked
+    print()
+
+    print("--- блокировки счетов (по возрастанию id) ---")
+    print(header)
+    for title, accounts, transfers in SCENARIOS:
+        balance_service.account_locks = AccountLocks()
+        await _run(title, accounts, transfers, rng)
+        locks = balance_service.account_locks
+        print(f"{'':<24}захватов {locks.acquired}, ожиданий {locks.contended}, в реестре после прогона {len(locks)}")
+    await close_db()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
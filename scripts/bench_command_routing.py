@@ -0,0 +1,120 @@
+"""
+Бенчмарк маршрутизации команд и callback'ов: сколько фильтров aiogram проверяет
+на один апдейт без индексов и с индексами (services/routing.py).
+Обработчики подменяются заглушками — БД и сеть не нужны.
+Запуск из корня проекта: python scripts/bench_command_routing.py
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.event.handler import FilterObject
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from main import register_routers
+from middlewares import CallbackRoutingMiddleware, CommandRoutingMiddleware
+from services.callbacks import pack
+from services.routing import callback_index, command_index
+
+BOT_USERNAME = "TehnologGamesBot"
+ROUNDS = 2000
+COMMANDS = ["/start", "/balance", "/slot 100", "/reactor 50", "/trace 50",
+            f"/trace@{BOT_USERNAME} 50", "/steal", "/admin", "/unknowncmd"]
+CALLBACKS = [pack("tutorial", "main"), pack("pay_tax", 1001), pack("birzh_buy", 1001, "jd"),
+             pack("almaz_dig", 1001), pack("mirror", 1001, "self"), pack("chisla_btn", "1_2_3", 4),
+             "legacy_button_42"]
+
+_filter_calls = 0
+_original_call = FilterObject.call
+
+
+async def _counting_call(self, *args, **kwargs):
+    global _filter_calls
+    _filter_calls += 1
+    return await _original_call(self, *args, **kwargs)
+
+
+async def _noop(*args, **kwargs):
+    return None
+
+
+def _make_update(update_id: int, text: str) -> Update:
+    user = User(id=1000 + update_id % 50, is_bot=False, first_name="bench")
+    message = Message(
+        message_id=update_id, date=0, text=text,
+        chat=Chat(id=-100500, type="supergroup"), from_user=user,
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def _make_callback_update(update_id: int, data: str) -> Update:
+    user = User(id=1000 + update_id % 50, is_bot=False, first_name="bench")
+    callback = CallbackQuery(id=str(update_id), from_user=user, chat_instance="bench", data=data)
+    return Update(update_id=update_id, callback_query=callback)
+
+
+async def _run(dp: Dispatcher, bot: Bot, title: str, samples=COMMANDS, make_update=_make_update):
+    global _filter_calls
+    print(f"--- {title} ---")
+    print(f"{'апдейт':<28}{'фильтров/апдейт':>18}{'мкс/апдейт':>14}")
+    update_id = 0
+    for text in samples:
+        _filter_calls = 0
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            update_id += 1
+            await dp.feed_update(bot, make_update(update_id, text))
+        elapsed = time.perf_counter() - started
+        print(f"{text:<28}{_filter_calls / ROUNDS:>18.1f}{elapsed / ROUNDS * 1e6:>14.1f}")
+    print()
+
+
+async def main():
+    logging.disable(logging.CRITICAL)
+    dp = Dispatcher()
+    await register_routers(dp)
+    handlers = callbacks = 0
+    for router in dp.chain_tail:
+        for handler in router.message.handlers:
+            handler.callback = _noop
+            handler.__post_init__()
+            handlers += 1
+        for handler in router.callback_query.handlers:
+            handler.callback = _noop
+            handler.__post_init__()
+            callbacks += 1
+    FilterObject.call = _counting_call
+    # «Кнопка устарела» для неизвестных префиксов — без обращения к Bot API
+    CallbackQuery.answer = _noop
+
+    bot = Bot(token="42:BENCHMARK")
+    bot._me = User(id=42, is_bot=True, first_name="bench", username=BOT_USERNAME)
+    print(f"Обработчиков сообщений: {handlers}, callback'ов: {callbacks}\n")
+
+    await _run(dp, bot, "aiogram: последовательная проверка фильтров")
+    await _run(dp, bot, "aiogram: callback'и, последовательная проверка фильтров",
+               CALLBACKS, _make_callback_update)
+
+    command_index.build(dp)
+    command_index.set_bot_username(BOT_USERNAME)
+    dp.message.outer_middleware(CommandRoutingMiddleware())
+    await _run(dp, bot, f"индекс команд ({len(command_index)} ключей)")
+    print(f"Попаданий в индекс: {command_index.hits}, обычный путь: {command_index.misses}")
+
+    callback_index.build(dp)
+    dp.callback_query.outer_middleware(CallbackRoutingMiddleware())
+    await _run(dp, bot, f"индекс callback'ов ({len(callback_index)} префиксов)",
+               CALLBACKS, _make_callback_update)
+    print(f"Попаданий в индекс: {callback_index.hits}, обычный путь: {callback_index.misses}")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
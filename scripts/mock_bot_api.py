@@ -0,0 +1,364 @@
+"""
+Локальный Bot API для нагрузочных тестов без сети
+Заменяет api.telegram.org: бот (main.py без изменений) ходит сюда, если задать
+BOT_API_BASE_URL=http://127.0.0.1:8081. Сервер:
+- отвечает на getMe, getUpdates, setWebhook/deleteWebhook, sendMessage, sendPhoto,
+  sendAudio, editMessageText/Caption/Media/ReplyMarkup, deleteMessage(s),
+  answerCallbackQuery (остальные методы — ok/true);
+- генерирует входящие: --users пользователей шлют команды из --commands с общей
+  скоростью --rate в секунду; отдаёт их через getUpdates или POST на webhook
+  (если бот вызвал setWebhook);
+- добавляет задержку ответа (--latency ± --jitter) и отвечает 429 с retry_after
+  на долю запросов (--error-429);
+- считает запросы, ошибки и время по методам: сводка раз в --report секунд,
+  при остановке и по GET /stats.
+Запуск из корня проекта: python scripts/mock_bot_api.py --users 1000 --rate 200
+Затем в другом терминале: BOT_API_BASE_URL=http://127.0.0.1:8081 python main.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Mock", "username": "MockBot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+FIRST_USER_ID = 10_000_001
+DEFAULT_COMMANDS = "/start,/balance,/profile,/slot 100,/top"
+
+
+class MethodCounter:
+    """Запросы одного метода"""
+
+    __slots__ = ("count", "errors_429", "bytes_received", "total_time")
+
+    def __init__(self):
+        self.count = 0
+        self.errors_429 = 0
+        self.bytes_received = 0
+        self.total_time = 0.0
+
+
+class MockBotApi:
+    """Состояние поддельного Bot API: сообщения, входящие обновления, статистика"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.methods: Dict[str, MethodCounter] = {}
+        self.started = time.monotonic()
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._updates: Deque[Dict[str, Any]] = deque(maxlen=args.max_pending)
+        self._updates_ready = asyncio.Event()
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.generated = 0
+        self.delivered = 0
+        self._last_delivered = 0
+        self.webhook_rejected = 0
+
+    # --- Ответы методов ---
+
+    def _message(self, chat_id: Any, **fields: Any) -> Dict[str, Any]:
+        chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0
+        message = {
+            "message_id": int(fields.pop("message_id", 0) or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup", "title": "Mock"},
+            "from": BOT_USER,
+        }
+        message.update(fields)
+        return message
+
+    def _file(self, **fields: Any) -> Dict[str, Any]:
+        n = next(self._file_ids)
+        return {"file_id": f"mock-file-{n}", "file_unique_id": f"mock-{n}", **fields}
+
+    def _media_fields(self, media: Any) -> Dict[str, Any]:
+        """Поле сообщения для InputMedia (editMessageMedia)"""
+        if isinstance(media, str):
+            try:
+                media = json.loads(media)
+            except ValueError:
+                media = {}
+        kind = media.get("type", "photo") if isinstance(media, dict) else "photo"
+        caption = media.get("caption") if isinstance(media, dict) else None
+        fields: Dict[str, Any] = {"caption": caption} if caption else {}
+        if kind == "photo":
+            fields["photo"] = [self._file(width=1280, height=720)]
+        else:
+            fields[kind] = self._file(duration=0) if kind in ("audio", "video", "animation") else self._file()
+        return fields
+
+    def result(self, method: str, params: Dict[str, Any]) -> Any:
+        """Результат метода (как в настоящем Bot API, с минимально нужными полями)"""
+        chat_id = params.get("chat_id", 0)
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            raise RuntimeError("getUpdates обрабатывается отдельно")
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url or "", "has_custom_certificate": False,
+                    "pending_update_count": len(self._updates)}
+        if method == "setWebhook":
+            self.webhook_url = params.get("url") or None
+            self.webhook_secret = params.get("secret_token") or None
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            if str(params.get("drop_pending_updates", "")).lower() == "true":
+                self._updates.clear()
+            return True
+        if method == "sendMessage":
+            return self._message(chat_id, text=params.get("text", ""))
+        if method == "sendPhoto":
+            return self._message(chat_id, photo=[self._file(width=1280, height=720)],
+                                 **({"caption": params["caption"]} if params.get("caption") else {}))
+        if method == "sendAudio":
+            return self._message(chat_id, audio=self._file(duration=0),
+                                 **({"caption": params["caption"]} if params.get("caption") else {}))
+        if method in ("editMessageText", "editMessageCaption", "editMessageMedia", "editMessageReplyMarkup"):
+            if params.get("inline_message_id"):
+                return True
+            fields: Dict[str, Any] = {"message_id": params.get("message_id"), "edit_date": int(time.time())}
+            if method == "editMessageText":
+                fields["text"] = params.get("text", "")
+            elif method == "editMessageCaption":
+                fields["caption"] = params.get("caption", "")
+                fields["photo"] = [self._file(width=1280, height=720)]
+            elif method == "editMessageMedia":
+                fields.update(self._media_fields(params.get("media")))
+            else:
+                fields["text"] = ""
+            return self._message(chat_id, **fields)
+        # deleteMessage(s), answerCallbackQuery, setMyCommands и прочее
+        return True
+
+    # --- Входящие обновления ---
+
+    def _make_update(self) -> Dict[str, Any]:
+        user_id = FIRST_USER_ID + random.randrange(self.args.users)
+        text = random.choice(self.args.command_list)
+        command = text.split(maxsplit=1)[0]
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+                "from": user,
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}] if command.startswith("/") else [],
+            },
+        }
+
+    async def generate(self) -> None:
+        """Поток входящих: --rate обновлений в секунду (пачками по 10 мс)"""
+        if self.args.rate <= 0 or self.args.users <= 0:
+            return
+        tick = 0.01
+        budget = 0.0
+        while True:
+            await asyncio.sleep(tick)
+            budget += self.args.rate * tick
+            while budget >= 1:
+                budget -= 1
+                self._updates.append(self._make_update())
+                self.generated += 1
+            if self._updates:
+                self._updates_ready.set()
+
+    async def get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """getUpdates: подтверждение по offset, long polling до timeout секунд"""
+        offset = int(params.get("offset") or 0)
+        limit = max(1, min(100, int(params.get("limit") or 100)))
+        timeout = float(params.get("timeout") or 0)
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout > 0:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = list(itertools.islice(self._updates, limit))
+        # Неподтверждённые обновления отдаются повторно — в delivered считаются один раз
+        fresh = [u for u in batch if u["update_id"] > self._last_delivered]
+        if fresh:
+            self.delivered += len(fresh)
+            self._last_delivered = fresh[-1]["update_id"]
+        return batch
+
+    async def push_webhook(self) -> None:
+        """Режим webhook: входящие уходят POST на URL из setWebhook (429 — повтор после паузы)"""
+        async with ClientSession(timeout=ClientTimeout(total=30)) as session:
+            while True:
+                if not self.webhook_url or not self._updates:
+                    self._updates_ready.clear()
+                    try:
+                        await asyncio.wait_for(self._updates_ready.wait(), 0.5)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                update = self._updates[0]
+                headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+                try:
+                    async with session.post(self.webhook_url, json=update, headers=headers) as response:
+                        if response.status == 429:
+                            self.webhook_rejected += 1
+                            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+                            continue
+                except Exception:
+                    await asyncio.sleep(1)
+                    continue
+                self._updates.popleft()
+                self.delivered += 1
+
+    # --- HTTP ---
+
+    async def _params(self, request: web.Request, counter: "MethodCounter") -> Dict[str, Any]:
+        """Параметры запроса: JSON, форма или multipart (файлы только считаются в байтах)"""
+        params: Dict[str, Any] = dict(request.query)
+        if request.method != "POST":
+            return params
+        if request.content_type.startswith("multipart/"):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename:
+                    while True:
+                        chunk = await part.read_chunk()
+                        if not chunk:
+                            break
+                        counter.bytes_received += len(chunk)
+                else:
+                    value = await part.text()
+                    counter.bytes_received += len(value.encode())
+                    params[part.name] = value
+            return params
+        counter.bytes_received += request.content_length or 0
+        if request.content_type == "application/json":
+            body = await request.json()
+            params.update(body if isinstance(body, dict) else {})
+        else:
+            params.update(await request.post())
+        return params
+
+    def method_stats(self, method: str) -> MethodCounter:
+        counter = self.methods.get(method)
+        if counter is None:
+            counter = self.methods[method] = MethodCounter()
+        return counter
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        counter = self.method_stats(method)
+        counter.count += 1
+        started = time.monotonic()
+        try:
+            params = await self._params(request, counter)
+            if method == "getUpdates":
+                # Long polling сам ждёт обновлений: задержка и 429 к нему не применяются
+                return web.json_response({"ok": True, "result": await self.get_updates(params)})
+            delay = self.args.latency + random.uniform(-self.args.jitter, self.args.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay / 1000)
+            if random.random() < self.args.error_429:
+                counter.errors_429 += 1
+                return web.json_response({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.args.retry_after}",
+                    "parameters": {"retry_after": self.args.retry_after},
+                }, status=429)
+            return web.json_response({"ok": True, "result": self.result(method, params)})
+        finally:
+            counter.total_time += time.monotonic() - started
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(0.001, time.monotonic() - self.started)
+        total = sum(c.count for c in self.methods.values() if c is not self.methods.get("getUpdates"))
+        return {
+            "elapsed": round(elapsed, 1),
+            "requests": total,
+            "requests_per_second": round(total / elapsed, 1),
+            "updates_generated": self.generated,
+            "updates_delivered": self.delivered,
+            "updates_pending": len(self._updates),
+            "webhook": self.webhook_url,
+            "webhook_429": self.webhook_rejected,
+            "methods": {
+                name: {
+                    "count": c.count,
+                    "429": c.errors_429,
+                    "bytes": c.bytes_received,
+                    "avg_ms": round(1000 * c.total_time / c.count, 1) if c.count else 0.0,
+                }
+                for name, c in sorted(self.methods.items(), key=lambda item: -item[1].count)
+            },
+        }
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.summary())
+
+    def print_summary(self) -> None:
+        s = self.summary()
+        print(f"[{s['elapsed']:>7}s] запросов {s['requests']} ({s['requests_per_second']}/с), "
+              f"входящих {s['updates_delivered']}/{s['updates_generated']}, ждут {s['updates_pending']}")
+        for name, m in s["methods"].items():
+            print(f"    {name:<24} {m['count']:>8}  429: {m['429']:<6} {m['avg_ms']:>7} мс  {m['bytes']} байт")
+
+    async def report(self) -> None:
+        while True:
+            await asyncio.sleep(self.args.report)
+            self.print_summary()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Локальный Bot API для нагрузочных тестов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=100, help="пользователей, от которых идут входящие")
+    parser.add_argument("--rate", type=float, default=0, help="входящих обновлений в секунду (0 — не генерировать)")
+    parser.add_argument("--commands", default=DEFAULT_COMMANDS, help="команды пользователей через запятую")
+    parser.add_argument("--max-pending", type=int, default=100_000, help="сколько входящих держать неподтверждёнными")
+    parser.add_argument("--latency", type=float, default=30, help="задержка ответа, мс")
+    parser.add_argument("--jitter", type=float, default=10, help="разброс задержки, ± мс")
+    parser.add_argument("--error-429", type=float, default=0.0, help="доля запросов с ответом 429 (0..1)")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, секунды")
+    parser.add_argument("--report", type=float, default=10, help="секунды между сводками")
+    args = parser.parse_args()
+    args.command_list = [c.strip() for c in args.commands.split(",") if c.strip()]
+    return args
+
+
+async def main():
+    args = parse_args()
+    api = MockBotApi(args)
+    app = web.Application(client_max_size=50 * 1024 * 1024)
+    app.router.add_get("/stats", api.stats)
+    app.router.add_route("*", "/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    print(f"Mock Bot API на http://{args.host}:{args.port} — запусти бота с BOT_API_BASE_URL=http://{args.host}:{args.port}")
+    tasks = [asyncio.create_task(coro) for coro in (api.generate(), api.push_webhook(), api.report())]
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        api.print_summary()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
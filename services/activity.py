@@ -0,0 +1,131 @@
+"""
+Сервис активности пользователей
+Отложенная (write-behind) запись users.last_active и username:
+middleware только помечают пользователя «грязным», фоновая задача
+раз в несколько секунд сбрасывает всё одним executemany в одной транзакции.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from config import config
+from db import db
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityService:
+    """
+    Буфер активности пользователей
+    last_active нужен с точностью до минуты — писать его на каждый апдейт незачем
+    """
+
+    def __init__(self):
+        """Инициализация буфера активности"""
+        self._flush_task = None
+        self._dirty_active: Dict[int, int] = {}  # user_id -> last_active
+        self._dirty_usernames: Dict[int, str] = {}  # user_id -> новый username
+        self._known_usernames: Dict[int, Optional[str]] = {}  # user_id -> username, который уже в БД
+        self._known_users: Set[int] = set()  # пользователи, чья строка в users точно есть
+
+    def is_known(self, user_id: int) -> bool:
+        """Пользователь уже есть в БД (видели его в этом процессе)"""
+        return user_id in self._known_users
+
+    def remember(self, user_id: int, username: Optional[str]) -> None:
+        """Запомнить username, который сейчас записан в БД (после get_user/create_user)"""
+        self._known_users.add(user_id)
+        self._known_usernames[user_id] = username
+
+    def touch(self, user_id: int, username: Optional[str] = None) -> None:
+        """
+        Отметить активность пользователя (без запроса к БД)
+
+        Args:
+            user_id: ID пользователя
+            username: Актуальный username; пишется только если отличается от сохранённого
+        """
+        self._dirty_active[user_id] = int(time.time())
+        if username and self._known_usernames.get(user_id) != username:
+            self._dirty_usernames[user_id] = username
+            self._known_usernames[user_id] = username
+
+    @property
+    def pending(self) -> int:
+        """Сколько пользователей ждут записи"""
+        return len(self._dirty_active) + len(self._dirty_usernames)
+
+    async def flush(self) -> int:
+        """
+        Сбросить накопленные изменения в БД одной транзакцией
+
+        Returns:
+            Количество записанных строк
+        """
+        if not self._dirty_active and not self._dirty_usernames:
+            return 0
+        active, self._dirty_active = self._dirty_active, {}
+        usernames, self._dirty_usernames = self._dirty_usernames, {}
+        active_rows = [(ts, uid) for uid, ts in active.items()]
+        username_rows = [(un, uid) for uid, un in usernames.items()]
+        try:
+            async with db.transaction() as conn:
+                if active_rows:
+                    # Пользователь снова пишет боту — рассылки до него снова доходят
+                    await conn.executemany(
+                        "UPDATE users SET last_active = ?, bot_blocked = 0 WHERE user_id = ?", active_rows
+                    )
+                if username_rows:
+                    await conn.executemany(
+                        "UPDATE users SET username = ? WHERE user_id = ?", username_rows
+                    )
+        except Exception as e:
+            # Возвращаем в буфер, не затирая более свежие отметки
+            for uid, ts in active.items():
+                self._dirty_active[uid] = max(ts, self._dirty_active.get(uid, 0))
+            for uid, un in usernames.items():
+                self._dirty_usernames.setdefault(uid, un)
+            logger.warning("Не удалось записать активность пользователей: %s", e)
+            return 0
+        logger.debug(
+            "Активность записана: last_active=%s, username=%s", len(active_rows), len(username_rows)
+        )
+        return len(active_rows) + len(username_rows)
+
+    async def start_flush_task(self):
+        """
+        Запуск фоновой задачи записи активности
+        Вызывается при старте бота
+        """
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+            logger.info("Задача записи активности пользователей запущена")
+
+    async def stop_flush_task(self):
+        """Остановка фоновой задачи и финальный сброс буфера"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        logger.info("Задача записи активности пользователей остановлена")
+
+    async def _flush_loop(self):
+        """Периодический сброс буфера (USER_ACTIVITY_FLUSH_INTERVAL секунд)"""
+        interval = getattr(config, "USER_ACTIVITY_FLUSH_INTERVAL", 5)
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Ошибка записи активности пользователей: {e}", exc_info=True)
+
+
+# Глобальный экземпляр сервиса
+activity_service = ActivityService()
@@ -0,0 +1,194 @@
+"""
+Сессия Bot API со статистикой
+Раньше по запросам к Telegram ничего не было видно: медленно отвечает Telegram или
+всё стоит у нас (очередь лимитов, занятые соединения) — не различить.
+InstrumentedSession — это AiohttpSession aiogram, которая дополнительно считает:
+- время ответа по методам (гистограмма: сколько запросов уложилось в каждую границу);
+- ошибки, сетевые сбои и RetryAfter по методам;
+- отправленные байты по методам (фото, аудио, формы);
+- пул соединений: новые и переиспользованные соединения, ожидание свободного,
+  запросы в полёте.
+Время ответа меряется вокруг самого HTTP-запроса, то есть без ожидания в
+планировщике исходящих (services/outbound.py): его задержки видны там.
+Размер пула и keep-alive задаются BOT_API_POOL_SIZE и BOT_API_KEEPALIVE.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot, __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from config import config
+
+# Границы гистограммы времени ответа, секунды (последняя корзина — всё, что дольше)
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MethodStats:
+    """Статистика одного метода Bot API"""
+
+    __slots__ = ("count", "errors", "network_errors", "retry_after", "bytes_sent", "total_time", "max_time", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.network_errors = 0
+        self.retry_after = 0
+        self.bytes_sent = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, elapsed: float) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    @property
+    def avg_time(self) -> float:
+        return self.total_time / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по гистограмме (верхняя граница корзины)"""
+        return _quantile(self.buckets, self.count, q, self.max_time)
+
+
+def _quantile(buckets: List[int], count: int, q: float, max_time: float) -> float:
+    if not count:
+        return 0.0
+    rank = q * count
+    seen = 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= rank:
+            return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else max_time
+    return max_time
+
+
+class ApiStats:
+    """Статистика всех запросов к Bot API: по методам и по пулу соединений"""
+
+    def __init__(self):
+        """Инициализация пустой статистики"""
+        self.methods: Dict[str, MethodStats] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.pool_waits = 0
+        self.pool_wait_time = 0.0
+
+    def method(self, name: str) -> MethodStats:
+        stats = self.methods.get(name)
+        if stats is None:
+            stats = self.methods[name] = MethodStats()
+        return stats
+
+    def total(self) -> MethodStats:
+        """Сводка по всем методам"""
+        total = MethodStats()
+        for stats in self.methods.values():
+            total.count += stats.count
+            total.errors += stats.errors
+            total.network_errors += stats.network_errors
+            total.retry_after += stats.retry_after
+            total.bytes_sent += stats.bytes_sent
+            total.total_time += stats.total_time
+            total.max_time = max(total.max_time, stats.max_time)
+            total.buckets = [a + b for a, b in zip(total.buckets, stats.buckets)]
+        return total
+
+    def slowest(self, limit: int = 3) -> List[Tuple[str, MethodStats]]:
+        """Методы с наибольшим средним временем ответа"""
+        return sorted(
+            ((name, stats) for name, stats in self.methods.items() if stats.count),
+            key=lambda item: item[1].avg_time,
+            reverse=True,
+        )[:limit]
+
+
+class InstrumentedSession(AiohttpSession):
+    """AiohttpSession со статистикой (api_stats) и настраиваемым пулом соединений"""
+
+    def __init__(self, proxy: Optional[Any] = None, stats: Optional["ApiStats"] = None, **kwargs: Any):
+        limit = int(getattr(config, "BOT_API_POOL_SIZE", 100))
+        super().__init__(proxy=proxy, limit=limit, **kwargs)
+        self._connector_init["keepalive_timeout"] = float(getattr(config, "BOT_API_KEEPALIVE", 15.0))
+        self.stats = stats if stats is not None else api_stats
+
+    def _trace_config(self) -> TraceConfig:
+        """Хуки aiohttp: отправленные байты и события пула соединений"""
+        stats = self.stats
+        trace = TraceConfig()
+
+        async def on_chunk_sent(session, ctx, params):
+            stats.method(params.url.path.rsplit("/", 1)[-1]).bytes_sent += len(params.chunk)
+
+        async def on_queued_start(session, ctx, params):
+            ctx.queued_at = time.monotonic()
+
+        async def on_queued_end(session, ctx, params):
+            stats.pool_waits += 1
+            stats.pool_wait_time += time.monotonic() - getattr(ctx, "queued_at", time.monotonic())
+
+        async def on_create_end(session, ctx, params):
+            stats.connections_created += 1
+
+        async def on_reuse(session, ctx, params):
+            stats.connections_reused += 1
+
+        trace.on_request_chunk_sent.append(on_chunk_sent)
+        trace.on_connection_queued_start.append(on_queued_start)
+        trace.on_connection_queued_end.append(on_queued_end)
+        trace.on_connection_create_end.append(on_create_end)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    async def create_session(self) -> ClientSession:
+        """Как в AiohttpSession, но с хуками статистики"""
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={
+                    USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}",
+                },
+                trace_configs=[self._trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        stats = self.stats.method(method.__api_method__)
+        self.stats.in_flight += 1
+        self.stats.max_in_flight = max(self.stats.max_in_flight, self.stats.in_flight)
+        started = time.monotonic()
+        try:
+            return await super().make_request(bot, method, timeout)
+        except TelegramRetryAfter:
+            stats.retry_after += 1
+            raise
+        except TelegramNetworkError:
+            stats.network_errors += 1
+            raise
+        except TelegramAPIError:
+            stats.errors += 1
+            raise
+        finally:
+            self.stats.in_flight -= 1
+            stats.observe(time.monotonic() - started)
+
+
+# Глобальная статистика запросов к Bot API
+api_stats = ApiStats()
@@ -9,6 +9,7 @@ from typing import Optional, TYPE_CHECKING
 
 from config import config
 from db import db
+from services.balance import balance_service
 
 if TYPE_CHECKING:
     from aiogram import Bot
@@ -35,8 +36,8 @@ async def _do_end_season_and_wipe():
     for i, t in enumerate(top):
         uid = t.get("user_id")
         if uid and i < len(_rewards) and _rewards[i] > 0:
-            await db.update_balance(uid, _rewards[i], "income", "autonomy_season", "Награда за топ сезона")
-            await db.update_total_coins(uid, _rewards[i])
+            async with balance_service.locked(uid):
+                await balance_service.credit(uid, _rewards[i], "autonomy_season", "Награда за топ сезона")
             if _bot:
                 try:
                     await _bot.send_message(
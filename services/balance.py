@@ -6,18 +6,123 @@
 
 import asyncio
 import logging
-from typing import Optional, Tuple
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
 from aiogram import Bot
 from aiogram.types import Message
 from aiogram.exceptions import TelegramBadRequest
 
 from config import config
 from db import db
-from utils import delete_message_after, format_message_with_username
+from services.journal import session_journal
+from services.outbound import LANE_NOTIFY, outbound_scheduler
+from utils import delete_message_later, format_message_with_username
 
 logger = logging.getLogger(__name__)
 
 
+class _AccountLock:
+    """Блокировка одного счёта; повторный захват той же задачей не блокирует"""
+
+    __slots__ = ("lock", "owner", "depth", "__weakref__")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.owner: Optional[asyncio.Task] = None
+        self.depth = 0
+
+
+class AccountLocks:
+    """
+    Логические блокировки счетов
+    Глобальная блокировка БД защищает только отдельный запрос, а операции с балансом —
+    это «прочитать, проверить, записать» из нескольких запросов: два одновременных
+    callback'а могли переплестись между ними. Блокировка берётся на каждый затронутый
+    счёт, несколько счетов — всегда по возрастанию user_id, поэтому две операции
+    с одними и теми же счетами не ждут друг друга по кругу.
+    Реестр держит блокировки по слабым ссылкам: блокировка живёт, пока её держат или
+    ждут, и исчезает сама — простаивающие пользователи ничего не стоят.
+    """
+
+    def __init__(self):
+        """Инициализация пустого реестра"""
+        self._locks: "weakref.WeakValueDictionary[int, _AccountLock]" = weakref.WeakValueDictionary()
+        # Статистика для /debug
+        self.acquired = 0
+        self.contended = 0
+
+    def __len__(self) -> int:
+        """Сколько счетов сейчас заблокировано или ожидается"""
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, *user_ids: int) -> AsyncIterator[None]:
+        """
+        Заблокировать счета на время блока (async with)
+
+        Вложенный hold() той же задачи по уже захваченным счетам проходит сразу;
+        новые счета во вложенном блоке должны иметь user_id больше уже захваченных.
+
+        Args:
+            user_ids: ID пользователей (повторы и порядок не важны)
+        """
+        task = asyncio.current_task()
+        held = []  # сильные ссылки: пока блок активен, записи не исчезнут из реестра
+        try:
+            for user_id in sorted(set(user_ids)):
+                entry = self._locks.get(user_id)
+                if entry is None:
+                    entry = self._locks[user_id] = _AccountLock()
+                held.append(entry)
+                if entry.owner is task:
+                    entry.depth += 1
+                    continue
+                if entry.lock.locked():
+                    self.contended += 1
+                await entry.lock.acquire()
+                entry.owner = task
+                entry.depth = 1
+                self.acquired += 1
+            yield
+        finally:
+            for entry in reversed(held):
+                # Не захвачена (отмена во время ожидания) — отпускать нечего
+                if entry.owner is not task:
+                    continue
+                entry.depth -= 1
+                if entry.depth == 0:
+                    entry.owner = None
+                    entry.lock.release()
+
+
+class GameReceipt:
+    """
+    Чек игры для режима экономии сообщений (MESSAGE_BUDGET_MODE)
+    Вместо отдельных «Списано», «Начислено» и «Технолог забрал свой налог» (каждое —
+    отправка и удаление) движения баланса за игру копятся здесь и дописываются строкой
+    к итоговому сообщению игры: receipt.render().
+    entries — обычный список [вид, сумма]: его можно держать в игровой сессии между
+    обработчиками (и в журнале сессий).
+    """
+
+    __slots__ = ("entries",)
+
+    LABELS = {"expense": "💸 Списано {}", "income": "💰 Начислено {}", "tax": "🧠 Налог Технолога {}"}
+
+    def __init__(self, entries: Optional[List[list]] = None):
+        self.entries = entries if entries is not None else []
+
+    def add(self, kind: str, amount: int) -> None:
+        self.entries.append([kind, int(amount)])
+
+    def render(self) -> str:
+        """Строка для итогового сообщения («» — если движений не было)"""
+        if not self.entries:
+            return ""
+        return "\n\n" + " · ".join(self.LABELS.get(kind, kind + " {}").format(amount) for kind, amount in self.entries)
+
+
 class BalanceService:
     """
     Сервис для работы с балансом пользователей
@@ -26,7 +131,115 @@ class BalanceService:
     
     def __init__(self):
         """Инициализация сервиса баланса"""
-        pass
+        self.account_locks = AccountLocks()
+
+    def receipt(self, entries: Optional[List[list]] = None) -> GameReceipt:
+        """
+        Чек игры: передаётся в subtract_balance/add_balance/add_game_win (receipt=...),
+        итог — receipt.render() в подписи результата. Без MESSAGE_BUDGET_MODE чек
+        остаётся пустым, а уведомления уходят как раньше.
+
+        Args:
+            entries: Список из игровой сессии, если игра идёт в нескольких обработчиках
+        """
+        return GameReceipt(entries)
+
+    @staticmethod
+    def _to_receipt(receipt: Optional[GameReceipt], kind: str, amount: int) -> bool:
+        """Записать движение в чек вместо отдельного сообщения. Returns: True — записано"""
+        if receipt is None or not getattr(config, "MESSAGE_BUDGET_MODE", True):
+            return False
+        receipt.add(kind, amount)
+        return True
+
+    def locked(self, *user_ids: int):
+        """
+        Блокировка счетов для операции из нескольких шагов (кража, расчёт дуэли и т.п.):
+        async with balance_service.locked(a, b): ...
+        add_balance/subtract_balance внутри блока по тем же счетам не ждут.
+        """
+        return self.account_locks.hold(*user_ids)
+
+    async def credit(self, user_id: int, amount: int, command_source: str, comment: str = None) -> Tuple[int, int]:
+        """Начисление в БД без уведомлений (счёт должен быть заблокирован вызывающим)"""
+        # Закрытие игровой сессии должно лечь в журнал раньше выплаты по ней
+        await session_journal.sync()
+        balance_before, balance_after = await db.update_balance(
+            user_id=user_id,
+            amount=amount,
+            transaction_type="income",
+            command_source=command_source,
+            comment=comment
+        )
+        await db.update_total_coins(user_id, amount)
+        return balance_before, balance_after
+
+    async def debit(
+        self, user_id: int, amount: int, command_source: str, comment: str = None, allow_negative: bool = False
+    ) -> Tuple[bool, int, int]:
+        """
+        Проверка средств и списание в БД без уведомлений (счёт должен быть заблокирован вызывающим)
+
+        Returns:
+            Кортеж (хватило средств, баланс_до, баланс_после)
+        """
+        balance_before = await db.get_balance(user_id)
+        if not allow_negative and balance_before < amount:
+            return False, balance_before, balance_before
+        balance_before, balance_after = await db.update_balance(
+            user_id=user_id,
+            amount=-amount,
+            transaction_type="expense",
+            command_source=command_source,
+            comment=comment,
+            allow_negative=allow_negative
+        )
+        return True, balance_before, balance_after
+
+    async def transfer(
+        self, from_id: int, to_id: int, amount: int, command_source: str, comment: str = None
+    ) -> Tuple[bool, int, int]:
+        """
+        Перевод между счетами под блокировкой обоих, без комиссии и уведомлений (кража и т.п.)
+
+        Returns:
+            Кортеж (хватило средств, баланс_отправителя_после, баланс_получателя_после)
+        """
+        async with self.locked(from_id, to_id):
+            enough, _, from_after = await self.debit(from_id, amount, command_source, comment)
+            if not enough:
+                return False, from_after, await db.get_balance(to_id)
+            _, to_after = await self.credit(to_id, amount, command_source, comment)
+        return True, from_after, to_after
+
+    async def reset_balance(self, user_id: int, required: int = 0) -> Tuple[bool, int]:
+        """
+        Обнуление баланса под блокировкой счёта (/skinna0, перерождение)
+
+        Args:
+            required: Минимальный баланс для обнуления (цена перерождения)
+
+        Returns:
+            Кортеж (обнулён, баланс_до)
+        """
+        async with self.locked(user_id):
+            balance_before = await db.get_balance(user_id)
+            if balance_before < required:
+                return False, balance_before
+            await db.set_balance_direct(user_id, 0)
+        logger.info(f"Обнуление баланса: user_id={user_id}, balance_before={balance_before}")
+        return True, balance_before
+
+    def alert_income(self, bot: Optional[Bot], user_id: int, amount: int, balance_after: int, command_source: str) -> None:
+        """Уведомление создателю при резком росте баланса"""
+        thresh = getattr(config, "NOTIFY_CREATOR_BALANCE_THRESHOLD", 100_000)
+        am_thresh = getattr(config, "NOTIFY_CREATOR_SINGLE_AMOUNT", 50_000)
+        if bot and (balance_after >= thresh or amount >= am_thresh):
+            from utils import notify_creator
+            asyncio.create_task(notify_creator(
+                bot, f"user_id={user_id}, +{amount}, баланс={balance_after}, источник={command_source}",
+                kind="Рост баланса", critical=amount >= getattr(config, "NOTIFY_CREATOR_CRITICAL_AMOUNT", 1_000_000)
+            ))
     
     async def add_balance(
         self,
@@ -38,7 +251,8 @@ class BalanceService:
         bot: Bot = None,
         chat_id: int = None,
         username: str = None,
-        first_name: str = None
+        first_name: str = None,
+        receipt: GameReceipt = None
     ) -> Tuple[bool, int, int]:
         """
         Начисление баланса пользователю
@@ -52,6 +266,7 @@ class BalanceService:
             bot: Бот для отправки сообщения (если message не указан)
             username: Username пользователя (для форматирования)
             first_name: Имя пользователя (для форматирования)
+            receipt: Чек игры — «Начислено» попадёт в него, а не отдельным сообщением
             
         Returns:
             Кортеж (успех, баланс_до, баланс_после)
@@ -61,30 +276,18 @@ class BalanceService:
             return False, 0, 0
         
         try:
-            # Получаем текущий баланс
-            balance_before = await db.get_balance(user_id)
-            
-            balance_before, balance_after = await db.update_balance(
-                user_id=user_id,
-                amount=amount,
-                transaction_type="income",
-                command_source=command_source,
-                comment=comment
-            )
-            await db.update_total_coins(user_id, amount)
+            async with self.locked(user_id):
+                balance_before, balance_after = await self.credit(user_id, amount, command_source, comment)
 
             logger.info(
                 f"Начисление баланса: user_id={user_id}, amount={amount}, "
                 f"balance_before={balance_before}, balance_after={balance_after}, "
                 f"source={command_source}, comment={comment or 'N/A'}"
             )
-            # Уведомление создателю при резком росте баланса
-            thresh = getattr(config, "NOTIFY_CREATOR_BALANCE_THRESHOLD", 100_000)
-            am_thresh = getattr(config, "NOTIFY_CREATOR_SINGLE_AMOUNT", 50_000)
-            if bot and (balance_after >= thresh or amount >= am_thresh):
-                from utils import notify_creator
-                asyncio.create_task(notify_creator(bot, f"Рост баланса: user_id={user_id}, +{amount}, баланс={balance_after}, источник={command_source}"))
-            await self._send_transaction_notification(
+            self.alert_income(bot, user_id, amount, balance_after, command_source)
+            if self._to_receipt(receipt, "income", amount):
+                return True, balance_before, balance_after
+            await self.notify_transaction(
                 user_id=user_id,
                 amount=amount,
                 transaction_type="income",
@@ -113,7 +316,8 @@ class BalanceService:
         chat_id: int = None,
         username: str = None,
         first_name: str = None,
-        allow_negative: bool = False
+        allow_negative: bool = False,
+        receipt: GameReceipt = None
     ) -> Tuple[bool, int, int, str]:
         """
         Списание баланса у пользователя с защитой от отрицательного баланса
@@ -129,6 +333,7 @@ class BalanceService:
             username: Username пользователя (для форматирования)
             first_name: Имя пользователя (для форматирования)
             allow_negative: Разрешить отрицательный баланс (по умолчанию False)
+            receipt: Чек игры — «Списано» попадёт в него, а не отдельным сообщением
             
         Returns:
             Кортеж (успех, баланс_до, баланс_после, сообщение_об_ошибке)
@@ -155,11 +360,13 @@ class BalanceService:
             return False, 0, 0, "Сумма списания должна быть положительной"
         
         try:
-            # Получаем текущий баланс
-            balance_before = await db.get_balance(user_id)
+            # Проверка средств и списание — под блокировкой счёта, уведомления — после неё
+            async with self.locked(user_id):
+                enough, balance_before, balance_after = await self.debit(
+                    user_id, amount, command_source, comment, allow_negative
+                )
             
-            # Проверяем достаточность средств
-            if not allow_negative and balance_before < amount:
+            if not enough:
                 error_msg = (
                     f"Недостаточно средств! "
                     f"Нужно {amount} коинов, у тебя {balance_before} коинов"
@@ -186,16 +393,6 @@ class BalanceService:
                 
                 return False, balance_before, balance_before, error_msg
             
-            # Обновляем баланс
-            balance_before, balance_after = await db.update_balance(
-                user_id=user_id,
-                amount=-amount,
-                transaction_type="expense",
-                command_source=command_source,
-                comment=comment,
-                allow_negative=allow_negative
-            )
-            
             # Логируем в файл
             logger.info(
                 f"Списание баланса: user_id={user_id}, amount={amount}, "
@@ -203,8 +400,11 @@ class BalanceService:
                 f"source={command_source}, comment={comment or 'N/A'}"
             )
             
+            if self._to_receipt(receipt, "expense", amount):
+                return True, balance_before, balance_after, ""
+            
             # Отправляем уведомление о списании
-            await self._send_transaction_notification(
+            await self.notify_transaction(
                 user_id=user_id,
                 amount=amount,
                 transaction_type="expense",
@@ -262,47 +462,92 @@ class BalanceService:
         if amount <= 0:
             return False, "Сумма перевода должна быть положительной"
         
-        # Списываем у отправителя
-        success, balance_before, balance_after, error = await self.subtract_balance(
+        sender_comment = f"Перевод пользователю {receiver_id}: {comment or ''}"
+        receiver_comment = f"Перевод от пользователя {sender_id}: {comment or ''}"
+        # Оба счёта блокируются на списание и начисление (по возрастанию id),
+        # уведомления отправляются уже после снятия блокировок
+        async with self.locked(sender_id, receiver_id):
+            try:
+                enough, sender_before, sender_after = await self.debit(
+                    sender_id, amount, command_source, sender_comment
+                )
+            except Exception as e:
+                logger.error(f"Ошибка списания баланса для пользователя {sender_id}: {e}", exc_info=True)
+                return False, f"Ошибка при списании: {e}"
+            received = False
+            if enough:
+                try:
+                    _, receiver_after = await self.credit(receiver_id, amount, command_source, receiver_comment)
+                    received = True
+                except Exception as e:
+                    # Откатываем транзакцию отправителя (возвращаем средства)
+                    logger.error(f"Ошибка начисления баланса для пользователя {receiver_id}: {e}", exc_info=True)
+                    await db.update_balance(
+                        user_id=sender_id,
+                        amount=amount,
+                        transaction_type="income",
+                        command_source="rollback",
+                        comment=f"Откат перевода пользователю {receiver_id}"
+                    )
+        
+        if not enough:
+            error_msg = (
+                f"Недостаточно средств! "
+                f"Нужно {amount} коинов, у тебя {sender_before} коинов"
+            )
+            logger.warning(
+                f"Попытка списания при недостатке средств: user_id={sender_id}, "
+                f"amount={amount}, balance={sender_before}, source={command_source}"
+            )
+            await self._send_error_notification(
+                error_msg=error_msg,
+                message=message,
+                bot=bot,
+                chat_id=chat_id if chat_id else (message.chat.id if message else None),
+                user_id=sender_id,
+                username=sender_username,
+                first_name=sender_first_name
+            )
+            return False, error_msg
+        
+        if not received:
+            logger.error(f"Ошибка начисления получателю {receiver_id}, откат транзакции")
+            return False, "Ошибка при переводе получателю"
+        
+        logger.info(
+            f"Списание баланса: user_id={sender_id}, amount={amount}, "
+            f"balance_before={sender_before}, balance_after={sender_after}, "
+            f"source={command_source}, comment={sender_comment}"
+        )
+        logger.info(
+            f"Начисление баланса: user_id={receiver_id}, amount={amount}, "
+            f"balance_after={receiver_after}, source={command_source}, comment={receiver_comment}"
+        )
+        self.alert_income(bot, receiver_id, amount, receiver_after, command_source)
+        await self.notify_transaction(
             user_id=sender_id,
             amount=amount,
-            command_source=command_source,
-            comment=f"Перевод пользователю {receiver_id}: {comment or ''}",
+            transaction_type="expense",
+            balance_after=sender_after,
             message=message,
             bot=bot,
             chat_id=chat_id,
             username=sender_username,
             first_name=sender_first_name
         )
-        
-        if not success:
-            return False, error
-        
-        # Начисляем получателю
-        success_receive, _, _ = await self.add_balance(
+        # Уведомление получателю — как раньше через bot/chat_id, без ответа на сообщение отправителя
+        await self.notify_transaction(
             user_id=receiver_id,
             amount=amount,
-            command_source=command_source,
-            comment=f"Перевод от пользователя {sender_id}: {comment or ''}",
-            message=None,  # Не отправляем уведомление получателю автоматически
+            transaction_type="income",
+            balance_after=receiver_after,
+            message=None,
             bot=bot,
             chat_id=chat_id,
             username=receiver_username,
             first_name=receiver_first_name
         )
         
-        if not success_receive:
-            # Откатываем транзакцию отправителя (возвращаем средства)
-            await db.update_balance(
-                user_id=sender_id,
-                amount=amount,
-                transaction_type="income",
-                command_source="rollback",
-                comment=f"Откат перевода пользователю {receiver_id}"
-            )
-            logger.error(f"Ошибка начисления получателю {receiver_id}, откат транзакции")
-            return False, "Ошибка при переводе получателю"
-        
         # Логируем успешный перевод
         logger.info(
             f"Перевод баланса: sender_id={sender_id}, receiver_id={receiver_id}, "
@@ -366,24 +611,17 @@ class BalanceService:
         username: str = None,
         first_name: str = None,
         is_premium: bool = None,
+        receipt: GameReceipt = None,
     ) -> Tuple[bool, int, int, int]:
         """
         Начисление выигрыша за игру с учётом лимита и налога Технолога.
         Налог: 5% (база) или 2% (премиум). Лимит выигрыша за одну игру — из config.
+        С чеком игры (receipt) «Начислено» и налог попадают в него, а не отдельными сообщениями.
         Returns: (успех, баланс_до, баланс_после, сумма_налога).
         """
         if gross_amount <= 0:
             return False, 0, 0, 0
-        max_win = getattr(config, "MAX_WIN_PER_GAME", 50_000)
-        capped = min(gross_amount, max_win)
-        if is_premium is None:
-            is_premium = await db.is_premium(user_id)
-        tax_rate = getattr(config, "TAX_ON_WIN_PERCENT_PREMIUM", 0.02) if is_premium else getattr(config, "TAX_ON_WIN_PERCENT", 0.05)
-        tax = int(capped * tax_rate)
-        ev = await db.get_active_event(user_id)
-        if ev and ev.get("event_type") == "lucky_taxfree":
-            tax = 0
-        net = int(capped - tax)
+        capped, net, tax = await self.game_win_tax(user_id, gross_amount, is_premium)
         if net <= 0:
             return False, 0, 0, 0
         success, balance_before, balance_after = await self.add_balance(
@@ -396,34 +634,183 @@ class BalanceService:
             chat_id=chat_id,
             username=username,
             first_name=first_name,
+            receipt=receipt,
         )
         if success:
-            thresh = getattr(config, "NOTIFY_CREATOR_BALANCE_THRESHOLD", 100_000)
-            am_thresh = getattr(config, "NOTIFY_CREATOR_SINGLE_AMOUNT", 50_000)
-            if (bot or message) and (balance_after >= thresh or capped >= am_thresh):
-                from utils import notify_creator
-                b = bot if bot else (getattr(message, "bot", None) if message else None)
-                if b:
-                    asyncio.create_task(notify_creator(b, f"Крупный выигрыш: user_id={user_id}, +{net} (налог {tax}), баланс={balance_after}, {command_source}"))
-        if success and tax > 0:
-            tax_text = format_message_with_username(
-                "Технолог забрал свой налог 🧠",
-                username, first_name
-            )
-            try:
+            self._alert_game_win(bot or getattr(message, "bot", None), user_id, net, tax, capped, balance_after, command_source)
+        if success and tax > 0 and not self._to_receipt(receipt, "tax", tax):
+            await self._send_tax_notification(message, bot, chat_id, username, first_name)
+        return success, balance_before, balance_after, tax
+
+    async def settle_game(
+        self,
+        user_id: int,
+        stake: int,
+        payout: int,
+        game: str,
+        charge: int = None,
+        penalty: int = 0,
+        multiplier: float = 1.0,
+        command_source: str = None,
+        comment: str = None,
+        message: Message = None,
+        bot: Bot = None,
+        chat_id: int = None,
+        username: str = None,
+        first_name: str = None,
+        is_premium: bool = None,
+        receipt: GameReceipt = None,
+    ) -> Tuple[bool, int, int]:
+        """
+        Расчёт раунда игры одной транзакцией в БД
+        Раньше раунд — это subtract_balance, add_game_win, log_admin_game и log_game_session:
+        около десятка commit'ов, и сбой между ними оставлял ставку списанной без результата.
+        Здесь ставка, выигрыш (с лимитом и налогом), штраф, строки transactions, total_coins
+        и логи игры пишутся одной транзакцией; уведомления — как у subtract_balance/add_game_win
+        (с чеком игры — в чек).
+
+        Args:
+            stake: Ставка (для логов; списывается, если charge не указан)
+            payout: Выигрыш до налога (0 — проигрыш)
+            game: Игра (games_sessions.game_type)
+            charge: Сколько списать сейчас: 0 — ставка списана при старте игры
+            penalty: Доп. списание при проигрыше, если после ставки на него хватает
+            multiplier: Множитель для games_sessions
+            command_source: Команда для transactions и админ-лога (по умолчанию /game)
+
+        Returns:
+            Кортеж (успех, итоговый_баланс, налог); не хватило на ставку — (False, баланс, 0)
+        """
+        charge = stake if charge is None else charge
+        command_source = command_source or f"/{game}"
+        comment = comment or command_source
+        result = "win" if payout > 0 else "loss"
+        try:
+            capped, net, tax = (0, 0, 0)
+            if payout > 0:
+                capped, net, tax = await self.game_win_tax(user_id, payout, is_premium)
+            await session_journal.sync()
+            async with self.locked(user_id):
+                settled = await db.settle_game(
+                    user_id, command_source, game, username, stake, charge, net, tax, result,
+                    payout - stake, multiplier, comment, penalty
+                )
+            if settled is None:
+                balance = await db.get_balance(user_id)
+                error_msg = f"Недостаточно средств! Нужно {charge} коинов, у тебя {balance} коинов"
+                logger.warning(
+                    f"Расчёт игры при недостатке средств: user_id={user_id}, "
+                    f"charge={charge}, balance={balance}, source={command_source}"
+                )
+                await self._send_error_notification(
+                    error_msg=error_msg, message=message, bot=bot,
+                    chat_id=chat_id if chat_id else (message.chat.id if message else None),
+                    user_id=user_id, username=username, first_name=first_name
+                )
+                return False, balance, 0
+        except Exception as e:
+            logger.error(f"Ошибка расчёта игры для пользователя {user_id}: {e}", exc_info=True)
+            return False, 0, 0
+
+        balance_before, balance_after, penalty = settled
+        logger.info(
+            f"Расчёт игры: user_id={user_id}, stake={stake}, charge={charge}, penalty={penalty}, "
+            f"payout={payout}, net={net}, tax={tax}, balance_before={balance_before}, "
+            f"balance_after={balance_after}, source={command_source}"
+        )
+        await db.progress_game_quests(user_id, game, result, payout - stake - penalty)
+        if net > 0:
+            self._alert_game_win(bot or getattr(message, "bot", None), user_id, net, tax, capped, balance_after, command_source)
+
+        # Уведомления по движениям: баланс после каждого — как при отдельных списаниях/начислениях
+        balance = balance_before
+        for kind, amount in (("expense", charge), ("expense", penalty), ("income", net)):
+            if amount <= 0:
+                continue
+            balance += amount if kind == "income" else -amount
+            if not self._to_receipt(receipt, kind, amount):
+                await self.notify_transaction(
+                    user_id=user_id, amount=amount, transaction_type=kind, balance_after=balance,
+                    message=message, bot=bot, chat_id=chat_id, username=username, first_name=first_name
+                )
+        if tax > 0 and not self._to_receipt(receipt, "tax", tax):
+            await self._send_tax_notification(message, bot, chat_id, username, first_name)
+        return True, balance_after, tax
+
+    def _alert_game_win(
+        self, bot: Optional[Bot], user_id: int, net: int, tax: int, gross: int, balance_after: int, command_source: str
+    ) -> None:
+        """Уведомление создателю о крупном выигрыше"""
+        thresh = getattr(config, "NOTIFY_CREATOR_BALANCE_THRESHOLD", 100_000)
+        am_thresh = getattr(config, "NOTIFY_CREATOR_SINGLE_AMOUNT", 50_000)
+        if bot and (balance_after >= thresh or gross >= am_thresh):
+            from utils import notify_creator
+            asyncio.create_task(notify_creator(
+                bot, f"user_id={user_id}, +{net} (налог {tax}), баланс={balance_after}, {command_source}",
+                kind="Крупный выигрыш", critical=gross >= getattr(config, "NOTIFY_CREATOR_CRITICAL_AMOUNT", 1_000_000)
+            ))
+
+    async def _send_tax_notification(
+        self, message: Message = None, bot: Bot = None, chat_id: int = None, username: str = None, first_name: str = None
+    ) -> None:
+        """«Технолог забрал свой налог» — отдельным сообщением на TRANSACTION_MESSAGE_TIMEOUT"""
+        tax_text = format_message_with_username("Технолог забрал свой налог 🧠", username, first_name)
+        try:
+            with outbound_scheduler.lane(LANE_NOTIFY):
                 if message:
                     sent = await message.answer(tax_text)
                 elif bot and chat_id:
                     sent = await bot.send_message(chat_id=chat_id, text=tax_text)
                 else:
                     sent = None
-                if sent:
-                    asyncio.create_task(delete_message_after(sent, config.TRANSACTION_MESSAGE_TIMEOUT))
-            except Exception as e:
-                logger.warning(f"Не удалось отправить сообщение о налоге: {e}")
-        return success, balance_before, balance_after, tax
+            if sent:
+                delete_message_later(sent, config.TRANSACTION_MESSAGE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Не удалось отправить сообщение о налоге: {e}")
     
-    async def _send_transaction_notification(
+    async def game_win_tax(self, user_id: int, gross_amount: int, is_premium: bool = None) -> Tuple[int, int, int]:
+        """
+        Лимит выигрыша и налог Технолога (без начисления)
+
+        Returns:
+            (выигрыш с учётом лимита, к начислению, налог)
+        """
+        max_win = getattr(config, "MAX_WIN_PER_GAME", 50_000)
+        capped = min(gross_amount, max_win)
+        if is_premium is None:
+            is_premium = await db.is_premium(user_id)
+        tax_rate = getattr(config, "TAX_ON_WIN_PERCENT_PREMIUM", 0.02) if is_premium else getattr(config, "TAX_ON_WIN_PERCENT", 0.05)
+        tax = int(capped * tax_rate)
+        ev = await db.get_active_event(user_id)
+        if ev and ev.get("event_type") == "lucky_taxfree":
+            tax = 0
+        return capped, int(capped - tax), tax
+
+    async def announce_game_win(
+        self,
+        user_id: int,
+        net: int,
+        tax: int,
+        balance_after: int,
+        command_source: str,
+        bot: Bot,
+        chat_id: int,
+        username: str = None,
+        first_name: str = None,
+    ):
+        """
+        Уведомления о выигрыше, уже начисленном в БД (например, расчётом одной транзакцией):
+        «Начислено», налог Технолога и сигнал создателю — как у add_game_win
+        """
+        self._alert_game_win(bot, user_id, net, tax, net + tax, balance_after, command_source)
+        await self.notify_transaction(
+            user_id=user_id, amount=net, transaction_type="income", balance_after=balance_after,
+            bot=bot, chat_id=chat_id, username=username, first_name=first_name
+        )
+        if tax > 0 and bot and chat_id:
+            await self._send_tax_notification(bot=bot, chat_id=chat_id, username=username, first_name=first_name)
+
+    async def notify_transaction(
         self,
         user_id: int,
         amount: int,
@@ -458,16 +845,18 @@ class BalanceService:
         notification_text = format_message_with_username(text, username, first_name)
         
         try:
-            if message:
-                sent_message = await message.answer(notification_text)
-            elif bot and chat_id:
-                sent_message = await bot.send_message(chat_id=chat_id, text=notification_text)
-            else:
-                logger.warning(f"Не указан message или (bot+chat_id) для отправки уведомления для {user_id}")
-                return
+            # «Списано/Начислено» уступают очередь результатам игр (services/outbound.py)
+            with outbound_scheduler.lane(LANE_NOTIFY):
+                if message:
+                    sent_message = await message.answer(notification_text)
+                elif bot and chat_id:
+                    sent_message = await bot.send_message(chat_id=chat_id, text=notification_text)
+                else:
+                    logger.warning(f"Не указан message или (bot+chat_id) для отправки уведомления для {user_id}")
+                    return
             
             # Автоудаление через 5 секунд
-            asyncio.create_task(delete_message_after(sent_message, config.TRANSACTION_MESSAGE_TIMEOUT))
+            delete_message_later(sent_message, config.TRANSACTION_MESSAGE_TIMEOUT)
             
         except TelegramBadRequest as e:
             logger.error(f"Ошибка отправки уведомления о транзакции для {user_id}: {e}")
@@ -502,10 +891,10 @@ class BalanceService:
             if message:
                 sent_message = await message.answer(notification_text)
                 # Автоудаление через 30 секунд (обычное время для ошибок)
-                asyncio.create_task(delete_message_after(sent_message))
+                delete_message_later(sent_message)
             elif bot and chat_id:
                 sent_message = await bot.send_message(chat_id=chat_id, text=notification_text)
-                asyncio.create_task(delete_message_after(sent_message))
+                delete_message_later(sent_message)
             else:
                 logger.warning(f"Не указан message или (bot+chat_id) для отправки уведомления об ошибке для {user_id}")
                 
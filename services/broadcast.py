@@ -0,0 +1,194 @@
+"""
+Рассылка всем пользователям (объявление обновления, итоги сезона)
+Наивный цикл send_message по всем пользователям сразу упирается в лимиты Telegram,
+а перезапуск бота посреди рассылки начинал бы её заново.
+Рассылка здесь:
+- читает получателей порциями по курсору (user_id > последнего обработанного),
+  без выгрузки всей таблицы;
+- отправляет в полосе LANE_BULK планировщика исходящих: на максимальной общей скорости,
+  но только тем, что осталось от игр, уведомлений и удалений;
+- после каждой порции сохраняет контрольную точку (курсор и счётчики) — после
+  перезапуска рассылка продолжается с неё;
+- отмечает заблокировавших бота (bot_blocked) — следующие рассылки их пропускают;
+- показывает прогресс и скорость в сообщении создателю, обновляя его на месте.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+
+from config import config
+from db import db
+from services.edits import edit_coalescer
+from services.outbound import LANE_BULK, outbound_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastEngine:
+    """Одна рассылка за раз; состояние — в таблице broadcasts"""
+
+    def __init__(self):
+        """Инициализация без активной рассылки"""
+        self._task: Optional[asyncio.Task] = None
+        self._cancelled = False
+        self.current: Optional[Dict[str, Any]] = None
+        self.rate = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot: Bot, text: str, created_by: int, report_chat_id: int) -> Optional[int]:
+        """
+        Начать рассылку
+
+        Returns:
+            id рассылки или None, если другая рассылка ещё идёт
+        """
+        if self.running or await db.get_running_broadcast():
+            return None
+        total = await db.count_broadcast_recipients()
+        broadcast_id = await db.create_broadcast(text, created_by, total)
+        try:
+            report = await bot.send_message(report_chat_id, f"📣 Рассылка #{broadcast_id}: начинаю, получателей {total}")
+            await db.set_broadcast_report(broadcast_id, report.chat.id, report.message_id)
+            self._launch(bot, await db.get_running_broadcast())
+        except Exception:
+            # Без задачи строка running заблокировала бы следующие рассылки
+            await db.finish_broadcast(broadcast_id, "failed")
+            raise
+        logger.info("Рассылка #%s запущена: %s получателей", broadcast_id, total)
+        return broadcast_id
+
+    async def resume(self, bot: Bot) -> bool:
+        """Продолжить рассылку, прерванную перезапуском (с последней контрольной точки)"""
+        broadcast = await db.get_running_broadcast()
+        if not broadcast or self.running:
+            return False
+        logger.info(
+            "Рассылка #%s продолжается после перезапуска с user_id > %s (отправлено %s из %s)",
+            broadcast["id"], broadcast["last_user_id"], broadcast["sent"], broadcast["total"]
+        )
+        self._launch(bot, broadcast)
+        return True
+
+    async def cancel(self) -> bool:
+        """
+        Остановить текущую рассылку (текущая порция дойдёт)
+        Строка running без живой задачи (рассылка упала, не продолжена) закрывается сразу.
+
+        Returns:
+            False — рассылки нет
+        """
+        if self.running:
+            self._cancelled = True
+            return True
+        broadcast = await db.get_running_broadcast()
+        if not broadcast:
+            return False
+        await db.finish_broadcast(broadcast["id"], "cancelled")
+        logger.info("Рассылка #%s без активной задачи закрыта как cancelled", broadcast["id"])
+        return True
+
+    async def stop(self) -> None:
+        """Остановка бота: рассылка прерывается, контрольная точка остаётся для resume"""
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def _launch(self, bot: Bot, broadcast: Dict[str, Any]) -> None:
+        self._cancelled = False
+        self.current = broadcast
+        self.rate = 0.0
+        self._task = asyncio.create_task(self._run(bot, broadcast))
+
+    async def _send_one(self, bot: Bot, user_id: int, text: str) -> str:
+        """Одно сообщение. Returns: sent, blocked или failed"""
+        try:
+            with outbound_scheduler.lane(LANE_BULK):
+                await bot.send_message(user_id, text)
+            return "sent"
+        except TelegramForbiddenError:
+            return "blocked"
+        except Exception as e:
+            logger.debug("Рассылка: %s не доставлено: %s", user_id, e)
+            return "failed"
+
+    def _report_text(self, broadcast: Dict[str, Any], status: str) -> str:
+        done = broadcast["sent"] + broadcast["failed"] + broadcast["blocked"]
+        return (
+            f"📣 Рассылка #{broadcast['id']}: {status}\n"
+            f"Обработано {done} из {broadcast['total']}\n"
+            f"Доставлено {broadcast['sent']}, заблокировали бота {broadcast['blocked']}, ошибок {broadcast['failed']}\n"
+            f"Скорость: {self.rate:.1f} сообщ./с"
+        )
+
+    def _report(self, bot: Bot, broadcast: Dict[str, Any], status: str) -> None:
+        if broadcast.get("report_message_id"):
+            edit_coalescer.submit(
+                bot, broadcast["report_chat_id"], broadcast["report_message_id"],
+                self._report_text(broadcast, status), kind="text"
+            )
+
+    async def _run(self, bot: Bot, broadcast: Dict[str, Any]) -> None:
+        chunk_size = max(1, int(getattr(config, "BROADCAST_CHUNK_SIZE", 200)))
+        concurrency = max(1, int(getattr(config, "BROADCAST_CONCURRENCY", 25)))
+        report_every = float(getattr(config, "BROADCAST_REPORT_INTERVAL", 5.0))
+        semaphore = asyncio.Semaphore(concurrency)
+        started, started_done = time.monotonic(), broadcast["sent"] + broadcast["failed"] + broadcast["blocked"]
+        last_report = 0.0
+
+        async def deliver(user_id: int) -> str:
+            async with semaphore:
+                return await self._send_one(bot, user_id, broadcast["text"])
+
+        try:
+            while not self._cancelled:
+                user_ids: List[int] = await db.get_broadcast_chunk(broadcast["last_user_id"], chunk_size)
+                if not user_ids:
+                    break
+                results = await asyncio.gather(*(deliver(uid) for uid in user_ids))
+                blocked_ids = [uid for uid, result in zip(user_ids, results) if result == "blocked"]
+                broadcast["sent"] += results.count("sent")
+                broadcast["failed"] += results.count("failed")
+                broadcast["blocked"] += len(blocked_ids)
+                broadcast["last_user_id"] = user_ids[-1]
+                await db.save_broadcast_progress(
+                    broadcast["id"], broadcast["last_user_id"], broadcast["sent"],
+                    broadcast["failed"], broadcast["blocked"], blocked_ids
+                )
+                done = broadcast["sent"] + broadcast["failed"] + broadcast["blocked"]
+                self.rate = (done - started_done) / max(0.001, time.monotonic() - started)
+                if time.monotonic() - last_report >= report_every:
+                    last_report = time.monotonic()
+                    self._report(bot, broadcast, "идёт")
+            status = "cancelled" if self._cancelled else "done"
+            await db.finish_broadcast(broadcast["id"], status)
+            self._report(bot, broadcast, "остановлена" if self._cancelled else "завершена")
+            logger.info(
+                "Рассылка #%s %s: доставлено %s, заблокировали %s, ошибок %s, %.1f сообщ./с",
+                broadcast["id"], status, broadcast["sent"], broadcast["blocked"], broadcast["failed"], self.rate
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Строка закрывается, иначе running без задачи блокирует /broadcast до перезапуска
+            logger.error("Рассылка #%s прервана: %s", broadcast["id"], e, exc_info=True)
+            try:
+                await db.finish_broadcast(broadcast["id"], "failed")
+            except Exception as db_error:
+                logger.error("Рассылка #%s: статус failed не сохранён: %s", broadcast["id"], db_error)
+            self._report(bot, broadcast, "прервана ошибкой")
+
+
+# Глобальный экземпляр
+broadcast_engine = BroadcastEngine()
@@ -0,0 +1,85 @@
+"""
+Единая схема callback_data: «префикс|арг1|арг2...»
+Данные разбираются один раз на callback (CallbackRoutingMiddleware кладёт результат
+в data["callback_payload"]), маршрутизация — словарём по префиксу (services/routing.py).
+Telegram ограничивает callback_data 64 байтами — pack() проверяет это при сборке кнопки.
+"""
+
+from typing import Any, Dict, Optional, Tuple, Union
+
+from aiogram.filters import Filter
+from aiogram.types import CallbackQuery
+
+SEP = "|"
+MAX_CALLBACK_DATA_BYTES = 64
+
+
+class CallbackPayload:
+    """Разобранные callback_data: префикс и позиционные аргументы (строки)"""
+
+    __slots__ = ("prefix", "args")
+
+    def __init__(self, prefix: str, args: Tuple[str, ...]):
+        self.prefix = prefix
+        self.args = args
+
+    def __len__(self) -> int:
+        return len(self.args)
+
+    def get(self, index: int, default: Optional[str] = None) -> Optional[str]:
+        """Аргумент по номеру или default"""
+        return self.args[index] if index < len(self.args) else default
+
+    def get_int(self, index: int, default: Optional[int] = None) -> Optional[int]:
+        """Аргумент как int или default (если нет или не число)"""
+        try:
+            return int(self.args[index])
+        except (IndexError, ValueError):
+            return default
+
+    def __repr__(self) -> str:
+        return f"CallbackPayload({self.prefix!r}, {self.args!r})"
+
+
+def pack(prefix: str, *args: Any) -> str:
+    """
+    Сборка callback_data: pack("risk40_act", slug, act_id, user_id) -> "risk40_act|reactor|cool|42"
+
+    Raises:
+        ValueError: если аргумент содержит разделитель или данные длиннее 64 байт
+    """
+    parts = [str(a) for a in args]
+    if any(SEP in p for p in parts):
+        raise ValueError(f"callback_data: аргумент содержит '{SEP}': {parts}")
+    data = SEP.join([prefix, *parts])
+    if len(data.encode("utf-8")) > MAX_CALLBACK_DATA_BYTES:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA_BYTES} байт: {data}")
+    return data
+
+
+def unpack(data: Optional[str]) -> CallbackPayload:
+    """Разбор callback_data в CallbackPayload (без аргументов, если данных нет)"""
+    if not data:
+        return CallbackPayload("", ())
+    prefix, *args = data.split(SEP)
+    return CallbackPayload(prefix, tuple(args))
+
+
+class CallbackPrefix(Filter):
+    """
+    Фильтр callback_query по префиксу схемы; передаёт в обработчик payload: CallbackPayload
+    Пример: @router.callback_query(CallbackPrefix("almaz_dig"))
+    """
+
+    __slots__ = ("prefixes",)
+
+    def __init__(self, *prefixes: str):
+        self.prefixes = frozenset(prefixes)
+
+    async def __call__(
+        self, callback: CallbackQuery, callback_payload: Optional[CallbackPayload] = None
+    ) -> Union[bool, Dict[str, Any]]:
+        payload = callback_payload if callback_payload is not None else unpack(callback.data)
+        if payload.prefix not in self.prefixes:
+            return False
+        return {"payload": payload}
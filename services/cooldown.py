@@ -0,0 +1,250 @@
+"""
+Сервис cooldown'ов команд
+Таблица cooldown'ов держится в памяти: пользователь подгружается из БД один раз (лениво),
+дальше проверка cooldown — чистое вычисление без запросов.
+Запись в cooldowns — отложенная, пачками (write-behind); долгие cooldown'ы
+(/steal, /refill, /kachalka ...) пишутся сразу, чтобы пережить перезапуск.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from config import config
+from db import db
+
+logger = logging.getLogger(__name__)
+
+
+class CooldownService:
+    """
+    In-memory таблица cooldown'ов с отложенной записью в БД
+    Также кэширует premium_until и срок баффа kachalka — от них зависит длительность cooldown
+    """
+
+    def __init__(self):
+        """Инициализация сервиса cooldown'ов"""
+        self._flush_task = None
+        self._last_used: Dict[int, Dict[str, int]] = {}  # user_id -> {command: last_used}
+        self._hydrated: Set[int] = set()  # пользователи, чьи cooldown'ы уже подгружены из БД
+        self._hydrating: Dict[int, asyncio.Future] = {}  # user_id -> идущая загрузка из БД
+        self._dirty: Set[Tuple[int, str]] = set()  # (user_id, command) для INSERT OR REPLACE
+        self._perks: Dict[int, Tuple[int, int, int]] = {}  # user_id -> (premium_until, kachalka_until, loaded_at)
+
+    # ---------- загрузка ----------
+
+    async def _hydrate(self, user_id: int) -> Dict[str, int]:
+        """Подгрузка cooldown'ов пользователя из БД (один раз за время жизни записи в памяти)"""
+        if user_id in self._hydrated:
+            return self._last_used[user_id]
+        pending = self._hydrating.get(user_id)
+        if pending is not None:
+            return await pending
+        fut = asyncio.get_running_loop().create_future()
+        self._hydrating[user_id] = fut
+        try:
+            rows = await db.fetchall(
+                "SELECT command, last_used FROM cooldowns WHERE user_id = ?",
+                (user_id,)
+            )
+            table = {command: last_used for command, last_used in rows}
+            # Записи, поставленные пока шла загрузка, свежее БД
+            table.update(self._last_used.get(user_id, {}))
+            self._last_used[user_id] = table
+            self._hydrated.add(user_id)
+            fut.set_result(table)
+            return table
+        except Exception as e:
+            fut.set_exception(e)
+            # Future никто может не ждать — гасим «exception was never retrieved»
+            fut.exception()
+            raise
+        finally:
+            self._hydrating.pop(user_id, None)
+
+    async def _get_perks(self, user_id: int) -> Tuple[int, int]:
+        """(premium_until, kachalka_until) из кэша; обновляется раз в COOLDOWN_PERKS_TTL"""
+        now = int(time.time())
+        cached = self._perks.get(user_id)
+        ttl = getattr(config, "COOLDOWN_PERKS_TTL", 300)
+        if cached is not None and now - cached[2] < ttl:
+            return cached[0], cached[1]
+        row = await db.fetchone(
+            "SELECT premium_until FROM users WHERE user_id = ?", (user_id,)
+        )
+        premium_until = (row[0] or 0) if row else 0
+        row = await db.fetchone(
+            "SELECT MAX(expires_at) FROM effects WHERE user_id = ? AND effect_type = 'kachalka'",
+            (user_id,)
+        )
+        kachalka_until = (row[0] or 0) if row else 0
+        self._perks[user_id] = (premium_until, kachalka_until, now)
+        return premium_until, kachalka_until
+
+    def invalidate_perks(self, user_id: int) -> None:
+        """Сбросить кэш Premium/kachalka (после покупки Premium или /kachalka)"""
+        self._perks.pop(user_id, None)
+
+    # ---------- чтение ----------
+
+    async def get_last_used(self, user_id: int, command: str) -> Optional[int]:
+        """
+        Время последнего использования команды
+
+        Args:
+            user_id: ID пользователя
+            command: Название команды
+
+        Returns:
+            Timestamp последнего использования или None
+        """
+        table = await self._hydrate(user_id)
+        return table.get(command)
+
+    async def get_cooldown_seconds(self, user_id: int) -> int:
+        """
+        Время cooldown для пользователя с учётом Premium и эффектов
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            Время cooldown в секундах
+        """
+        premium_until, kachalka_until = await self._get_perks(user_id)
+        now = int(time.time())
+        # Базовый cooldown
+        base_cooldown = config.DEFAULT_COOLDOWN
+        if premium_until > now:
+            base_cooldown = config.PREMIUM_COOLDOWN
+        # Эффект kachalka (снижает cooldown до 30 сек)
+        if kachalka_until > now:
+            base_cooldown = config.KACHALKA_COOLDOWN_REDUCTION
+        return base_cooldown
+
+    async def get_remaining(self, user_id: int, command: str) -> int:
+        """Сколько секунд осталось до снятия cooldown команды (0 — можно)"""
+        last_used = await self.get_last_used(user_id, command)
+        if not last_used:
+            return 0
+        cooldown_seconds = await self.get_cooldown_seconds(user_id)
+        return max(0, cooldown_seconds - (int(time.time()) - last_used))
+
+    # ---------- запись ----------
+
+    async def set(self, user_id: int, command: str) -> None:
+        """
+        Установка времени последнего использования команды
+        Долгие cooldown'ы (DURABLE_COOLDOWN_COMMANDS) пишутся в БД сразу, остальные — пачкой
+
+        Args:
+            user_id: ID пользователя
+            command: Название команды
+        """
+        now = int(time.time())
+        self._last_used.setdefault(user_id, {})[command] = now
+        key = (user_id, command)
+        if command in getattr(config, "DURABLE_COOLDOWN_COMMANDS", []):
+            self._dirty.discard(key)
+            await db.execute(
+                """INSERT OR REPLACE INTO cooldowns (user_id, command, last_used)
+                   VALUES (?, ?, ?)""",
+                (user_id, command, now)
+            )
+        else:
+            self._dirty.add(key)
+
+    async def reset(self, user_id: int, command: str) -> None:
+        """Сброс cooldown для команды (для реф-кода #PADLOPLAY)"""
+        table = self._last_used.get(user_id)
+        if table is not None:
+            table.pop(command, None)
+        key = (user_id, command)
+        self._dirty.discard(key)
+        await db.reset_cooldown(user_id, command)
+
+    @property
+    def pending(self) -> int:
+        """Сколько изменений ждут записи в БД"""
+        return len(self._dirty)
+
+    async def flush(self) -> int:
+        """
+        Запись накопленных cooldown'ов одной транзакцией
+
+        Returns:
+            Количество записанных строк
+        """
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        rows = []
+        for user_id, command in dirty:
+            last_used = self._last_used.get(user_id, {}).get(command)
+            if last_used is not None:
+                rows.append((user_id, command, last_used))
+        try:
+            await db.executemany(
+                """INSERT OR REPLACE INTO cooldowns (user_id, command, last_used)
+                   VALUES (?, ?, ?)""",
+                rows
+            )
+        except Exception as e:
+            self._dirty |= dirty
+            logger.warning("Не удалось записать cooldown'ы: %s", e)
+            return 0
+        return len(rows)
+
+    def _evict_idle(self) -> None:
+        """Выгрузка из памяти пользователей, у которых все cooldown'ы давно истекли"""
+        now = int(time.time())
+        keep_for = getattr(config, "COOLDOWN_MEMORY_TTL", 7 * 86400)
+        dirty_users = {uid for uid, _ in self._dirty}
+        for user_id in list(self._last_used):
+            if user_id in dirty_users:
+                continue
+            table = self._last_used[user_id]
+            if user_id in self._hydrated and all(now - ts > keep_for for ts in table.values()):
+                del self._last_used[user_id]
+                self._hydrated.discard(user_id)
+        perks_ttl = getattr(config, "COOLDOWN_PERKS_TTL", 300)
+        for user_id in [uid for uid, p in self._perks.items() if now - p[2] >= perks_ttl]:
+            del self._perks[user_id]
+
+    async def start_flush_task(self):
+        """
+        Запуск фоновой задачи записи cooldown'ов
+        Вызывается при старте бота
+        """
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+            logger.info("Задача записи cooldown'ов запущена")
+
+    async def stop_flush_task(self):
+        """Остановка фоновой задачи и финальная запись"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        logger.info("Задача записи cooldown'ов остановлена")
+
+    async def _flush_loop(self):
+        """Периодическая запись (COOLDOWN_FLUSH_INTERVAL секунд) и чистка памяти"""
+        interval = getattr(config, "COOLDOWN_FLUSH_INTERVAL", 5)
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await self.flush()
+                self._evict_idle()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Ошибка записи cooldown'ов: {e}", exc_info=True)
+
+
+# Глобальный экземпляр сервиса
+cooldown_service = CooldownService()
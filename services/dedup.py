@@ -0,0 +1,94 @@
+"""
+Отсев повторных обновлений
+Telegram повторно доставляет обновление webhook, если не получил ответ вовремя
+(или получил 429 от очереди обновлений). Повтор проходил всю цепочку middleware,
+ходил в БД и мог второй раз рассчитать игру. Теперь до очереди и до всех middleware
+обновление сверяется с ограниченными LRU-множествами недавних update_id и id
+callback-запросов; повтор отбрасывается.
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Hashable
+
+from aiogram.types import Update
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class RecentIds:
+    """Множество последних id ограниченного размера: самые давние вытесняются"""
+
+    __slots__ = ("_ids", "size")
+
+    def __init__(self, size: int):
+        self._ids: "OrderedDict[Hashable, None]" = OrderedDict()
+        self.size = max(1, size)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._ids
+
+    def add(self, item: Hashable) -> bool:
+        """Запомнить id. Returns: False — id уже был среди недавних"""
+        if item in self._ids:
+            self._ids.move_to_end(item)
+            return False
+        self._ids[item] = None
+        if len(self._ids) > self.size:
+            self._ids.popitem(last=False)
+        return True
+
+    def discard(self, item: Hashable) -> None:
+        self._ids.pop(item, None)
+
+
+class UpdateDeduplicator:
+    """Недавние update_id и id callback-запросов"""
+
+    def __init__(self):
+        """Инициализация пустых множеств (размер — UPDATE_DEDUP_SIZE)"""
+        size = int(getattr(config, "UPDATE_DEDUP_SIZE", 10000))
+        self._updates = RecentIds(size)
+        self._callbacks = RecentIds(size)
+        # Статистика для /debug
+        self.dropped_updates = 0
+        self.dropped_callbacks = 0
+
+    def __len__(self) -> int:
+        return len(self._updates)
+
+    def is_duplicate(self, update: Update) -> bool:
+        """
+        Обновление уже приходило? Новое запоминается
+
+        Returns:
+            True — повтор, обрабатывать не нужно
+        """
+        if update.update_id in self._updates:
+            self._updates.add(update.update_id)
+            self.dropped_updates += 1
+            return True
+        callback = update.callback_query
+        if callback is not None and callback.id in self._callbacks:
+            self._callbacks.add(callback.id)
+            self.dropped_callbacks += 1
+            return True
+        self._updates.add(update.update_id)
+        if callback is not None:
+            self._callbacks.add(callback.id)
+        return False
+
+    def forget(self, update: Update) -> None:
+        """Обновление не принято (очередь полна) — его повтор нужно обработать"""
+        self._updates.discard(update.update_id)
+        if update.callback_query is not None:
+            self._callbacks.discard(update.callback_query.id)
+
+
+# Глобальный экземпляр
+update_dedup = UpdateDeduplicator()
@@ -0,0 +1,117 @@
+"""
+Планировщик автоудаления сообщений
+Раньше каждое отправленное сообщение порождало отдельную задачу, которая спала
+MESSAGE_DELETE_TIMEOUT секунд. Теперь все удаления лежат в одной min-куче по
+времени срабатывания, а её обслуживает одна фоновая задача. Ожидающее удаление —
+это несколько полей в __slots__, а не корутина со своим стеком.
+Удаления одного чата, наступившие почти одновременно (ставка, налог, уведомления
+и результат игры), уходят одним deleteMessages — до 100 id за вызов.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+
+from config import config
+from services.scheduler import HeapScheduler, ScheduledHandle
+
+logger = logging.getLogger(__name__)
+
+# Лимит Bot API deleteMessages
+MAX_DELETE_BATCH = 100
+
+
+class DeletionHandle(ScheduledHandle):
+    """Запланированное удаление; cancel() отменяет его (например, если сообщение удалили раньше)"""
+
+    __slots__ = ("bot", "chat_id", "message_id")
+
+    def __init__(self, when: float, bot: Bot, chat_id: int, message_id: int):
+        super().__init__(when)
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    def cancel(self) -> bool:
+        """Отменить удаление. Returns: False, если оно уже выполнено или отменено"""
+        return deletion_scheduler.cancel(self)
+
+
+class DeletionScheduler(HeapScheduler):
+    """
+    Планировщик на общей куче (services/scheduler.py): наступившие удаления уходят
+    пакетами по чату. Просыпается на MESSAGE_DELETE_BATCH_WINDOW позже срока, чтобы
+    забрать соседние удаления одним вызовом.
+    """
+
+    label = "Планировщик автоудаления сообщений"
+
+    def __init__(self):
+        """Инициализация пустого планировщика"""
+        super().__init__()
+        # Статистика для /debug
+        self.deleted = 0
+        self.failed = 0
+        self.api_calls = 0
+
+    def schedule(self, bot: Bot, chat_id: int, message_id: int, seconds: float) -> Optional[DeletionHandle]:
+        """
+        Запланировать удаление сообщения через seconds секунд
+
+        Returns:
+            DeletionHandle или None, если seconds <= 0 или нет запущенного event loop
+        """
+        if seconds <= 0:
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning("Удаление сообщения %s/%s не запланировано: нет event loop", chat_id, message_id)
+            return None
+        return self._push(DeletionHandle(loop.time() + seconds, bot, chat_id, message_id))
+
+    def _on_due(self, due: List[DeletionHandle]) -> None:
+        self._spawn(self._delete(due))
+
+    def _wake_delay(self) -> float:
+        return max(0.0, float(getattr(config, "MESSAGE_DELETE_BATCH_WINDOW", 1.0)))
+
+    async def _delete(self, due: List[DeletionHandle]) -> None:
+        """Удаление сообщений, время которых пришло: группами по чату, до 100 id за вызов"""
+        by_chat: Dict[Tuple[int, int], List[DeletionHandle]] = defaultdict(list)
+        for handle in due:
+            by_chat[(id(handle.bot), handle.chat_id)].append(handle)
+        for handles in by_chat.values():
+            bot = handles[0].bot
+            chat_id = handles[0].chat_id
+            message_ids = list(dict.fromkeys(h.message_id for h in handles))
+            for i in range(0, len(message_ids), MAX_DELETE_BATCH):
+                chunk = message_ids[i:i + MAX_DELETE_BATCH]
+                if len(chunk) == 1:
+                    await self._delete_one(bot, chat_id, chunk[0])
+                    continue
+                try:
+                    self.api_calls += 1
+                    await bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+                    self.deleted += len(chunk)
+                except Exception as e:
+                    # Пакет отклонён целиком (например, старый Bot API или нет прав) — по одному
+                    logger.debug("deleteMessages в чате %s не прошёл (%s), удаляем по одному", chat_id, e)
+                    for message_id in chunk:
+                        await self._delete_one(bot, chat_id, message_id)
+
+    async def _delete_one(self, bot: Bot, chat_id: int, message_id: int) -> None:
+        try:
+            self.api_calls += 1
+            await bot.delete_message(chat_id=chat_id, message_id=message_id)
+            self.deleted += 1
+        except Exception:
+            # Сообщение уже удалено, нет прав или чат недоступен — как и раньше, молча
+            self.failed += 1
+
+
+# Глобальный экземпляр планировщика
+deletion_scheduler = DeletionScheduler()
@@ -0,0 +1,128 @@
+"""
+Сводка уведомлений создателю
+Раньше notify_creator отправлял отдельное сообщение на каждый бан антиспама, крупный
+выигрыш и рост баланса. При всплеске это десятки сообщений подряд в один чат —
+они съедают лимит, который этот чат делит с обычными ответами бота.
+Теперь уведомления копятся по видам и раз в CREATOR_DIGEST_INTERVAL секунд уходят
+одним сообщением: по каждому виду — число событий и последние из них.
+Критичные уведомления (critical=True) отправляются сразу, минуя сводку.
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+
+from config import config
+from services.timers import TimerHandle, game_timers
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+
+class _Group:
+    """Уведомления одного вида за интервал"""
+
+    __slots__ = ("count", "lines")
+
+    def __init__(self):
+        self.count = 0
+        self.lines: List[str] = []
+
+
+class CreatorDigest:
+    """Накопитель уведомлений создателю: по видам, одно сообщение за интервал"""
+
+    def __init__(self):
+        """Инициализация пустой сводки"""
+        self._groups: "OrderedDict[str, _Group]" = OrderedDict()
+        self._bot: Optional[Bot] = None
+        self._timer: Optional[TimerHandle] = None
+        # Статистика для /debug
+        self.received = 0
+        self.sent = 0
+        self.critical = 0
+
+    @property
+    def pending(self) -> int:
+        """Сколько уведомлений ждёт сводки"""
+        return sum(group.count for group in self._groups.values())
+
+    async def add(self, bot: Bot, kind: str, text: str, critical: bool = False) -> None:
+        """
+        Уведомление создателю
+
+        Args:
+            kind: Вид (заголовок группы в сводке), например «Антиспам»
+            text: Текст уведомления
+            critical: Отправить сразу, минуя сводку
+        """
+        self.received += 1
+        interval = float(getattr(config, "CREATOR_DIGEST_INTERVAL", 60))
+        if critical or interval <= 0:
+            if critical:
+                self.critical += 1
+            await self._send(bot, f"🔔 <b>Уведомление</b>\n\n{text}")
+            return
+        group = self._groups.get(kind)
+        if group is None:
+            group = self._groups[kind] = _Group()
+        group.count += 1
+        group.lines.append(text)
+        keep = max(1, int(getattr(config, "CREATOR_DIGEST_MAX_LINES", 5)))
+        if len(group.lines) > keep:
+            # В сводке — последние события вида, остальные только в счётчике
+            del group.lines[0]
+        self._bot = bot
+        if self._timer is None:
+            self._timer = game_timers.call_later(interval, self.flush)
+
+    def render(self) -> str:
+        """
+        Текст сводки по накопленным уведомлениям
+        Строки уведомлений — HTML, поэтому сводка обрезается только целыми строками:
+        обрезка по символу могла бы разрезать тег и Telegram отклонил бы сообщение.
+        """
+        # Место под итоговую строку «не вошло»
+        limit = MAX_MESSAGE_LENGTH - 64
+        text = f"🔔 <b>Сводка уведомлений</b> ({self.pending})"
+        dropped = 0
+        for kind, group in self._groups.items():
+            block = [f"<b>{kind}</b> — {group.count}"]
+            block.extend(f"• {line}" for line in group.lines)
+            hidden = group.count - len(group.lines)
+            if hidden > 0:
+                block.append(f"…и ещё {hidden}")
+            separator = "\n\n"
+            for line in block:
+                if dropped or len(text) + len(separator) + len(line) > limit:
+                    dropped += 1
+                    continue
+                text += separator + line
+                separator = "\n"
+        if dropped:
+            text += f"\n\n…не вошло строк: {dropped}"
+        return text
+
+    async def flush(self) -> None:
+        """Отправить накопленное одним сообщением (по таймеру и при остановке бота)"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._groups or self._bot is None:
+            return
+        text = self.render()
+        self._groups.clear()
+        await self._send(self._bot, text)
+
+    async def _send(self, bot: Bot, text: str) -> None:
+        from utils import send_to_creator
+        if await send_to_creator(bot, text):
+            self.sent += 1
+
+
+# Глобальный экземпляр
+creator_digest = CreatorDigest()
@@ -0,0 +1,224 @@
+"""
+Склейка правок «живых» игровых сообщений
+Тикер Lucky Jet правит подпись каждый тик, RISK40 — каждое нажатие, биржа — каждое
+обновление, лобби — каждое вступление. Когда Bot API отвечает медленно, правки одного
+сообщения копятся в очереди и уходят одна за другой, хотя нужна только последняя,
+а правка тем же текстом возвращает «message is not modified».
+Теперь правка сообщения (chat_id, message_id) ставится в слот этого сообщения:
+- в слоте ждёт только самая новая правка, более старые отбрасываются (latest wins);
+- правка, совпадающая с уже показанной или ожидающей, не отправляется;
+- одно сообщение правится не чаще раза в EDIT_MIN_INTERVAL секунд.
+Итоговое сообщение игры (результат, удаление) ставится после close(): она снимает
+ожидающую правку и дожидается отправляемой, чтобы тиковая правка не затёрла результат.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Сколько сообщений помнить (показанное содержимое нужно, чтобы не слать повторы)
+MAX_SLOTS = 4096
+
+EditKey = Tuple[str, str, Optional[str]]
+
+
+class _Edit:
+    """Правка, ожидающая отправки, и те, кто ждёт её результата"""
+
+    __slots__ = ("bot", "kind", "text", "reply_markup", "key", "waiters")
+
+    def __init__(self, bot: Bot, kind: str, text: str, reply_markup: Optional[InlineKeyboardMarkup], key: EditKey):
+        self.bot = bot
+        self.kind = kind
+        self.text = text
+        self.reply_markup = reply_markup
+        self.key = key
+        self.waiters: List[asyncio.Future] = []
+
+    def resolve(self, ok: bool) -> None:
+        for future in self.waiters:
+            if not future.done():
+                future.set_result(ok)
+        self.waiters.clear()
+
+
+class _Slot:
+    """Состояние правок одного сообщения"""
+
+    __slots__ = ("shown", "pending", "last_edit", "task")
+
+    def __init__(self):
+        self.shown: Optional[EditKey] = None
+        self.pending: Optional[_Edit] = None
+        self.last_edit = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+
+class EditCoalescer:
+    """Слоты правок по (chat_id, message_id); у слота с ожидающей правкой есть своя задача"""
+
+    def __init__(self):
+        """Инициализация пустого реестра"""
+        self._slots: "OrderedDict[Tuple[int, int], _Slot]" = OrderedDict()
+        # Статистика для /debug
+        self.edits = 0
+        self.coalesced = 0
+        self.unchanged = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @staticmethod
+    def _key(kind: str, text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> EditKey:
+        markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup is not None else None
+        return kind, text, markup
+
+    def _slot(self, ref: Tuple[int, int]) -> _Slot:
+        slot = self._slots.get(ref)
+        if slot is None:
+            if len(self._slots) >= MAX_SLOTS:
+                # Забываем самые давние простаивающие сообщения
+                for old_ref in list(self._slots)[: MAX_SLOTS // 4]:
+                    old = self._slots[old_ref]
+                    if old.task is None and old.pending is None:
+                        del self._slots[old_ref]
+            slot = self._slots[ref] = _Slot()
+        else:
+            self._slots.move_to_end(ref)
+        return slot
+
+    def submit(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        kind: str = "caption",
+    ) -> "asyncio.Future[bool]":
+        """
+        Поставить правку, не дожидаясь её отправки
+
+        Args:
+            kind: "caption" (подпись медиа) или "text" (текстовое сообщение)
+
+        Returns:
+            Future: True — правка показана (или уже была показана), False — её сменила
+            более новая, сообщение закрыто или Telegram вернул ошибку
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        ref = (chat_id, message_id)
+        slot = self._slot(ref)
+        key = self._key(kind, text, reply_markup)
+        if slot.pending is not None and slot.pending.key == key:
+            slot.pending.waiters.append(future)
+            self.unchanged += 1
+            return future
+        if slot.pending is None and slot.shown == key:
+            self.unchanged += 1
+            future.set_result(True)
+            return future
+        if slot.pending is not None:
+            self.coalesced += 1
+            slot.pending.resolve(False)
+        slot.pending = _Edit(bot, kind, text, reply_markup, key)
+        slot.pending.waiters.append(future)
+        if slot.task is None:
+            slot.task = asyncio.create_task(self._drain(ref, slot))
+        return future
+
+    async def edit_caption(
+        self, bot: Bot, chat_id: int, message_id: int, caption: str, reply_markup: Optional[InlineKeyboardMarkup] = None
+    ) -> bool:
+        """Правка подписи с ожиданием результата (см. submit)"""
+        return await self.submit(bot, chat_id, message_id, caption, reply_markup, "caption")
+
+    async def edit_text(
+        self, bot: Bot, chat_id: int, message_id: int, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None
+    ) -> bool:
+        """Правка текста с ожиданием результата (см. submit)"""
+        return await self.submit(bot, chat_id, message_id, text, reply_markup, "text")
+
+    async def close(self, chat_id: int, message_id: int) -> None:
+        """
+        Сообщение переходит в итоговое состояние (результат игры, удаление):
+        ожидающая правка отменяется, отправляемая — дожидается, слот забывается
+        """
+        slot = self._slots.pop((chat_id, message_id), None)
+        if slot is None:
+            return
+        if slot.pending is not None:
+            slot.pending.resolve(False)
+            slot.pending = None
+        task = slot.task
+        if task is not None and task is not asyncio.current_task():
+            try:
+                await asyncio.shield(task)
+            except Exception:
+                pass
+
+    async def _send(self, chat_id: int, message_id: int, edit: _Edit) -> None:
+        if edit.kind == "text":
+            await edit.bot.edit_message_text(
+                chat_id=chat_id, message_id=message_id, text=edit.text, reply_markup=edit.reply_markup
+            )
+        else:
+            await edit.bot.edit_message_caption(
+                chat_id=chat_id, message_id=message_id, caption=edit.text, reply_markup=edit.reply_markup
+            )
+
+    async def _drain(self, ref: Tuple[int, int], slot: _Slot) -> None:
+        """Задача слота: отправляет последнюю правку, выдерживая интервал между правками"""
+        loop = asyncio.get_running_loop()
+        interval = max(0.0, float(getattr(config, "EDIT_MIN_INTERVAL", 1.0)))
+        try:
+            while slot.pending is not None:
+                delay = slot.last_edit + interval - loop.time()
+                if delay > 0:
+                    # За это время правку могут сменить ещё несколько раз — уйдёт последняя
+                    await asyncio.sleep(delay)
+                    continue
+                edit, slot.pending = slot.pending, None
+                if edit.key == slot.shown:
+                    self.unchanged += 1
+                    edit.resolve(True)
+                    continue
+                slot.last_edit = loop.time()
+                ok = False
+                try:
+                    await self._send(ref[0], ref[1], edit)
+                    ok = True
+                    self.edits += 1
+                except TelegramBadRequest as e:
+                    if "message is not modified" in str(e):
+                        ok = True
+                        self.unchanged += 1
+                    else:
+                        self.failed += 1
+                        logger.debug("Правка %s/%s: %s", ref[0], ref[1], e)
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning("Правка %s/%s не отправлена: %s", ref[0], ref[1], e)
+                if ok:
+                    slot.shown = edit.key
+                edit.resolve(ok)
+        finally:
+            slot.task = None
+            if slot.pending is not None:
+                slot.pending.resolve(False)
+                slot.pending = None
+
+
+# Глобальный экземпляр
+edit_coalescer = EditCoalescer()
@@ -11,6 +11,7 @@ from datetime import datetime, timedelta
 
 from config import config
 from db import db
+from services.cooldown import cooldown_service
 
 logger = logging.getLogger(__name__)
 
@@ -88,6 +89,9 @@ class EffectsService:
             multiplier=multiplier,
             metadata=metadata
         )
+        if effect_type in ("premium", "kachalka"):
+            # Длительность cooldown зависит от этих эффектов
+            cooldown_service.invalidate_perks(user_id)
         
         logger.info(
             f"Добавлен эффект: user_id={user_id}, effect_type={effect_type}, "
@@ -0,0 +1,372 @@
+"""
+Журнал игровых сессий
+Ставка списывается в начале игры, а сама сессия живёт только в памяти — при
+перезапуске бота незавершённые игры пропадали вместе со ставками. Журнал хранит
+активные сессии игр со ставкой на диске:
+- append-only файл JSON-строк: put (сессия открыта/изменена) и del (закрыта);
+- обработчик только помечает ключ «грязным» (O(1)), строки пишет фоновая задача
+  раз в SESSION_JOURNAL_FLUSH_INTERVAL секунд, несколько изменений сессии — одной строкой;
+  закрытие (del) и замена сессии ставятся в запись сразу;
+- файлы пишет один поток (не event loop) строго в порядке постановки, а зачисления
+  balance_service ждут его (sync()) — закрытие сессии на диске раньше выплаты;
+- раз в SESSION_JOURNAL_SNAPSHOT_INTERVAL секунд все открытые сессии пишутся в
+  снапшот (атомарно через os.replace), а журнал обрезается.
+У снапшота и строк журнала есть номер поколения: строки старше снапшота при чтении
+пропускаются, поэтому падение между записью снапшота и обрезкой журнала безопасно.
+Возврат, который не удался целиком, остаётся в журнале записью «долга» (owe) с
+невыплаченным остатком — до полной выплаты (SessionManager.settle_owed()).
+Восстановление (возврат ставок или продолжение игры) — SessionManager.recover().
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Значения состояния, которые попадают в журнал (bot, задачи и т.п. — нет)
+_JSON_TYPES = (int, float, str, bool, list, tuple, dict, type(None))
+
+
+def _state(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Сериализуемая часть состояния сессии"""
+    return {k: v for k, v in session.items() if isinstance(v, _JSON_TYPES)}
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=lambda _: None)
+
+
+class SessionJournal:
+    """Append-only журнал + снапшот активных сессий (game, key) -> GameSession"""
+
+    def __init__(self):
+        """Инициализация пустого журнала"""
+        self._open: Dict[Tuple[str, int], Any] = {}  # открытые сессии (ссылки, сериализуются при записи)
+        self._dirty: Dict[Tuple[str, int], Any] = {}  # изменённые с прошлой записи: сессия или None (закрыта)
+        self._kept: Dict[Tuple[str, int], Dict[str, Any]] = {}  # записи, которые не удалось восстановить
+        self._owed: Dict[str, Dict[str, Any]] = {}  # id -> запись с невыплаченным возвратом (left)
+        self._gen = 0
+        self._task: Optional[asyncio.Task] = None
+        # Один поток записи: строки и снапшоты попадают в файлы в порядке постановки
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-journal")
+        self._writes: Set[asyncio.Future] = set()  # поставленные и ещё не записанные
+        self._io_lock: Optional[asyncio.Lock] = None
+        self._last_snapshot = time.time()
+        # Статистика для /debug
+        self.lines_written = 0
+        self.snapshots = 0
+
+    @property
+    def path(self) -> Path:
+        return Path(getattr(config, "SESSION_JOURNAL_PATH", Path("sessions.journal")))
+
+    @property
+    def snapshot_path(self) -> Path:
+        return self.path.with_suffix(".snapshot")
+
+    @property
+    def open_count(self) -> int:
+        return len(self._open)
+
+    @property
+    def pending(self) -> int:
+        """Сколько изменений ждёт записи"""
+        return len(self._dirty)
+
+    def put(self, session) -> None:
+        """Сессия открыта или изменилась (вызывается SessionStore)"""
+        ref = (session.game, session.key)
+        self._open[ref] = session
+        self._dirty[ref] = session
+
+    def drop(self, session) -> None:
+        """
+        Сессия закрыта (вызывается SessionStore)
+        Строка del ставится в запись сразу, а не ждёт фоновой задачи: обработчик следом
+        зачисляет выигрыш или возврат, и падение до записи вернуло бы при старте уже
+        рассчитанную ставку (зачисление ждёт записи через sync()).
+        """
+        ref = (session.game, session.key)
+        if self._open.get(ref) is not session:
+            return
+        del self._open[ref]
+        self._dirty.pop(ref, None)
+        self._write_now(
+            _dumps({"g": self._gen, "op": "del", "game": ref[0], "key": ref[1]}),
+            lambda: self._dirty.setdefault(ref, None)
+        )
+
+    def replace(self, previous, session) -> None:
+        """
+        Сессия заменена новой по тому же ключу (вызывается SessionStore)
+        Новая запись ставится в запись сразу: строка put перекрывает старую, и нет
+        окна, в котором списанной ставки нет в журнале.
+        """
+        ref = (session.game, session.key)
+        if self._open.get(ref) is not previous:
+            self.put(session)
+            return
+        self._open[ref] = session
+        self._dirty.pop(ref, None)
+        record = self.record(session)
+        record["g"] = self._gen
+        record["op"] = "put"
+        # Более свежие изменения при ошибке не затираем
+        self._write_now(_dumps(record), lambda: self._dirty.setdefault(ref, session))
+
+    def owe(self, record: Dict[str, Any], left: List[Tuple[int, int]]) -> None:
+        """
+        Возврат ставок выплачен не целиком: запись остаётся в журнале с остатком left
+        [(user_id, сумма)] до полной выплаты (повтор — при проходе TTL и при старте)
+        """
+        owed = {k: v for k, v in record.items() if k not in ("g", "op")}
+        owed.setdefault("id", f"{record['game']}:{record['key']}:{record.get('created', time.time())}")
+        owed["left"] = [[int(uid), int(amount)] for uid, amount in left]
+        self._owed[owed["id"]] = owed
+        line = dict(owed)
+        line["g"] = self._gen
+        line["op"] = "owe"
+        # Ошибка записи не теряет долг: он в памяти и попадёт в следующий снапшот
+        self._write_now(_dumps(line), lambda: None)
+
+    def paid(self, owed_id: str) -> None:
+        """Долг по возврату выплачен полностью"""
+        if self._owed.pop(owed_id, None) is not None:
+            self._write_now(_dumps({"g": self._gen, "op": "paid", "id": owed_id}), lambda: None)
+
+    def owed(self) -> List[Dict[str, Any]]:
+        """Невыплаченные возвраты: записи {id, game, key, owner, s, left}"""
+        return list(self._owed.values())
+
+    def _write_now(self, line: str, on_error: Callable[[], Any]) -> None:
+        """Поставить строку в запись вне очереди flush"""
+        def done(future: "asyncio.Future") -> None:
+            if future.cancelled() or future.exception() is not None:
+                error = None if future.cancelled() else future.exception()
+                logger.warning("Не удалось записать строку журнала сессий: %s", error)
+                on_error()
+            else:
+                self.lines_written += 1
+
+        try:
+            future = self._write(self._append, [line])
+        except RuntimeError:
+            # Вне event loop (старт, скрипты) — пишем сразу
+            self._append([line])
+            self.lines_written += 1
+            return
+        future.add_done_callback(done)
+
+    def _write(self, func: Callable[..., Any], *args: Any) -> "asyncio.Future":
+        """Запись в потоке журнала (в порядке постановки)"""
+        future = asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        self._writes.add(future)
+        future.add_done_callback(self._writes.discard)
+        return future
+
+    async def sync(self) -> None:
+        """Дождаться записи всего, что уже поставлено (вызывается перед зачислениями)"""
+        if self._writes:
+            await asyncio.gather(*list(self._writes), return_exceptions=True)
+
+    def keep(self, record: Dict[str, Any]) -> None:
+        """Оставить запись в снапшоте до следующего старта (игра не загружена или восстановление упало)"""
+        self._kept[(record["game"], record["key"])] = record
+
+    @staticmethod
+    def record(session) -> Dict[str, Any]:
+        """Запись сессии для журнала: {game, key, owner, created, s}"""
+        return {
+            "game": session.game, "key": session.key, "owner": session.owner_id,
+            "created": session.created_at, "s": _state(session),
+        }
+
+    def _lock(self) -> asyncio.Lock:
+        if self._io_lock is None:
+            self._io_lock = asyncio.Lock()
+        return self._io_lock
+
+    # ---------- запись ----------
+
+    def _append(self, lines: List[str]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+
+    def _write_snapshot(self, data: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.snapshot_path.with_suffix(".snapshot.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        # Всё, что было в журнале, покрыто снапшотом
+        with open(self.path, "w", encoding="utf-8"):
+            pass
+
+    async def flush(self) -> int:
+        """
+        Дописать изменения в журнал
+
+        Returns:
+            Количество записанных строк
+        """
+        async with self._lock():
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, {}
+            lines = []
+            for (game, key), session in dirty.items():
+                if session is None:
+                    lines.append(_dumps({"g": self._gen, "op": "del", "game": game, "key": key}))
+                else:
+                    record = self.record(session)
+                    record["g"] = self._gen
+                    record["op"] = "put"
+                    lines.append(_dumps(record))
+            try:
+                await self._write(self._append, lines)
+            except Exception as e:
+                # Возвращаем в буфер, не затирая более свежие изменения
+                for ref, session in dirty.items():
+                    self._dirty.setdefault(ref, session)
+                logger.warning("Не удалось записать журнал сессий: %s", e)
+                return 0
+            self.lines_written += len(lines)
+            return len(lines)
+
+    async def snapshot(self) -> int:
+        """
+        Записать снапшот открытых сессий и обрезать журнал
+
+        Returns:
+            Количество сессий в снапшоте
+        """
+        async with self._lock():
+            gen = self._gen
+            self._gen += 1
+            # Снапшот покрывает и ещё не записанные изменения
+            dirty, self._dirty = self._dirty, {}
+            data = _dumps({"g": gen, "t": time.time(), "sessions": [
+                self.record(s) for s in self._open.values()
+            ] + [r for ref, r in self._kept.items() if ref not in self._open], "owed": list(self._owed.values())})
+            try:
+                await self._write(self._write_snapshot, data)
+            except Exception as e:
+                for ref, session in dirty.items():
+                    self._dirty.setdefault(ref, session)
+                # Новые строки журнала пойдут с поколением, которого ещё нет в снапшоте на диске
+                logger.warning("Не удалось записать снапшот сессий: %s", e)
+                return 0
+            self._last_snapshot = time.time()
+            self.snapshots += 1
+            return len(self._open)
+
+    # ---------- чтение ----------
+
+    def load(self) -> Dict[Tuple[str, int], Dict[str, Any]]:
+        """
+        Прочитать снапшот и журнал (при старте, до обработки апдейтов)
+        Невыплаченные возвраты после чтения доступны через owed()
+
+        Returns:
+            (game, key) -> запись {game, key, owner, created, s} сессий, открытых на момент остановки
+        """
+        sessions: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._owed = {}
+        snap_gen = -1
+        try:
+            if self.snapshot_path.exists():
+                snap = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+                snap_gen = int(snap.get("g", -1))
+                for record in snap.get("sessions", []):
+                    sessions[(record["game"], record["key"])] = record
+                for record in snap.get("owed", []):
+                    self._owed[record["id"]] = record
+        except Exception as e:
+            logger.error("Снапшот сессий %s не прочитан: %s", self.snapshot_path, e)
+        max_gen = snap_gen
+        try:
+            if self.path.exists():
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # Недописанная последняя строка после аварийной остановки
+                            continue
+                        gen = int(record.get("g", 0))
+                        if gen <= snap_gen:
+                            continue
+                        max_gen = max(max_gen, gen)
+                        op = record.pop("op", "put")
+                        if op in ("owe", "paid"):
+                            if op == "owe":
+                                record.pop("g", None)
+                                self._owed[record["id"]] = record
+                            else:
+                                self._owed.pop(record["id"], None)
+                            continue
+                        ref = (record["game"], record["key"])
+                        if op == "del":
+                            sessions.pop(ref, None)
+                        else:
+                            sessions[ref] = record
+        except Exception as e:
+            logger.error("Журнал сессий %s не прочитан: %s", self.path, e)
+        self._gen = max(self._gen, max_gen + 1)
+        self._kept.clear()
+        return sessions
+
+    # ---------- фоновая задача ----------
+
+    async def start(self):
+        """
+        Запуск фоновой записи журнала
+        Вызывается при старте бота (после восстановления сессий)
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            logger.info("Журнал игровых сессий запущен: %s", self.path)
+
+    async def stop(self):
+        """Остановка фоновой задачи и финальный снапшот открытых сессий"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        count = await self.snapshot()
+        logger.info("Журнал игровых сессий остановлен, открытых сессий: %s", count)
+
+    async def _loop(self):
+        """Запись изменений раз в SESSION_JOURNAL_FLUSH_INTERVAL, снапшот раз в SESSION_JOURNAL_SNAPSHOT_INTERVAL"""
+        flush_interval = max(0.1, float(getattr(config, "SESSION_JOURNAL_FLUSH_INTERVAL", 1.0)))
+        snapshot_interval = max(flush_interval, float(getattr(config, "SESSION_JOURNAL_SNAPSHOT_INTERVAL", 60)))
+        while True:
+            try:
+                await asyncio.sleep(flush_interval)
+                if time.time() - self._last_snapshot >= snapshot_interval:
+                    await self.snapshot()
+                else:
+                    await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала сессий: {e}", exc_info=True)
+
+
+# Глобальный экземпляр журнала
+session_journal = SessionJournal()
@@ -0,0 +1,109 @@
+"""
+Лобби групповых игр (/rulet, /frekaz)
+Раньше каждое вступление сразу редактировало сообщение лобби: при наплыве игроков
+это шторм editMessageCaption и 429 от Telegram. Теперь вступление только помечает
+лобби изменённым, а сообщение перерисовывается не чаще раза в LOBBY_EDIT_INTERVAL
+секунд по последнему состоянию — сколько бы игроков ни вступило за это время.
+Отложенные правки и фазы игр (выбывание, финал) обслуживает общий планировщик
+таймаутов services/timers.py — своих задач у лобби нет.
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+from config import config
+from services.edits import edit_coalescer
+from services.sessions import GameSession, session_manager
+from services.timers import TimerHandle, game_timers
+
+logger = logging.getLogger(__name__)
+
+# Отрисовка лобби: сессия -> (подпись, клавиатура)
+LobbyRender = Callable[[GameSession], Tuple[str, Optional[InlineKeyboardMarkup]]]
+
+
+class _LobbyMessage:
+    """Состояние правок одного сообщения лобби"""
+
+    __slots__ = ("session", "render", "last_edit", "timer")
+
+    def __init__(self, session: GameSession, render: LobbyRender):
+        self.session = session
+        self.render = render
+        self.last_edit = 0.0
+        self.timer: Optional[TimerHandle] = None
+
+
+class LobbyEngine:
+    """Отложенные (debounce) правки сообщений лобби, не чаще одной за интервал на лобби"""
+
+    def __init__(self):
+        """Инициализация пустого движка"""
+        self._lobbies: Dict[Tuple[str, int], _LobbyMessage] = {}
+        # Статистика для /debug
+        self.edits = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._lobbies)
+
+    def touch(self, session: GameSession, render: LobbyRender) -> None:
+        """
+        Лобби изменилось: перерисовать сообщение (сразу, если давно не правили, иначе в конце интервала)
+
+        Args:
+            session: Сессия лобби (в хранилище игры; нужны поля bot, message_id)
+            render: Функция, строящая подпись и клавиатуру по текущему состоянию
+        """
+        ref = (session.game, session.key)
+        lobby = self._lobbies.get(ref)
+        if lobby is None or lobby.session is not session:
+            lobby = self._lobbies[ref] = _LobbyMessage(session, render)
+        lobby.render = render
+        if lobby.timer is not None:
+            # Правка уже запланирована (или сработала и ждёт выполнения) — она возьмёт свежее состояние
+            self.coalesced += 1
+            return
+        interval = max(0.0, float(getattr(config, "LOBBY_EDIT_INTERVAL", 3.0)))
+        delay = max(0.0, lobby.last_edit + interval - asyncio.get_running_loop().time())
+        lobby.timer = game_timers.call_later(delay, self._edit, ref)
+
+    def discard(self, session: GameSession) -> None:
+        """Лобби закрыто (игра началась, завершилась или отменена): отложенная правка не нужна"""
+        ref = (session.game, session.key)
+        lobby = self._lobbies.get(ref)
+        if lobby is not None and lobby.session is session:
+            if lobby.timer is not None:
+                lobby.timer.cancel()
+            del self._lobbies[ref]
+
+    async def close(self, session: GameSession) -> None:
+        """Лобби закрыто перед итоговой правкой: снять отложенную и дождаться отправляемой правки"""
+        self.discard(session)
+        if session.get("message_id") is not None:
+            await edit_coalescer.close(session.get("chat_id", session.key), session["message_id"])
+
+    async def _edit(self, ref: Tuple[str, int]) -> None:
+        lobby = self._lobbies.get(ref)
+        if lobby is None:
+            return
+        session = lobby.session
+        lobby.timer = None
+        # Сессия уже завершена — правка больше не нужна
+        if session_manager.store(session.game).get(session.key) is not session:
+            del self._lobbies[ref]
+            return
+        lobby.last_edit = asyncio.get_running_loop().time()
+        caption, reply_markup = lobby.render(session)
+        self.edits += 1
+        # Тот же состав — та же подпись: склейщик правок её не отправит
+        await edit_coalescer.edit_caption(
+            session["bot"], session.get("chat_id", session.key), session["message_id"], caption, reply_markup
+        )
+
+
+# Глобальный экземпляр движка
+lobby_engine = LobbyEngine()
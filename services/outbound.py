@@ -0,0 +1,305 @@
+"""
+Планировщик исходящих запросов к Telegram
+Раньше отправки, правки и удаления уходили в Bot API сразу, без учёта лимитов
+Telegram (около 1 сообщения в секунду на чат, около 20 в минуту на группу и около
+30 в секунду на бота). При всплеске приходил TelegramRetryAfter, и его чаще всего
+молча глотал широкий except — сообщение терялось.
+Теперь все запросы проходят через request-middleware сессии бота:
+- token bucket на бота и на каждый чат (для групп — свой, более строгий);
+- полосы приоритета: результаты игр, затем уведомления, затем удаления, затем рассылки;
+- запрос, для которого нет токена, не отбрасывается, а ждёт своей очереди;
+- TelegramRetryAfter ставит чат (или весь бот) на паузу на retry_after секунд,
+  и запрос повторяется автоматически.
+Уведомления помечаются блоком with outbound_scheduler.lane(LANE_NOTIFY).
+"""
+
+import asyncio
+import contextvars
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Union
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessage, DeleteMessages, TelegramMethod
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета (меньше — раньше)
+LANE_GAME = 0
+LANE_NOTIFY = 1
+LANE_CLEANUP = 2
+LANE_BULK = 3  # рассылки: только то, что осталось от остального трафика
+LANES = (LANE_GAME, LANE_NOTIFY, LANE_CLEANUP, LANE_BULK)
+
+# Методы, которые расходуют лимиты чата: отправка, правка, пересылка
+_LIMITED_PREFIXES = ("Send", "Edit", "Copy", "Forward")
+
+_current_lane: contextvars.ContextVar[int] = contextvars.ContextVar("outbound_lane", default=LANE_GAME)
+
+ChatId = Union[int, str]
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity; пауза после RetryAfter"""
+
+    __slots__ = ("rate", "capacity", "tokens", "stamp", "paused_until")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.stamp = now
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.stamp:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def ready_at(self, now: float) -> float:
+        """Момент, когда будет доступен токен (<= now — уже доступен)"""
+        self._refill(now)
+        at = now if self.tokens >= 1.0 else now + (1.0 - self.tokens) / self.rate
+        return max(at, self.paused_until)
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1.0
+
+    def pause(self, until: float) -> None:
+        """Telegram попросил подождать: до until запросов нет, после — один токен и обычный темп"""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 1.0
+        self.stamp = max(self.stamp, until)
+
+    def idle(self, now: float) -> bool:
+        """Полный и без паузы — такой bucket можно забыть и создать заново"""
+        return self.paused_until <= now and self.ready_at(now) <= now and self.tokens >= self.capacity
+
+
+class _Waiter:
+    """Запрос, ожидающий токена"""
+
+    __slots__ = ("future", "chat_id")
+
+    def __init__(self, future: asyncio.Future, chat_id: Optional[ChatId]):
+        self.future = future
+        self.chat_id = chat_id
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Request-middleware сессии бота (bot.session.middleware(outbound_scheduler))
+    Очереди: полоса -> чат -> FIFO ожидающих. Чаты одной полосы обслуживаются по кругу,
+    поэтому чат, упёршийся в свой лимит, не задерживает остальные.
+    Раздачу токенов ведёт одна фоновая задача; когда очередей нет и токен есть,
+    запрос уходит сразу, без переключения на неё.
+    """
+
+    def __init__(self):
+        """Инициализация пустого планировщика"""
+        self._global: Optional[TokenBucket] = None
+        self._chats: Dict[ChatId, TokenBucket] = {}
+        self._queues: Dict[int, "OrderedDict[Optional[ChatId], Deque[_Waiter]]"] = {lane: OrderedDict() for lane in LANES}
+        self._waiting = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopped = False
+        # Статистика для /debug
+        self.sent = 0
+        self.delayed = 0
+        self.retry_after = 0
+
+    @property
+    def waiting(self) -> int:
+        """Сколько запросов ждёт токена"""
+        return self._waiting
+
+    @contextmanager
+    def lane(self, lane: int) -> Iterator[None]:
+        """Запросы внутри блока идут в указанной полосе (например, LANE_NOTIFY)"""
+        token = _current_lane.set(lane)
+        try:
+            yield
+        finally:
+            _current_lane.reset(token)
+
+    # ---------- лимиты ----------
+
+    def _global_bucket(self, now: float) -> TokenBucket:
+        if self._global is None:
+            rate = float(getattr(config, "OUTBOUND_GLOBAL_PER_SECOND", 30))
+            self._global = TokenBucket(rate, rate, now)
+        return self._global
+
+    def _chat_bucket(self, chat_id: ChatId, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 4096:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle(now)}
+            if isinstance(chat_id, int) and chat_id > 0:
+                rate = float(getattr(config, "OUTBOUND_CHAT_PER_SECOND", 1.0))
+                burst = float(getattr(config, "OUTBOUND_CHAT_BURST", 3))
+            else:
+                rate = float(getattr(config, "OUTBOUND_GROUP_PER_MINUTE", 20)) / 60.0
+                burst = float(getattr(config, "OUTBOUND_GROUP_BURST", 5))
+            bucket = self._chats[chat_id] = TokenBucket(rate, burst, now)
+        return bucket
+
+    @staticmethod
+    def _classify(method: TelegramMethod) -> Optional[tuple]:
+        """(полоса, чат для лимита или None) или None, если метод не лимитируется"""
+        if isinstance(method, (DeleteMessage, DeleteMessages)):
+            return LANE_CLEANUP, None
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not type(method).__name__.startswith(_LIMITED_PREFIXES):
+            return None
+        return _current_lane.get(), chat_id
+
+    def _ready_at(self, chat_id: Optional[ChatId], now: float) -> float:
+        at = self._global_bucket(now).ready_at(now)
+        if chat_id is not None:
+            at = max(at, self._chat_bucket(chat_id, now).ready_at(now))
+        return at
+
+    def _take(self, chat_id: Optional[ChatId], now: float) -> None:
+        self._global_bucket(now).take(now)
+        if chat_id is not None:
+            self._chat_bucket(chat_id, now).take(now)
+
+    # ---------- очередь ----------
+
+    async def _acquire(self, lane: int, chat_id: Optional[ChatId]) -> None:
+        """Дождаться токена: сразу, если очередей нет, иначе — через фоновую задачу"""
+        if self._stopped:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if not self._waiting and self._ready_at(chat_id, now) <= now:
+            self._take(chat_id, now)
+            return
+        waiter = _Waiter(loop.create_future(), chat_id)
+        self._queues[lane].setdefault(chat_id, deque()).append(waiter)
+        self._waiting += 1
+        self.delayed += 1
+        self._ensure_task()
+        self._wakeup.set()
+        await waiter.future
+
+    def _grant(self, now: float) -> Optional[float]:
+        """
+        Раздать токены ожидающим по приоритету полос
+
+        Returns:
+            Когда снова проверить очередь (None — очередь пуста)
+        """
+        next_at: Optional[float] = None
+        for lane in LANES:
+            queue = self._queues[lane]
+            for chat_id in list(queue):
+                waiters = queue[chat_id]
+                while waiters and waiters[0].future.done():
+                    # Обработчик отменён, пока ждал
+                    waiters.popleft()
+                    self._waiting -= 1
+                if not waiters:
+                    del queue[chat_id]
+                    continue
+                at = self._ready_at(chat_id, now)
+                if at > now:
+                    next_at = at if next_at is None else min(next_at, at)
+                    if self._global_bucket(now).ready_at(now) > now:
+                        # Общий лимит исчерпан — младшие полосы тем более ждут
+                        return next_at
+                    continue
+                self._take(chat_id, now)
+                waiter = waiters.popleft()
+                self._waiting -= 1
+                waiter.future.set_result(None)
+                if waiters:
+                    # Следующий запрос этого чата — после остальных чатов полосы
+                    queue.move_to_end(chat_id)
+                    next_at = now
+                else:
+                    del queue[chat_id]
+        return next_at
+
+    def _ensure_task(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """Единственная задача раздачи токенов: спит до ближайшего токена или нового запроса"""
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            next_at = self._grant(loop.time())
+            if next_at is not None and next_at <= loop.time():
+                await asyncio.sleep(0)
+                continue
+            timer = loop.call_at(next_at, self._wakeup.set) if next_at is not None else None
+            try:
+                await self._wakeup.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+    # ---------- middleware ----------
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot, method: TelegramMethod) -> Any:
+        route = self._classify(method)
+        if route is None:
+            return await make_request(bot, method)
+        lane, chat_id = route
+        max_retries = int(getattr(config, "OUTBOUND_MAX_RETRIES", 3))
+        max_wait = float(getattr(config, "OUTBOUND_MAX_RETRY_AFTER", 60))
+        attempt = 0
+        while True:
+            await self._acquire(lane, chat_id)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after += 1
+                attempt += 1
+                if attempt > max_retries or e.retry_after > max_wait:
+                    raise
+                now = asyncio.get_running_loop().time()
+                until = now + e.retry_after
+                if chat_id is not None:
+                    self._chat_bucket(chat_id, now).pause(until)
+                else:
+                    self._global_bucket(now).pause(until)
+                logger.warning(
+                    "RetryAfter %s с на %s (чат %s), повтор %s/%s",
+                    e.retry_after, type(method).__name__, chat_id, attempt, max_retries
+                )
+                continue
+            self.sent += 1
+            return response
+
+    async def stop(self):
+        """Остановка: ожидающие запросы уходят без лимита (бот завершается)"""
+        self._stopped = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        for queue in self._queues.values():
+            for waiters in queue.values():
+                for waiter in waiters:
+                    if not waiter.future.done():
+                        waiter.future.set_result(None)
+            queue.clear()
+        self._waiting = 0
+
+
+# Глобальный экземпляр планировщика
+outbound_scheduler = OutboundScheduler()
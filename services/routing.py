@@ -0,0 +1,246 @@
+"""
+Индексы маршрутизации апдейтов
+aiogram проверяет фильтры обработчиков по очереди (≈90 Command(...) на сообщение,
+≈35 префиксов на callback). Индексы строятся один раз при старте и сразу отдают
+обработчик: команды — по имени (включая /cmd@botname), callback'и — по префиксу
+схемы services/callbacks.py. Цена маршрутизации не зависит от числа игр.
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Dispatcher, Router
+from aiogram.dispatcher.event.bases import UNHANDLED, SkipHandler
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, Message
+
+from services.callbacks import CallbackPrefix, unpack
+
+logger = logging.getLogger(__name__)
+
+# Результат dispatch: маршрут не подошёл, событие нужно отдать обычному пути aiogram
+FALLBACK = object()
+
+
+class Route:
+    """Маршрут: обработчик, его роутер и готовая цепочка inner-middleware"""
+
+    __slots__ = ("router", "observer", "handler", "middlewares", "shadowing", "position")
+
+    def __init__(self, router: Router, observer: TelegramEventObserver,
+                 handler: HandlerObject, shadowing: Tuple[HandlerObject, ...], position: int):
+        self.router = router
+        self.observer = observer
+        self.handler = handler
+        # Inner-middleware всей цепочки роутеров (как в TelegramEventObserver.trigger)
+        self.middlewares = observer._resolve_middlewares()
+        # Неиндексируемые обработчики, стоящие раньше: aiogram проверил бы их первыми
+        self.shadowing = shadowing
+        # Место обработчика в порядке обхода aiogram (после SkipHandler — следующие)
+        self.position = position
+
+    async def call(self, event: Any, kwargs: Dict[str, Any]) -> Any:
+        """Обработчик внутри своих inner-middleware"""
+        wrapped = self.observer.outer_middleware.wrap_middlewares(self.middlewares, self.handler.call)
+        return await wrapped(event, kwargs)
+
+
+class _HandlerIndex(ABC):
+    """
+    Общая часть индексов: обход роутеров в порядке aiogram и прямой вызов обработчика
+    Подклассы задают тип события и ключи обработчика
+    """
+
+    event_name = ""
+
+    def __init__(self):
+        """Инициализация пустого индекса"""
+        self._routes: Dict[str, Route] = {}
+        self._chain: List[Route] = []  # все обработчики в порядке обхода aiogram
+        self._opaque: Tuple[HandlerObject, ...] = ()  # все неиндексируемые обработчики
+        self.enabled = False
+        # Статистика для /debug и бенчмарков
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def _handler_keys(self, handler: HandlerObject) -> Optional[Iterable[str]]:
+        """Ключи обработчика или None, если его нельзя проиндексировать"""
+
+    def build(self, dp: Dispatcher) -> None:
+        """
+        Построение индекса по всем роутерам диспетчера (в порядке обхода aiogram)
+        Вызывается после регистрации роутеров
+        """
+        self._routes.clear()
+        self._chain = []
+        shadowing: List[HandlerObject] = []
+        for router in dp.chain_tail:
+            observer = router.observers[self.event_name]
+            # Глобальные фильтры и outer-middleware вложенных роутеров индекс не повторяет
+            if observer._handler.filters or (router is not dp and len(observer.outer_middleware)):
+                logger.warning(
+                    "Индекс %s отключён: у роутера %s есть root-фильтры или outer-middleware",
+                    self.event_name, router.name
+                )
+                self.enabled = False
+                self._routes.clear()
+                self._chain = []
+                return
+            for handler in observer.handlers:
+                keys = self._handler_keys(handler)
+                route = Route(router, observer, handler, tuple(shadowing), len(self._chain))
+                self._chain.append(route)
+                if keys is None:
+                    shadowing.append(handler)
+                    continue
+                for key in keys:
+                    if key not in self._routes:
+                        self._routes[key] = route
+        self._opaque = tuple(shadowing)
+        self.enabled = True
+        logger.info("Индекс %s построен: %s ключей", self.event_name, len(self._routes))
+
+    async def dispatch(self, route: Route, event: Any, data: Dict[str, Any]) -> Any:
+        """
+        Вызов обработчика напрямую, минуя линейный перебор фильтров
+        Возвращает FALLBACK, если нужно идти обычным путём aiogram
+        """
+        for handler in route.shadowing:
+            matched, _ = await handler.check(event, **data)
+            if matched:
+                return FALLBACK
+        kwargs = dict(data)
+        kwargs["event_router"] = route.router
+        kwargs["handler"] = route.handler
+        # Фильтры самого обработчика (Command даёт CommandObject, CallbackPrefix — payload)
+        matched, kwargs = await route.handler.check(event, **kwargs)
+        if not matched:
+            return FALLBACK
+        try:
+            return await route.call(event, kwargs)
+        except SkipHandler:
+            pass
+        # Как aiogram: следующие по порядку обработчики, без повторного запуска уже
+        # отработавшего обработчика и его inner-middleware
+        for candidate in self._chain[route.position + 1:]:
+            kwargs = dict(data)
+            kwargs["event_router"] = candidate.router
+            kwargs["handler"] = candidate.handler
+            matched, kwargs = await candidate.handler.check(event, **kwargs)
+            if not matched:
+                continue
+            try:
+                return await candidate.call(event, kwargs)
+            except SkipHandler:
+                continue
+        return UNHANDLED
+
+    async def is_unroutable(self, event: Any, data: Dict[str, Any]) -> bool:
+        """
+        Ключа нет в индексе: событие могут поймать только неиндексируемые обработчики.
+        Если ни один из них не подходит — перебирать остальные фильтры бессмысленно.
+        """
+        for handler in self._opaque:
+            matched, _ = await handler.check(event, **data)
+            if matched:
+                return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+
+class CommandIndex(_HandlerIndex):
+    """
+    Индекс: нормализованное имя команды -> Route
+    Индексируются только обработчики, у которых первый фильтр — Command со строковыми
+    командами и префиксом «/»; всё остальное идёт обычным путём aiogram.
+    """
+
+    event_name = "message"
+
+    def __init__(self):
+        super().__init__()
+        self._bot_username: Optional[str] = None
+
+    def _handler_keys(self, handler: HandlerObject) -> Optional[Iterable[str]]:
+        if not handler.filters:
+            return None
+        flt = handler.filters[0].callback
+        if not isinstance(flt, Command):
+            return None
+        if flt.ignore_case or tuple(flt.prefix) != ("/",) or flt.magic is not None:
+            return None
+        if not all(isinstance(c, str) for c in flt.commands):
+            return None
+        return list(flt.commands)
+
+    def build(self, dp: Dispatcher) -> None:
+        super().build(dp)
+        self._add_mention_aliases()
+
+    def set_bot_username(self, username: Optional[str]) -> None:
+        """Username бота для вариантов /cmd@botname (известен после get_me)"""
+        self._bot_username = username.lower() if username else None
+        self._add_mention_aliases()
+
+    def _add_mention_aliases(self) -> None:
+        if not self._bot_username:
+            return
+        suffix = "@" + self._bot_username
+        for name in [n for n in self._routes if "@" not in n]:
+            self._routes[name + suffix] = self._routes[name]
+
+    def resolve(self, message: Message) -> Optional[Route]:
+        """Поиск маршрута по первому слову сообщения (O(1))"""
+        text = message.text or message.caption
+        if not text or text[0] != "/":
+            return None
+        key = text.split(maxsplit=1)[0][1:]
+        if "@" in key:
+            name, mention = key.split("@", 1)
+            key = f"{name}@{mention.lower()}"
+        return self._routes.get(key)
+
+    def is_command(self, message: Message) -> bool:
+        """Сообщение — команда, которую индекс может однозначно оценить (с учётом @botname)"""
+        text = message.text or message.caption
+        if not text or text[0] != "/":
+            return False
+        token = text.split(maxsplit=1)[0]
+        if "@" not in token:
+            return True
+        # /cmd@other_bot: Command-фильтры отклонят его, но только если мы знаем свой username
+        return self._bot_username is not None
+
+
+class CallbackIndex(_HandlerIndex):
+    """
+    Индекс: префикс callback_data -> Route
+    Индексируются обработчики с фильтром CallbackPrefix первым
+    """
+
+    event_name = "callback_query"
+
+    def _handler_keys(self, handler: HandlerObject) -> Optional[Iterable[str]]:
+        if not handler.filters:
+            return None
+        flt = handler.filters[0].callback
+        if not isinstance(flt, CallbackPrefix):
+            return None
+        return flt.prefixes
+
+    def resolve(self, callback: CallbackQuery, data: Dict[str, Any]) -> Optional[Route]:
+        """Разбор callback_data (один раз, в data["callback_payload"]) и поиск маршрута (O(1))"""
+        payload = unpack(callback.data)
+        data["callback_payload"] = payload
+        return self._routes.get(payload.prefix)
+
+
+# Глобальные экземпляры индексов
+command_index = CommandIndex()
+callback_index = CallbackIndex()
@@ -0,0 +1,147 @@
+"""
+Общая основа планировщиков на min-куче (автоудаление сообщений, таймауты игр)
+Все отложенные действия лежат в одной куче (время, порядковый номер, handle), её
+обслуживает одна фоновая задача, которая спит до ближайшего срока. Отмена — O(1):
+запись помечается неактивной и пропускается при срабатывании; когда таких больше
+половины, куча перестраивается. Что делать с наступившими записями, решает подкласс.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Coroutine, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledHandle:
+    """Запланированное действие: срок (по loop.time()) и флаг «ещё ждёт»"""
+
+    __slots__ = ("when", "active")
+
+    def __init__(self, when: float):
+        self.when = when
+        self.active = True
+
+
+class HeapScheduler(ABC):
+    """
+    Min-куча + одна задача-обработчик
+    Подкласс задаёт _on_due() — что делать с записями, срок которых пришёл, — и при
+    необходимости _wake_delay(): насколько позже срока просыпаться (чтобы забрать соседей).
+    """
+
+    # Для логов запуска и остановки
+    label = "Планировщик"
+
+    def __init__(self):
+        """Инициализация пустого планировщика"""
+        self._heap: List[Tuple[float, int, ScheduledHandle]] = []
+        self._seq = itertools.count()
+        self._pending = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running: Set[asyncio.Task] = set()  # задачи сработавших записей, которые выполняются сейчас
+
+    @property
+    def pending(self) -> int:
+        """Сколько записей ждёт своего времени"""
+        return self._pending
+
+    def _push(self, handle: ScheduledHandle) -> ScheduledHandle:
+        """Положить запись в кучу и разбудить задачу, если она стала ближайшей"""
+        heapq.heappush(self._heap, (handle.when, next(self._seq), handle))
+        self._pending += 1
+        self._ensure_task()
+        # Новая запись раньше текущей ближайшей — будим задачу, чтобы пересчитать таймер
+        if self._heap[0][2] is handle and self._wakeup is not None:
+            self._wakeup.set()
+        return handle
+
+    def cancel(self, handle: ScheduledHandle) -> bool:
+        """
+        Отмена записи (из кучи она уберётся лениво)
+
+        Returns:
+            False, если запись уже сработала или отменена
+        """
+        if not handle.active:
+            return False
+        handle.active = False
+        self._pending -= 1
+        if len(self._heap) > 64 and self._pending < len(self._heap) // 2:
+            self._heap = [entry for entry in self._heap if entry[2].active]
+            heapq.heapify(self._heap)
+        return True
+
+    def _pop_due(self, now: float) -> List[ScheduledHandle]:
+        """Вынуть из кучи все записи, время которых пришло"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, handle = heapq.heappop(self._heap)
+            if not handle.active:
+                continue
+            handle.active = False
+            self._pending -= 1
+            due.append(handle)
+        return due
+
+    @abstractmethod
+    def _on_due(self, due: List[ScheduledHandle]) -> None:
+        """Записи, срок которых пришёл (не пусто); работу запускать через _spawn()"""
+
+    def _wake_delay(self) -> float:
+        """На сколько секунд позже ближайшего срока просыпаться"""
+        return 0.0
+
+    def _spawn(self, coro: Coroutine[Any, Any, Any]) -> None:
+        """Выполнить coro отдельной задачей: медленное действие не задерживает кучу"""
+        task = asyncio.create_task(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    def _ensure_task(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """Единственная задача планировщика: спит до ближайшего срока"""
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            due = self._pop_due(loop.time())
+            if due:
+                self._on_due(due)
+            timer = loop.call_at(self._heap[0][0] + self._wake_delay(), self._wakeup.set) if self._heap else None
+            try:
+                await self._wakeup.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+    async def start(self):
+        """
+        Запуск задачи планировщика
+        Вызывается при старте бота (постановка записи тоже запускает её при необходимости)
+        """
+        self._ensure_task()
+        logger.info("%s запущен", self.label)
+
+    async def stop(self):
+        """Остановка планировщика; несработавшие записи отбрасываются"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._pending:
+            logger.info("%s остановлен, не сработало: %s", self.label, self._pending)
+        for _, _, handle in self._heap:
+            handle.active = False
+        self._heap.clear()
+        self._pending = 0
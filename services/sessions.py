@@ -0,0 +1,452 @@
+"""
+Менеджер игровых сессий
+Раньше каждая игра держала свой словарь в handlers/games.py, а команды проверяли
+их по очереди. Теперь все сессии живут в одном менеджере:
+- GameSession — запись сессии: состояние игры как в словаре + служебные поля в __slots__;
+- SessionStore — хранилище одной игры с интерфейсом словаря (key -> GameSession);
+- O(1) «во что сейчас играет пользователь» по всем играм сразу;
+- TTL: зависшие сессии удаляются сами, списанная ставка при этом возвращается;
+- per-session asyncio.Lock: двойной клик по кнопке обрабатывается последовательно;
+- таймаут сессии — запись в общем планировщике (services/timers.py), которая
+  отменяется сама, когда сессия завершается или заменяется;
+- сессии игр со ставкой пишутся в журнал (services/journal.py): после перезапуска
+  игра продолжается или ставка возвращается.
+"""
+
+import asyncio
+import functools
+import logging
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from aiogram import Bot
+
+from config import config
+from services.journal import session_journal
+from services.timers import TimerHandle, game_timers
+
+logger = logging.getLogger(__name__)
+
+
+class GameSession(dict):
+    """
+    Сессия игры: поля состояния — ключи словаря (как раньше), служебные — в __slots__
+    Создаётся в обработчике игры и кладётся в SessionStore, который заполняет служебные поля.
+    """
+
+    __slots__ = ("game", "key", "owner_id", "created_at", "deadline", "_lock", "_timer")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.game: Optional[str] = None
+        self.key: Optional[int] = None
+        self.owner_id: Optional[int] = None
+        self.created_at = time.time()
+        self.deadline = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._timer: Optional[TimerHandle] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """Замок сессии (создаётся при первом обращении)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def set_timeout(self, seconds: float, callback: Callable[..., Awaitable[Any]], *args: Any) -> TimerHandle:
+        """Таймаут сессии: await callback(*args) через seconds секунд (прежний таймаут отменяется)"""
+        self.cancel_timeout()
+        self._timer = game_timers.call_later(seconds, callback, *args)
+        return self._timer
+
+    def cancel_timeout(self) -> None:
+        """Отменить таймаут (O(1)); вызывается и автоматически при удалении сессии из хранилища"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def expired(self, now: float = None) -> bool:
+        return self.deadline > 0 and (now if now is not None else time.time()) >= self.deadline
+
+    def __repr__(self) -> str:
+        return f"GameSession({self.game!r}, key={self.key!r}, {dict.__repr__(self)})"
+
+
+# Ставка сессии: имя поля со ставкой владельца или функция state -> [(user_id, сумма), ...]
+StakeSpec = Union[str, Callable[[Dict[str, Any]], List[Tuple[int, int]]]]
+# Продолжение игры после перезапуска: (bot, key, state) -> True, если сессия восстановлена
+Resumer = Callable[[Bot, int, Dict[str, Any]], Awaitable[bool]]
+
+
+class SessionStore:
+    """
+    Сессии одной игры: user_id (или chat_id для групповых игр) -> GameSession
+    Поддерживает операции словаря, которыми пользуются обработчики игр.
+    """
+
+    def __init__(self, manager: "SessionManager", game: str, owner_field: Optional[str], ttl: int,
+                 stake: Optional[StakeSpec] = None):
+        self._manager = manager
+        self._sessions: Dict[int, GameSession] = {}
+        self.game = game
+        self.owner_field = owner_field  # None — владелец = ключ; иначе поле сессии (creator_id)
+        self.ttl = ttl
+        self.stake = stake  # None — денег в сессии нет, журнал не нужен
+        self.resumer: Optional[Resumer] = None
+
+    def on_resume(self, resumer: Resumer) -> Resumer:
+        """Обработчик продолжения игры после перезапуска (без него ставка возвращается)"""
+        self.resumer = resumer
+        return resumer
+
+    def refunds(self, owner_id: Optional[int], state: Dict[str, Any]) -> List[Tuple[int, int]]:
+        """Кому и сколько вернуть, если сессию нельзя продолжить"""
+        if self.stake is None:
+            return []
+        if callable(self.stake):
+            return [(int(uid), int(amount)) for uid, amount in self.stake(state) if amount > 0]
+        amount = int(state.get(self.stake) or 0)
+        return [(owner_id, amount)] if owner_id is not None and amount > 0 else []
+
+    def save(self, key: int) -> None:
+        """Записать в журнал изменившееся состояние сессии (например, новый участник)"""
+        session = self._sessions.get(key)
+        if session is not None and self.stake is not None:
+            session_journal.put(session)
+
+    def _alive(self, key: int) -> Optional[GameSession]:
+        session = self._sessions.get(key)
+        if session is not None and session.expired():
+            self._expire(key, session)
+            return None
+        return session
+
+    def _expire(self, key: int, session: GameSession) -> None:
+        logger.warning(
+            "Сессия %s (key=%s) удалена по TTL %s сек", self.game, key, self.ttl
+        )
+        if self.stake is None:
+            self._remove(key)
+            return
+        # Ставка списана: запись остаётся в журнале, пока деньги не вернутся —
+        # если бот упадёт раньше, возврат сделает recover() при старте
+        self._remove(key, drop=False)
+        try:
+            task = asyncio.get_running_loop().create_task(self._refund_expired(key, session))
+        except RuntimeError:
+            logger.error("Ставка %s (key=%s) не возвращена: нет event loop, вернётся при перезапуске", self.game, key)
+            return
+        self._manager._refunding.add(task)
+        task.add_done_callback(self._manager._refunding.discard)
+
+    async def _refund_expired(self, key: int, session: GameSession) -> None:
+        """Вернуть ставки сессии, удалённой по TTL; невыплаченный остаток остаётся долгом в журнале"""
+        left = await self._manager._pay_refunds(
+            self.game, key, self.refunds(session.owner_id, session),
+            "/timeout", f"Возврат ставки {self.game}: сессия истекла"
+        )
+        if left:
+            session_journal.owe(session_journal.record(session), left)
+        session_journal.drop(session)
+
+    def _remove(self, key: int, drop: bool = True) -> Optional[GameSession]:
+        session = self._sessions.pop(key, None)
+        if session is not None:
+            session.cancel_timeout()
+            self._manager._unindex(session)
+            if drop and self.stake is not None:
+                session_journal.drop(session)
+        return session
+
+    def __contains__(self, key: int) -> bool:
+        return self._alive(key) is not None
+
+    def __getitem__(self, key: int) -> GameSession:
+        session = self._alive(key)
+        if session is None:
+            raise KeyError(key)
+        return session
+
+    def get(self, key: int, default: Any = None) -> Any:
+        session = self._alive(key)
+        return session if session is not None else default
+
+    def __setitem__(self, key: int, session: GameSession) -> None:
+        if not isinstance(session, GameSession):
+            raise TypeError(f"{self.game}: сессия должна быть GameSession, а не {type(session).__name__}")
+        previous = self._sessions.get(key)
+        replaced = previous is not None and previous is not session
+        if replaced:
+            previous.cancel_timeout()
+            self._manager._unindex(previous)
+        session.game = self.game
+        session.key = key
+        session.owner_id = session.get(self.owner_field) if self.owner_field else key
+        session.deadline = time.time() + self.ttl if self.ttl > 0 else 0.0
+        self._sessions[key] = session
+        self._manager._index(session)
+        if self.stake is not None:
+            if replaced:
+                session_journal.replace(previous, session)
+            else:
+                session_journal.put(session)
+        self._manager._maybe_sweep()
+
+    def __delitem__(self, key: int) -> None:
+        if self._remove(key) is None:
+            raise KeyError(key)
+
+    _MISSING = object()
+
+    def pop(self, key: int, default: Any = _MISSING) -> Any:
+        session = self._alive(key)
+        if session is None:
+            if default is self._MISSING:
+                raise KeyError(key)
+            return default
+        return self._remove(key)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._sessions))
+
+    def keys(self) -> List[int]:
+        return list(self._sessions)
+
+    def values(self) -> List[GameSession]:
+        return list(self._sessions.values())
+
+    def items(self) -> List[Tuple[int, GameSession]]:
+        return list(self._sessions.items())
+
+    def sweep(self, now: float) -> int:
+        """Удалить сессии с истёкшим TTL"""
+        expired = [(k, s) for k, s in self._sessions.items() if s.expired(now)]
+        for key, session in expired:
+            self._expire(key, session)
+        return len(expired)
+
+    def memory_bytes(self) -> int:
+        """Приблизительный объём памяти сессий (запись + значения первого уровня)"""
+        total = sys.getsizeof(self._sessions)
+        for session in self._sessions.values():
+            total += sys.getsizeof(session)
+            total += sum(sys.getsizeof(v) for v in session.values())
+        return total
+
+
+class SessionManager:
+    """Реестр хранилищ сессий всех игр + индекс владелец -> активные игры"""
+
+    SWEEP_INTERVAL = 60  # секунды между проходами по TTL
+
+    def __init__(self):
+        """Инициализация пустого менеджера"""
+        self._stores: Dict[str, SessionStore] = {}
+        self._by_owner: Dict[int, Set[Tuple[str, int]]] = {}
+        self._last_sweep = time.time()
+        self._refunding: Set[asyncio.Task] = set()  # возвраты ставок истёкших сессий
+
+    def store(self, game: str, owner_field: Optional[str] = None, ttl: Optional[int] = None,
+              stake: Optional[StakeSpec] = None) -> SessionStore:
+        """
+        Хранилище сессий игры (создаётся один раз при импорте модуля игр)
+
+        Args:
+            game: Имя игры (kripta, almaz, rulet...)
+            owner_field: Поле сессии с владельцем, если ключ — не user_id (групповые игры по chat_id)
+            ttl: Время жизни сессии в секундах (по умолчанию GAME_SESSION_TTL)
+            stake: Списанная ставка — поле сессии или функция state -> [(user_id, сумма)];
+                   сессии со ставкой пишутся в журнал и переживают перезапуск
+        """
+        if game not in self._stores:
+            if ttl is None:
+                ttl = getattr(config, "GAME_SESSION_TTL", 3600)
+            self._stores[game] = SessionStore(self, game, owner_field, ttl, stake)
+        return self._stores[game]
+
+    def _index(self, session: GameSession) -> None:
+        if session.owner_id is not None:
+            self._by_owner.setdefault(session.owner_id, set()).add((session.game, session.key))
+
+    def _unindex(self, session: GameSession) -> None:
+        games = self._by_owner.get(session.owner_id)
+        if games is not None:
+            games.discard((session.game, session.key))
+            if not games:
+                del self._by_owner[session.owner_id]
+
+    def _maybe_sweep(self) -> None:
+        now = time.time()
+        if now - self._last_sweep < self.SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for store in self._stores.values():
+            store.sweep(now)
+        if session_journal.owed() and not self._refunding:
+            try:
+                task = asyncio.get_running_loop().create_task(self.settle_owed())
+            except RuntimeError:
+                return
+            self._refunding.add(task)
+            task.add_done_callback(self._refunding.discard)
+
+    def active_games(self, user_id: int) -> List[str]:
+        """Игры, в которых у пользователя есть активная сессия (O(1) по числу игр)"""
+        entries = self._by_owner.get(user_id)
+        if not entries:
+            return []
+        return [game for game, key in list(entries) if key in self._stores[game]]
+
+    def has_active_game(self, user_id: int) -> bool:
+        return bool(self.active_games(user_id))
+
+    async def recover(self, bot: Bot) -> Dict[str, int]:
+        """
+        Восстановление сессий из журнала после перезапуска (вызывается при старте до polling)
+        Игра с обработчиком on_resume продолжается; остальным участникам возвращается
+        ставка, сообщение игры удаляется, в чат приходит короткое уведомление.
+
+        Returns:
+            {"resumed": ..., "refunded": ..., "coins": ...}
+        """
+        from utils import delete_message_later_by_id
+
+        result = {"resumed": 0, "refunded": 0, "coins": 0}
+        records = session_journal.load()
+        for (game, key), record in records.items():
+            store = self._stores.get(game)
+            state = record.get("s") or {}
+            if store is None:
+                logger.warning("Сессия %s (key=%s) из журнала: игра не загружена, оставлена до следующего старта", game, key)
+                session_journal.keep(record)
+                continue
+            try:
+                if store.resumer is not None and await store.resumer(bot, key, state):
+                    result["resumed"] += 1
+                    continue
+                refunds = store.refunds(record.get("owner"), state)
+                left = await self._pay_refunds(game, key, refunds, "/restart", f"Возврат ставки {game}: бот перезапущен")
+                if left:
+                    session_journal.owe(record, left)
+                total = sum(amount for _, amount in refunds) - sum(amount for _, amount in left)
+                result["refunded"] += 1
+                result["coins"] += total
+            except Exception as e:
+                logger.error("Не удалось восстановить сессию %s (key=%s): %s", game, key, e, exc_info=True)
+                session_journal.keep(record)
+                continue
+            chat_id = state.get("chat_id") or (key if store.owner_field else None)
+            message_id = state.get("message_id")
+            if not chat_id:
+                continue
+            try:
+                if message_id:
+                    await bot.delete_message(chat_id=chat_id, message_id=message_id)
+            except Exception:
+                pass
+            if total:
+                try:
+                    notice = await bot.send_message(
+                        chat_id,
+                        f"♻️ Бот перезапускался — игра /{state.get('slug', game)} прервана, ставки возвращены ({total} коинов)."
+                    )
+                    delete_message_later_by_id(bot, chat_id, notice.message_id, config.MESSAGE_DELETE_TIMEOUT)
+                except Exception as e:
+                    logger.debug("Уведомление о возврате ставки в чат %s: %s", chat_id, e)
+        # Долги по возвратам с прошлых запусков
+        result["coins"] += await self.settle_owed()
+        # Журнал начинается заново: в снапшоте только продолженные игры и невыплаченные возвраты
+        await session_journal.snapshot()
+        if records:
+            logger.info(
+                "Сессии из журнала: продолжено %s, возвращено ставок %s (%s коинов)",
+                result["resumed"], result["refunded"], result["coins"]
+            )
+        return result
+
+    async def _pay_refunds(
+        self, game: str, key: int, refunds: List[Tuple[int, int]], command_source: str, comment: str
+    ) -> List[Tuple[int, int]]:
+        """
+        Вернуть ставки по списку [(user_id, сумма)]
+
+        Returns:
+            Невыплаченный остаток (ошибка одного возврата не отменяет остальные)
+        """
+        from services.balance import balance_service
+
+        left = []
+        for user_id, amount in refunds:
+            try:
+                success, _, _ = await balance_service.add_balance(
+                    user_id=user_id, amount=amount, command_source=command_source, comment=comment
+                )
+            except Exception as e:
+                logger.error("Возврат ставки %s (key=%s) пользователю %s: %s", game, key, user_id, e, exc_info=True)
+                success = False
+            if not success:
+                logger.error("Ставка %s за %s (key=%s) не возвращена пользователю %s", amount, game, key, user_id)
+                left.append((user_id, amount))
+        return left
+
+    async def settle_owed(self) -> int:
+        """
+        Повторить невыплаченные возвраты из журнала (при старте и на проходе TTL)
+
+        Returns:
+            Сколько коинов выплачено
+        """
+        paid = 0
+        for record in session_journal.owed():
+            left = [(int(uid), int(amount)) for uid, amount in record.get("left") or []]
+            still = await self._pay_refunds(
+                record["game"], record["key"], left, "/restart", f"Возврат ставки {record['game']}: повтор"
+            )
+            paid += sum(amount for _, amount in left) - sum(amount for _, amount in still)
+            if still:
+                session_journal.owe(record, still)
+            else:
+                session_journal.paid(record["id"])
+        return paid
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Для /debug: {игра: {count, bytes}}"""
+        return {
+            game: {"count": len(store), "bytes": store.memory_bytes()}
+            for game, store in self._stores.items()
+        }
+
+
+def session_locked(store: SessionStore, key_index: Optional[int] = 0):
+    """
+    Декоратор callback-обработчика: вызовы по одной сессии выполняются по очереди
+    (двойной клик не спишет/начислит дважды). Ключ сессии — аргумент payload с номером
+    key_index, либо id нажавшего, если key_index=None.
+    """
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        async def wrapper(callback, *args, **kwargs):
+            if key_index is None:
+                key = callback.from_user.id
+            else:
+                payload = kwargs.get("payload") or (args[0] if args else None)
+                key = payload.get_int(key_index) if payload is not None else None
+            session = store.get(key) if key is not None else None
+            while session is not None:
+                async with session.lock:
+                    current = store.get(key)
+                    # Пока ждали блокировку, сессию заменили новой — ждём уже её блокировку
+                    if current is session or current is None:
+                        return await func(callback, *args, **kwargs)
+                session = current
+            return await func(callback, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Глобальный экземпляр менеджера
+session_manager = SessionManager()
@@ -0,0 +1,90 @@
+"""
+Сервис налога Технолога
+Состояние налога целиком определяется временем последнего налога и балансом,
+поэтому держим его в памяти (подгрузка из tax_states один раз на пользователя)
+и вычисляем «пора ли платить» на лету. В БД пишем только когда налог
+реально выставлен, оплачен или таймер сброшен.
+"""
+
+import logging
+import time
+from typing import Any, Dict
+
+from config import config
+from db import db
+
+logger = logging.getLogger(__name__)
+
+
+class TaxService:
+    """
+    Кэш состояний налога: user_id -> {last_tax_time, tax_due, is_paid}
+    """
+
+    def __init__(self):
+        """Инициализация сервиса налога"""
+        self._states: Dict[int, Dict[str, Any]] = {}
+
+    @property
+    def interval_seconds(self) -> int:
+        """Интервал налога в секундах"""
+        return int(config.TAX_INTERVAL_HOURS * 3600)
+
+    async def get_state(self, user_id: int) -> Dict[str, Any]:
+        """
+        Состояние налога пользователя (из кэша, при первом обращении — из БД)
+
+        Returns:
+            Словарь {last_tax_time, tax_due, is_paid}
+        """
+        state = self._states.get(user_id)
+        if state is None:
+            state = await db.get_tax_state(user_id)
+            self._states[user_id] = state
+        return state
+
+    def is_due(self, state: Dict[str, Any], now: int = None) -> bool:
+        """Чистое вычисление: налог оплачен, но интервал уже прошёл — пора выставлять новый"""
+        if state["last_tax_time"] is None or not state["is_paid"]:
+            return False
+        now = now if now is not None else int(time.time())
+        return now - state["last_tax_time"] >= self.interval_seconds
+
+    async def init_timer(self, user_id: int) -> None:
+        """Старт таймера налога при первом заходе (не блокировать команды)"""
+        await db.init_tax_timer(user_id)
+        self._states[user_id] = {"last_tax_time": int(time.time()), "tax_due": 0, "is_paid": True}
+
+    async def set_due(self, user_id: int, tax_amount: int) -> None:
+        """Выставить налог к оплате"""
+        await db.set_tax_due(user_id, tax_amount)
+        self._states[user_id] = {"last_tax_time": int(time.time()), "tax_due": tax_amount, "is_paid": False}
+
+    async def pay(self, user_id: int) -> None:
+        """Отметить налог оплаченным (или снятым при нулевом балансе)"""
+        await db.pay_tax(user_id)
+        state = self._states.get(user_id)
+        if state is not None:
+            state["tax_due"] = 0
+            state["is_paid"] = True
+
+    async def charge_if_due(self, user_id: int) -> Dict[str, Any]:
+        """
+        Выставление налога, если подошёл срок (1/4 баланса раз в TAX_INTERVAL_HOURS)
+        При нулевом балансе налог не выставляется
+
+        Returns:
+            Актуальное состояние налога
+        """
+        balance = await db.get_balance(user_id)
+        if balance == 0:
+            # Баланс = 0, налог не требуется; состояние и так «оплачено» — писать в БД нечего
+            return await self.get_state(user_id)
+        tax_amount = int(balance * config.TAX_PERCENTAGE)
+        logger.info(f"Налог Технолог установлен: user_id={user_id}, сумма={tax_amount}, баланс={balance}")
+        await self.set_due(user_id, tax_amount)
+        return self._states[user_id]
+
+
+# Глобальный экземпляр сервиса
+tax_service = TaxService()
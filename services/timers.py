@@ -0,0 +1,83 @@
+"""
+Планировщик таймаутов игр
+Раньше каждая игра запускала задачу, которая спала до GAME_MAX_DURATION_SEC и
+продолжала спать, даже если игру уже забрали. Теперь дедлайны лежат в одной
+min-куче, а завершение игры отменяет свой дедлайн за O(1) (запись помечается
+неактивной и выбрасывается из кучи лениво). Корутина таймаута создаётся только
+когда дедлайн действительно наступил.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Tuple
+
+from services.scheduler import HeapScheduler, ScheduledHandle
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle(ScheduledHandle):
+    """Запланированный таймаут; cancel() отменяет его (игра завершилась раньше)"""
+
+    __slots__ = ("callback", "args")
+
+    def __init__(self, when: float, callback: Callable[..., Awaitable[Any]], args: Tuple[Any, ...]):
+        super().__init__(when)
+        self.callback = callback
+        self.args = args
+
+    def cancel(self) -> bool:
+        """Отменить таймаут. Returns: False, если он уже сработал или отменён"""
+        return game_timers.cancel(self)
+
+
+class TimerScheduler(HeapScheduler):
+    """Планировщик на общей куче (services/scheduler.py): сработавший таймаут вызывает корутину игры"""
+
+    label = "Планировщик таймаутов игр"
+
+    def __init__(self):
+        """Инициализация пустого планировщика"""
+        super().__init__()
+        # Статистика для /debug
+        self.fired = 0
+        self.cancelled = 0
+
+    @property
+    def live(self) -> int:
+        """Сколько таймаутов ждёт своего времени"""
+        return self.pending
+
+    def call_later(self, seconds: float, callback: Callable[..., Awaitable[Any]], *args: Any) -> TimerHandle:
+        """
+        Вызвать await callback(*args) через seconds секунд
+
+        Returns:
+            TimerHandle для отмены
+        """
+        loop = asyncio.get_running_loop()
+        return self._push(TimerHandle(loop.time() + max(0.0, seconds), callback, args))
+
+    def cancel(self, handle: TimerHandle) -> bool:
+        """Отмена таймаута (запись уберётся из кучи лениво)"""
+        if not super().cancel(handle):
+            return False
+        handle.args = ()  # не держим сессию/бота до ленивой очистки
+        self.cancelled += 1
+        return True
+
+    def _on_due(self, due: List[TimerHandle]) -> None:
+        # Каждый таймаут — своей задачей: долгий расчёт одной игры не задерживает другие
+        for handle in due:
+            self.fired += 1
+            self._spawn(self._fire(handle))
+
+    async def _fire(self, handle: TimerHandle) -> None:
+        try:
+            await handle.callback(*handle.args)
+        except Exception as e:
+            logger.error("Ошибка таймаута %s: %s", getattr(handle.callback, "__name__", handle.callback), e, exc_info=True)
+
+
+# Глобальный экземпляр планировщика
+game_timers = TimerScheduler()
@@ -0,0 +1,283 @@
+"""
+Очередь входящих обновлений
+Раньше в режиме webhook каждое обновление становилось отдельной задачей без всякого
+ограничения: при всплеске (или когда Bot API отвечает медленно и обработчики висят
+на ожидании лимитов) задачи копились без предела, а два нажатия одного пользователя
+обрабатывались одновременно и гонялись друг с другом.
+Теперь webhook подтверждает обновление сразу и кладёт его в ограниченную очередь:
+- у каждого пользователя своя очередь: его обновления идут строго по порядку;
+- обработчик очереди пользователя существует, пока в ней есть обновления, — долгий
+  обработчик (ожидание лимита группы, пауза в /random) задерживает только его самого;
+- одновременно обрабатывается не больше UPDATE_CONCURRENCY обновлений;
+- в очереди не больше UPDATE_QUEUE_SIZE обновлений: когда она полна, webhook
+  отвечает Telegram 429 с Retry-After, и Telegram доставит обновление позже.
+В режиме polling обновления попадают в ту же очередь через QueuedDispatcher — ещё до
+middleware диспетчера: цикл getUpdates только раскладывает их по очередям, а при полной
+очереди ждёт места — непрочитанные обновления остаются у Telegram. Обработчик очереди
+выполняет полный feed_update: состояние FSM читается перед обработкой, а ошибки
+доходят до @dp.error(), как при обработке без очереди.
+Лобби групповых игр упорядочиваются по чату, а не по пользователю: вступления
+разных игроков в одно лобби идут по очереди.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, Message, Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from config import config
+from services.dedup import update_dedup
+
+logger = logging.getLogger(__name__)
+
+# Обработка одного обновления
+UpdateJob = Callable[[], Awaitable[Any]]
+
+# Лобби групповых игр: их команды и кнопки упорядочиваются по чату
+CHAT_ORDERED_COMMANDS = frozenset({"rulet", "frekaz"})
+CHAT_ORDERED_CALLBACKS = frozenset({"rulet_join", "rulet_cancel", "frekaz_join", "frekaz_cancel"})
+
+def _chat_ordered(event: Any) -> bool:
+    """Команда или кнопка лобби групповой игры"""
+    if isinstance(event, CallbackQuery):
+        prefix = (event.data or "").split("|", 1)[0]
+        return prefix in CHAT_ORDERED_CALLBACKS and event.message is not None
+    if isinstance(event, Message) and event.text and event.text.startswith("/"):
+        command = event.text[1:].split(maxsplit=1)[0].split("@", 1)[0].lower() if len(event.text) > 1 else ""
+        return command in CHAT_ORDERED_COMMANDS
+    return False
+
+
+def update_key(update: Update) -> int:
+    """
+    Ключ порядка: чат — для лобби групповых игр, иначе пользователь,
+    от которого пришло обновление (иначе чат, иначе само обновление)
+    """
+    event = update.event
+    if _chat_ordered(event):
+        message = event.message if isinstance(event, CallbackQuery) else event
+        return message.chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+
+class UpdateQueue:
+    """
+    Ограниченная очередь обновлений: своя очередь (FIFO) у каждого ключа и свой обработчик,
+    пока у ключа есть обновления; одновременно обрабатывается не больше UPDATE_CONCURRENCY
+    """
+
+    def __init__(self):
+        """Инициализация (приём обновлений включается в start)"""
+        self._keys: Dict[int, Deque[Tuple[float, UpdateJob]]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[Dispatcher] = None
+        self._bot: Optional[Bot] = None
+        self._depth = 0
+        self._accepting = False
+        self._space: Optional[asyncio.Event] = None
+        # Статистика для /debug
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.max_active = 0
+
+    @property
+    def depth(self) -> int:
+        """Сколько обновлений ждёт обработки (вместе с обрабатываемыми)"""
+        return self._depth
+
+    @property
+    def capacity(self) -> int:
+        return max(1, int(getattr(config, "UPDATE_QUEUE_SIZE", 1000)))
+
+    @property
+    def concurrency(self) -> int:
+        return max(1, int(getattr(config, "UPDATE_CONCURRENCY", 256)))
+
+    @property
+    def active(self) -> int:
+        """У скольких ключей (пользователей, лобби) сейчас есть обновления"""
+        return len(self._keys)
+
+    @property
+    def wait_avg(self) -> float:
+        finished = self.processed + self.failed
+        return self.wait_total / finished if finished else 0.0
+
+    @property
+    def running(self) -> bool:
+        """Очередь принимает обновления"""
+        return self._accepting
+
+    def busiest(self, limit: int = 3) -> List[Tuple[int, int, float]]:
+        """Ключи с самой длинной очередью: (ключ, ждут, возраст старейшего, с)"""
+        now = time.monotonic()
+        return sorted(
+            ((key, len(items), now - items[0][0]) for key, items in self._keys.items() if items),
+            key=lambda item: (item[1], item[2]),
+            reverse=True,
+        )[:limit]
+
+    def start(self, dispatcher: Dispatcher, bot: Bot) -> None:
+        """Включить приём (в цикле событий, который получает обновления)"""
+        if self._accepting:
+            return
+        self._dispatcher = dispatcher
+        self._bot = bot
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._space = asyncio.Event()
+        self._space.set()
+        self._accepting = True
+        logger.info("Очередь обновлений: до %s одновременно, до %s в очереди", self.concurrency, self.capacity)
+
+    def submit(self, key: int, job: UpdateJob) -> bool:
+        """
+        Поставить обработку в очередь ключа key
+
+        Returns:
+            False — очередь полна или остановлена (обновление не принято)
+        """
+        if not self._accepting or self._depth >= self.capacity:
+            self.rejected += 1
+            return False
+        items = self._keys.get(key)
+        if items is None:
+            # У ключа нет обработчика — запускаем; он живёт, пока у ключа есть обновления
+            items = self._keys[key] = deque()
+            task = asyncio.create_task(self._drain(key, items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            self.max_active = max(self.max_active, len(self._keys))
+        items.append((time.monotonic(), job))
+        self._depth += 1
+        self.accepted += 1
+        return True
+
+    async def put(self, key: int, job: UpdateJob) -> bool:
+        """
+        Поставить обработку в очередь, дождавшись места (polling: чтение обновлений притормаживает)
+
+        Returns:
+            False — очередь остановлена (обновление не принято)
+        """
+        while self._accepting and self._depth >= self.capacity:
+            self._space.clear()
+            await self._space.wait()
+        if not self._accepting:
+            return False
+        return self.submit(key, job)
+
+    def feed(self, bot: Bot, update: Update, **kwargs: Any) -> bool:
+        """Поставить обновление в очередь (см. submit): обработка — полный feed_update диспетчера"""
+        return self.submit(update_key(update), lambda: self._dispatcher.feed_update(bot, update, **kwargs))
+
+    async def _drain(self, key: int, items: Deque[Tuple[float, UpdateJob]]) -> None:
+        """Обработчик ключа: обновления по одному, в порядке поступления, пока очередь ключа не опустеет"""
+        try:
+            while items:
+                enqueued_at, job = items.popleft()
+                try:
+                    async with self._slots:
+                        waited = time.monotonic() - enqueued_at
+                        self.wait_total += waited
+                        self.wait_max = max(self.wait_max, waited)
+                        response = await job()
+                        # Обработчик вернул метод API (ответ «через webhook») — выполняем его, как aiogram
+                        if isinstance(response, TelegramMethod):
+                            await self._dispatcher.silent_call_request(bot=self._bot, result=response)
+                    self.processed += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    logger.exception("Ошибка обработки обновления: %s", e)
+                finally:
+                    self._depth -= 1
+                    if self._depth < self.capacity and self._space is not None:
+                        self._space.set()
+        finally:
+            if self._keys.get(key) is items:
+                del self._keys[key]
+
+    async def stop(self) -> None:
+        """Остановка: новые обновления не принимаются, очередь дообрабатывается до UPDATE_DRAIN_TIMEOUT"""
+        self._accepting = False
+        if self._space is not None:
+            # Ожидающие места в put() получат отказ и обработают обновление сами
+            self._space.set()
+        timeout = float(getattr(config, "UPDATE_DRAIN_TIMEOUT", 5.0))
+        deadline = time.monotonic() + timeout
+        while self._depth > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._depth > 0:
+            logger.warning("Очередь обновлений: %s обновлений не обработано при остановке", self._depth)
+        tasks = [task for task in self._tasks if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._keys.clear()
+        self._depth = 0
+
+
+class QueuedDispatcher(Dispatcher):
+    """Dispatcher, который в режиме polling ставит обновления в update_queue до своей цепочки middleware"""
+
+    async def _process_update(self, bot: Bot, update: Update, call_answer: bool = True, **kwargs: Any) -> bool:
+        # Внутренний метод aiogram 3.x: его вызывает цикл polling для каждого обновления
+        # (start_polling(handle_as_tasks=False) ждёт его завершения — отсюда и backpressure)
+        if not update_queue.running:
+            return await super()._process_update(bot, update, call_answer=call_answer, **kwargs)
+        if update_dedup.is_duplicate(update):
+            return True
+        if await update_queue.put(update_key(update), lambda: self.feed_update(bot, update, **kwargs)):
+            return True
+        # Очередь остановилась, пока ждали места, — обрабатываем сами
+        return await super()._process_update(bot, update, call_answer=call_answer, **kwargs)
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Webhook: обновление подтверждается сразу и уходит в очередь; очередь полна — 429"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, queue: UpdateQueue, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.queue = queue
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        update = Update.model_validate(
+            await request.json(loads=bot.session.json_loads), context={"bot": bot}
+        )
+        if update_dedup.is_duplicate(update):
+            # Повторная доставка: подтверждаем, ничего не делая
+            return web.json_response({}, dumps=bot.session.json_dumps)
+        if not self.queue.feed(bot, update):
+            update_dedup.forget(update)
+            retry_after = int(getattr(config, "UPDATE_RETRY_AFTER", 1))
+            return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": str(retry_after)})
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+
+# Глобальный экземпляр очереди
+update_queue = UpdateQueue()
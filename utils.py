@@ -3,7 +3,6 @@
 Автоудаление сообщений, форматирование текста, мем-фишка «дружок»
 """
 
-import asyncio
 import random
 from typing import Optional, Tuple
 
@@ -11,6 +10,8 @@ from aiogram import Bot
 from aiogram.types import Message
 
 from config import config
+from services.deletion import DeletionHandle, deletion_scheduler
+from services.outbound import LANE_NOTIFY, outbound_scheduler
 
 # Сообщение при недостатке баланса для ставки (игры)
 INSUFFICIENT_BALANCE_PHRASE = "с тебя нечего взять — ты нищет 😭"
@@ -50,32 +51,23 @@ TEHNOLOG_PHRASES = [
 ]
 
 
-async def delete_message_after(message: Message, seconds: int = None):
+def delete_message_later(message: Message, seconds: int = None) -> Optional[DeletionHandle]:
     """
     Автоматическое удаление сообщения через указанное время.
+    Не создаёт задачу: удаление ставится в общий планировщик (services/deletion.py).
     """
+    if message is None:
+        return None
     if seconds is None:
         seconds = config.MESSAGE_DELETE_TIMEOUT
-    if seconds <= 0:
-        return
-    try:
-        await asyncio.sleep(seconds)
-        await message.delete()
-    except Exception:
-        pass
+    return deletion_scheduler.schedule(message.bot, message.chat.id, message.message_id, seconds)
 
 
-async def delete_message_after_by_id(bot: Bot, chat_id: int, message_id: int, seconds: int = None):
+def delete_message_later_by_id(bot: Bot, chat_id: int, message_id: int, seconds: int = None) -> Optional[DeletionHandle]:
     """Удаление сообщения по chat_id и message_id через указанное время."""
     if seconds is None:
         seconds = config.MESSAGE_DELETE_TIMEOUT
-    if seconds <= 0:
-        return
-    try:
-        await asyncio.sleep(seconds)
-        await bot.delete_message(chat_id=chat_id, message_id=message_id)
-    except Exception:
-        pass
+    return deletion_scheduler.schedule(bot, chat_id, message_id, seconds)
 
 
 def resolve_recipient_from_message(message: Message) -> Tuple[Optional[int], Optional[str]]:
@@ -196,17 +188,32 @@ async def get_creator_id() -> Optional[int]:
     return _creator_id_cache
 
 
-async def notify_creator(bot: Bot, text: str) -> None:
-    """Отправить уведомление создателю (по user_id). Логи игроку не показываются."""
+async def send_to_creator(bot: Bot, text: str) -> bool:
+    """Отправить сообщение создателю (по user_id). Returns: True — отправлено"""
     if not bot:
-        return
+        return False
     try:
         creator_id = await get_creator_id()
         if creator_id:
-            await bot.send_message(chat_id=creator_id, text=f"🔔 <b>Уведомление</b>\n\n{text}")
+            with outbound_scheduler.lane(LANE_NOTIFY):
+                await bot.send_message(chat_id=creator_id, text=text)
+            return True
     except Exception as e:
         import logging
         logging.getLogger(__name__).warning("notify_creator: %s", e)
+    return False
+
+
+async def notify_creator(bot: Bot, text: str, kind: str = "Прочее", critical: bool = False) -> None:
+    """
+    Уведомление создателю. Логи игроку не показываются.
+    Обычные уведомления копятся по виду (kind) и уходят сводкой раз в CREATOR_DIGEST_INTERVAL
+    (services/digest.py); critical=True — отправить сразу.
+    """
+    if not bot:
+        return
+    from services.digest import creator_digest
+    await creator_digest.add(bot, kind, text, critical=critical)
 
 
 def is_creator_by_username(username: Optional[str]) -> bool: